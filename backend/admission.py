@@ -0,0 +1,256 @@
+import itertools
+import math
+import threading
+import time
+
+import metrics
+
+MAX_IDLE_BUCKETS = 1024  # 超过这个数量时丢弃已经回满的令牌桶
+
+
+class AdmissionRejected(Exception):
+    """排队已满或等待超时，调用方应在 retry_after 秒后重试。"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """允许令牌透支：一次取走的字节数超过余量时，返回补足欠额需要等待的秒数。"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self.refill(now)
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class Ticket:
+    """一次已准入的传输，结束时必须 release；重复 release 无副作用。"""
+
+    def __init__(self, controller, user_id, direction, size, interactive):
+        self.controller = controller
+        self.user_id = user_id
+        self.direction = direction
+        self.size = size
+        self.interactive = interactive
+        self.released = False
+
+    def throttle(self, nbytes):
+        return self.controller.throttle(self, nbytes)
+
+    def shaped(self, iterable):
+        return ShapedIterator(self, iterable)
+
+    def release(self):
+        self.controller.release(self)
+
+
+class ShapedIterator:
+    """逐块限速地转发响应体，关闭时释放名额。
+
+    WSGI 服务器发送完毕或连接断开时都会调用 close；HEAD 和 304 响应不迭代也会关闭。
+    """
+
+    def __init__(self, ticket, iterable):
+        self.ticket = ticket
+        self.iterable = iterable
+        self._iterator = iter(iterable)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        block = next(self._iterator)
+        self.ticket.throttle(len(block))
+        return block
+
+    def close(self):
+        try:
+            close = getattr(self.iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.ticket.release()
+
+
+class AdmissionController:
+    """上传与下载的准入控制。
+
+    同时进行的传输数有全局和单用户两级上限，超出的请求排队等待；队列按优先级出队，
+    不超过 small_request_bytes 的请求优先，并且可以额外使用 interactive_slots 个预留名额，
+    大文件占满名额时小请求不必跟在后面。队列满或等待超过 queue_timeout 时抛出 AdmissionRejected。
+    bandwidth 大于 0 时按用户和方向各维护一个令牌桶，传输超速时在读写之间让出等待。
+    限额只在当前进程内生效，多个 Web 进程时总上限是单进程的倍数。
+    """
+
+    def __init__(self, max_active=16, max_active_per_user=4, max_queue=64, max_queue_per_user=8,
+                 queue_timeout=10.0, small_request_bytes=1024 * 1024, interactive_slots=4,
+                 bandwidth=0, burst=8 * 1024 * 1024, sleep=time.sleep, clock=time.monotonic):
+        self.poll_interval = 0.005
+        self.configure(
+            max_active=max_active,
+            max_active_per_user=max_active_per_user,
+            max_queue=max_queue,
+            max_queue_per_user=max_queue_per_user,
+            queue_timeout=queue_timeout,
+            small_request_bytes=small_request_bytes,
+            interactive_slots=interactive_slots,
+            bandwidth=bandwidth,
+            burst=burst,
+            sleep=sleep,
+            clock=clock
+        )
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._active = 0
+        self._user_active = {}
+        self._waiters = []  # [优先级, 序号, 用户]
+        self._buckets = {}  # (用户, 方向) -> TokenBucket
+
+    def configure(self, max_active=None, max_active_per_user=None, max_queue=None, max_queue_per_user=None,
+                  queue_timeout=None, small_request_bytes=None, interactive_slots=None, bandwidth=None,
+                  burst=None, sleep=None, clock=None):
+        if max_active is not None:
+            self.max_active = max_active
+        if max_active_per_user is not None:
+            self.max_active_per_user = max_active_per_user
+        if max_queue is not None:
+            self.max_queue = max_queue
+        if max_queue_per_user is not None:
+            self.max_queue_per_user = max_queue_per_user
+        if queue_timeout is not None:
+            self.queue_timeout = queue_timeout
+        if small_request_bytes is not None:
+            self.small_request_bytes = small_request_bytes
+        if interactive_slots is not None:
+            self.interactive_slots = interactive_slots
+        if bandwidth is not None:
+            self.bandwidth = bandwidth
+        if burst is not None:
+            self.burst = burst
+        if sleep is not None:
+            self.sleep = sleep
+        if clock is not None:
+            self.clock = clock
+        if self.max_active <= 0 or self.max_active_per_user <= 0:
+            raise ValueError('并发传输上限必须大于 0')
+        if min(self.max_queue, self.max_queue_per_user, self.queue_timeout, self.small_request_bytes,
+               self.interactive_slots, self.bandwidth) < 0:
+            raise ValueError('排队和限速配置不能为负数')
+        if self.bandwidth and self.burst <= 0:
+            raise ValueError('限速的突发字节数必须大于 0')
+        if hasattr(self, '_buckets'):
+            self._buckets.clear()
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def queue_length(self):
+        return len(self._waiters)
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.queue_timeout))
+
+    def _can_start(self, user_id, interactive):
+        if self._user_active.get(user_id, 0) >= self.max_active_per_user:
+            return False
+        limit = self.max_active + (self.interactive_slots if interactive else 0)
+        return self._active < limit
+
+    def _next_waiter(self):
+        eligible = [waiter for waiter in self._waiters if self._can_start(waiter[2], waiter[0] == 0)]
+        return min(eligible, default=None)
+
+    def _start(self, waiter, direction, size):
+        self._waiters.remove(waiter)
+        self._active += 1
+        self._user_active[waiter[2]] = self._user_active.get(waiter[2], 0) + 1
+        return Ticket(self, waiter[2], direction, size, waiter[0] == 0)
+
+    def _reject(self, reason, message):
+        metrics.ADMISSION_REJECTED.inc(reason)
+        return AdmissionRejected(message, self.retry_after)
+
+    def admit(self, user_id, direction, size):
+        """等待传输名额，返回 Ticket；排队已满或超时时抛出 AdmissionRejected。"""
+        interactive = size <= self.small_request_bytes
+        waiter = [0 if interactive else 1, next(self._sequence), user_id]
+        started = self.clock()
+        with self._lock:
+            self._waiters.append(waiter)
+            if self._next_waiter() is waiter:
+                return self._start(waiter, direction, size)
+            if len(self._waiters) > self.max_queue:
+                self._waiters.remove(waiter)
+                raise self._reject('queue_full', '当前传输任务过多，请稍后重试')
+            if sum(1 for other in self._waiters if other[2] == user_id) > self.max_queue_per_user:
+                self._waiters.remove(waiter)
+                raise self._reject('user_queue_full', '您同时进行的传输过多，请稍后重试')
+
+        priority = 'interactive' if interactive else 'bulk'
+        deadline = started + self.queue_timeout
+        try:
+            while True:
+                self.sleep(self.poll_interval)
+                with self._lock:
+                    if self._next_waiter() is waiter:
+                        metrics.ADMISSION_WAIT.observe(self.clock() - started, priority)
+                        return self._start(waiter, direction, size)
+                    if self.clock() >= deadline:
+                        raise self._reject('timeout', '传输排队超时，请稍后重试')
+        finally:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._active -= 1
+            self._user_active[ticket.user_id] -= 1
+            if not self._user_active[ticket.user_id]:
+                del self._user_active[ticket.user_id]
+
+    def _prune_buckets(self, now):
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self._buckets[key]
+
+    def throttle(self, ticket, nbytes):
+        """按用户令牌桶计入 nbytes 字节，超速时等待并返回等待的秒数。"""
+        if not self.bandwidth or nbytes <= 0:
+            return 0.0
+        key = (ticket.user_id, ticket.direction)
+        with self._lock:
+            now = self.clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_IDLE_BUCKETS:
+                    self._prune_buckets(now)
+                bucket = self._buckets[key] = TokenBucket(self.bandwidth, self.burst, now)
+            delay = bucket.reserve(nbytes, now)
+        if delay > 0:
+            metrics.THROTTLE_EVENTS.inc(ticket.direction)
+            metrics.THROTTLE_SECONDS.inc(ticket.direction, amount=delay)
+            self.sleep(delay)
+        return delay
+
+
+admission = AdmissionController()
@@ -1,13 +1,14 @@
-from flask import Flask, request, send_file, jsonify, redirect
+from flask import Blueprint, Flask, Response, current_app, g, has_request_context, request, send_file, jsonify, redirect
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, jwt_required
+from flask_jwt_extended import JWTManager, create_access_token, decode_token, get_jwt_identity, jwt_required
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge, ClientDisconnected
+from werkzeug.local import LocalProxy
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 import os
 import glob
 import json
@@ -15,31 +16,60 @@ import hashlib
 import time
 import bcrypt
 import secrets
-import urllib.error
 import urllib.parse
-import urllib.request
 from datetime import datetime, timedelta
 from enum import Enum
-from sqlalchemy import Enum as SQLEnum
+from sqlalchemy import Enum as SQLEnum, event, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
 from crypto_utils import crypto  # 导入加密工具
+import metrics
+from request_profiler import RequestProfiler
+from log_pipeline import DEFAULT_LEVELS, SampledLogger, log_pipeline, parse_levels
+import db_profile
+from maintenance import maintenance
+from admission import AdmissionController, AdmissionRejected, admission
+from oauth_client import OAuthError, oauth_client
+from chunk_store import ChunkStore
+from storage_layout import StorageLayout
+from storage_backend import READ_BLOCK_SIZE, create_storage
+from preview import PreviewService, preview_kind
+from share_links import ShareLinkError, ShareLinks
 import base64
 import io
 import logging
 import re
 from dotenv import load_dotenv
-from routes.patterns import patterns_bp
+from routes.patterns import patterns_bp, set_overlay_loader
+from grok_engine import GROK_REFERENCE, GrokError, PatternOverlay, grok_engine
+from regex_pool import regex_pool
+import grok_jobs
 
 # 加载环境变量
 load_dotenv()
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# 上传路径单独一个日志器，便于按 LOG_LEVELS 调整
+upload_logger = logging.getLogger('websync.upload')
+
+_names_before_settings = set(globals())
 
 # 从环境变量加载配置
 UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
 SYNC_FOLDER = os.environ.get('SYNC_FOLDER', 'sync')
 SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///websync.db')
+# 连接池：SQLite 文件库与 PostgreSQL 等网络数据库使用，内存库忽略
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# SQLite 每个连接建立时执行的 PRAGMA
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', '')
 JWT_ACCESS_TOKEN_EXPIRES = int(os.environ.get('JWT_ACCESS_TOKEN_EXPIRES', 86400))
 ALLOWED_ORIGINS = os.environ.get('ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
@@ -48,60 +78,497 @@ MAGIC_LINK_DEFAULT_TTL = int(os.environ.get('MAGIC_LINK_DEFAULT_TTL', 120))
 MAGIC_LINK_MIN_TTL = int(os.environ.get('MAGIC_LINK_MIN_TTL', 60))
 MAGIC_LINK_MAX_TTL = int(os.environ.get('MAGIC_LINK_MAX_TTL', 600))
 MAGIC_LINK_RATE_LIMIT = int(os.environ.get('MAGIC_LINK_RATE_LIMIT', 10))
+# 剪贴板保留策略默认值，0 表示不限制；用户可单独覆盖
+CLIPBOARD_MAX_ITEMS = int(os.environ.get('CLIPBOARD_MAX_ITEMS', 1000))
+CLIPBOARD_MAX_AGE_DAYS = int(os.environ.get('CLIPBOARD_MAX_AGE_DAYS', 90))
+CLIPBOARD_MAX_BYTES = int(os.environ.get('CLIPBOARD_MAX_BYTES', 512 * 1024 * 1024))
+CLIPBOARD_COMPACT_INTERVAL = int(os.environ.get('CLIPBOARD_COMPACT_INTERVAL', 600))
+CLIPBOARD_COMPACT_BATCH = int(os.environ.get('CLIPBOARD_COMPACT_BATCH', 200))
+# 后台维护：调度器检查间隔、各清理任务的执行间隔（秒）与每批删除条数
+MAINTENANCE_TICK = float(os.environ.get('MAINTENANCE_TICK', 5))
+MAGIC_CODE_PURGE_INTERVAL = int(os.environ.get('MAGIC_CODE_PURGE_INTERVAL', 3600))
+ATTACH_TMP_CLEANUP_INTERVAL = int(os.environ.get('ATTACH_TMP_CLEANUP_INTERVAL', 3600))
+MAINTENANCE_BATCH = int(os.environ.get('MAINTENANCE_BATCH', 500))
+# 上传/下载准入控制：全局与单用户并发上限、排队长度与等待时间，小请求优先并有预留名额
+ADMISSION_MAX_ACTIVE = int(os.environ.get('ADMISSION_MAX_ACTIVE', 16))
+ADMISSION_MAX_ACTIVE_PER_USER = int(os.environ.get('ADMISSION_MAX_ACTIVE_PER_USER', 4))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 64))
+ADMISSION_MAX_QUEUE_PER_USER = int(os.environ.get('ADMISSION_MAX_QUEUE_PER_USER', 8))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10))
+ADMISSION_SMALL_REQUEST_BYTES = int(os.environ.get('ADMISSION_SMALL_REQUEST_BYTES', 1024 * 1024))
+ADMISSION_INTERACTIVE_SLOTS = int(os.environ.get('ADMISSION_INTERACTIVE_SLOTS', 4))
+# 每个用户每个方向的带宽上限（字节/秒，0 表示不限速）与允许的突发字节数
+USER_BANDWIDTH_LIMIT = int(os.environ.get('USER_BANDWIDTH_LIMIT', 0))
+USER_BANDWIDTH_BURST = int(os.environ.get('USER_BANDWIDTH_BURST', 8 * 1024 * 1024))
+# 文件版本历史：每个文件保留的版本数（含当前版本，0 表示不限制）、非当前版本的最长保留天数（0 表示不限制）、
+# 清理间隔（秒），以及不再被引用的数据块在删除前的宽限期（秒）
+FILE_VERSION_KEEP = int(os.environ.get('FILE_VERSION_KEEP', 10))
+FILE_VERSION_MAX_AGE_DAYS = int(os.environ.get('FILE_VERSION_MAX_AGE_DAYS', 0))
+FILE_VERSION_PRUNE_INTERVAL = int(os.environ.get('FILE_VERSION_PRUNE_INTERVAL', 3600))
+CHUNK_GC_GRACE = int(os.environ.get('CHUNK_GC_GRACE', 3600))
+# 上传文件的磁盘布局：flat 平铺在上传目录下；sharded 按对象键分片存放，已有平铺文件由后台任务分批迁移
+STORAGE_LAYOUT = os.environ.get('STORAGE_LAYOUT', 'flat')
+STORAGE_SHARD_DEPTH = int(os.environ.get('STORAGE_SHARD_DEPTH', 2))
+STORAGE_MIGRATION_INTERVAL = int(os.environ.get('STORAGE_MIGRATION_INTERVAL', 60))
+# 回收站：删除的文件保留的天数（0 表示下次回收时即物理删除）、后台回收的间隔（秒）与每批删除的文件数
+TRASH_RETENTION_DAYS = float(os.environ.get('TRASH_RETENTION_DAYS', 30))
+TRASH_PURGE_INTERVAL = int(os.environ.get('TRASH_PURGE_INTERVAL', 300))
+TRASH_PURGE_BATCH = int(os.environ.get('TRASH_PURGE_BATCH', 200))
+# 上传文件和剪贴板图片的存储后端：local 存放在 UPLOAD_FOLDER；s3 存放在 S3 兼容对象存储，多个节点可共用
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+S3_ENDPOINT = os.environ.get('S3_ENDPOINT', '')
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY', '')
+S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY', '')
+S3_PREFIX = os.environ.get('S3_PREFIX', '')
+# 超过阈值的文件分段并行上传：分段字节数（S3 要求至少 5MB）与并发数
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024))
+S3_PART_SIZE = int(os.environ.get('S3_PART_SIZE', 8 * 1024 * 1024))
+S3_UPLOAD_CONCURRENCY = int(os.environ.get('S3_UPLOAD_CONCURRENCY', 4))
+S3_TIMEOUT = float(os.environ.get('S3_TIMEOUT', 30))
+# 本地读缓存的总字节数（0 表示关闭）与可缓存的单个对象上限
+S3_CACHE_BYTES = int(os.environ.get('S3_CACHE_BYTES', 256 * 1024 * 1024))
+S3_CACHE_MAX_OBJECT = int(os.environ.get('S3_CACHE_MAX_OBJECT', 16 * 1024 * 1024))
+# 文件预览：缓存总字节数、文本预览读取的字节数、缩略图边长、压缩包列出的条目数、
+# 生成缩略图的图片大小上限与同时生成预览的后台任务数
+PREVIEW_CACHE_BYTES = int(os.environ.get('PREVIEW_CACHE_BYTES', 64 * 1024 * 1024))
+PREVIEW_TEXT_BYTES = int(os.environ.get('PREVIEW_TEXT_BYTES', 64 * 1024))
+PREVIEW_THUMBNAIL_SIZE = int(os.environ.get('PREVIEW_THUMBNAIL_SIZE', 256))
+PREVIEW_ARCHIVE_ENTRIES = int(os.environ.get('PREVIEW_ARCHIVE_ENTRIES', 500))
+PREVIEW_MAX_IMAGE_BYTES = int(os.environ.get('PREVIEW_MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 2))
+# 下载卸载：off 由本进程发送文件内容；nginx 只返回 X-Accel-Redirect，apache 只返回 X-Sendfile，
+# 由前置服务器用 sendfile 发送并处理 Range。nginx 中对应的 internal location 须与 DOWNLOAD_OFFLOAD_PREFIX 一致
+DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', 'off')
+DOWNLOAD_OFFLOAD_PREFIX = os.environ.get('DOWNLOAD_OFFLOAD_PREFIX', '/_protected_uploads/')
+# 签名分享链接：默认与最长有效期（秒）、代理/CDN 可缓存的最长秒数（也是撤销在缓存中生效的最长延迟），
+# 以及各进程重新加载撤销纪元表的间隔（秒）。签名密钥为空时使用 JWT_SECRET_KEY
+SHARE_LINK_SECRET = os.environ.get('SHARE_LINK_SECRET', '')
+SHARE_LINK_DEFAULT_TTL = int(os.environ.get('SHARE_LINK_DEFAULT_TTL', 7 * 24 * 3600))
+SHARE_LINK_MAX_TTL = int(os.environ.get('SHARE_LINK_MAX_TTL', 30 * 24 * 3600))
+SHARE_LINK_CACHE_MAX_AGE = int(os.environ.get('SHARE_LINK_CACHE_MAX_AGE', 300))
+SHARE_LINK_EPOCH_REFRESH = float(os.environ.get('SHARE_LINK_EPOCH_REFRESH', 5))
+GROK_JOB_WORKERS = int(os.environ.get('GROK_JOB_WORKERS', os.cpu_count() or 1))
+GROK_JOB_SHARD_SIZE = int(os.environ.get('GROK_JOB_SHARD_SIZE', grok_jobs.DEFAULT_SHARD_SIZE))
+GROK_JOB_CPU_LIMIT = int(os.environ.get('GROK_JOB_CPU_LIMIT', 600))
+# 交互式匹配的隔离进程池：墙钟超时（秒）、单任务 CPU 上限（秒）与排队上限
+REGEX_POOL_WORKERS = int(os.environ.get('REGEX_POOL_WORKERS', 2))
+REGEX_TIMEOUT = float(os.environ.get('REGEX_TIMEOUT', 2))
+REGEX_CPU_LIMIT = int(os.environ.get('REGEX_CPU_LIMIT', 2))
+REGEX_QUEUE_SIZE = int(os.environ.get('REGEX_QUEUE_SIZE', 32))
+REGEX_QUEUE_TIMEOUT = float(os.environ.get('REGEX_QUEUE_TIMEOUT', 5))
+CUSTOM_PATTERN_LIMIT = int(os.environ.get('CUSTOM_PATTERN_LIMIT', 500))
+# 关闭后不安装任何钩子，/metrics 返回 404。/metrics 只在设置了 METRICS_TOKEN 时提供，抓取需携带 Bearer 令牌，
+# 未设置令牌时只采集不对外暴露，避免默认部署公开路由、请求量和耗时等信息
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# 请求级采样分析：关闭时不安装任何钩子。开启后由管理员签发的令牌（请求头或查询参数）
+# 或按 PROFILE_SAMPLE_RATE 随机触发，结果保存在 PROFILE_DIR，只保留最近 PROFILE_RETENTION 份
+PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_RETENTION = int(os.environ.get('PROFILE_RETENTION', 50))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 1))
+PROFILE_TOKEN_TTL = int(os.environ.get('PROFILE_TOKEN_TTL', 600))
+# 后台服务（文件监视、剪贴板压缩、grok 批量任务）的运行位置：inline 随 python app.py 在同一进程启动；
+# external 由 serve.py 的独立服务进程承担，Web 进程只把 grok 任务写入数据库等待领取
+BACKGROUND_SERVICES = os.environ.get('BACKGROUND_SERVICES', 'inline')
+# 多进程部署时用于在进程间转发 Socket.IO 推送的消息队列，例如 redis://localhost:6379/0
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+# 复查已登录 Socket.IO 连接的间隔秒数：token 过期、用户被删除或角色变化的连接会被断开
+SOCKETIO_AUTH_CHECK_INTERVAL = float(os.environ.get('SOCKETIO_AUTH_CHECK_INTERVAL', 60))
+GROK_JOB_POLL_INTERVAL = float(os.environ.get('GROK_JOB_POLL_INTERVAL', 1))
+# 日志：根级别、按子系统覆盖的级别（如 "socketio=WARNING,websync.upload=DEBUG"）、
+# 后台写出队列长度，以及分块上传这类高频日志的最小输出间隔（秒）
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.environ.get('LOG_LEVELS', DEFAULT_LEVELS)
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_SAMPLE_INTERVAL = float(os.environ.get('LOG_SAMPLE_INTERVAL', 1))
+# 身份提供方 HTTP 调用的超时秒数、每个主机保留的空闲连接数与 JWKS 默认缓存秒数
+OAUTH_HTTP_TIMEOUT = float(os.environ.get('OAUTH_HTTP_TIMEOUT', 10))
+OAUTH_POOL_SIZE = int(os.environ.get('OAUTH_POOL_SIZE', 4))
+OAUTH_JWKS_TTL = int(os.environ.get('OAUTH_JWKS_TTL', 3600))
+
+# 以上大写变量是环境变量给出的默认配置，只在创建应用时读取；create_app 合并调用方的覆盖项并校验后
+# 写入 app.config，运行时一律经 current_app.config 读取
+_SETTING_NAMES = frozenset(name for name in globals() if name.isupper() and name not in _names_before_settings)
+_DEFAULT_SETTINGS = {name: globals()[name] for name in _SETTING_NAMES}
+del _names_before_settings
+
+CLIPBOARD_PREVIEW_CHARS = 200  # 实时推送事件中文本预览的最大字符数
+CUSTOM_PATTERN_MAX_LENGTH = 4096
+PROFILE_HEADER = 'X-WebSync-Profile'
+PROFILE_QUERY_PARAM = '__profile'
 GOOGLE_OAUTH_STATE_COOKIE = 'websync_oauth_state'
 GOOGLE_OAUTH_STATE_MAX_AGE = 600
 
-if (
-    len(JWT_SECRET_KEY) < 32
-    or JWT_SECRET_KEY in {'your-secret-key', 'your-secret-key-here'}
-    or JWT_SECRET_KEY.startswith('replace-')
-):
-    raise RuntimeError('JWT_SECRET_KEY 必须配置为至少 32 个字符的随机密钥')
-if MAX_UPLOAD_SIZE <= 0:
-    raise RuntimeError('MAX_UPLOAD_SIZE 必须大于 0')
-if not (
-    0 < MAGIC_LINK_MIN_TTL
-    <= MAGIC_LINK_DEFAULT_TTL
-    <= MAGIC_LINK_MAX_TTL
-):
-    raise RuntimeError('Magic Link 有效期配置无效')
-if MAGIC_LINK_RATE_LIMIT <= 0:
-    raise RuntimeError('MAGIC_LINK_RATE_LIMIT 必须大于 0')
-
-app = Flask(__name__)
-
-# 配置 CORS，允许指定源的跨域请求
-CORS(app, origins=ALLOWED_ORIGINS, supports_credentials=True)
-
-# 配置
-app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
-app.config['JWT_SECRET_KEY'] = JWT_SECRET_KEY
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(seconds=JWT_ACCESS_TOKEN_EXPIRES)
-app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
-
-db = SQLAlchemy(app)
-jwt = JWTManager(app)
-
-# 初始化 SocketIO
-socketio = SocketIO(
-    app,
-    cors_allowed_origins=ALLOWED_ORIGINS,
-    async_mode='eventlet',  # 使用 eventlet 作为异步模式
-    ping_timeout=60,
-    logger=True,
-    engineio_logger=True
-)
-
-# 注册路由
-app.register_blueprint(patterns_bp, url_prefix='/api/patterns')
+def validate_settings(settings):
+    """校验合并后的配置，settings 为设置名到取值的字典，配置无效时抛出 RuntimeError。"""
+    jwt_secret_key = settings['JWT_SECRET_KEY']
+    if (
+        len(jwt_secret_key) < 32
+        or jwt_secret_key in {'your-secret-key', 'your-secret-key-here'}
+        or jwt_secret_key.startswith('replace-')
+    ):
+        raise RuntimeError('JWT_SECRET_KEY 必须配置为至少 32 个字符的随机密钥')
+    if settings['MAX_UPLOAD_SIZE'] <= 0:
+        raise RuntimeError('MAX_UPLOAD_SIZE 必须大于 0')
+    if not (
+        0 < settings['MAGIC_LINK_MIN_TTL']
+        <= settings['MAGIC_LINK_DEFAULT_TTL']
+        <= settings['MAGIC_LINK_MAX_TTL']
+    ):
+        raise RuntimeError('Magic Link 有效期配置无效')
+    if settings['MAGIC_LINK_RATE_LIMIT'] <= 0:
+        raise RuntimeError('MAGIC_LINK_RATE_LIMIT 必须大于 0')
+    if min(settings['CLIPBOARD_MAX_ITEMS'], settings['CLIPBOARD_MAX_AGE_DAYS'], settings['CLIPBOARD_MAX_BYTES']) < 0:
+        raise RuntimeError('剪贴板保留策略不能为负数')
+    if min(
+        settings['MAINTENANCE_TICK'], settings['MAGIC_CODE_PURGE_INTERVAL'],
+        settings['ATTACH_TMP_CLEANUP_INTERVAL'], settings['MAINTENANCE_BATCH']
+    ) <= 0:
+        raise RuntimeError('后台维护任务的间隔和批大小必须大于 0')
+    if (
+        min(settings['FILE_VERSION_KEEP'], settings['FILE_VERSION_MAX_AGE_DAYS'], settings['CHUNK_GC_GRACE']) < 0
+        or settings['FILE_VERSION_PRUNE_INTERVAL'] <= 0
+    ):
+        raise RuntimeError('文件版本保留策略无效')
+    if settings['STORAGE_MIGRATION_INTERVAL'] <= 0:
+        raise RuntimeError('STORAGE_MIGRATION_INTERVAL 必须大于 0')
+    if settings['TRASH_RETENTION_DAYS'] < 0 or min(settings['TRASH_PURGE_INTERVAL'], settings['TRASH_PURGE_BATCH']) <= 0:
+        raise RuntimeError('回收站配置无效')
+    if settings['STORAGE_BACKEND'] == 's3' and settings['S3_PART_SIZE'] < 5 * 1024 * 1024:
+        raise RuntimeError('S3_PART_SIZE 不能小于 5MB')
+    if min(settings['S3_CACHE_BYTES'], settings['S3_CACHE_MAX_OBJECT']) < 0:
+        raise RuntimeError('S3 缓存大小不能为负数')
+    if min(
+        settings['PREVIEW_CACHE_BYTES'], settings['PREVIEW_TEXT_BYTES'], settings['PREVIEW_THUMBNAIL_SIZE'],
+        settings['PREVIEW_ARCHIVE_ENTRIES'], settings['PREVIEW_WORKERS']
+    ) <= 0 or settings['PREVIEW_MAX_IMAGE_BYTES'] < 0:
+        raise RuntimeError('文件预览配置无效')
+    if settings['DOWNLOAD_OFFLOAD'] not in ('off', 'nginx', 'apache'):
+        raise RuntimeError('DOWNLOAD_OFFLOAD 只支持 off、nginx 或 apache')
+    prefix = settings['DOWNLOAD_OFFLOAD_PREFIX']
+    if not (prefix.startswith('/') and prefix.endswith('/')):
+        raise RuntimeError('DOWNLOAD_OFFLOAD_PREFIX 必须以 / 开头和结尾')
+    if (
+        not 0 < settings['SHARE_LINK_DEFAULT_TTL'] <= settings['SHARE_LINK_MAX_TTL']
+        or settings['SHARE_LINK_CACHE_MAX_AGE'] < 0
+        or settings['SHARE_LINK_EPOCH_REFRESH'] <= 0
+    ):
+        raise RuntimeError('分享链接配置无效')
+    if settings['CLIPBOARD_COMPACT_INTERVAL'] <= 0 or settings['CLIPBOARD_COMPACT_BATCH'] <= 0:
+        raise RuntimeError('剪贴板压缩间隔和批大小必须大于 0')
+    if settings['SOCKETIO_AUTH_CHECK_INTERVAL'] <= 0:
+        raise RuntimeError('SOCKETIO_AUTH_CHECK_INTERVAL 必须大于 0')
+    if settings['GROK_JOB_WORKERS'] <= 0 or settings['GROK_JOB_SHARD_SIZE'] <= 0:
+        raise RuntimeError('GROK_JOB_WORKERS 和 GROK_JOB_SHARD_SIZE 必须大于 0')
+    if (
+        not 0 <= settings['PROFILE_SAMPLE_RATE'] <= 1
+        or settings['PROFILE_RETENTION'] <= 0
+        or settings['PROFILE_INTERVAL_MS'] <= 0
+    ):
+        raise RuntimeError('请求分析配置无效')
+    if settings['CUSTOM_PATTERN_LIMIT'] <= 0:
+        raise RuntimeError('CUSTOM_PATTERN_LIMIT 必须大于 0')
+    if settings['GROK_JOB_CPU_LIMIT'] < 0 or settings['REGEX_CPU_LIMIT'] < 0:
+        raise RuntimeError('CPU 时间上限不能为负数')
+    if (
+        settings['REGEX_POOL_WORKERS'] <= 0 or settings['REGEX_TIMEOUT'] <= 0
+        or settings['REGEX_QUEUE_SIZE'] < 0 or settings['REGEX_QUEUE_TIMEOUT'] < 0
+    ):
+        raise RuntimeError('正则执行池配置无效')
+    if settings['BACKGROUND_SERVICES'] not in ('inline', 'external'):
+        raise RuntimeError('BACKGROUND_SERVICES 只能是 inline 或 external')
+    if settings['GROK_JOB_POLL_INTERVAL'] <= 0:
+        raise RuntimeError('GROK_JOB_POLL_INTERVAL 必须大于 0')
+    if settings['DB_POOL_SIZE'] <= 0 or settings['DB_MAX_OVERFLOW'] < 0 or settings['DB_POOL_TIMEOUT'] <= 0:
+        raise RuntimeError('数据库连接池配置无效')
+    if settings['OAUTH_HTTP_TIMEOUT'] <= 0 or settings['OAUTH_POOL_SIZE'] < 0 or settings['OAUTH_JWKS_TTL'] <= 0:
+        raise RuntimeError('OAuth 客户端配置无效')
+    if settings['LOG_QUEUE_SIZE'] <= 0 or settings['LOG_SAMPLE_INTERVAL'] < 0:
+        raise RuntimeError('日志队列长度必须大于 0，采样间隔不能为负数')
+    # 以下各组件自带的校验：只构造临时实例，不改动进程内正在使用的服务
+    try:
+        parse_levels(settings['LOG_LEVELS'])
+        db_profile.SQLitePragmas(
+            journal_mode=settings['SQLITE_JOURNAL_MODE'],
+            synchronous=settings['SQLITE_SYNCHRONOUS'],
+            busy_timeout_ms=settings['SQLITE_BUSY_TIMEOUT_MS'],
+            mmap_size=settings['SQLITE_MMAP_SIZE'],
+            cache_size_kb=settings['SQLITE_CACHE_SIZE_KB']
+        )
+        AdmissionController(**_admission_options(settings))
+        StorageLayout(mode=settings['STORAGE_LAYOUT'], depth=settings['STORAGE_SHARD_DEPTH'])
+    except ValueError as e:
+        raise RuntimeError(str(e))
+
+def _admission_options(settings):
+    return {
+        'max_active': settings['ADMISSION_MAX_ACTIVE'],
+        'max_active_per_user': settings['ADMISSION_MAX_ACTIVE_PER_USER'],
+        'max_queue': settings['ADMISSION_MAX_QUEUE'],
+        'max_queue_per_user': settings['ADMISSION_MAX_QUEUE_PER_USER'],
+        'queue_timeout': settings['ADMISSION_QUEUE_TIMEOUT'],
+        'small_request_bytes': settings['ADMISSION_SMALL_REQUEST_BYTES'],
+        'interactive_slots': settings['ADMISSION_INTERACTIVE_SLOTS'],
+        'bandwidth': settings['USER_BANDWIDTH_LIMIT'],
+        'burst': settings['USER_BANDWIDTH_BURST']
+    }
+
+# 间隔由 configure_process 按应用配置调整
+chunk_log = SampledLogger(upload_logger, LOG_SAMPLE_INTERVAL)
+
+db = SQLAlchemy()
+jwt = JWTManager()
+# 全部 API 路由注册在蓝图上，由 create_app 挂到应用实例
+api_bp = Blueprint('api', __name__)
+
+class InstrumentedSocketIO(SocketIO):
+    """统计每种事件的推送次数。"""
+
+    def emit(self, event, *args, **kwargs):
+        metrics.SOCKETIO_EMITS.inc(event)
+        return super().emit(event, *args, **kwargs)
+
+# SocketIO 在 create_app 中绑定到应用；事件处理函数可以先注册
+socketio = InstrumentedSocketIO()
+
+# 等待工作进程、排队等待和限速等待都要让出协程，不阻塞其他请求
+regex_pool.configure(sleep=socketio.sleep)
+admission.configure(sleep=socketio.sleep)
+
+metrics.ADMISSION_ACTIVE.set_function(lambda: admission.active)
+metrics.ADMISSION_QUEUE.set_function(lambda: admission.queue_length)
+
+def _app_service(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+# 各应用独立的服务，由 create_app 按应用配置创建并保存在 app.extensions 中，经当前应用上下文访问
+storage = _app_service('storage')  # 上传文件和剪贴板图片的存储后端
+chunk_store = _app_service('chunk_store')
+storage_layout = _app_service('storage_layout')
+preview_service = _app_service('preview_service')
+request_profiler = _app_service('request_profiler')
+share_links = _app_service('share_links')
+
+# METRICS_ENABLED 时由 create_app 安装到应用上
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.db_queries = 0
+
+def record_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        # 用路由模板而不是实际路径作标签，避免 ID 之类的参数撑爆序列数
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, request.method, endpoint)
+        metrics.HTTP_REQUESTS.inc(request.method, endpoint, str(response.status_code))
+        metrics.DB_QUERIES_PER_REQUEST.observe(g.pop('db_queries', 0), endpoint)
+    return response
+
+def count_db_query(conn, cursor, statement, parameters, context, executemany):
+    metrics.DB_QUERIES.inc()
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+
+def _profile_serializer():
+    return URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY'], salt='request-profile')
+
+def verify_profile_token(token):
+    """返回签发令牌的管理员 ID；令牌无效、过期，或签发者已被删除或不再是管理员时返回 None。"""
+    try:
+        admin_id = int(_profile_serializer().loads(token, max_age=current_app.config['PROFILE_TOKEN_TTL']))
+    except (BadSignature, SignatureExpired, TypeError, ValueError):
+        return None
+    user = db.session.get(User, admin_id)
+    if not user or user.role != UserRole.ADMIN:
+        return None
+    return admin_id
+
+# 未开启时钩子只做一次属性判断，SQL 事件监听器也不会安装
+@api_bp.before_app_request
+def start_request_profile():
+    if not request_profiler.enabled:
+        return
+    token = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_PARAM)
+    if token:
+        g.profile_admin = verify_profile_token(token)
+        if g.profile_admin is None:
+            return
+    elif not request_profiler.sampled():
+        return
+    g.request_profile = request_profiler.start()
+
+@api_bp.after_app_request
+def save_request_profile(response):
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile_id = request_profiler.save(
+            profile,
+            method=request.method,
+            path=request.path,
+            endpoint=request.url_rule.rule if request.url_rule else None,
+            status=response.status_code,
+            trigger='token' if g.get('profile_admin') else 'sampled'
+        )
+        response.headers['X-WebSync-Profile-Id'] = profile_id
+    return response
+
+def _start_profiled_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'request_profile' in g:
+        conn.info.setdefault('profile_query_started', []).append(time.perf_counter())
+
+def _record_profiled_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'request_profile' in g:
+        started = conn.info.get('profile_query_started')
+        if started:
+            g.request_profile.record_query(statement, time.perf_counter() - started.pop())
+
+def enable_request_profiling(app):
+    """开启应用的请求分析并安装 SQL 计时监听器，可重复调用。"""
+    app.extensions['request_profiler'].enabled = True
+    if not event.contains(Engine, 'before_cursor_execute', _start_profiled_query):
+        event.listen(Engine, 'before_cursor_execute', _start_profiled_query)
+        event.listen(Engine, 'after_cursor_execute', _record_profiled_query)
+
+def _require_admin():
+    current_user = get_current_user()
+    if not current_user:
+        return None, (jsonify({'error': '用户未找到'}), 404)
+    if current_user.role != UserRole.ADMIN:
+        return None, (jsonify({'error': '只有管理员可以执行此操作'}), 403)
+    return current_user, None
+
+@api_bp.route('/api/admin/profiles/token', methods=['POST'])
+@jwt_required()
+def create_profile_token():
+    """签发短期分析令牌，放在 X-WebSync-Profile 请求头或 __profile 查询参数中即可分析该请求。"""
+    current_user, error = _require_admin()
+    if error:
+        return error
+    if not request_profiler.enabled:
+        return jsonify({'error': '未开启请求分析 (PROFILE_ENABLED)'}), 409
+    return no_store_json({
+        'token': _profile_serializer().dumps(current_user.id),
+        'header': PROFILE_HEADER,
+        'query_param': PROFILE_QUERY_PARAM,
+        'expires_in': current_app.config['PROFILE_TOKEN_TTL']
+    })
+
+@api_bp.route('/api/admin/profiles', methods=['GET'])
+@jwt_required()
+def list_request_profiles():
+    _, error = _require_admin()
+    if error:
+        return error
+    return jsonify(request_profiler.list())
+
+@api_bp.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@jwt_required()
+def download_request_profile(profile_id):
+    """下载完整分析结果；format=collapsed 时返回折叠栈文本，可直接交给火焰图工具。"""
+    _, error = _require_admin()
+    if error:
+        return error
+    document = request_profiler.load(profile_id)
+    if document is None:
+        return jsonify({'error': '分析结果不存在'}), 404
+    if request.args.get('format') == 'collapsed':
+        response = Response(request_profiler.collapsed(document), mimetype='text/plain')
+        response.headers['Content-Disposition'] = f'attachment; filename=profile-{profile_id}.txt'
+        return response
+    response = jsonify(document)
+    response.headers['Content-Disposition'] = f'attachment; filename=profile-{profile_id}.json'
+    return response
+
+@api_bp.route('/api/admin/maintenance', methods=['GET'])
+@jwt_required()
+def get_maintenance_status():
+    """后台维护任务最近一次的执行时间、耗时、结果与错误。"""
+    _, error = _require_admin()
+    if error:
+        return error
+    return jsonify(maintenance.load_status(_maintenance_status_path(current_app.config)) or {'jobs': maintenance.status()})
+
+@api_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 文本格式的指标。"""
+    token = current_app.config['METRICS_TOKEN']
+    if not current_app.config['METRICS_ENABLED'] or not token:
+        return jsonify({'error': 'Not found'}), 404
+    if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': '未授权'}), 401
+    return Response(metrics.registry.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+SOCKET_AUTH_KEY = 'websync.socket_auth'
+
+def user_room(user_id):
+    """每个用户的私有 Socket.IO 房间，只推送给该用户自己的设备。"""
+    return f'user_{user_id}'
 
 @socketio.on('connect')
-def handle_connect():
-    print('Client connected')
+def handle_connect(auth=None):
+    logger.debug('Client connected')
+    # 未携带 token 的连接仍可接收公共的 files_updated 广播；
+    # 携带 token 时必须有效，验证通过后加入该用户的私有房间
+    token = auth.get('token') if isinstance(auth, dict) else None
+    if not token:
+        metrics.SOCKETIO_CLIENTS.inc()
+        return
+    try:
+        claims = decode_token(token)
+    except Exception:
+        return False
+    if reject_non_allowed_users(None, claims):
+        return False
+    user = db.session.get(User, int(claims['sub']))
+    # 连接只在建立时校验 token，复查所需的信息随连接的 environ 保存，由 check_socket_sessions 定期核对
+    request.environ[SOCKET_AUTH_KEY] = {'user_id': user.id, 'role': user.role.value, 'exp': claims.get('exp')}
+    join_room(user_room(user.id))
+    metrics.SOCKETIO_CLIENTS.inc()
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    logger.debug('Client disconnected')
+    metrics.SOCKETIO_CLIENTS.dec()
+
+def check_socket_sessions(now=None):
+    """断开本进程中凭据已失效的登录连接，返回断开的连接数。
+
+    失效包括 token 过期、用户被删除或不再是允许登录的账号，以及角色与连接时不同；
+    角色变化后客户端重新连接即按新角色处理。
+    """
+    now = now or time.time()
+    server = socketio.server
+    closed = 0
+    for sid, eio_sid in list(server.manager.get_participants('/', None)):
+        session = server.environ.get(eio_sid, {}).get(SOCKET_AUTH_KEY)
+        if session is None:  # 匿名连接或已经断开
+            continue
+        user = db.session.get(User, session['user_id'])
+        if (
+            (session['exp'] is not None and session['exp'] <= now)
+            or reject_non_allowed_users(None, {'sub': str(session['user_id'])})
+            or user.role != session['role']
+        ):
+            server.disconnect(sid, namespace='/')
+            closed += 1
+    return closed
+
+def run_socket_auth_checker(app):
+    """Web 进程的后台协程：按 SOCKETIO_AUTH_CHECK_INTERVAL 定期复查登录连接。"""
+    while True:
+        socketio.sleep(app.config['SOCKETIO_AUTH_CHECK_INTERVAL'])
+        with app.app_context():
+            try:
+                closed = check_socket_sessions()
+                if closed:
+                    logger.info("已断开 %d 个凭据失效的 Socket.IO 连接", closed)
+            except Exception as e:
+                logger.error("复查 Socket.IO 连接失败: %s", e)
+            finally:
+                db.session.remove()
 
 class UserRole(str, Enum):
     ADMIN = 'admin'
@@ -120,6 +587,10 @@ class User(db.Model):
     last_login_attempt = db.Column(db.DateTime)
     storage_limit = db.Column(db.BigInteger, nullable=False, default=1024*1024*1024)  # 默认1GB
     storage_used = db.Column(db.BigInteger, nullable=False, default=0)
+    # 剪贴板保留策略，为空时使用全局默认值
+    clipboard_max_items = db.Column(db.Integer, nullable=True)
+    clipboard_max_age_days = db.Column(db.Integer, nullable=True)
+    clipboard_max_bytes = db.Column(db.BigInteger, nullable=True)
 
 class MagicLoginCode(db.Model):
     __tablename__ = 'magic_login_codes'
@@ -144,34 +615,127 @@ def reject_non_allowed_users(jwt_header, jwt_payload):
 class File(db.Model):
     __tablename__ = 'files'
     id = db.Column(db.Integer, primary_key=True)
-    path = db.Column(db.String(500), nullable=False)
+    path = db.Column(db.String(500), nullable=False, index=True)
     hash = db.Column(db.String(64), nullable=False)
     last_modified = db.Column(db.DateTime, nullable=False)
     size = db.Column(db.Integer, nullable=False)
-    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     is_public = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # 分片布局下的对象键；为空时文件按 path 平铺在上传目录下
+    storage_key = db.Column(db.String(100), index=True)
+    # 移入回收站的时间与计划物理删除的时间；为空表示文件未删除
+    trashed_at = db.Column(db.DateTime)
+    purge_at = db.Column(db.DateTime, index=True)
 
 class FileShare(db.Model):
     __tablename__ = 'file_shares'
+    __table_args__ = (
+        db.Index('ix_file_shares_user_file', 'user_id', 'file_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     file_id = db.Column(db.Integer, db.ForeignKey('files.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
+class ShareLinkEpoch(db.Model):
+    """签发过分享链接的文件的撤销纪元，纪元加一后之前签发的链接全部失效。
+
+    只有签发过链接的文件才有记录；文件删除后记录保留，避免文件 ID 被复用时旧链接重新生效。
+    """
+    __tablename__ = 'share_link_epochs'
+    file_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    epoch = db.Column(db.Integer, nullable=False, default=0)
+
+class BlobDeletion(db.Model):
+    """等待后台回收的存储对象，记录已随用户一起删除，只剩下物理文件。"""
+    __tablename__ = 'blob_deletions'
+    id = db.Column(db.Integer, primary_key=True)
+    storage_key = db.Column(db.String(600), nullable=False)
+    # 接收回收进度的用户（发起删除的管理员）
+    notify_user_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class Chunk(db.Model):
+    """版本历史的数据块，内容按哈希存放在 chunk_store 中，所有文件共享。"""
+    __tablename__ = 'chunks'
+    hash = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class FileVersion(db.Model):
+    __tablename__ = 'file_versions'
+    __table_args__ = (
+        db.UniqueConstraint('file_id', 'version', name='uq_file_versions_file_version'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    hash = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    chunk_count = db.Column(db.Integer, nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    restored_from = db.Column(db.Integer, nullable=True)  # 由哪个版本恢复而来
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class FileVersionChunk(db.Model):
+    """版本清单：按顺序拼接各数据块即得到该版本的内容。"""
+    __tablename__ = 'file_version_chunks'
+    version_id = db.Column(db.Integer, db.ForeignKey('file_versions.id'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    chunk_hash = db.Column(db.String(64), db.ForeignKey('chunks.hash'), nullable=False, index=True)
+
+class GrokJob(db.Model):
+    __tablename__ = 'grok_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id'), nullable=False)
+    pattern = db.Column(db.Text, nullable=False)
+    pattern_files = db.Column(db.Text, nullable=True)  # JSON 数组，为空表示全部模式文件
+    output_format = db.Column(db.String(10), nullable=False, default='ndjson')
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, running, done, failed
+    bytes_total = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_done = db.Column(db.BigInteger, nullable=False, default=0)
+    matched = db.Column(db.BigInteger, nullable=False, default=0)
+    unmatched = db.Column(db.BigInteger, nullable=False, default=0)
+    result_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class CustomPattern(db.Model):
+    __tablename__ = 'custom_patterns'
+    __table_args__ = (
+        db.UniqueConstraint('owner_id', 'name', name='uq_custom_patterns_owner_name'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    pattern = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 class FileChangeHandler(FileSystemEventHandler):
-    def __init__(self, app_context, socketio):
-        self.app_context = app_context
+    """监视上传目录顶层的平铺文件；分片对象和内部目录（.chunks、.tmp 等）的事件直接忽略。"""
+
+    def __init__(self, app, socketio):
+        self.app = app
         self.socketio = socketio
 
+    def _flat_path(self, event):
+        return self.app.extensions['storage_layout'].flat_path(self.app.config['UPLOAD_FOLDER'], event.src_path)
+
     def on_modified(self, event):
+        metrics.WATCHER_EVENTS.inc('modified')
         if not event.is_directory:
-            with self.app_context:
+            rel_path = self._flat_path(event)
+            if rel_path is None:
+                return
+            with self.app.app_context():
                 # 检查文件是否真的发生了变化
                 file_path = event.src_path
-                rel_path = os.path.relpath(file_path, UPLOAD_FOLDER)
-                file_record = File.query.filter_by(path=rel_path).first()
+                file_record = find_flat_file(rel_path)
                 
                 if file_record:
                     # 获取文件当前状态
@@ -190,43 +754,87 @@ class FileChangeHandler(FileSystemEventHandler):
                     self.socketio.emit('files_updated', {'message': '新文件已添加'})
 
     def on_created(self, event):
+        metrics.WATCHER_EVENTS.inc('created')
         if not event.is_directory:
-            with self.app_context:
+            rel_path = self._flat_path(event)
+            if rel_path is None:
+                return
+            with self.app.app_context():
                 # 检查文件是否已存在于数据库中
-                file_path = event.src_path
-                rel_path = os.path.relpath(file_path, UPLOAD_FOLDER)
-                file_record = File.query.filter_by(path=rel_path).first()
+                file_record = find_flat_file(rel_path)
                 
                 if not file_record:
                     update_file_info(event.src_path)
                     self.socketio.emit('files_updated', {'message': '新文件已添加'})
 
     def on_deleted(self, event):
+        metrics.WATCHER_EVENTS.inc('deleted')
         if not event.is_directory:
-            with self.app_context:
-                # 检查文件是否存在于数据库中
-                file_path = event.src_path
-                rel_path = os.path.relpath(file_path, UPLOAD_FOLDER)
-                file_record = File.query.filter_by(path=rel_path).first()
+            rel_path = self._flat_path(event)
+            if rel_path is None:
+                return
+            with self.app.app_context():
+                # 检查文件是否存在于数据库中；已迁移到分片目录的记录不受旧位置删除的影响，
+                # 回收站中的记录由后台回收任务删除
+                file_record = find_flat_file(rel_path)
                 
-                if file_record:
+                if file_record and file_record.trashed_at is None:
+                    revoke_share_links([file_record.id])
                     db.session.delete(file_record)
                     db.session.commit()
                     self.socketio.emit('files_updated', {'message': '文件已删除'})
 
+def revoke_share_links(file_ids):
+    """使这些文件已签发的分享链接失效（内容变化、删除、迁移或手动撤销），由调用方提交事务。"""
+    if not file_ids:
+        return
+    db.session.execute(
+        db.update(ShareLinkEpoch)
+        .where(ShareLinkEpoch.file_id.in_(file_ids))
+        .values(epoch=ShareLinkEpoch.epoch + 1)
+    )
+    db.session.info['share_links_revoked'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _reload_share_link_epochs(session):
+    # 撤销提交后本进程立即重新加载纪元表，其他进程在 SHARE_LINK_EPOCH_REFRESH 秒内生效
+    if session.info.pop('share_links_revoked', False):
+        share_links.expire()
+
+def _load_share_link_epochs():
+    return db.session.execute(db.select(ShareLinkEpoch.file_id, ShareLinkEpoch.epoch)).all()
+
+def find_flat_file(rel_path):
+    """按平铺文件名查找仍存放在上传目录顶层的文件记录。
+
+    包括回收站中的文件：它们仍占用该位置，同名的新上传会改用分片对象键。
+    """
+    return File.query.filter_by(path=rel_path, storage_key=None).first()
+
+def get_live_file(file_id):
+    """按 ID 取文件记录，回收站中的文件视为不存在。"""
+    file_record = db.session.get(File, file_id)
+    return file_record if file_record and file_record.trashed_at is None else None
+
+def file_storage_key(file_record):
+    """文件在存储后端中的键：分片布局下为对象键，否则为平铺路径。"""
+    return file_record.storage_key or file_record.path
+
 def update_file_info(file_path):
     try:
         if not os.path.exists(file_path):
             return
             
-        rel_path = os.path.relpath(file_path, UPLOAD_FOLDER)
+        rel_path = os.path.relpath(file_path, current_app.config['UPLOAD_FOLDER'])
         stat = os.stat(file_path)
         
-        with open(file_path, 'rb') as f:
+        with open(file_path, 'rb') as f, metrics.HASH_DURATION.time('sha256'):
             file_hash = hashlib.sha256(f.read()).hexdigest()
             
-        file_record = File.query.filter_by(path=rel_path).first()
+        file_record = find_flat_file(rel_path)
         if file_record:
+            if file_record.hash != file_hash:
+                revoke_share_links([file_record.id])
             file_record.hash = file_hash
             file_record.last_modified = datetime.fromtimestamp(stat.st_mtime)
             file_record.size = stat.st_size
@@ -241,11 +849,57 @@ def update_file_info(file_path):
             
         db.session.commit()
     except Exception as e:
-        print(f"Error updating file info: {e}")
+        logger.error("Error updating file info: %s", e)
+
+# 项目没有引入迁移工具，旧数据库缺少的字段和索引在启动时按需补齐。
+# 每项为 (表名, 字段名, 字段 DDL, 补齐后执行的回填 SQL)
+SCHEMA_COLUMN_UPGRADES = [
+    ('users', 'clipboard_max_items', 'INTEGER', None),
+    ('users', 'clipboard_max_age_days', 'INTEGER', None),
+    ('users', 'clipboard_max_bytes', 'BIGINT', None),
+    ('clipboard_items', 'content_hash', 'VARCHAR(64)', None),
+    ('clipboard_items', 'size', 'BIGINT', None),
+    ('clipboard_items', 'updated_at', 'DATETIME',
+     'UPDATE clipboard_items SET updated_at = created_at WHERE updated_at IS NULL'),
+    ('files', 'storage_key', 'VARCHAR(100)', None),
+    ('files', 'trashed_at', 'DATETIME', None),
+    ('files', 'purge_at', 'DATETIME', None),
+]
+SCHEMA_INDEX_UPGRADES = [
+    ('ix_clipboard_items_owner_hash', 'clipboard_items', ('owner_id', 'content_hash')),
+    ('ix_files_path', 'files', ('path',)),
+    ('ix_files_owner_id', 'files', ('owner_id',)),
+    ('ix_files_storage_key', 'files', ('storage_key',)),
+    ('ix_files_purge_at', 'files', ('purge_at',)),
+    ('ix_file_shares_user_file', 'file_shares', ('user_id', 'file_id')),
+    # 列表按所有者过滤并按 updated_at 排序，同时覆盖按 owner_id 的查找
+    ('ix_clipboard_items_owner_updated', 'clipboard_items', ('owner_id', 'updated_at')),
+]
+
+def upgrade_schema():
+    """为已有数据库补齐新增字段和索引，可重复执行。"""
+    inspector = db.inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    with db.engine.begin() as conn:
+        for table, column, ddl, backfill in SCHEMA_COLUMN_UPGRADES:
+            if table not in tables:
+                continue
+            columns = {info['name'] for info in inspector.get_columns(table)}
+            if column in columns:
+                continue
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            if backfill:
+                conn.execute(text(backfill))
+            logger.info("数据库升级: %s.%s", table, column)
+        for name, table, columns in SCHEMA_INDEX_UPGRADES:
+            if table in tables:
+                conn.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'
+                ))
 
 def init_upload_folder():
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(SYNC_FOLDER, exist_ok=True)
+    os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(current_app.config['SYNC_FOLDER'], exist_ok=True)
 
 def create_initial_admin():
     try:
@@ -280,12 +934,12 @@ def get_current_user():
     except (ValueError, TypeError):
         return None
 
-@app.route('/api/register', methods=['POST'])
+@api_bp.route('/api/register', methods=['POST'])
 @jwt_required()
 def register():
     return jsonify({'error': '本站只允许指定的 Google 账号登录，不能创建其他账号'}), 403
 
-@app.route('/api/login', methods=['POST'])
+@api_bp.route('/api/login', methods=['POST'])
 def login():
     return jsonify({'error': '密码登录已关闭，请使用 Google 登录'}), 410
 
@@ -327,12 +981,15 @@ def no_store_json(payload, status=200):
     response.headers['Referrer-Policy'] = 'no-referrer'
     return response
 
-@app.route('/api/auth/google', methods=['GET'])
+def _oauth_nonce(state):
+    return hashlib.sha256(f"{current_app.config['JWT_SECRET_KEY']}:{state}".encode('utf-8')).hexdigest()
+
+@api_bp.route('/api/auth/google', methods=['GET'])
 def google_login():
     try:
         config, callback_uri = load_google_oauth_config()
         state = secrets.token_urlsafe(32)
-        signed_state = URLSafeTimedSerializer(JWT_SECRET_KEY).dumps(
+        signed_state = URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY']).dumps(
             state,
             salt='google-oauth-state'
         )
@@ -342,8 +999,12 @@ def google_login():
             'response_type': 'code',
             'scope': 'openid email profile',
             'state': state,
+            # id_token 中带回 nonce，与 state 绑定，防止重放别处截获的 id_token
+            'nonce': _oauth_nonce(state),
             'prompt': 'select_account'
         })
+        # 用户在 Google 页面操作期间预取签名公钥
+        socketio.start_background_task(oauth_client.warm_up, config)
         response = redirect(f"{config['auth_uri']}?{params}")
         response.set_cookie(
             GOOGLE_OAUTH_STATE_COOKIE,
@@ -359,7 +1020,7 @@ def google_login():
         logger.error("Google OAuth 配置错误: %s", error)
         return jsonify({'error': 'Google 登录配置不可用'}), 500
 
-@app.route('/auth/google/callback', methods=['GET'])
+@api_bp.route('/auth/google/callback', methods=['GET'])
 def google_callback():
     if request.args.get('error'):
         return frontend_redirect('auth_error=google_denied')
@@ -371,7 +1032,7 @@ def google_callback():
         return frontend_redirect('auth_error=invalid_state')
 
     try:
-        expected_state = URLSafeTimedSerializer(JWT_SECRET_KEY).loads(
+        expected_state = URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY']).loads(
             signed_state,
             salt='google-oauth-state',
             max_age=GOOGLE_OAUTH_STATE_MAX_AGE
@@ -380,31 +1041,10 @@ def google_callback():
             return frontend_redirect('auth_error=invalid_state')
 
         config, callback_uri = load_google_oauth_config()
-        token_body = urllib.parse.urlencode({
-            'code': code,
-            'client_id': config['client_id'],
-            'client_secret': config['client_secret'],
-            'redirect_uri': callback_uri,
-            'grant_type': 'authorization_code'
-        }).encode('utf-8')
-        token_request = urllib.request.Request(
-            config['token_uri'],
-            data=token_body,
-            headers={'Content-Type': 'application/x-www-form-urlencoded'}
-        )
-        with urllib.request.urlopen(token_request, timeout=10) as token_response:
-            token_data = json.load(token_response)
-
-        google_access_token = token_data.get('access_token')
-        if not google_access_token:
-            raise ValueError('Google token 响应中缺少 access_token')
-
-        userinfo_request = urllib.request.Request(
-            'https://openidconnect.googleapis.com/v1/userinfo',
-            headers={'Authorization': f'Bearer {google_access_token}'}
-        )
-        with urllib.request.urlopen(userinfo_request, timeout=10) as userinfo_response:
-            google_user = json.load(userinfo_response)
+        # 只需换取 token 这一次往返，邮箱等声明取自本地验签后的 id_token
+        google_user = oauth_client.exchange_code(config, code, callback_uri)
+        if not secrets.compare_digest(str(google_user.get('nonce', '')), _oauth_nonce(state)):
+            raise OAuthError('id_token 的 nonce 与登录请求不符')
 
         email = str(google_user.get('email', '')).lower()
         allowed_email = config['allowed_email'].strip().lower()
@@ -433,11 +1073,11 @@ def google_callback():
         return response
     except (BadSignature, SignatureExpired):
         return frontend_redirect('auth_error=invalid_state')
-    except (OSError, ValueError, urllib.error.URLError, json.JSONDecodeError) as error:
+    except (OSError, ValueError, OAuthError) as error:
         logger.error("Google OAuth 回调失败: %s", error)
         return frontend_redirect('auth_error=google_failed')
 
-@app.route('/api/auth/me', methods=['GET'])
+@api_bp.route('/api/auth/me', methods=['GET'])
 @jwt_required()
 def auth_me():
     user = get_current_user()
@@ -451,7 +1091,26 @@ def auth_me():
         }
     })
 
-@app.route('/api/auth/magic-link', methods=['POST'])
+# 过期一天以上的登录码才清理，近期记录保留用于限流和审计
+MAGIC_CODE_RETENTION = timedelta(days=1)
+
+def purge_magic_codes(now=None, batch_size=None):
+    """后台维护任务：分批删除过期已久的临时登录码，返回删除条数。"""
+    cutoff = (now or datetime.utcnow()) - MAGIC_CODE_RETENTION
+    batch_size = batch_size or current_app.config['MAINTENANCE_BATCH']
+    removed = 0
+    while True:
+        ids = db.session.execute(
+            db.select(MagicLoginCode.id).where(MagicLoginCode.expires_at < cutoff).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return removed
+        MagicLoginCode.query.filter(MagicLoginCode.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += len(ids)
+        socketio.sleep(0)
+
+@api_bp.route('/api/auth/magic-link', methods=['POST'])
 @jwt_required()
 def create_magic_link():
     current_user = get_current_user()
@@ -464,12 +1123,14 @@ def create_magic_link():
             return no_store_json({'error': '没有权限生成临时登录链接'}, 403)
 
         payload = request.get_json(silent=True) or {}
-        expires_in = int(payload.get('expires_in', MAGIC_LINK_DEFAULT_TTL))
-        if not MAGIC_LINK_MIN_TTL <= expires_in <= MAGIC_LINK_MAX_TTL:
+        min_ttl = current_app.config['MAGIC_LINK_MIN_TTL']
+        max_ttl = current_app.config['MAGIC_LINK_MAX_TTL']
+        expires_in = int(payload.get('expires_in', current_app.config['MAGIC_LINK_DEFAULT_TTL']))
+        if not min_ttl <= expires_in <= max_ttl:
             return no_store_json({
                 'error': (
-                    f'有效期必须在 {MAGIC_LINK_MIN_TTL} 到 '
-                    f'{MAGIC_LINK_MAX_TTL} 秒之间'
+                    f'有效期必须在 {min_ttl} 到 '
+                    f'{max_ttl} 秒之间'
                 )
             }, 400)
 
@@ -478,14 +1139,9 @@ def create_magic_link():
             MagicLoginCode.user_id == current_user.id,
             MagicLoginCode.created_at >= now - timedelta(hours=1)
         ).count()
-        if recent_count >= MAGIC_LINK_RATE_LIMIT:
+        if recent_count >= current_app.config['MAGIC_LINK_RATE_LIMIT']:
             return no_store_json({'error': '临时登录链接生成过于频繁，请稍后再试'}, 429)
 
-        # 仅清理一天以前的记录，保留近期记录用于限流和审计。
-        MagicLoginCode.query.filter(
-            MagicLoginCode.expires_at < now - timedelta(days=1)
-        ).delete(synchronize_session=False)
-
         # 同一账号只保留最新一条未使用链接，重新生成会立即作废旧链接。
         MagicLoginCode.query.filter(
             MagicLoginCode.user_id == current_user.id,
@@ -516,7 +1172,7 @@ def create_magic_link():
         db.session.rollback()
         return no_store_json({'error': '无法生成临时登录链接'}, 400)
 
-@app.route('/api/auth/magic-link/consume', methods=['POST'])
+@api_bp.route('/api/auth/magic-link/consume', methods=['POST'])
 def consume_magic_link():
     payload = request.get_json(silent=True) or {}
     code = payload.get('code')
@@ -554,7 +1210,7 @@ def consume_magic_link():
         db.session.rollback()
         return no_store_json({'error': '临时登录链接无效或已过期'}, 400)
 
-@app.route('/api/users', methods=['GET'])
+@api_bp.route('/api/users', methods=['GET'])
 @jwt_required()
 def get_users():
     try:
@@ -575,10 +1231,10 @@ def get_users():
             'storage_used': user.storage_used
         } for user in users])
     except Exception as e:
-        print(f"Error in get_users: {str(e)}")
+        logger.error("Error in get_users: %s", e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/files', methods=['GET'])
+@api_bp.route('/api/files', methods=['GET'])
 @jwt_required()
 def list_files():
     try:
@@ -587,13 +1243,14 @@ def list_files():
             return jsonify({'error': '用户未找到'}), 404
         
         # 查询用户可以访问的所有文件
-        owned_files = File.query.filter_by(owner_id=current_user.id).all()
-        shared_files = File.query.join(FileShare).filter(FileShare.user_id == current_user.id).all()
-        public_files = File.query.filter_by(is_public=True).all()
+        live_files = File.query.filter(File.trashed_at.is_(None))
+        owned_files = live_files.filter_by(owner_id=current_user.id).all()
+        shared_files = live_files.join(FileShare).filter(FileShare.user_id == current_user.id).all()
+        public_files = live_files.filter_by(is_public=True).all()
         
         # 如果是管理员，可以看到所有文件
         if current_user.role == UserRole.ADMIN:
-            all_files = File.query.all()
+            all_files = live_files.all()
         else:
             all_files = list(set(owned_files + shared_files + public_files))
         
@@ -617,32 +1274,150 @@ def list_files():
         
         return jsonify(files_data)
     except Exception as e:
-        print(f"Error in list_files: {str(e)}")
+        logger.error("Error in list_files: %s", e)
         return jsonify({'error': str(e)}), 500
 
-def _finalize_upload(current_user, filename, file_path):
-    """对已写入磁盘的文件计算哈希、入库并广播，返回上传成功响应。"""
+def admit_transfer(user_id, direction, size):
+    """申请上传/下载名额，返回 (ticket, error)；排队已满或超时时 error 为带 Retry-After 的 429 响应。
+
+    名额在请求结束时释放，经 stream_transfer 发送的响应在发送完毕后释放。
+    """
     try:
-        stat = os.stat(file_path)
-        with open(file_path, 'rb') as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
+        ticket = admission.admit(user_id, direction, size)
+    except AdmissionRejected as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return None, response
+    g.admission_ticket = ticket
+    return ticket, None
+
+def stream_transfer(response):
+    """按用户限速发送响应体，名额保留到发送完毕。
+
+    错误响应（如 (jsonify(...), 404) 元组）不需要发送文件内容，原样返回并立即释放名额。
+    """
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        if isinstance(response, Response):
+            response.response = ticket.shaped(response.response)
+        else:
+            ticket.release()
+    return response
 
-        logger.info(f"文件哈希值: {file_hash}")
+def _attachment_disposition(download_name):
+    return 'attachment; filename*=UTF-8\'\'' + urllib.parse.quote(download_name)
 
-        new_file = File(
-            path=filename,
-            hash=file_hash,
-            last_modified=datetime.fromtimestamp(stat.st_mtime),
-            size=stat.st_size,
-            owner_id=current_user.id
-        )
+def offload_path(key):
+    """下载可以交给前置服务器发送时返回文件的本地路径，否则返回 None（未开启卸载或远程存储）。"""
+    if current_app.config['DOWNLOAD_OFFLOAD'] == 'off':
+        return None
+    return storage.local_path(key)
+
+def offload_download(key, local_path, download_name):
+    """只返回内部重定向头，文件内容、Range 和条件请求都由 nginx（X-Accel-Redirect）或 Apache（X-Sendfile）处理。"""
+    if not os.path.isfile(local_path):
+        return jsonify({'error': '文件不存在'}), 404
+    response = Response(mimetype='application/octet-stream')
+    config = current_app.config
+    if config['DOWNLOAD_OFFLOAD'] == 'nginx':
+        response.headers['X-Accel-Redirect'] = config['DOWNLOAD_OFFLOAD_PREFIX'] + urllib.parse.quote(key)
+        # nginx 只能按连接限速，近似用户带宽限额
+        if config['USER_BANDWIDTH_LIMIT']:
+            response.headers['X-Accel-Limit-Rate'] = str(config['USER_BANDWIDTH_LIMIT'])
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(local_path)
+    response.headers['Content-Disposition'] = _attachment_disposition(download_name)
+    # 缓存策略由后端决定，前置服务器原样转发；分享链接会替换为自己的策略
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def send_stored_file(key, download_name, size=None):
+    """以附件形式返回存储后端中的对象。
+
+    本地后端交给 send_file，沿用其条件请求和 Range 处理；远程后端按请求的单个 Range 向对象存储发起
+    区间读取并流式转发，不在本机落盘。
+    """
+    local_path = storage.local_path(key)
+    if local_path is not None:
+        return send_file(local_path, as_attachment=True, download_name=download_name)
+
+    try:
+        if size is None:
+            size = storage.size(key)
+        start, end, status = 0, size, 200
+        if request.range and len(request.range.ranges) == 1:
+            byte_range = request.range.range_for_length(size)
+            if byte_range is None:
+                response = Response(status=416)
+                response.headers['Content-Range'] = f'bytes */{size}'
+                return response
+            start, end = byte_range
+            status = 206
+        body = storage.open_stream(key, start, end) if status == 206 else storage.open_stream(key)
+    except FileNotFoundError:
+        return jsonify({'error': '文件不存在'}), 404
+
+    response = Response(body, status=status, mimetype='application/octet-stream', direct_passthrough=True)
+    response.headers['Content-Length'] = str(end - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    response.headers['Content-Disposition'] = _attachment_disposition(download_name)
+    return response
+
+@api_bp.teardown_app_request
+def release_transfer(exc=None):
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        ticket.release()
+
+def _record_upload(path, nbytes, chunks, started):
+    """记录一次上传请求收到的字节数、数据块数与接收速率。"""
+    metrics.UPLOAD_BYTES.inc(path, amount=nbytes)
+    metrics.UPLOAD_CHUNKS.inc(path, amount=chunks)
+    elapsed = time.perf_counter() - started
+    if elapsed > 0:
+        metrics.UPLOAD_THROUGHPUT.observe(nbytes / elapsed, path)
+
+def _finalize_upload(current_user, filename, staged_path):
+    """把暂存目录中已写完的文件移到正式位置并广播，返回上传成功响应。
+
+    同一用户再次上传同名文件时更新原有记录并追加一个版本；被取代的内容先分块入库，之后可以从数据块恢复。
+    新文件在分片布局下分配对象键；平铺布局下若同名文件属于其他用户，也改用对象键，不再互相覆盖。
+    """
+    try:
+        stat = os.stat(staged_path)
+        with metrics.HASH_DURATION.time('sha256'):
+            file_hash = _file_sha256(staged_path)
+        size = stat.st_size
+
+        file_record = File.query.filter_by(path=filename, owner_id=current_user.id, trashed_at=None).first()
+        if file_record:
+            archive_current_version(file_record)
+            # 覆盖同名文件只按大小差额计入已用空间
+            current_user.storage_used = max(0, current_user.storage_used - file_record.size)
+            if file_record.hash != file_hash:
+                revoke_share_links([file_record.id])
+        else:
+            file_record = File(path=filename, owner_id=current_user.id)
+            if storage_layout.sharded or find_flat_file(filename):
+                file_record.storage_key = storage_layout.new_key()
+            db.session.add(file_record)
+        file_record.hash = file_hash
+        file_record.last_modified = datetime.fromtimestamp(stat.st_mtime)
+        file_record.size = size
 
         # 更新用户已使用的存储空间
-        current_user.storage_used += stat.st_size
+        current_user.storage_used += size
 
-        db.session.add(new_file)
+        db.session.flush()
+        version = add_file_version(file_record, file_hash, size, None, current_user.id)
+        storage.save(file_storage_key(file_record), staged_path)
         db.session.commit()
-        logger.info("文件信息保存到数据库成功")
+        upload_logger.info(
+            "文件上传完成: %s, %d 字节, sha256=%s, 版本 %d", filename, size, file_hash, version.version
+        )
 
         # 发送文件更新通知
         socketio.emit('files_updated', {'message': '新文件已上传'})
@@ -650,24 +1425,25 @@ def _finalize_upload(current_user, filename, file_path):
         return jsonify({
             'message': '文件上传成功',
             'file': {
-                'id': new_file.id,
-                'path': new_file.path,
-                'size': new_file.size,
-                'modified': new_file.last_modified.isoformat(),
+                'id': file_record.id,
+                'path': file_record.path,
+                'size': file_record.size,
+                'modified': file_record.last_modified.isoformat(),
                 'owner': current_user.email,
                 'type': 'own',
-                'is_public': new_file.is_public
+                'is_public': file_record.is_public,
+                'version': version.version
             }
         })
     except Exception as e:
-        logger.error(f"数据库操作失败: {str(e)}")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info("已删除已上传的文件")
+        upload_logger.error("数据库操作失败: %s", e)
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+            upload_logger.info("已删除已上传的文件: %s", staged_path)
         db.session.rollback()
         return jsonify({'error': f'保存文件信息失败: {str(e)}'}), 500
 
-@app.route('/api/clipboard/attach', methods=['POST'])
+@api_bp.route('/api/clipboard/attach', methods=['POST'])
 @jwt_required()
 def attach_file():
     """通过剪贴板通道接收文件：请求体为裸二进制流，文件名走 query 参数。
@@ -675,37 +1451,40 @@ def attach_file():
     用于绕开本地安全软件对 multipart 上传请求的拦截，与 /api/upload 等价。
     """
     try:
-        logger.info("开始处理 attach 上传请求")
         current_user = get_current_user()
         if not current_user:
-            logger.error("用户未找到")
+            upload_logger.warning("用户未找到")
             return jsonify({'error': '用户未找到'}), 404
 
         raw_filename = request.args.get('filename', '')
         if not raw_filename:
-            logger.error("缺少文件名")
+            upload_logger.warning("缺少文件名")
             return jsonify({'error': '缺少文件名'}), 400
 
         filename = secure_filename(raw_filename)
         if not filename:
-            logger.error(f"文件名无效: {raw_filename}")
+            upload_logger.warning("文件名无效: %s", raw_filename)
             return jsonify({'error': '文件名无效'}), 400
 
         file_size = request.content_length or 0
-        logger.info(f"attach 文件: {filename}, 声明大小: {file_size}, 当前已用空间: {current_user.storage_used}, 存储限制: {current_user.storage_limit}")
+        ticket, error = admit_transfer(current_user.id, 'upload', file_size)
+        if error:
+            return error
+        upload_logger.debug(
+            "attach 文件: %s, 声明大小: %d, 当前已用空间: %d, 存储限制: %d",
+            filename, file_size, current_user.storage_used, current_user.storage_limit
+        )
 
         if current_user.storage_used + file_size > current_user.storage_limit:
-            logger.error("存储空间不足")
+            upload_logger.warning("存储空间不足: 用户 %d", current_user.id)
             return jsonify({'error': '存储空间不足'}), 400
 
-        # 确保上传目录存在
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        logger.info(f"文件保存路径: {file_path}")
+        file_path = _staging_path()
 
         # 流式写入，避免大文件占用内存
         bytes_written = 0
+        chunks_read = 0
+        started = time.perf_counter()
         try:
             with open(file_path, 'wb') as f:
                 while True:
@@ -714,28 +1493,30 @@ def attach_file():
                         break
                     f.write(chunk)
                     bytes_written += len(chunk)
-            logger.info(f"文件写入完成，收到 {bytes_written} 字节")
+                    chunks_read += 1
+                    ticket.throttle(len(chunk))
+            _record_upload('attach', bytes_written, chunks_read, started)
         except Exception as e:
             # 连接被中途掐断（如本地安全软件截断请求体）时 werkzeug 会抛
             # ClientDisconnected；无论哪种异常都要清掉写了一半的文件
             if os.path.exists(file_path):
                 os.remove(file_path)
             if isinstance(e, ClientDisconnected):
-                logger.error(f"传输被中断: 声明 {file_size} 字节，实际收到 {bytes_written} 字节")
+                upload_logger.warning("传输被中断: 声明 %d 字节，实际收到 %d 字节", file_size, bytes_written)
                 return jsonify({'error': f'文件传输不完整（{bytes_written}/{file_size} 字节），请重试'}), 400
-            logger.error(f"文件保存失败: {str(e)}")
+            upload_logger.error("文件保存失败: %s", e)
             return jsonify({'error': f'文件保存失败: {str(e)}'}), 500
 
         # 校验实际收到的字节数与 Content-Length 一致，防止传输被中途截断
         # 后误存半个文件
         if bytes_written == 0:
             os.remove(file_path)
-            logger.error("请求体为空")
+            upload_logger.warning("请求体为空")
             return jsonify({'error': '没有文件被上传'}), 400
 
         if file_size and bytes_written != file_size:
             os.remove(file_path)
-            logger.error(f"传输不完整: 声明 {file_size} 字节，实际收到 {bytes_written} 字节")
+            upload_logger.warning("传输不完整: 声明 %d 字节，实际收到 %d 字节", file_size, bytes_written)
             return jsonify({'error': f'文件传输不完整（{bytes_written}/{file_size} 字节），请重试'}), 400
 
         return _finalize_upload(current_user, filename, file_path)
@@ -743,28 +1524,87 @@ def attach_file():
     except RequestEntityTooLarge:
         return jsonify({'error': '上传文件超过大小限制'}), 413
     except Exception as e:
-        logger.error(f"attach 上传过程中发生错误: {str(e)}")
+        upload_logger.error("attach 上传过程中发生错误: %s", e)
         db.session.rollback()
         return jsonify({'error': f'文件上传失败: {str(e)}'}), 500
 
-ATTACH_TMP_DIR = os.path.join(UPLOAD_FOLDER, '.tmp')
 ATTACH_TMP_MAX_AGE = 24 * 3600  # 超过 24 小时未完成的分块临时文件会被清理
 ATTACH_MAX_CHUNKS = 10000
 
+def attach_tmp_dir():
+    """分块上传和暂存文件所在目录。"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], '.tmp')
+
+def _staging_path():
+    """上传先写入暂存文件，完整收到后才替换正式文件，传输中断不会破坏已有内容。"""
+    os.makedirs(attach_tmp_dir(), exist_ok=True)
+    return os.path.join(attach_tmp_dir(), f'upload-{secrets.token_hex(16)}.part')
+
+def migrate_storage_layout(batch_size=None):
+    """后台维护任务：分片布局下把仍平铺存放的文件分批迁入分片目录，返回迁移的文件数。
 
-def _cleanup_stale_attach_tmp():
-    """顺手清理超期未完成的分块临时文件。"""
+    每批先为文件在新位置建立硬链接并提交对象键，提交后才删除旧位置，迁移期间下载不受影响。
+    建链后旧位置又被写入新内容时，用旧位置的文件替换新位置；多个记录共用同一个平铺文件时，
+    等这些记录都迁移后才删除旧文件。
+    """
+    if not storage_layout.sharded or storage.name != 'local':
+        return None
+    batch_size = batch_size or current_app.config['MAINTENANCE_BATCH']
+    migrated = 0
+    while True:
+        records = File.query.filter(File.storage_key.is_(None)).order_by(File.id).limit(batch_size).all()
+        if not records:
+            break
+        linked = {}
+        # 已签发的链接记录的是旧的存储键
+        revoke_share_links([record.id for record in records])
+        for record in records:
+            source = storage.local_path(record.path)
+            record.storage_key = storage_layout.new_key()
+            if os.path.exists(source):
+                storage_layout.link(source, storage.local_path(record.storage_key))
+                linked[source] = record
+            else:
+                logger.warning("迁移存储布局时未找到文件: %s", record.path)
+        db.session.commit()
+        for source, record in linked.items():
+            if find_flat_file(record.path):
+                continue
+            if os.path.samefile(source, storage.local_path(record.storage_key)):
+                os.remove(source)
+            else:
+                storage.save(record.storage_key, source)
+        migrated += len(records)
+        socketio.sleep(0)
+    return {'migrated': migrated} if migrated else None
+
+
+def cleanup_stale_attach_tmp(now=None, batch_size=None):
+    """后台维护任务：删除超期未完成的分块临时文件，单次最多删除 batch_size 个，返回删除个数。"""
+    now = now or time.time()
+    batch_size = batch_size or current_app.config['MAINTENANCE_BATCH']
+    removed = 0
     try:
-        now = time.time()
-        for path in glob.glob(os.path.join(ATTACH_TMP_DIR, '*.part')):
-            if now - os.path.getmtime(path) > ATTACH_TMP_MAX_AGE:
-                os.remove(path)
-                logger.info(f"清理超期分块临时文件: {path}")
-    except OSError:
-        pass
+        entries = os.scandir(attach_tmp_dir())
+    except FileNotFoundError:
+        return 0
+    with entries:
+        for entry in entries:
+            if removed >= batch_size:
+                break
+            if not entry.name.endswith('.part'):
+                continue
+            try:
+                if now - entry.stat().st_mtime > ATTACH_TMP_MAX_AGE:
+                    os.remove(entry.path)
+                    removed += 1
+                    upload_logger.info("清理超期分块临时文件: %s", entry.path)
+            except OSError:
+                pass
+    return removed
 
 
-@app.route('/api/clipboard/attach/chunk', methods=['POST'])
+@api_bp.route('/api/clipboard/attach/chunk', methods=['POST'])
 @jwt_required()
 def attach_file_chunk():
     """分块接收文件：每块 base64 编码后放在 JSON body 里，与文本剪贴板同形态。
@@ -777,6 +1617,10 @@ def attach_file_chunk():
         if not current_user:
             return jsonify({'error': '用户未找到'}), 404
 
+        ticket, error = admit_transfer(current_user.id, 'upload', request.content_length or 0)
+        if error:
+            return error
+
         data = request.get_json(silent=True) or {}
         upload_id = str(data.get('upload_id', ''))
         filename = secure_filename(str(data.get('filename', '')))
@@ -807,26 +1651,29 @@ def attach_file_chunk():
         if offset + len(chunk) > total_size:
             return jsonify({'error': '分块超出声明的文件大小'}), 400
 
-        # 首块时检查配额，并顺带清理超期临时文件
+        # 首块时检查配额
         if index == 0:
-            _cleanup_stale_attach_tmp()
             if current_user.storage_used + total_size > current_user.storage_limit:
-                logger.error("存储空间不足")
+                upload_logger.warning("存储空间不足: 用户 %d", current_user.id)
                 return jsonify({'error': '存储空间不足'}), 400
 
-        os.makedirs(ATTACH_TMP_DIR, exist_ok=True)
-        part_path = os.path.join(ATTACH_TMP_DIR, f'{upload_id}.part')
+        os.makedirs(attach_tmp_dir(), exist_ok=True)
+        part_path = os.path.join(attach_tmp_dir(), f'{upload_id}.part')
+
+        ticket.throttle(len(chunk))
 
         # 按偏移写入，同一块重传是幂等的
         try:
             with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as f:
                 f.seek(offset)
                 f.write(chunk)
+            _record_upload('chunk', len(chunk), 1, g.get('metrics_started', time.perf_counter()))
         except OSError as e:
-            logger.error(f"分块写入失败: {str(e)}")
+            upload_logger.error("分块写入失败: %s", e)
             return jsonify({'error': f'分块写入失败: {str(e)}'}), 500
 
-        logger.info(f"attach 分块: {filename} [{index + 1}/{total}] offset={offset} size={len(chunk)}")
+        # 每块一条日志会让日志 I/O 随分块数线性增长，这里按时间间隔采样
+        chunk_log.info("attach 分块: %s [%d/%d] offset=%d size=%d", filename, index + 1, total, offset, len(chunk))
 
         # 还未收齐
         if index < total - 1:
@@ -834,112 +1681,563 @@ def attach_file_chunk():
 
         # 最后一块：校验完整性后转入正式文件
         if os.path.getsize(part_path) != total_size:
-            logger.error(f"分块拼好后大小不符: 期望 {total_size}, 实际 {os.path.getsize(part_path)}")
+            upload_logger.warning("分块拼好后大小不符: 期望 %d, 实际 %d", total_size, os.path.getsize(part_path))
             return jsonify({'error': '文件块不完整，请重传缺失的分块'}), 400
 
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        os.replace(part_path, file_path)
-        logger.info(f"分块上传完成: {filename}, 共 {total_size} 字节")
-
-        return _finalize_upload(current_user, filename, file_path)
+        return _finalize_upload(current_user, filename, part_path)
 
     except RequestEntityTooLarge:
         return jsonify({'error': '分块超过大小限制'}), 413
     except Exception as e:
-        logger.error(f"attach 分块处理错误: {str(e)}")
+        upload_logger.error("attach 分块处理错误: %s", e)
         db.session.rollback()
         return jsonify({'error': f'文件上传失败: {str(e)}'}), 500
 
-@app.route('/api/upload', methods=['POST'])
+@api_bp.route('/api/upload', methods=['POST'])
 @jwt_required()
 def upload_file():
     try:
-        logger.info("开始处理文件上传请求")
         current_user = get_current_user()
         if not current_user:
-            logger.error("用户未找到")
+            upload_logger.warning("用户未找到")
             return jsonify({'error': '用户未找到'}), 404
-        
-        logger.info(f"当前用户: {current_user.email}")
+
+        # 访问 request.files 就会读取请求体，必须先取得名额
+        ticket, error = admit_transfer(current_user.id, 'upload', request.content_length or 0)
+        if error:
+            return error
         
         if 'file' not in request.files:
-            logger.error("请求中没有文件")
+            upload_logger.warning("请求中没有文件")
             return jsonify({'error': '没有文件被上传'}), 400
             
         file = request.files['file']
         if file.filename == '':
-            logger.error("文件名为空")
+            upload_logger.warning("文件名为空")
             return jsonify({'error': '没有选择文件'}), 400
             
         if file:
-            logger.info(f"准备上传文件: {file.filename}")
             # 检查文件大小和存储限制
             file.stream.seek(0, os.SEEK_END)
             file_size = file.stream.tell()
             file.stream.seek(0)
             
-            logger.info(f"文件大小: {file_size}, 当前已用空间: {current_user.storage_used}, 存储限制: {current_user.storage_limit}")
+            upload_logger.debug(
+                "准备上传文件: %s, 大小: %d, 当前已用空间: %d, 存储限制: %d",
+                file.filename, file_size, current_user.storage_used, current_user.storage_limit
+            )
             
             if current_user.storage_used + file_size > current_user.storage_limit:
-                logger.error("存储空间不足")
+                upload_logger.warning("存储空间不足: 用户 %d", current_user.id)
                 return jsonify({'error': '存储空间不足'}), 400
                 
             filename = secure_filename(file.filename)
-            logger.info(f"安全文件名: {filename}")
-            
-            # 确保上传目录存在
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-            
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            logger.info(f"文件保存路径: {file_path}")
+            file_path = _staging_path()
             
             try:
+                started = time.perf_counter()
                 file.save(file_path)
-                logger.info("文件保存成功")
+                # multipart 请求体已由解析器整体读入，只能在保存后按大小补足限速等待
+                ticket.throttle(file_size)
+                _record_upload('upload', file_size, 1, started)
             except Exception as e:
-                logger.error(f"文件保存失败: {str(e)}")
+                upload_logger.error("文件保存失败: %s", e)
                 return jsonify({'error': f'文件保存失败: {str(e)}'}), 500
 
             return _finalize_upload(current_user, filename, file_path)
         
-        logger.error("文件上传失败：未知原因")
+        upload_logger.error("文件上传失败：未知原因")
         return jsonify({'error': '文件上传失败'}), 400
         
     except RequestEntityTooLarge:
         return jsonify({'error': '上传文件超过大小限制'}), 413
     except Exception as e:
-        logger.error(f"文件上传过程中发生错误: {str(e)}")
+        upload_logger.error("文件上传过程中发生错误: %s", e)
         db.session.rollback()
         return jsonify({'error': f'文件上传失败: {str(e)}'}), 500
 
-@app.route('/api/download/<path:filename>')
+def can_read_file(user, file_record):
+    """所有者、管理员、公开文件或被共享的用户可以读取文件内容。"""
+    return bool(
+        file_record.owner_id == user.id or
+        file_record.is_public or
+        user.role == UserRole.ADMIN or
+        FileShare.query.filter_by(
+            file_id=file_record.id,
+            user_id=user.id
+        ).first()
+    )
+
+@api_bp.route('/api/download/<path:filename>')
 @jwt_required()
 def download_file(filename):
     current_user = User.query.get(get_jwt_identity())
-    file_record = File.query.filter_by(path=filename).first()
+    # 不同用户可以有同名文件，优先返回自己的
+    file_record = File.query.filter_by(path=filename, trashed_at=None).order_by(
+        db.case((File.owner_id == current_user.id, 0), else_=1), File.id
+    ).first()
     
     if not file_record:
         return jsonify({'error': '文件不存在'}), 404
         
     # 检查用户是否有权限下载文件
-    if not (file_record.owner_id == current_user.id or
-            file_record.is_public or
-            current_user.role == UserRole.ADMIN or
-            FileShare.query.filter_by(
-                file_id=file_record.id,
-                user_id=current_user.id
-            ).first()):
+    if not can_read_file(current_user, file_record):
         return jsonify({'error': '没有权限下载此文件'}), 403
-        
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    return send_file(file_path, as_attachment=True)
 
-@app.route('/api/files/<int:file_id>/share', methods=['POST'])
+    key = file_storage_key(file_record)
+    download_name = os.path.basename(file_record.path)
+    # 卸载给前置服务器时本进程不经手文件内容，不占用传输名额
+    local_path = offload_path(key)
+    if local_path is not None:
+        return offload_download(key, local_path, download_name)
+
+    _, error = admit_transfer(current_user.id, 'download', file_record.size)
+    if error:
+        return error
+
+    return stream_transfer(send_stored_file(key, download_name, size=file_record.size))
+
+PREVIEW_CACHE_CONTROL = 'private, no-cache'
+
+@api_bp.route('/api/files/<int:file_id>/preview', methods=['GET'])
+@jwt_required()
+def preview_file(file_id):
+    """返回文件预览：文本开头、图片缩略图或压缩包目录。
+
+    预览按内容哈希缓存并以 ETag 校验；尚未生成时安排后台生成并返回 202，客户端按 Retry-After 重试。
+    """
+    current_user = get_current_user()
+    file_record = get_live_file(file_id)
+    if not current_user or not file_record:
+        return jsonify({'error': '文件不存在'}), 404
+    if not can_read_file(current_user, file_record):
+        return jsonify({'error': '没有权限读取此文件'}), 403
+
+    return _preview_response(
+        file_record.hash, os.path.basename(file_record.path), file_record.size, file_storage_key(file_record)
+    )
+
+def _preview_response(file_hash, filename, size, storage_key, cache_control=PREVIEW_CACHE_CONTROL):
+    kind = preview_kind(filename)
+    key = preview_service.key(file_hash, kind)
+    # 预览键由内容哈希决定，客户端持有的版本仍有效时不必读取缓存
+    if key in request.if_none_match:
+        metrics.PREVIEW_REQUESTS.inc('not_modified')
+        response = Response(status=304)
+    else:
+        payload = preview_service.get(key)
+        if payload is None:
+            metrics.PREVIEW_REQUESTS.inc('miss')
+            # 生成在应用上下文之外的后台任务中进行，直接绑定当前应用的存储后端
+            backend = current_app.extensions['storage']
+            preview_service.submit(key, kind, filename, size, lambda: backend.open_file(storage_key))
+            # 后台任务可能已经同步完成
+            payload = preview_service.get(key)
+            if payload is None:
+                response = jsonify({'status': 'pending'})
+                response.status_code = 202
+                response.headers['Retry-After'] = '1'
+                return response
+        else:
+            metrics.PREVIEW_REQUESTS.inc('hit')
+        response = Response(payload, mimetype='application/json')
+    response.set_etag(key)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+@api_bp.route('/api/files/<int:file_id>/links', methods=['POST'])
+@jwt_required()
+def create_share_link(file_id):
+    """签发无需登录的分享链接。
+
+    请求格式: {expires_in?: 秒, operations?: ["download", "preview"]}。链接绑定当前内容，
+    文件内容变化、删除或调用 DELETE 撤销后失效。
+    """
+    current_user = get_current_user()
+    file_record = get_live_file(file_id)
+    if not current_user or not file_record:
+        return jsonify({'error': '文件不存在'}), 404
+    if not (file_record.owner_id == current_user.id or current_user.role == UserRole.ADMIN):
+        return jsonify({'error': '没有权限分享此文件'}), 403
+
+    data = request.get_json(silent=True) or {}
+    max_ttl = current_app.config['SHARE_LINK_MAX_TTL']
+    expires_in = data.get('expires_in', current_app.config['SHARE_LINK_DEFAULT_TTL'])
+    operations = data.get('operations', ['download', 'preview'])
+    if not isinstance(expires_in, int) or isinstance(expires_in, bool) or not 0 < expires_in <= max_ttl:
+        return jsonify({'error': f'有效期必须在 1 到 {max_ttl} 秒之间'}), 400
+    if not isinstance(operations, list) or not operations or not set(operations) <= {'download', 'preview'}:
+        return jsonify({'error': 'operations 只能包含 download 和 preview'}), 400
+
+    record = db.session.get(ShareLinkEpoch, file_record.id)
+    if record is None:
+        record = ShareLinkEpoch(file_id=file_record.id, epoch=0)
+        db.session.add(record)
+        db.session.commit()
+    share_links.set_epoch(file_record.id, record.epoch)
+
+    expires_at = int(time.time()) + expires_in
+    token = share_links.sign(
+        file_record.id, file_storage_key(file_record), file_record.hash, os.path.basename(file_record.path),
+        file_record.size, expires_at, sorted(set(operations)), record.epoch, file_record.is_public
+    )
+    return jsonify({
+        'token': token,
+        'url': f'/api/s/{token}',
+        'expires_at': datetime.utcfromtimestamp(expires_at).isoformat() + 'Z',
+        'operations': sorted(set(operations))
+    }), 201
+
+@api_bp.route('/api/files/<int:file_id>/links', methods=['DELETE'])
+@jwt_required()
+def revoke_file_share_links(file_id):
+    """撤销文件已签发的全部分享链接。"""
+    current_user = get_current_user()
+    file_record = get_live_file(file_id)
+    if not current_user or not file_record:
+        return jsonify({'error': '文件不存在'}), 404
+    if not (file_record.owner_id == current_user.id or current_user.role == UserRole.ADMIN):
+        return jsonify({'error': '没有权限撤销此文件的链接'}), 403
+    revoke_share_links([file_record.id])
+    db.session.commit()
+    return jsonify({'message': '已撤销该文件的全部分享链接'})
+
+def _verify_share_link(token, operation):
+    """返回 (声明, 错误响应)，只校验签名、有效期和缓存中的撤销纪元。"""
+    try:
+        return share_links.verify(token, operation), None
+    except ShareLinkError as e:
+        return None, (jsonify({'error': str(e)}), e.status)
+
+def _share_link_cache_control(claims):
+    """链接内容由哈希固定，可以缓存；公开文件允许共享缓存，最长缓存时间同时是撤销在缓存中的最长延迟。"""
+    max_age = max(0, min(current_app.config['SHARE_LINK_CACHE_MAX_AGE'], claims['x'] - int(time.time())))
+    return f"{'public' if claims['pub'] else 'private'}, max-age={max_age}"
+
+@api_bp.route('/api/s/<token>', methods=['GET'])
+def download_share_link(token):
+    """通过签名分享链接下载，不需要登录，也不查询数据库。"""
+    claims, error = _verify_share_link(token, 'download')
+    if error:
+        return error
+    cache_control = _share_link_cache_control(claims)
+    if claims['h'] in request.if_none_match:
+        response = Response(status=304)
+    else:
+        key = claims['k']
+        local_path = offload_path(key)
+        if local_path is not None:
+            response = offload_download(key, local_path, claims['n'])
+        else:
+            # 匿名下载按链接对应的文件分别计算传输名额
+            _, error = admit_transfer(f"share:{claims['f']}", 'download', claims['s'])
+            if error:
+                return error
+            response = stream_transfer(send_stored_file(key, claims['n'], size=claims['s']))
+        if isinstance(response, tuple):
+            return response
+    response.set_etag(claims['h'])
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+@api_bp.route('/api/s/<token>/preview', methods=['GET'])
+def preview_share_link(token):
+    claims, error = _verify_share_link(token, 'preview')
+    if error:
+        return error
+    return _preview_response(
+        claims['h'], claims['n'], claims['s'], claims['k'], cache_control=_share_link_cache_control(claims)
+    )
+
+def grok_job_dir():
+    """批量解析结果文件所在目录。"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], '.grok_jobs')
+
+def _grok_job_payload(job):
+    return {
+        'id': job.id,
+        'file_id': job.file_id,
+        'pattern': job.pattern,
+        'format': job.output_format,
+        'status': job.status,
+        'bytes_total': job.bytes_total,
+        'bytes_done': job.bytes_done,
+        'matched': job.matched,
+        'unmatched': job.unmatched,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def _emit_grok_job(job):
+    socketio.emit('grok_job_progress', _grok_job_payload(job), to=user_room(job.owner_id))
+
+def run_grok_job(app, job_id):
+    """后台任务：把文件分片交给进程池解析，分片完成时更新进度并推送给任务所有者。"""
+    with app.app_context():
+        job = db.session.get(GrokJob, job_id)
+        file_record = db.session.get(File, job.file_id) if job else None
+        if not job or not file_record:
+            return
+
+        def report(bytes_done, bytes_total, matched, unmatched):
+            job.bytes_done = bytes_done
+            job.bytes_total = bytes_total
+            job.matched = matched
+            job.unmatched = unmatched
+            db.session.commit()
+            _emit_grok_job(job)
+
+        try:
+            job.status = 'running'
+            db.session.commit()
+            _emit_grok_job(job)
+
+            os.makedirs(grok_job_dir(), exist_ok=True)
+            result_path = os.path.join(grok_job_dir(), f'{job.id}.{job.output_format}')
+            # 分片解析需要按偏移读取真实文件，远程存储的文件先下载到本地临时文件
+            with storage.local_copy(file_storage_key(file_record)) as source_path:
+                grok_jobs.run_bulk_parse(
+                    source_path,
+                    job.pattern,
+                    json.loads(job.pattern_files) if job.pattern_files else None,
+                    job.output_format,
+                    result_path,
+                    progress=report,
+                    sleep=socketio.sleep,
+                    executor=grok_jobs.get_executor(app.config['GROK_JOB_WORKERS']),
+                    shard_size=app.config['GROK_JOB_SHARD_SIZE'],
+                    cpu_limit=app.config['GROK_JOB_CPU_LIMIT'],
+                    overlay=load_pattern_overlay(job.owner_id)
+                )
+            job.result_path = os.path.basename(result_path)
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Grok 批量解析失败: %s", e)
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            _emit_grok_job(job)
+            db.session.remove()
+
+def recover_grok_jobs(app):
+    """把上次进程退出时仍在运行的任务标记为失败，它们的进度已无法恢复。"""
+    with app.app_context():
+        try:
+            interrupted = GrokJob.query.filter_by(status='running').all()
+            for job in interrupted:
+                job.status = 'failed'
+                job.error = '服务重启，任务中断'
+                job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return len(interrupted)
+        finally:
+            db.session.remove()
+
+def run_grok_job_dispatcher(app):
+    """后台任务（external 模式）：轮询 pending 任务，逐个交给 run_grok_job 执行。"""
+    dispatched = set()
+
+    def run(job_id):
+        try:
+            run_grok_job(app, job_id)
+        finally:
+            dispatched.discard(job_id)
+
+    while True:
+        with app.app_context():
+            try:
+                pending = db.session.execute(
+                    db.select(GrokJob.id).filter_by(status='pending').order_by(GrokJob.id)
+                ).scalars().all()
+            except Exception as e:
+                logger.error("读取待执行的 grok 任务失败: %s", e)
+                pending = []
+            finally:
+                db.session.remove()
+        for job_id in pending:
+            if job_id not in dispatched:
+                dispatched.add(job_id)
+                socketio.start_background_task(run, job_id)
+        socketio.sleep(app.config['GROK_JOB_POLL_INTERVAL'])
+
+@api_bp.route('/api/files/<int:file_id>/grok', methods=['POST'])
+@jwt_required()
+def create_grok_job(file_id):
+    """对已上传的文件启动 grok 批量解析任务。
+
+    请求格式: {pattern, format: ndjson|csv, files?}，进度通过 grok_job_progress 事件推送。
+    """
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+
+    file_record = get_live_file(file_id)
+    if not file_record:
+        return jsonify({'error': '文件不存在'}), 404
+    if not can_read_file(current_user, file_record):
+        return jsonify({'error': '没有权限读取此文件'}), 403
+
+    data = request.get_json(silent=True) or {}
+    expression = data.get('pattern')
+    output_format = data.get('format', 'ndjson')
+    pattern_files = data.get('files')
+    if not isinstance(expression, str) or not expression:
+        return jsonify({'error': '缺少 grok 表达式'}), 400
+    if output_format not in grok_jobs.OUTPUT_FORMATS:
+        return jsonify({'error': '输出格式只支持 ndjson 或 csv'}), 400
+    if pattern_files is not None and (
+        not isinstance(pattern_files, list) or not all(isinstance(name, str) for name in pattern_files)
+    ):
+        return jsonify({'error': 'files 必须是文件名列表'}), 400
+
+    # 先在当前进程编译一次，表达式有误时直接返回而不是等子进程失败
+    try:
+        grok_engine.compile(expression, pattern_files, load_pattern_overlay(current_user.id))
+    except GrokError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job = GrokJob(
+        owner_id=current_user.id,
+        file_id=file_record.id,
+        pattern=expression,
+        pattern_files=json.dumps(pattern_files) if pattern_files is not None else None,
+        output_format=output_format,
+        bytes_total=file_record.size
+    )
+    db.session.add(job)
+    db.session.commit()
+    # external 模式下由服务进程的调度器领取 pending 任务
+    if current_app.config['BACKGROUND_SERVICES'] == 'inline':
+        socketio.start_background_task(run_grok_job, current_app._get_current_object(), job.id)
+    return jsonify(_grok_job_payload(job)), 202
+
+def _purge_grok_jobs(*criteria):
+    """删除满足任一条件的任务记录和结果文件，由调用方提交事务。"""
+    for job in GrokJob.query.filter(db.or_(*criteria)).all():
+        if job.result_path:
+            result_path = os.path.join(grok_job_dir(), job.result_path)
+            if os.path.exists(result_path):
+                os.remove(result_path)
+        db.session.delete(job)
+
+def _get_owned_grok_job(job_id):
+    current_user = get_current_user()
+    job = db.session.get(GrokJob, job_id)
+    if not current_user or not job or job.owner_id != current_user.id:
+        return None
+    return job
+
+@api_bp.route('/api/grok/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_grok_job(job_id):
+    job = _get_owned_grok_job(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(_grok_job_payload(job))
+
+@api_bp.route('/api/grok/jobs/<int:job_id>/result', methods=['GET'])
+@jwt_required()
+def download_grok_job_result(job_id):
+    """流式下载解析结果，NDJSON 每行一条记录，CSV 首行为字段表头。"""
+    job = _get_owned_grok_job(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    if job.status != 'done' or not job.result_path:
+        return jsonify({'error': '任务尚未完成'}), 409
+
+    result_path = os.path.join(grok_job_dir(), job.result_path)
+    if not os.path.exists(result_path):
+        return jsonify({'error': '结果文件不存在'}), 404
+    mimetype = 'text/csv' if job.output_format == 'csv' else 'application/x-ndjson'
+    return send_file(result_path, mimetype=mimetype, as_attachment=True,
+                     download_name=f'grok-job-{job.id}.{job.output_format}')
+
+def load_pattern_overlay(user_id):
+    """返回用户自定义模式组成的覆盖层，没有自定义模式时返回 None 只使用内置模式库。"""
+    rows = db.session.query(CustomPattern.name, CustomPattern.pattern).filter_by(owner_id=int(user_id)).all()
+    if not rows:
+        return None
+    return PatternOverlay(int(user_id), dict(rows))
+
+set_overlay_loader(load_pattern_overlay)
+
+def _custom_pattern_payload(custom_pattern):
+    return {
+        'name': custom_pattern.name,
+        'pattern': custom_pattern.pattern,
+        'updated_at': custom_pattern.updated_at.isoformat()
+    }
+
+@api_bp.route('/api/patterns/custom', methods=['GET'])
+@jwt_required()
+def list_custom_patterns():
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+    patterns = CustomPattern.query.filter_by(owner_id=current_user.id).order_by(CustomPattern.name).all()
+    return jsonify([_custom_pattern_payload(item) for item in patterns])
+
+@api_bp.route('/api/patterns/custom/<name>', methods=['PUT'])
+@jwt_required()
+def save_custom_pattern(name):
+    """新增或修改自定义模式，同名时覆盖内置模式；保存前确认其能与现有模式一起编译。"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+
+    pattern = (request.get_json(silent=True) or {}).get('pattern')
+    reference = GROK_REFERENCE.fullmatch(f'%{{{name}}}')
+    if not reference or len(name) > 100:
+        return jsonify({'error': '模式名称只能包含字母、数字和下划线'}), 400
+    if not isinstance(pattern, str) or not pattern.strip():
+        return jsonify({'error': '缺少模式定义'}), 400
+    if len(pattern) > CUSTOM_PATTERN_MAX_LENGTH:
+        return jsonify({'error': f'模式定义超过最大长度限制 ({CUSTOM_PATTERN_MAX_LENGTH} 字符)'}), 400
+
+    custom_pattern = CustomPattern.query.filter_by(owner_id=current_user.id, name=name).first()
+    limit = current_app.config['CUSTOM_PATTERN_LIMIT']
+    if not custom_pattern and CustomPattern.query.filter_by(owner_id=current_user.id).count() >= limit:
+        return jsonify({'error': f'自定义模式数量已达上限 ({limit})'}), 400
+
+    overlay = load_pattern_overlay(current_user.id) or PatternOverlay(current_user.id, {})
+    overlay.patterns[name] = pattern.strip()
+    try:
+        # 临时覆盖层不写入缓存，校验失败不会影响已有的编译结果
+        grok_engine.compile(reference.group(0), overlay=PatternOverlay(None, overlay.patterns))
+    except GrokError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if custom_pattern:
+        custom_pattern.pattern = pattern.strip()
+        custom_pattern.updated_at = datetime.utcnow()
+    else:
+        custom_pattern = CustomPattern(owner_id=current_user.id, name=name, pattern=pattern.strip())
+        db.session.add(custom_pattern)
+    db.session.commit()
+    return jsonify(_custom_pattern_payload(custom_pattern))
+
+@api_bp.route('/api/patterns/custom/<name>', methods=['DELETE'])
+@jwt_required()
+def delete_custom_pattern(name):
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+    custom_pattern = CustomPattern.query.filter_by(owner_id=current_user.id, name=name).first()
+    if not custom_pattern:
+        return jsonify({'error': '自定义模式不存在'}), 404
+    db.session.delete(custom_pattern)
+    db.session.commit()
+    return jsonify({'message': '自定义模式已删除'})
+
+@api_bp.route('/api/files/<int:file_id>/share', methods=['POST'])
 @jwt_required()
 def share_file(file_id):
     current_user = User.query.get(get_jwt_identity())
-    file_record = File.query.get(file_id)
+    file_record = get_live_file(file_id)
     
     if not file_record:
         return jsonify({'error': '文件不存在'}), 404
@@ -983,11 +2281,11 @@ def share_file(file_id):
 
     return jsonify({'error': '无效的共享类型'}), 400
 
-@app.route('/api/files/<int:file_id>/share', methods=['DELETE'])
+@api_bp.route('/api/files/<int:file_id>/share', methods=['DELETE'])
 @jwt_required()
 def unshare_file(file_id):
     current_user = User.query.get(get_jwt_identity())
-    file_record = File.query.get(file_id)
+    file_record = get_live_file(file_id)
     
     if not file_record:
         return jsonify({'error': '文件不存在'}), 404
@@ -999,6 +2297,9 @@ def unshare_file(file_id):
     share_type = data.get('type')
 
     if share_type == 'public':
+        if file_record.is_public:
+            # 已签发的链接带着公开状态并据此允许共享缓存，取消公开后须作废
+            revoke_share_links([file_record.id])
         file_record.is_public = False
         db.session.commit()
         return jsonify({'message': '文件已取消公开'})
@@ -1026,11 +2327,11 @@ def unshare_file(file_id):
 
     return jsonify({'error': '无效的共享类型'}), 400
 
-@app.route('/api/files/<int:file_id>', methods=['DELETE'])
+@api_bp.route('/api/files/<int:file_id>', methods=['DELETE'])
 @jwt_required()
 def delete_file(file_id):
     current_user = User.query.get(get_jwt_identity())
-    file_record = File.query.get(file_id)
+    file_record = get_live_file(file_id)
     
     if not file_record:
         return jsonify({'error': '文件不存在'}), 404
@@ -1039,41 +2340,651 @@ def delete_file(file_id):
         return jsonify({'error': '没有权限删除此文件'}), 403
         
     try:
-        # 更新用户已使用的存储空间
+        # 更新用户已使用的存储空间，回收站中的文件不计入
         file_owner = User.query.get(file_record.owner_id)
         if file_owner:
             file_owner.storage_used = max(0, file_owner.storage_used - file_record.size)
         
-        # 删除物理文件
-        file_path = os.path.join(UPLOAD_FOLDER, file_record.path)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            
-        # 删除共享记录
-        FileShare.query.filter_by(file_id=file_id).delete()
-        
-        # 删除文件记录
-        db.session.delete(file_record)
+        # 只移入回收站并撤销分享链接；物理文件、共享记录、版本和 grok 任务在保留期满后由后台回收
+        now = datetime.utcnow()
+        file_record.trashed_at = now
+        file_record.purge_at = now + timedelta(days=current_app.config['TRASH_RETENTION_DAYS'])
+        revoke_share_links([file_id])
         db.session.commit()
         
         # 发送文件更新通知
-        socketio.emit('files_updated', {'message': '文件已删除'})
+        socketio.emit('files_updated', {'message': '文件已移入回收站'})
         
-        return jsonify({'message': '文件删除成功'})
+        return jsonify({'message': '文件已移入回收站', 'purge_at': file_record.purge_at.isoformat()})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'删除文件时发生错误: {str(e)}'}), 500
 
+def _trash_payload(file_record, owner_email):
+    return {
+        'id': file_record.id,
+        'path': file_record.path,
+        'size': file_record.size,
+        'owner': owner_email,
+        'trashed_at': file_record.trashed_at.isoformat(),
+        'purge_at': file_record.purge_at.isoformat()
+    }
+
+def _get_trashed_file(current_user, file_id):
+    """返回 (回收站中的文件, 错误响应)，只有所有者和管理员可以操作。"""
+    file_record = db.session.get(File, file_id)
+    if not current_user or not file_record or file_record.trashed_at is None:
+        return None, (jsonify({'error': '回收站中没有此文件'}), 404)
+    if not (file_record.owner_id == current_user.id or current_user.role == UserRole.ADMIN):
+        return None, (jsonify({'error': '没有权限操作此文件'}), 403)
+    return file_record, None
+
+@api_bp.route('/api/trash', methods=['GET'])
+@jwt_required()
+def list_trash():
+    """列出回收站中的文件，管理员可以看到所有用户的。"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+    query = db.select(File, User.email).join(User, User.id == File.owner_id).where(File.trashed_at.isnot(None))
+    if current_user.role != UserRole.ADMIN:
+        query = query.where(File.owner_id == current_user.id)
+    rows = db.session.execute(query.order_by(File.trashed_at.desc())).all()
+    return jsonify([_trash_payload(file_record, email) for file_record, email in rows])
+
+@api_bp.route('/api/trash/<int:file_id>/restore', methods=['POST'])
+@jwt_required()
+def restore_trashed_file(file_id):
+    current_user = get_current_user()
+    file_record, error = _get_trashed_file(current_user, file_id)
+    if error:
+        return error
+    if File.query.filter_by(path=file_record.path, owner_id=file_record.owner_id, trashed_at=None).first():
+        return jsonify({'error': '已存在同名文件，请先删除或重命名'}), 409
+    owner = db.session.get(User, file_record.owner_id)
+    if owner.storage_used + file_record.size > owner.storage_limit:
+        return jsonify({'error': '存储空间不足'}), 400
+
+    owner.storage_used += file_record.size
+    file_record.trashed_at = None
+    file_record.purge_at = None
+    db.session.commit()
+    socketio.emit('files_updated', {'message': '文件已从回收站恢复'})
+    return jsonify({'message': '文件已恢复'})
+
+@api_bp.route('/api/trash/<int:file_id>', methods=['DELETE'])
+@jwt_required()
+def purge_trashed_file(file_id):
+    """彻底删除回收站中的文件：提前到期，由下一轮后台回收删除物理文件。"""
+    current_user = get_current_user()
+    file_record, error = _get_trashed_file(current_user, file_id)
+    if error:
+        return error
+    file_record.purge_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify({'message': f"文件将在 {current_app.config['TRASH_PURGE_INTERVAL']} 秒内被彻底删除"}), 202
+
+@api_bp.route('/api/trash', methods=['DELETE'])
+@jwt_required()
+def empty_trash():
+    """清空当前用户的回收站。"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+    count = File.query.filter(
+        File.owner_id == current_user.id, File.trashed_at.isnot(None)
+    ).update({File.purge_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    return jsonify({'message': f"回收站将在 {current_app.config['TRASH_PURGE_INTERVAL']} 秒内清空", 'count': count}), 202
+
+def queue_blob_deletions(key_select, notify_user_id):
+    """登记待回收的存储对象，key_select 为只选出对象键的查询，由调用方提交事务。"""
+    db.session.execute(
+        db.insert(BlobDeletion).from_select(
+            ['storage_key', 'notify_user_id'],
+            db.select(key_select.subquery().c[0], db.literal(notify_user_id))
+        )
+    )
+
+def _blob_in_use(key):
+    """平铺文件名可能被删除后同名的新上传重新占用，这时不能删除。"""
+    return db.session.execute(
+        db.select(File.id).where(db.or_(
+            File.storage_key == key,
+            db.and_(File.storage_key.is_(None), File.path == key)
+        )).limit(1)
+    ).first() is not None
+
+def _emit_trash_progress(purged):
+    """向相关用户推送本轮回收进度：已删除数和仍在排队的数目。"""
+    remaining = dict(db.session.execute(
+        db.select(File.owner_id, db.func.count()).where(
+            File.owner_id.in_(purged), File.purge_at <= datetime.utcnow()
+        ).group_by(File.owner_id)
+    ).all())
+    for user_id, count in db.session.execute(
+        db.select(BlobDeletion.notify_user_id, db.func.count()).where(
+            BlobDeletion.notify_user_id.in_(purged)
+        ).group_by(BlobDeletion.notify_user_id)
+    ).all():
+        remaining[user_id] = remaining.get(user_id, 0) + count
+    for user_id, count in purged.items():
+        socketio.emit('trash_purge_progress', {
+            'purged': count,
+            'remaining': remaining.get(user_id, 0)
+        }, to=user_room(user_id))
+
+def purge_trash(now=None, batch_size=None):
+    """后台维护任务：分批物理删除保留期已满的回收站文件和随用户删除登记的存储对象。
+
+    每批先删除物理文件再删除记录并提交，中途失败时剩下的记录下次重试，删除不存在的对象会被忽略；
+    批与批之间让出协程，并向相关用户推送进度。返回删除的文件数、存储对象数和释放的字节数。
+    """
+    now = now or datetime.utcnow()
+    batch_size = batch_size or current_app.config['TRASH_PURGE_BATCH']
+    result = {'files': 0, 'blobs': 0, 'bytes': 0}
+    purged = {}
+    while True:
+        records = File.query.filter(File.purge_at <= now).order_by(File.purge_at).limit(batch_size).all()
+        if not records:
+            break
+        file_ids = [record.id for record in records]
+        for record in records:
+            storage.delete(file_storage_key(record))
+        FileShare.query.filter(FileShare.file_id.in_(file_ids)).delete(synchronize_session=False)
+        _purge_grok_jobs(GrokJob.file_id.in_(file_ids))
+        # 不再被引用的数据块由版本清理任务回收
+        _purge_file_versions(FileVersion.file_id.in_(file_ids))
+        for record in records:
+            purged[record.owner_id] = purged.get(record.owner_id, 0) + 1
+            result['bytes'] += record.size
+            db.session.delete(record)
+        db.session.commit()
+        result['files'] += len(records)
+        metrics.TRASH_PURGED.inc('file', amount=len(records))
+        _emit_trash_progress(purged)
+        socketio.sleep(0)
+
+    while True:
+        blobs = BlobDeletion.query.order_by(BlobDeletion.id).limit(batch_size).all()
+        if not blobs:
+            break
+        for blob in blobs:
+            if not _blob_in_use(blob.storage_key):
+                storage.delete(blob.storage_key)
+            if blob.notify_user_id is not None:
+                purged[blob.notify_user_id] = purged.get(blob.notify_user_id, 0) + 1
+            db.session.delete(blob)
+        db.session.commit()
+        result['blobs'] += len(blobs)
+        metrics.TRASH_PURGED.inc('blob', amount=len(blobs))
+        _emit_trash_progress(purged)
+        socketio.sleep(0)
+    return result if result['files'] or result['blobs'] else None
+
+def _insert_missing_chunks(manifest):
+    """登记新数据块；并发上传相同内容时以先提交者为准，不报主键冲突。"""
+    rows = [{'hash': chunk_hash, 'size': size} for chunk_hash, size in dict(manifest).items()]
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        statement = sqlite.insert(Chunk).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(Chunk).on_conflict_do_nothing()
+    else:
+        existing = set(db.session.execute(
+            db.select(Chunk.hash).where(Chunk.hash.in_([row['hash'] for row in rows]))
+        ).scalars())
+        rows = [row for row in rows if row['hash'] not in existing]
+        statement = db.insert(Chunk)
+    batch = current_app.config['MAINTENANCE_BATCH']
+    for start in range(0, len(rows), batch):
+        db.session.execute(statement, rows[start:start + batch])
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_manifest(version, manifest):
+    _insert_missing_chunks(manifest)
+    version.chunk_count = len(manifest)
+    rows = [
+        {'version_id': version.id, 'seq': seq, 'chunk_hash': chunk_hash}
+        for seq, (chunk_hash, _) in enumerate(manifest)
+    ]
+    batch = current_app.config['MAINTENANCE_BATCH']
+    for start in range(0, len(rows), batch):
+        db.session.execute(db.insert(FileVersionChunk), rows[start:start + batch])
+
+def add_file_version(file_record, file_hash, size, manifest, user_id, restored_from=None):
+    """为文件追加一个版本，由调用方提交事务。
+
+    manifest 为按顺序的 [(块哈希, 块大小), ...]；传 None 表示内容只在存储后端保存了完整文件，
+    尚未分块入库，等被新内容取代时由 archive_current_version 补上清单。
+    """
+    latest = db.session.execute(
+        db.select(db.func.max(FileVersion.version)).where(FileVersion.file_id == file_record.id)
+    ).scalar() or 0
+    version = FileVersion(
+        file_id=file_record.id,
+        version=latest + 1,
+        hash=file_hash,
+        size=size,
+        chunk_count=0,
+        created_by=user_id,
+        restored_from=restored_from
+    )
+    db.session.add(version)
+    db.session.flush()
+    if manifest is not None:
+        _write_manifest(version, manifest)
+    return version
+
+def _latest_file_version(file_record):
+    return FileVersion.query.filter_by(file_id=file_record.id).order_by(FileVersion.version.desc()).first()
+
+def _version_archived(version):
+    return version.chunk_count > 0 or version.size == 0
+
+def archive_current_version(file_record):
+    """当前内容即将被取代时，把存储后端中的完整文件分块入库，由调用方提交事务。
+
+    最新版本平时只存一份完整文件，不再同时存一份数据块；被取代后才需要从数据块读取。
+    文件若在版本之外被改动过（如目录监控同步的修改），清单按实际内容更正，保证恢复出的正是被取代的内容。
+    """
+    version = _latest_file_version(file_record)
+    if version is None or _version_archived(version):
+        return
+    try:
+        source = storage.open_file(file_storage_key(file_record))
+    except FileNotFoundError:
+        logger.warning("文件 %s 的当前内容已不存在，版本 %d 无法归档", file_record.path, version.version)
+        return
+    with source:
+        file_hash, size, manifest, stored = chunk_store.ingest_stream(source)
+    metrics.CHUNK_STORE_BYTES.inc('stored', amount=stored)
+    metrics.CHUNK_STORE_BYTES.inc('deduplicated', amount=size - stored)
+    if file_hash != version.hash:
+        logger.warning("文件 %s 在版本 %d 之后被直接修改，按实际内容归档", file_record.path, version.version)
+        version.hash = file_hash
+        version.size = size
+    _write_manifest(version, manifest)
+
+def version_manifest(version):
+    """按顺序返回版本的 [(块哈希, 块大小), ...]。"""
+    return db.session.execute(
+        db.select(FileVersionChunk.chunk_hash, Chunk.size)
+        .join(Chunk, Chunk.hash == FileVersionChunk.chunk_hash)
+        .where(FileVersionChunk.version_id == version.id)
+        .order_by(FileVersionChunk.seq)
+    ).all()
+
+def _delete_versions(version_ids):
+    FileVersionChunk.query.filter(FileVersionChunk.version_id.in_(version_ids)).delete(synchronize_session=False)
+    FileVersion.query.filter(FileVersion.id.in_(version_ids)).delete(synchronize_session=False)
+
+def _purge_file_versions(*criteria):
+    """删除满足任一条件的版本及其清单，由调用方提交事务。"""
+    version_ids = db.session.execute(db.select(FileVersion.id).where(db.or_(*criteria))).scalars().all()
+    batch = current_app.config['MAINTENANCE_BATCH']
+    for start in range(0, len(version_ids), batch):
+        _delete_versions(version_ids[start:start + batch])
+
+def prune_file_versions(now=None, batch_size=None):
+    """后台维护任务：按保留策略删除旧版本，再回收不再被任何版本引用的数据块。
+
+    每个文件的最新版本始终保留。刚写入或刚被复用的数据块在 CHUNK_GC_GRACE 秒内不回收，
+    避免删掉正在上传、尚未提交清单的块。返回删除的版本数、数据块数和字节数。
+    """
+    now = now or datetime.utcnow()
+    batch_size = batch_size or current_app.config['MAINTENANCE_BATCH']
+    result = {'versions': 0, 'chunks': 0, 'bytes': 0}
+
+    ranked = db.select(
+        FileVersion.id,
+        FileVersion.created_at,
+        db.func.row_number().over(
+            partition_by=FileVersion.file_id,
+            order_by=FileVersion.version.desc()
+        ).label('rank')
+    ).subquery()
+    conditions = []
+    keep = current_app.config['FILE_VERSION_KEEP']
+    max_age_days = current_app.config['FILE_VERSION_MAX_AGE_DAYS']
+    if keep:
+        conditions.append(ranked.c.rank > keep)
+    if max_age_days:
+        cutoff = now - timedelta(days=max_age_days)
+        conditions.append(db.and_(ranked.c.rank > 1, ranked.c.created_at < cutoff))
+    while conditions:
+        version_ids = db.session.execute(
+            db.select(ranked.c.id).where(db.or_(*conditions)).limit(batch_size)
+        ).scalars().all()
+        if not version_ids:
+            break
+        _delete_versions(version_ids)
+        db.session.commit()
+        result['versions'] += len(version_ids)
+        socketio.sleep(0)
+
+    referenced = db.select(FileVersionChunk.version_id).where(FileVersionChunk.chunk_hash == Chunk.hash).exists()
+    after = ''
+    wall_now = time.time()
+    grace = current_app.config['CHUNK_GC_GRACE']
+    while True:
+        candidates = db.session.execute(
+            db.select(Chunk.hash, Chunk.size)
+            .where(~referenced, Chunk.hash > after)
+            .order_by(Chunk.hash)
+            .limit(batch_size)
+        ).all()
+        if not candidates:
+            break
+        after = candidates[-1].hash
+        stale = [row for row in candidates if chunk_store.is_stale(row.hash, grace, wall_now)]
+        if stale:
+            # 删除时再次确认没有引用，查询之后刚提交的清单不会丢块
+            Chunk.query.filter(
+                Chunk.hash.in_([row.hash for row in stale]), ~referenced
+            ).delete(synchronize_session=False)
+            for row in stale:
+                chunk_store.delete(row.hash)
+            db.session.commit()
+            result['chunks'] += len(stale)
+            result['bytes'] += sum(row.size for row in stale)
+        socketio.sleep(0)
+    return result if any(result.values()) else None
+
+def _file_version_payload(version, latest):
+    return {
+        'version': version.version,
+        'size': version.size,
+        'hash': version.hash,
+        'chunks': version.chunk_count,
+        'created_at': version.created_at.isoformat(),
+        'created_by': version.created_by,
+        'restored_from': version.restored_from,
+        'current': version.version == latest
+    }
+
+def _get_file_version(file_record, version_number):
+    return FileVersion.query.filter_by(file_id=file_record.id, version=version_number).first()
+
+@api_bp.route('/api/files/<int:file_id>/versions', methods=['GET'])
+@jwt_required()
+def list_file_versions(file_id):
+    current_user = get_current_user()
+    file_record = get_live_file(file_id)
+    if not current_user or not file_record:
+        return jsonify({'error': '文件不存在'}), 404
+    if not can_read_file(current_user, file_record):
+        return jsonify({'error': '没有权限查看此文件'}), 403
+
+    versions = FileVersion.query.filter_by(file_id=file_id).order_by(FileVersion.version.desc()).all()
+    latest = versions[0].version if versions else None
+    return jsonify({
+        'file_id': file_id,
+        'path': file_record.path,
+        'versions': [_file_version_payload(version, latest) for version in versions]
+    })
+
+@api_bp.route('/api/files/<int:file_id>/versions/<int:version_number>/download', methods=['GET'])
+@jwt_required()
+def download_file_version(file_id, version_number):
+    """按清单依次读取数据块，流式返回任一历史版本，不需要先拼出完整文件。"""
+    current_user = get_current_user()
+    file_record = get_live_file(file_id)
+    if not current_user or not file_record:
+        return jsonify({'error': '文件不存在'}), 404
+    if not can_read_file(current_user, file_record):
+        return jsonify({'error': '没有权限下载此文件'}), 403
+    version = _get_file_version(file_record, version_number)
+    if not version:
+        return jsonify({'error': '版本不存在'}), 404
+
+    _, error = admit_transfer(current_user.id, 'download', version.size)
+    if error:
+        return error
+
+    if _version_archived(version):
+        chunk_hashes = [chunk_hash for chunk_hash, _ in version_manifest(version)]
+        body = chunk_store.iter_content(chunk_hashes)
+    else:
+        # 尚未被取代的最新版本只有存储后端中的完整文件
+        try:
+            body = storage.open_stream(file_storage_key(file_record))
+        except FileNotFoundError:
+            return jsonify({'error': '文件不存在'}), 404
+    response = Response(body, mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(version.size)
+    response.headers['Content-Disposition'] = _attachment_disposition(
+        f'v{version.version}-{os.path.basename(file_record.path)}'
+    )
+    return stream_transfer(response)
+
+@api_bp.route('/api/files/<int:file_id>/versions/<int:version_number>/restore', methods=['POST'])
+@jwt_required()
+def restore_file_version(file_id, version_number):
+    """把历史版本恢复为当前内容，并记为一个新版本；数据块直接复用，不重复存储。"""
+    current_user = get_current_user()
+    file_record = get_live_file(file_id)
+    if not current_user or not file_record:
+        return jsonify({'error': '文件不存在'}), 404
+    if not (file_record.owner_id == current_user.id or current_user.role == UserRole.ADMIN):
+        return jsonify({'error': '没有权限恢复此文件'}), 403
+    version = _get_file_version(file_record, version_number)
+    if not version:
+        return jsonify({'error': '版本不存在'}), 404
+
+    owner = db.session.get(User, file_record.owner_id)
+    if owner.storage_used - file_record.size + version.size > owner.storage_limit:
+        return jsonify({'error': '存储空间不足'}), 400
+
+    try:
+        archive_current_version(file_record)
+        manifest = version_manifest(version)
+        staged_path = _staging_path()
+        chunk_store.restore([chunk_hash for chunk_hash, _ in manifest], staged_path)
+        stat = os.stat(staged_path)
+        storage.save(file_storage_key(file_record), staged_path)
+
+        owner.storage_used = max(0, owner.storage_used - file_record.size) + version.size
+        if file_record.hash != version.hash:
+            revoke_share_links([file_record.id])
+        file_record.hash = version.hash
+        file_record.size = version.size
+        file_record.last_modified = datetime.fromtimestamp(stat.st_mtime)
+        restored = add_file_version(
+            file_record, version.hash, version.size, manifest, current_user.id, restored_from=version.version
+        )
+        db.session.commit()
+    except OSError as e:
+        db.session.rollback()
+        logger.error("恢复文件版本失败: %s", e)
+        return jsonify({'error': f'恢复文件版本失败: {str(e)}'}), 500
+
+    socketio.emit('files_updated', {'message': '文件已恢复到历史版本'})
+    return jsonify(_file_version_payload(restored, restored.version))
+
+@api_bp.route('/api/files/versions/usage', methods=['GET'])
+@jwt_required()
+def file_version_usage():
+    """当前用户的版本占用：logical_bytes 为各版本大小之和，unique_bytes 为实际占用的字节数，
+    即去重后引用的数据块大小加上各文件当前内容的完整文件大小。"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+
+    owned_versions = db.select(FileVersion.id).join(File, File.id == FileVersion.file_id).where(
+        File.owner_id == current_user.id
+    )
+    versions, logical_bytes = db.session.execute(
+        db.select(db.func.count(FileVersion.id), db.func.coalesce(db.func.sum(FileVersion.size), 0))
+        .where(FileVersion.id.in_(owned_versions))
+    ).one()
+    owned_chunks = db.select(FileVersionChunk.chunk_hash).where(FileVersionChunk.version_id.in_(owned_versions))
+    chunks, chunk_bytes = db.session.execute(
+        db.select(db.func.count(Chunk.hash), db.func.coalesce(db.func.sum(Chunk.size), 0))
+        .where(Chunk.hash.in_(owned_chunks))
+    ).one()
+    current_bytes = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(File.size), 0)).where(
+            File.owner_id == current_user.id,
+            File.id.in_(db.select(FileVersion.file_id).where(FileVersion.id.in_(owned_versions)))
+        )
+    ).scalar()
+    unique_bytes = chunk_bytes + current_bytes
+    return jsonify({
+        'versions': versions,
+        'logical_bytes': int(logical_bytes),
+        'chunks': chunks,
+        'unique_bytes': int(unique_bytes)
+    })
+
 class ClipboardItem(db.Model):
     __tablename__ = 'clipboard_items'
+    __table_args__ = (
+        db.Index('ix_clipboard_items_owner_hash', 'owner_id', 'content_hash'),
+        db.Index('ix_clipboard_items_owner_updated', 'owner_id', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=True)  # 文本内容
     type = db.Column(db.String(10), nullable=False)  # text, code, image
     image_path = db.Column(db.String(500), nullable=True)  # 图片路径
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    content_hash = db.Column(db.String(64), nullable=True)  # 明文的 HMAC，用于去重
+    size = db.Column(db.BigInteger, nullable=True)  # 明文字节数，用于容量保留策略
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)  # 重复粘贴时刷新
+
+def _clipboard_digest(item_type, data):
+    """类型参与摘要，同样的文本以 text 和 code 粘贴视为两条。"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return crypto.content_digest(item_type.encode('utf-8') + b'\0' + data)
+
+def _touch_duplicate_clipboard_item(owner_id, content_hash):
+    """若已有相同内容的条目，刷新其时间戳并返回该条目。"""
+    item = ClipboardItem.query.filter_by(
+        owner_id=owner_id,
+        content_hash=content_hash
+    ).order_by(ClipboardItem.id.desc()).first()
+    if item:
+        item.updated_at = datetime.utcnow()
+        db.session.commit()
+    return item
+
+def _clipboard_image_key(image_path):
+    return f'clipboard_images/{image_path}'
+
+def _emit_clipboard_item(item, content=None, deduplicated=False):
+    """向条目所有者的其他设备推送精简的新增事件，文本只携带前若干字符预览。"""
+    preview = None
+    truncated = False
+    if content is not None:
+        preview = content[:CLIPBOARD_PREVIEW_CHARS]
+        truncated = len(content) > len(preview)
+    socketio.emit('clipboard_item_created', {
+        'id': item.id,
+        'type': item.type,
+        'preview': preview,
+        'truncated': truncated,
+        'deduplicated': deduplicated,
+        'created_at': item.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'updated_at': (item.updated_at or item.created_at).strftime('%Y-%m-%d %H:%M:%S')
+    }, to=user_room(item.owner_id))
+
+def _emit_clipboard_deleted(owner_id, item_ids):
+    socketio.emit('clipboard_items_deleted', {'ids': list(item_ids)}, to=user_room(owner_id))
+
+def get_clipboard_retention(user):
+    """返回用户生效的保留策略 (max_items, max_age_days, max_bytes)，0 表示不限制。"""
+    config = current_app.config
+    return (
+        config['CLIPBOARD_MAX_ITEMS'] if user.clipboard_max_items is None else user.clipboard_max_items,
+        config['CLIPBOARD_MAX_AGE_DAYS'] if user.clipboard_max_age_days is None else user.clipboard_max_age_days,
+        config['CLIPBOARD_MAX_BYTES'] if user.clipboard_max_bytes is None else user.clipboard_max_bytes
+    )
+
+def _expired_clipboard_items(user, now):
+    """按从新到旧遍历，超出任一限制之后的条目全部过期，返回 (id, image_path) 列表。"""
+    max_items, max_age_days, max_bytes = get_clipboard_retention(user)
+    if not (max_items or max_age_days or max_bytes):
+        return []
+
+    cutoff = now - timedelta(days=max_age_days) if max_age_days else None
+    rows = db.session.query(
+        ClipboardItem.id,
+        ClipboardItem.image_path,
+        ClipboardItem.size,
+        ClipboardItem.updated_at,
+        ClipboardItem.created_at
+    ).filter(
+        ClipboardItem.owner_id == user.id
+    ).order_by(
+        ClipboardItem.updated_at.desc(),
+        ClipboardItem.id.desc()
+    )
+
+    expired = []
+    kept = 0
+    kept_bytes = 0
+    overflow = False
+    for row in rows:
+        size = row.size or 0
+        touched_at = row.updated_at or row.created_at
+        if not overflow:
+            overflow = (
+                (cutoff is not None and touched_at < cutoff)
+                or (max_items and kept >= max_items)
+                or (max_bytes and kept_bytes + size > max_bytes)
+            )
+        if overflow:
+            expired.append((row.id, row.image_path))
+        else:
+            kept += 1
+            kept_bytes += size
+    return expired
+
+def compact_clipboard_items(now=None, batch_size=None):
+    """按保留策略分批删除过期的剪贴板条目及其图片文件，返回删除条数。
 
-@app.route('/api/clipboard', methods=['GET'])
+    每批单独提交并让出协程，避免长时间占用数据库写锁或阻塞请求。
+    """
+    now = now or datetime.utcnow()
+    batch_size = batch_size or current_app.config['CLIPBOARD_COMPACT_BATCH']
+    removed = 0
+    owner_ids = [row[0] for row in db.session.query(ClipboardItem.owner_id).distinct()]
+    for owner_id in owner_ids:
+        user = db.session.get(User, owner_id)
+        if not user:
+            continue
+        expired = _expired_clipboard_items(user, now)
+        for start in range(0, len(expired), batch_size):
+            batch = expired[start:start + batch_size]
+            item_ids = [item_id for item_id, _ in batch]
+            ClipboardItem.query.filter(
+                ClipboardItem.id.in_(item_ids)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            _emit_clipboard_deleted(owner_id, item_ids)
+
+            # 记录已删除后再清理文件，提交失败时不会留下指向空文件的记录
+            for _, image_path in batch:
+                if image_path:
+                    try:
+                        storage.delete(_clipboard_image_key(image_path))
+                    except OSError as e:
+                        logger.error("删除剪贴板图片失败: %s", e)
+            removed += len(batch)
+            socketio.sleep(0)
+    return removed
+
+@api_bp.route('/api/clipboard', methods=['GET'])
 @jwt_required()
 def list_clipboard_items():
     try:
@@ -1081,7 +2992,10 @@ def list_clipboard_items():
         if not current_user:
             return jsonify({'error': '用户未找到'}), 404
             
-        items = ClipboardItem.query.filter_by(owner_id=current_user.id).order_by(ClipboardItem.id.desc()).all()
+        items = ClipboardItem.query.filter_by(owner_id=current_user.id).order_by(
+            ClipboardItem.updated_at.desc(),
+            ClipboardItem.id.desc()
+        ).all()
         result = []
         for item in items:
             try:
@@ -1098,7 +3012,7 @@ def list_clipboard_items():
                     'created_at': item.created_at.strftime('%Y-%m-%d %H:%M:%S')
                 })
             except Exception as e:
-                print(f"解密错误: {str(e)}")  # 调试日志
+                logger.warning("解密错误: %s", e)
                 result.append({
                     'id': item.id,
                     'content': '解密失败',
@@ -1108,10 +3022,10 @@ def list_clipboard_items():
         
         return jsonify(result)
     except Exception as e:
-        print(f"Error in list_clipboard_items: {str(e)}")
+        logger.error("Error in list_clipboard_items: %s", e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/clipboard', methods=['POST'])
+@api_bp.route('/api/clipboard', methods=['POST'])
 @jwt_required()
 def create_clipboard_item():
     current_user = User.query.get(get_jwt_identity())
@@ -1125,32 +3039,44 @@ def create_clipboard_item():
             return jsonify({'error': '只支持图片文件'}), 400
             
         try:
-            # 创建图片存储目录
-            image_dir = os.path.join(UPLOAD_FOLDER, 'clipboard_images')
-            os.makedirs(image_dir, exist_ok=True)
-            
             # 读取文件内容并加密
             file_content = file.read()  # 已经是bytes类型
+
+            # 相同图片重复粘贴时只刷新时间戳，不再写入新文件
+            content_hash = _clipboard_digest('image', file_content)
+            duplicate = _touch_duplicate_clipboard_item(current_user.id, content_hash)
+            if duplicate:
+                _emit_clipboard_item(duplicate, deduplicated=True)
+                return jsonify({
+                    'id': duplicate.id,
+                    'type': duplicate.type,
+                    'image_path': duplicate.image_path,
+                    'created_at': duplicate.created_at.isoformat(),
+                    'updated_at': duplicate.updated_at.isoformat(),
+                    'deduplicated': True
+                }), 200
+
             encrypted_content = crypto.encrypt(file_content)  # 返回bytes类型
             
             # 生成唯一文件名
             timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
             filename = f"{timestamp}_{secure_filename(file.filename)}.enc"
-            file_path = os.path.join(image_dir, filename)
             
             # 直接写入加密后的二进制内容
-            with open(file_path, 'wb') as f:
-                f.write(encrypted_content)
+            storage.put_bytes(_clipboard_image_key(filename), encrypted_content)
             
             # 创建记录
             item = ClipboardItem(
                 type='image',
                 image_path=filename,
-                owner_id=current_user.id
+                owner_id=current_user.id,
+                content_hash=content_hash,
+                size=len(file_content)
             )
             
             db.session.add(item)
             db.session.commit()
+            _emit_clipboard_item(item)
             
             return jsonify({
                 'id': item.id,
@@ -1160,7 +3086,7 @@ def create_clipboard_item():
             }), 201
             
         except Exception as e:
-            print(f"Error saving encrypted image: {e}")  # 调试日志
+            logger.error("Error saving encrypted image: %s", e)
             db.session.rollback()
             return jsonify({'error': f'保存加密图片失败: {str(e)}'}), 500
 
@@ -1170,17 +3096,37 @@ def create_clipboard_item():
             return jsonify({'error': '缺少内容'}), 400
             
         try:
+            item_type = data.get('type', 'text')
+            content_bytes = data['content'].encode('utf-8')
+
+            # 多台设备粘贴同一段内容时只刷新时间戳，不新增记录
+            content_hash = _clipboard_digest(item_type, content_bytes)
+            duplicate = _touch_duplicate_clipboard_item(current_user.id, content_hash)
+            if duplicate:
+                _emit_clipboard_item(duplicate, data['content'], deduplicated=True)
+                return jsonify({
+                    'id': duplicate.id,
+                    'content': data['content'],
+                    'type': duplicate.type,
+                    'created_at': duplicate.created_at.isoformat(),
+                    'updated_at': duplicate.updated_at.isoformat(),
+                    'deduplicated': True
+                }), 200
+
             # 加密文本内容
-            encrypted_content = crypto.encrypt(data['content'])
+            encrypted_content = crypto.encrypt(content_bytes)
             
             item = ClipboardItem(
                 content=encrypted_content,  # 直接存储加密后的内容
-                type=data.get('type', 'text'),
-                owner_id=current_user.id
+                type=item_type,
+                owner_id=current_user.id,
+                content_hash=content_hash,
+                size=len(content_bytes)
             )
             
             db.session.add(item)
             db.session.commit()
+            _emit_clipboard_item(item, data['content'])
             
             return jsonify({
                 'id': item.id,
@@ -1189,11 +3135,55 @@ def create_clipboard_item():
                 'created_at': item.created_at.isoformat()
             }), 201
         except Exception as e:
-            print(f"Error saving encrypted text: {e}")  # 调试日志
+            logger.error("Error saving encrypted text: %s", e)
             db.session.rollback()
             return jsonify({'error': f'保存加密文本失败: {str(e)}'}), 500
 
-@app.route('/api/clipboard/<int:item_id>', methods=['DELETE'])
+@api_bp.route('/api/clipboard/retention', methods=['GET'])
+@jwt_required()
+def get_clipboard_retention_policy():
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+
+    max_items, max_age_days, max_bytes = get_clipboard_retention(current_user)
+    return jsonify({
+        'max_items': max_items,
+        'max_age_days': max_age_days,
+        'max_bytes': max_bytes
+    })
+
+@api_bp.route('/api/clipboard/retention', methods=['PUT'])
+@jwt_required()
+def update_clipboard_retention_policy():
+    """更新当前用户的保留策略；字段为 null 时恢复全局默认值，0 表示不限制。"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': '用户未找到'}), 404
+
+    data = request.get_json(silent=True) or {}
+    fields = {
+        'max_items': 'clipboard_max_items',
+        'max_age_days': 'clipboard_max_age_days',
+        'max_bytes': 'clipboard_max_bytes'
+    }
+    for key, column in fields.items():
+        if key not in data:
+            continue
+        value = data[key]
+        if value is not None:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return jsonify({'error': f'{key} 必须是整数'}), 400
+            if value < 0:
+                return jsonify({'error': f'{key} 不能为负数'}), 400
+        setattr(current_user, column, value)
+
+    db.session.commit()
+    return get_clipboard_retention_policy()
+
+@api_bp.route('/api/clipboard/<int:item_id>', methods=['DELETE'])
 @jwt_required()
 def delete_clipboard_item(item_id):
     current_user = User.query.get(get_jwt_identity())
@@ -1205,18 +3195,17 @@ def delete_clipboard_item(item_id):
     try:
         if item.type == 'image' and item.image_path:
             # 删除图片文件
-            file_path = os.path.join(UPLOAD_FOLDER, 'clipboard_images', item.image_path)
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            storage.delete(_clipboard_image_key(item.image_path))
         
         db.session.delete(item)
         db.session.commit()
+        _emit_clipboard_deleted(current_user.id, [item_id])
         return jsonify({'message': '删除成功'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'删除失败: {str(e)}'}), 500
 
-@app.route('/api/clipboard/image/<int:item_id>')
+@api_bp.route('/api/clipboard/image/<int:item_id>')
 @jwt_required()
 def get_clipboard_image(item_id):
     try:
@@ -1232,13 +3221,11 @@ def get_clipboard_image(item_id):
         if item.type != 'image' or not item.image_path:
             return jsonify({'error': '图片不存在'}), 404
             
-        file_path = os.path.join(UPLOAD_FOLDER, 'clipboard_images', item.image_path)
-        if not os.path.exists(file_path):
-            return jsonify({'error': '图片文件不存在'}), 404
-
         # 读取加密的图片内容
-        with open(file_path, 'rb') as f:
-            encrypted_content = f.read()  # 读取为bytes类型
+        try:
+            encrypted_content = storage.get_bytes(_clipboard_image_key(item.image_path))
+        except FileNotFoundError:
+            return jsonify({'error': '图片文件不存在'}), 404
         
         # 解密图片内容
         try:
@@ -1253,14 +3240,14 @@ def get_clipboard_image(item_id):
                 as_attachment=False
             )
         except Exception as e:
-            print(f"图片解密错误: {str(e)}")  # 调试日志
+            logger.warning("图片解密错误: %s", e)
             return jsonify({'error': '图片解密失败'}), 500
             
     except Exception as e:
-        print(f"读取图片错误: {str(e)}")  # 调试日志
+        logger.error("读取图片错误: %s", e)
         return jsonify({'error': '读取图片失败'}), 500
 
-@app.route('/api/users/<int:user_id>/reset-password', methods=['POST'])
+@api_bp.route('/api/users/<int:user_id>/reset-password', methods=['POST'])
 @jwt_required()
 def reset_password(user_id):
     current_user = User.query.get(get_jwt_identity())
@@ -1288,7 +3275,7 @@ def reset_password(user_id):
     
     return jsonify({'message': '密码重置成功'})
 
-@app.route('/api/users/<int:user_id>', methods=['DELETE'])
+@api_bp.route('/api/users/<int:user_id>', methods=['DELETE'])
 @jwt_required()
 def delete_user(user_id):
     try:
@@ -1306,37 +3293,48 @@ def delete_user(user_id):
         if target_user.role == UserRole.ADMIN:
             return jsonify({'error': '不能删除管理员账户'}), 403
             
-        # 删除用户的文件
-        user_files = File.query.filter_by(owner_id=user_id).all()
-        for file in user_files:
-            file_path = os.path.join(UPLOAD_FOLDER, file.path)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            db.session.delete(file)
-            
-        # 删除用户的剪贴板内容
-        clipboard_items = ClipboardItem.query.filter_by(owner_id=user_id).all()
-        for item in clipboard_items:
-            if item.type == 'image' and item.image_path:
-                file_path = os.path.join(UPLOAD_FOLDER, 'clipboard_images', item.image_path)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            db.session.delete(item)
+        user_file_ids = db.select(File.id).where(File.owner_id == user_id)
+
+        # 删除用户的 grok 解析任务，以及他人针对该用户文件的任务
+        _purge_grok_jobs(GrokJob.owner_id == user_id, GrokJob.file_id.in_(user_file_ids))
+
+        _purge_file_versions(FileVersion.file_id.in_(user_file_ids))
+
+        # 删除用户的文件和剪贴板内容：只用整表语句删除记录，物理文件登记后由后台任务分批删除，
+        # 文件再多也不会在请求中逐个删除文件、长时间占用数据库写锁
+        queue_blob_deletions(
+            db.select(db.func.coalesce(File.storage_key, File.path)).where(File.owner_id == user_id),
+            current_user.id
+        )
+        queue_blob_deletions(
+            db.select(db.literal(_clipboard_image_key('')) + ClipboardItem.image_path).where(
+                ClipboardItem.owner_id == user_id,
+                ClipboardItem.type == 'image',
+                ClipboardItem.image_path.isnot(None)
+            ),
+            current_user.id
+        )
+        revoke_share_links(db.session.scalars(user_file_ids).all())
+        FileShare.query.filter(
+            db.or_(FileShare.file_id.in_(user_file_ids), FileShare.user_id == user_id, FileShare.created_by == user_id)
+        ).delete(synchronize_session=False)
+        File.query.filter_by(owner_id=user_id).delete(synchronize_session=False)
+        ClipboardItem.query.filter_by(owner_id=user_id).delete(synchronize_session=False)
             
-        # 删除用户的文件共享记录
-        FileShare.query.filter_by(user_id=user_id).delete()
-        FileShare.query.filter_by(created_by=user_id).delete()
+        CustomPattern.query.filter_by(owner_id=user_id).delete()
         
         # 删除用户
         db.session.delete(target_user)
         db.session.commit()
+        # 该用户已建立的连接不再接收私有推送；连接本身由 check_socket_sessions 断开
+        socketio.close_room(user_room(user_id))
         
         return jsonify({'message': '用户删除成功'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'删除用户失败: {str(e)}'}), 500
 
-@app.route('/api/users/<int:user_id>', methods=['PUT'])
+@api_bp.route('/api/users/<int:user_id>', methods=['PUT'])
 @jwt_required()
 def update_user(user_id):
     try:
@@ -1392,7 +3390,7 @@ def update_user(user_id):
         db.session.rollback()
         return jsonify({'error': f'更新用户失败: {str(e)}'}), 500
 
-@app.route('/api/clipboard/<int:item_id>')
+@api_bp.route('/api/clipboard/<int:item_id>')
 @jwt_required()
 def get_clipboard_item(item_id):
     try:
@@ -1407,9 +3405,7 @@ def get_clipboard_item(item_id):
             
         if item.type == 'image':
             # 读取并解密图片
-            file_path = os.path.join(UPLOAD_FOLDER, 'clipboard_images', item.image_path)
-            with open(file_path, 'rb') as f:
-                encrypted_content = f.read()
+            encrypted_content = storage.get_bytes(_clipboard_image_key(item.image_path))
             decrypted_content = crypto.decrypt(encrypted_content)
             return send_file(
                 io.BytesIO(decrypted_content),
@@ -1426,25 +3422,238 @@ def get_clipboard_item(item_id):
                 'created_at': item.created_at.isoformat()
             })
     except Exception as e:
-        print(f"Error in get_clipboard_item: {str(e)}")
+        logger.error("Error in get_clipboard_item: %s", e)
         return jsonify({'error': str(e)}), 500
 
-if __name__ == '__main__':
-    init_upload_folder()
-    
-    # 在应用上下文中初始化数据库
+def _create_services(flask_app):
+    """按应用配置创建各应用独立的服务，保存在 app.extensions 中。"""
+    config = flask_app.config
+    upload_folder = config['UPLOAD_FOLDER']
+    try:
+        flask_app.extensions['storage'] = create_storage(
+            config['STORAGE_BACKEND'],
+            upload_folder,
+            endpoint=config['S3_ENDPOINT'],
+            bucket=config['S3_BUCKET'],
+            access_key=config['S3_ACCESS_KEY'],
+            secret_key=config['S3_SECRET_KEY'],
+            region=config['S3_REGION'],
+            prefix=config['S3_PREFIX'],
+            multipart_threshold=config['S3_MULTIPART_THRESHOLD'],
+            part_size=config['S3_PART_SIZE'],
+            concurrency=config['S3_UPLOAD_CONCURRENCY'],
+            timeout=config['S3_TIMEOUT'],
+            cache_dir=os.path.join(upload_folder, '.s3cache'),
+            cache_bytes=config['S3_CACHE_BYTES'],
+            cache_max_object=config['S3_CACHE_MAX_OBJECT']
+        )
+    except ValueError as e:
+        raise RuntimeError(str(e))
+    flask_app.extensions['storage_layout'] = StorageLayout(
+        mode=config['STORAGE_LAYOUT'], depth=config['STORAGE_SHARD_DEPTH']
+    )
+    flask_app.extensions['chunk_store'] = ChunkStore(root=os.path.join(upload_folder, '.chunks'))
+    flask_app.extensions['preview_service'] = PreviewService(
+        directory=os.path.join(upload_folder, '.previews'),
+        max_bytes=config['PREVIEW_CACHE_BYTES'],
+        text_bytes=config['PREVIEW_TEXT_BYTES'],
+        thumbnail_size=config['PREVIEW_THUMBNAIL_SIZE'],
+        archive_entries=config['PREVIEW_ARCHIVE_ENTRIES'],
+        max_image_bytes=config['PREVIEW_MAX_IMAGE_BYTES'],
+        # 使用默认的系统线程生成：threading 没有被 eventlet 替换，Pillow 解码和缩放不会阻塞事件循环，
+        # 图片大小受 PREVIEW_MAX_IMAGE_BYTES 限制
+        workers=config['PREVIEW_WORKERS']
+    )
+    flask_app.extensions['request_profiler'] = RequestProfiler(
+        directory=os.path.join(upload_folder, '.profiles'),
+        retention=config['PROFILE_RETENTION'],
+        interval=config['PROFILE_INTERVAL_MS'] / 1000,
+        sample_rate=config['PROFILE_SAMPLE_RATE']
+    )
+    if config['PROFILE_ENABLED']:
+        enable_request_profiling(flask_app)
+    flask_app.extensions['share_links'] = ShareLinks(
+        secret=config['SHARE_LINK_SECRET'] or config['JWT_SECRET_KEY'],
+        refresh_interval=config['SHARE_LINK_EPOCH_REFRESH'],
+        loader=_load_share_link_epochs
+    )
+
+def configure_process(app):
+    """按应用配置进程内只有一份的服务：日志、SQLite PRAGMA、准入控制、正则执行池、OAuth 客户端和指标开关。
+
+    由启动入口（serve.py、python app.py、基准测试）在创建应用后调用一次；配置已由 create_app 校验。
+    """
+    config = app.config
+    # 配置日志：请求线程只把记录放入队列，格式化和写出在后台线程完成
+    log_pipeline.configure(level=config['LOG_LEVEL'], levels=config['LOG_LEVELS'], queue_size=config['LOG_QUEUE_SIZE'])
+    chunk_log.interval = config['LOG_SAMPLE_INTERVAL']
+    db_profile.sqlite_pragmas.configure(
+        journal_mode=config['SQLITE_JOURNAL_MODE'],
+        synchronous=config['SQLITE_SYNCHRONOUS'],
+        busy_timeout_ms=config['SQLITE_BUSY_TIMEOUT_MS'],
+        mmap_size=config['SQLITE_MMAP_SIZE'],
+        cache_size_kb=config['SQLITE_CACHE_SIZE_KB']
+    )
+    admission.configure(**_admission_options(config))
+    oauth_client.configure(
+        timeout=config['OAUTH_HTTP_TIMEOUT'], max_idle=config['OAUTH_POOL_SIZE'], jwks_ttl=config['OAUTH_JWKS_TTL']
+    )
+    regex_pool.configure(
+        workers=config['REGEX_POOL_WORKERS'],
+        timeout=config['REGEX_TIMEOUT'],
+        cpu_limit=config['REGEX_CPU_LIMIT'],
+        max_queue=config['REGEX_QUEUE_SIZE'],
+        queue_timeout=config['REGEX_QUEUE_TIMEOUT']
+    )
+    metrics.registry.enabled = config['METRICS_ENABLED']
+
+def _maintenance_status_path(config):
+    return os.path.join(config['UPLOAD_FOLDER'], '.maintenance.json')
+
+def _maintenance_task(app, function):
+    """在独立的应用上下文中执行维护任务，失败时回滚会话。"""
+    def run():
+        with app.app_context():
+            try:
+                return function()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+    return run
+
+def register_maintenance_tasks(app):
+    """把后台维护任务注册到进程内的维护调度器并绑定到 app，由 start_background_services 调用。"""
+    config = app.config
+    maintenance.configure(
+        tick=config['MAINTENANCE_TICK'],
+        sleep=socketio.sleep,
+        status_path=_maintenance_status_path(config)
+    )
+    # 启动一分钟后先清理一次积压的登录码和临时文件；剪贴板压缩保持原来的节奏
+    maintenance.register(
+        'magic_codes', _maintenance_task(app, purge_magic_codes), config['MAGIC_CODE_PURGE_INTERVAL'],
+        initial_delay=60
+    )
+    maintenance.register(
+        'attach_tmp', _maintenance_task(app, cleanup_stale_attach_tmp), config['ATTACH_TMP_CLEANUP_INTERVAL'],
+        initial_delay=60
+    )
+    maintenance.register(
+        'clipboard_compaction', _maintenance_task(app, compact_clipboard_items), config['CLIPBOARD_COMPACT_INTERVAL']
+    )
+    maintenance.register(
+        'file_versions', _maintenance_task(app, prune_file_versions), config['FILE_VERSION_PRUNE_INTERVAL']
+    )
+    maintenance.register(
+        'storage_layout', _maintenance_task(app, migrate_storage_layout), config['STORAGE_MIGRATION_INTERVAL']
+    )
+    maintenance.register('trash', _maintenance_task(app, purge_trash), config['TRASH_PURGE_INTERVAL'])
+
+def create_app(config=None):
+    """应用工厂：创建并配置 Flask 应用，config 中的键覆盖环境变量给出的默认配置。
+
+    全部设置合并后统一校验（配置无效时抛出 RuntimeError）并保存在 app.config 中，存储后端、数据块仓库、
+    预览、请求分析和分享链接等服务按应用创建、保存在 app.extensions 中，因此每次调用得到互不影响的实例，
+    测试可以各自使用内存数据库和临时上传目录。进程级服务由 configure_process 配置，
+    后台任务由 start_background_services 启动；Socket.IO 服务在进程内只有一个，绑定到第一个创建的应用。
+    """
+    config = dict(config or {})
+    settings = dict(_DEFAULT_SETTINGS)
+    settings.update((key, value) for key, value in config.items() if key in _SETTING_NAMES)
+    validate_settings(settings)
+
+    flask_app = Flask(__name__)
+
+    # 配置 CORS，允许指定源的跨域请求
+    CORS(flask_app, origins=settings['ALLOWED_ORIGINS'], supports_credentials=True)
+
+    flask_app.config.update(settings)
+    flask_app.config['MAX_CONTENT_LENGTH'] = settings['MAX_UPLOAD_SIZE']
+    flask_app.config.update(config)
+    flask_app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', db_profile.engine_options(
+        flask_app.config['SQLALCHEMY_DATABASE_URI'],
+        pool_size=settings['DB_POOL_SIZE'],
+        max_overflow=settings['DB_MAX_OVERFLOW'],
+        pool_timeout=settings['DB_POOL_TIMEOUT'],
+        pool_recycle=settings['DB_POOL_RECYCLE']
+    ))
+
+    db.init_app(flask_app)
+    jwt.init_app(flask_app)
+    _create_services(flask_app)
+
+    # 关闭指标时不安装任何钩子
+    if settings['METRICS_ENABLED']:
+        flask_app.before_request(start_request_metrics)
+        flask_app.after_request(record_request_metrics)
+        if not event.contains(Engine, 'before_cursor_execute', count_db_query):
+            event.listen(Engine, 'before_cursor_execute', count_db_query)
+
+    # 注册路由
+    flask_app.register_blueprint(api_bp)
+    flask_app.register_blueprint(patterns_bp, url_prefix='/api/patterns')
+
+    if socketio.server is None:
+        socketio.init_app(
+            flask_app,
+            cors_allowed_origins=settings['ALLOWED_ORIGINS'],
+            async_mode='eventlet',  # 使用 eventlet 作为异步模式
+            ping_timeout=60,
+            # 传入具体的日志器，库不会再自行挂一个同步写 stderr 的处理器；级别由 LOG_LEVELS 控制
+            logger=logging.getLogger('socketio.server'),
+            engineio_logger=logging.getLogger('engineio.server'),
+            message_queue=settings['SOCKETIO_MESSAGE_QUEUE'] or None
+        )
+    else:
+        # 之后创建的应用共用已有的 Socket.IO 服务，test_client 等按应用查找扩展
+        flask_app.extensions['socketio'] = socketio
+    return flask_app
+
+def initialize_database(app):
+    """创建目录、数据表并补齐旧库结构，启动时执行一次。"""
+    # 在应用上下文中初始化目录和数据库
     with app.app_context():
+        init_upload_folder()
         try:
             db.create_all()
+            upgrade_schema()
             create_initial_admin()
         except Exception as e:
             print(f"Error during initialization: {e}")
-    
+
+def start_background_services(app):
+    """注册并启动维护调度器、grok 任务调度和文件监视器，返回监视器以便退出时停止。
+
+    多进程部署时只能在一个进程中调用，否则同一事件会被重复处理。
+    """
+    recover_grok_jobs(app)
+    register_maintenance_tasks(app)
+    # 登录码清理、分块临时文件清理和剪贴板压缩都由维护调度器在后台协程中执行，不占用请求
+    socketio.start_background_task(maintenance.run_forever)
+    if app.config['BACKGROUND_SERVICES'] == 'external':
+        socketio.start_background_task(run_grok_job_dispatcher, app)
+
     observer = Observer()
-    event_handler = FileChangeHandler(app.app_context(), socketio)
-    observer.schedule(event_handler, UPLOAD_FOLDER, recursive=False)
+    metrics.WATCHER_QUEUE.set_function(observer.event_queue.qsize)
+    # 远程存储没有可监视的本地目录，文件只经由接口写入
+    if app.extensions['storage'].name == 'local':
+        event_handler = FileChangeHandler(app, socketio)
+        observer.schedule(event_handler, app.config['UPLOAD_FOLDER'], recursive=False)
     observer.start()
-    
+    return observer
+
+if __name__ == '__main__':
+    # 单进程开发模式：Web 服务与后台服务在同一进程，生产环境多进程部署见 serve.py
+    app = create_app()
+    configure_process(app)
+    initialize_database(app)
+    observer = start_background_services(app)
+    # 预先启动正则执行进程，进程内会构建模式推荐索引，首个请求不必承担整库编译
+    socketio.start_background_task(regex_pool.start)
+    socketio.start_background_task(run_socket_auth_checker, app)
+
     try:
         # 使用 eventlet 运行服务器
         print('WebSync 服务已启动，监听地址：http://0.0.0.0:5002')
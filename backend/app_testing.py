@@ -0,0 +1,70 @@
+"""后端接口测试共用的夹具。
+
+AppTestCase 为每个用例创建独立的应用：数据库在内存中，上传目录、数据块和预览缓存都在临时目录中，
+用例之间不必保存和恢复应用的配置与服务。默认创建一个允许登录的管理员并准备好认证头。
+"""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+os.environ['JWT_SECRET_KEY'] = 'test-only-random-jwt-secret-with-32-characters'
+
+import app as module
+from flask_jwt_extended import create_access_token
+
+ALLOWED_EMAIL = 'allowed@example.test'
+
+
+def write_oauth_config(directory, **web):
+    """写出 load_google_oauth_config 读取的 client_secret JSON，返回路径；web 覆盖默认字段。"""
+    path = os.path.join(directory, 'client_secret_test.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'web': {
+            'client_id': 'test-client',
+            'client_secret': 'test-secret',
+            'auth_uri': 'https://example.test/auth',
+            'token_uri': 'https://example.test/token',
+            'redirect_uris': ['https://example.test/auth/google/callback'],
+            'allowed_email': ALLOWED_EMAIL,
+            **web
+        }}, f)
+    return path
+
+
+class AppTestCase(unittest.TestCase):
+    """接口测试基类。config 为覆盖的应用配置；子类的 setUp 先调用本类的 setUp。"""
+
+    config = {}
+
+    def setUp(self):
+        self.upload_folder = self.make_tempdir()
+        oauth_config = write_oauth_config(self.make_tempdir())
+        environ = mock.patch.dict(os.environ, {'GOOGLE_OAUTH_CLIENT_JSON': oauth_config})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self.app = module.create_app({'UPLOAD_FOLDER': self.upload_folder, **self.config})
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        module.db.create_all()
+        self.addCleanup(module.db.session.remove)
+
+        self.user = self.create_user(ALLOWED_EMAIL, module.UserRole.ADMIN)
+        self.access_token = create_access_token(identity=str(self.user.id))
+        self.headers = {'Authorization': f'Bearer {self.access_token}'}
+        self.client = self.app.test_client()
+
+    def make_tempdir(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def create_user(self, email, role=None):
+        user = module.User(email=email, password=b'not-used-for-login', role=role or module.UserRole.USER)
+        module.db.session.add(user)
+        module.db.session.commit()
+        return user
@@ -0,0 +1,565 @@
+"""后端热点接口的负载与基准测试工具
+
+在临时目录中用独立的 SQLite 数据库和上传目录启动应用，批量写入用户、文件、共享和
+剪贴板数据后，对三种上传通道、文件列表、剪贴板列表和文件下载逐一计时，输出吞吐量
+与 p50/p90/p99 延迟。
+
+    python bench_backend.py                              # 默认规模的文本报告
+    python bench_backend.py --rows 1000 10000 100000     # 文件列表在不同数据量下的表现
+    python bench_backend.py --json report.json           # 输出 JSON，便于在版本间对比
+    python bench_backend.py --compare report.json        # 与基线对比，存在退化时返回 1
+
+请求经由 Flask 测试客户端在进程内发出，覆盖路由、鉴权、数据库和磁盘读写，但不包含
+网络与 WSGI 服务器的开销；同一台机器上的前后两次结果才有可比性。
+"""
+import argparse
+import base64
+import io
+import json
+import logging
+import math
+import os
+import platform
+import secrets
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select
+
+BENCH_EMAIL = 'bench-admin@example.test'
+FILE_PREFIX = 'bench-'
+DEFAULT_ROWS = (1000, 10000)
+DEFAULT_USERS = 50
+DEFAULT_CLIPBOARD_ITEMS = 500
+DEFAULT_FILE_SIZE = 1024 * 1024
+DEFAULT_CHUNK_SIZE = 512 * 1024  # 与前端 UploadForm 的分块大小一致
+DEFAULT_ITERATIONS = 30
+DEFAULT_MAX_SECONDS = 10.0
+MIN_ITERATIONS = 3
+# 写入的种子文件中被共享给测试用户、以及设为公开的比例
+SHARE_RATIO = 0.05
+PUBLIC_RATIO = 0.02
+SEED_BATCH = 5000
+# 对比时的指标；延迟两侧都低于 COMPARE_FLOOR_MS 的差异视为噪声
+COMPARED_LATENCIES = ('p50_ms', 'p99_ms')
+COMPARE_FLOOR_MS = 1.0
+DEFAULT_THRESHOLD = 1.5
+
+
+class BenchmarkError(RuntimeError):
+    """被测接口返回了非 2xx 响应，此时的计时没有意义。"""
+
+
+def load_app(workdir, max_upload_size=None):
+    """在 workdir 中以独立的数据库、上传目录和加密密钥导入应用模块并创建应用，返回 (模块, 应用)。
+
+    配置在导入时读取，因此必须在 import app 之前设置环境变量并切换工作目录。
+    """
+    os.makedirs(workdir, exist_ok=True)
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['SYNC_FOLDER'] = os.path.join(workdir, 'sync')
+    os.environ['PROFILE_ENABLED'] = 'false'
+    if len(os.environ.get('JWT_SECRET_KEY', '')) < 32:
+        os.environ['JWT_SECRET_KEY'] = secrets.token_urlsafe(48)
+    if max_upload_size:
+        os.environ['MAX_UPLOAD_SIZE'] = str(max_upload_size)
+    os.chdir(workdir)  # crypto_utils 在当前目录生成 encryption.key
+
+    import app as module
+    app = module.create_app()
+    module.configure_process(app)
+    with app.app_context():
+        module.init_upload_folder()
+        module.db.create_all()
+        module.upgrade_schema()
+    return module, app
+
+
+class Bench:
+    """持有应用模块、测试用户和测试客户端，负责写入种子数据与执行各个场景。"""
+
+    def __init__(self, module, app, max_seconds=DEFAULT_MAX_SECONDS, progress=None):
+        self.module = module
+        self.max_seconds = max_seconds
+        self.progress = progress
+        self.run_id = secrets.token_hex(4)
+        self.client = app.test_client()
+        self._original_oauth_loader = module.load_google_oauth_config
+        # 鉴权只放行 allowed_email 对应的账号，测试期间让它指向测试用户
+        module.load_google_oauth_config = lambda: (
+            {'allowed_email': BENCH_EMAIL}, 'https://bench.invalid/auth/google/callback'
+        )
+
+        db = module.db
+        user = db.session.execute(select(module.User).filter_by(email=BENCH_EMAIL)).scalar_one_or_none()
+        if user is None:
+            user = module.User(email=BENCH_EMAIL, password=b'not-used-for-login', role=module.UserRole.ADMIN)
+            db.session.add(user)
+        user.storage_limit = 1 << 50
+        db.session.commit()
+        self.user_id = user.id
+        self.headers = {'Authorization': f'Bearer {module.create_access_token(identity=str(user.id))}'}
+
+    def close(self):
+        """恢复 OAuth 配置读取函数；场景写入的文件已由各场景自行删除。"""
+        self.module.load_google_oauth_config = self._original_oauth_loader
+
+    def _report(self, message):
+        if self.progress:
+            self.progress(message)
+
+    def _check(self, response, description):
+        if not 200 <= response.status_code < 300:
+            body = response.get_data(as_text=True)[:200]
+            response.close()
+            raise BenchmarkError(f'{description} 返回 {response.status_code}: {body}')
+        return response
+
+    # ---- 种子数据 ----
+
+    def seed_users(self, count):
+        """补齐到 count 个普通用户（不含测试用户），返回全部用户 ID。"""
+        module = self.module
+        db = module.db
+        existing = db.session.execute(
+            select(module.User.id).where(module.User.email.like(f'{FILE_PREFIX}user-%'))
+        ).scalars().all()
+        missing = count - len(existing)
+        if missing > 0:
+            now = datetime.utcnow()
+            db.session.execute(insert(module.User), [{
+                'email': f'{FILE_PREFIX}user-{self.run_id}-{index}@example.test',
+                'password': 'not-used-for-login',
+                'role': module.UserRole.USER,
+                'created_at': now,
+                'storage_limit': 1 << 40,
+                'storage_used': 0,
+            } for index in range(missing)])
+            db.session.commit()
+        return db.session.execute(
+            select(module.User.id).where(module.User.email.like(f'{FILE_PREFIX}user-%'))
+        ).scalars().all()
+
+    def seed_files(self, rows, user_ids):
+        """补齐 files 表到 rows 行：大部分属于其他用户，按比例共享给测试用户或设为公开。"""
+        module = self.module
+        db = module.db
+        current = db.session.execute(select(func.count(module.File.id))).scalar_one()
+        if current >= rows:
+            return current
+        owners = [self.user_id] + list(user_ids)
+        now = datetime.utcnow()
+        for start in range(current, rows, SEED_BATCH):
+            stop = min(rows, start + SEED_BATCH)
+            db.session.execute(insert(module.File), [{
+                'path': f'{FILE_PREFIX}seed/{index:07d}.bin',
+                'hash': f'{index:064x}',
+                'last_modified': now,
+                'size': 1024 + index % 4096,
+                'owner_id': owners[index % len(owners)],
+                'is_public': index % int(1 / PUBLIC_RATIO) == 1,
+                'created_at': now,
+            } for index in range(start, stop)])
+            shared = db.session.execute(
+                select(module.File.id, module.File.owner_id)
+                .where(module.File.path >= f'{FILE_PREFIX}seed/{start:07d}.bin')
+                .where(module.File.path < f'{FILE_PREFIX}seed/{stop:07d}.bin')
+                .where(module.File.owner_id != self.user_id)
+            ).all()
+            step = int(1 / SHARE_RATIO)
+            share_rows = [{
+                'file_id': file_id,
+                'user_id': self.user_id,
+                'created_at': now,
+                'created_by': owner_id,
+            } for file_id, owner_id in shared if file_id % step == 0]
+            if share_rows:
+                db.session.execute(insert(module.FileShare), share_rows)
+            db.session.commit()
+            self._report(f'已写入文件记录 {stop}/{rows}')
+        return rows
+
+    def seed_clipboard(self, count, size=256):
+        """为测试用户写入 count 条加密后的文本剪贴板记录。"""
+        module = self.module
+        db = module.db
+        current = db.session.execute(
+            select(func.count(module.ClipboardItem.id)).filter_by(owner_id=self.user_id)
+        ).scalar_one()
+        now = datetime.utcnow()
+        rows = []
+        for index in range(current, count):
+            text = (f'clipboard {index} ' * (size // 12 + 1))[:size]
+            rows.append({
+                'content': module.crypto.encrypt(text.encode('utf-8')),
+                'type': 'text',
+                'owner_id': self.user_id,
+                'created_at': now,
+                'updated_at': now,
+                'content_hash': module._clipboard_digest('text', text),
+                'size': len(text),
+            })
+        if rows:
+            db.session.execute(insert(module.ClipboardItem), rows)
+            db.session.commit()
+        return count
+
+    # ---- 场景 ----
+
+    def _measure(self, name, operation, iterations, bytes_per_op=0, **extra):
+        """重复执行 operation，至少 MIN_ITERATIONS 次，达到 iterations 次或超过 max_seconds 后停止。"""
+        latencies = []
+        started = time.perf_counter()
+        for index in range(iterations):
+            begin = time.perf_counter()
+            operation(index)
+            latencies.append(time.perf_counter() - begin)
+            if len(latencies) >= MIN_ITERATIONS and time.perf_counter() - started > self.max_seconds:
+                break
+        elapsed = time.perf_counter() - started
+        result = {'name': name, **summarize(latencies, elapsed, bytes_per_op), **extra}
+        self._report(f"{name}: p50 {result['p50_ms']}ms p99 {result['p99_ms']}ms")
+        return result
+
+    def _upload_name(self, kind, index):
+        return f'{FILE_PREFIX}{self.run_id}-{kind}-{index}.bin'
+
+    def _discard_uploads(self, kind):
+        """删除场景中上传的文件和记录，避免后续场景的文件列表规模被改变。"""
+        module = self.module
+        db = module.db
+        pattern = f'{FILE_PREFIX}{self.run_id}-{kind}-%'
+        records = db.session.execute(select(module.File).where(module.File.path.like(pattern))).scalars().all()
+        for record in records:
+            try:
+                module.storage.delete(module.file_storage_key(record))
+            except OSError:
+                pass
+        # 连同版本记录和只被这些版本引用的数据块一起删除
+        file_ids = select(module.File.id).where(module.File.path.like(pattern))
+        version_ids = select(module.FileVersion.id).where(module.FileVersion.file_id.in_(file_ids))
+        chunk_hashes = set(db.session.execute(
+            select(module.FileVersionChunk.chunk_hash).where(module.FileVersionChunk.version_id.in_(version_ids))
+        ).scalars())
+        module._purge_file_versions(module.FileVersion.file_id.in_(file_ids))
+        db.session.execute(delete(module.File).where(module.File.path.like(pattern)))
+        still_referenced = set(db.session.execute(
+            select(module.FileVersionChunk.chunk_hash).where(module.FileVersionChunk.chunk_hash.in_(chunk_hashes))
+        ).scalars())
+        orphaned = chunk_hashes - still_referenced
+        db.session.execute(delete(module.Chunk).where(module.Chunk.hash.in_(orphaned)))
+        for chunk_hash in orphaned:
+            module.chunk_store.delete(chunk_hash)
+        user = db.session.get(module.User, self.user_id)
+        user.storage_used = 0
+        db.session.commit()
+
+    def bench_upload_multipart(self, payload, iterations):
+        def operation(index):
+            response = self.client.post('/api/upload', headers=self.headers, data={
+                'file': (io.BytesIO(payload), self._upload_name('multipart', index))
+            }, content_type='multipart/form-data')
+            self._check(response, 'POST /api/upload').close()
+
+        try:
+            return self._measure('upload_multipart', operation, iterations, len(payload))
+        finally:
+            self._discard_uploads('multipart')
+
+    def bench_upload_attach(self, payload, iterations):
+        def operation(index):
+            response = self.client.post(
+                '/api/clipboard/attach',
+                query_string={'filename': self._upload_name('attach', index)},
+                headers={**self.headers, 'Content-Type': 'application/octet-stream'},
+                data=payload
+            )
+            self._check(response, 'POST /api/clipboard/attach').close()
+
+        try:
+            return self._measure('upload_attach', operation, iterations, len(payload))
+        finally:
+            self._discard_uploads('attach')
+
+    def bench_upload_chunked(self, payload, chunk_size, iterations):
+        """每次迭代为一个完整文件的全部分块；另外统计单个分块请求的延迟。"""
+        chunks = [
+            (offset, base64.b64encode(payload[offset:offset + chunk_size]).decode('ascii'))
+            for offset in range(0, len(payload), chunk_size)
+        ] or [(0, '')]
+        chunk_latencies = []
+
+        def operation(index):
+            upload_id = f'{self.run_id}chunk{index:06d}'
+            filename = self._upload_name('chunked', index)
+            for chunk_index, (offset, data) in enumerate(chunks):
+                begin = time.perf_counter()
+                response = self.client.post('/api/clipboard/attach/chunk', headers=self.headers, json={
+                    'upload_id': upload_id,
+                    'filename': filename,
+                    'index': chunk_index,
+                    'total': len(chunks),
+                    'offset': offset,
+                    'total_size': len(payload),
+                    'data': data,
+                })
+                self._check(response, 'POST /api/clipboard/attach/chunk').close()
+                chunk_latencies.append(time.perf_counter() - begin)
+
+        try:
+            result = self._measure('upload_chunked', operation, iterations, len(payload), chunks=len(chunks))
+        finally:
+            self._discard_uploads('chunked')
+        result['chunk_p50_ms'] = _milliseconds(percentile(chunk_latencies, 50))
+        result['chunk_p99_ms'] = _milliseconds(percentile(chunk_latencies, 99))
+        return result
+
+    def bench_list_files(self, rows, iterations):
+        def operation(index):
+            response = self._check(self.client.get('/api/files', headers=self.headers), 'GET /api/files')
+            response.get_data()
+            response.close()
+
+        return self._measure(f'list_files_{rows}', operation, iterations, rows=rows)
+
+    def bench_list_clipboard(self, items, iterations):
+        def operation(index):
+            response = self._check(self.client.get('/api/clipboard', headers=self.headers), 'GET /api/clipboard')
+            response.get_data()
+            response.close()
+
+        return self._measure('list_clipboard', operation, iterations, items=items)
+
+    def bench_download(self, payload, iterations):
+        module = self.module
+        filename = self._upload_name('download', 0)
+        module.storage.put_bytes(filename, payload)
+        record = module.File(
+            path=filename,
+            hash='0' * 64,
+            last_modified=datetime.utcnow(),
+            size=len(payload),
+            owner_id=self.user_id
+        )
+        module.db.session.add(record)
+        module.db.session.commit()
+
+        def operation(index):
+            response = self._check(
+                self.client.get(f'/api/download/{filename}', headers=self.headers),
+                'GET /api/download'
+            )
+            if len(response.get_data()) != len(payload):
+                raise BenchmarkError('下载的内容长度与写入的不一致')
+            response.close()
+
+        try:
+            return self._measure('download', operation, iterations, len(payload))
+        finally:
+            self._discard_uploads('download')
+
+
+def percentile(values, pct):
+    """最近秩法的百分位数，values 为空时返回 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+def summarize(latencies, elapsed, bytes_per_op=0):
+    """把一组单次耗时（秒）汇总为吞吐量与延迟分位数（毫秒）。"""
+    summary = {
+        'iterations': len(latencies),
+        'ops_per_s': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': _milliseconds(percentile(latencies, 50)),
+        'p90_ms': _milliseconds(percentile(latencies, 90)),
+        'p99_ms': _milliseconds(percentile(latencies, 99)),
+        'mean_ms': _milliseconds(sum(latencies) / len(latencies)) if latencies else 0.0,
+        'max_ms': _milliseconds(max(latencies, default=0.0)),
+    }
+    if bytes_per_op:
+        summary['bytes'] = bytes_per_op
+        summary['mb_per_s'] = round(bytes_per_op * len(latencies) / elapsed / (1024 * 1024), 2) if elapsed > 0 else 0.0
+    return summary
+
+
+def run_benchmark(module, app, rows=DEFAULT_ROWS, users=DEFAULT_USERS, clipboard_items=DEFAULT_CLIPBOARD_ITEMS,
+                  file_size=DEFAULT_FILE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE, iterations=DEFAULT_ITERATIONS,
+                  max_seconds=DEFAULT_MAX_SECONDS, scenarios=None, progress=None):
+    """写入种子数据并依次执行各场景，返回可直接序列化为 JSON 的报告。
+
+    文件列表场景按 rows 从小到大逐级补齐数据后计时，其余场景在最小的规模下执行。
+    """
+    selected = set(scenarios or ('upload', 'list_files', 'clipboard', 'download'))
+    payload = os.urandom(file_size)
+    rows = sorted(set(rows))
+    results = []
+    with app.app_context():
+        bench = Bench(module, app, max_seconds=max_seconds, progress=progress)
+        try:
+            user_ids = bench.seed_users(users)
+            bench.seed_files(rows[0] if rows else 0, user_ids)
+            if 'upload' in selected:
+                results.append(bench.bench_upload_multipart(payload, iterations))
+                results.append(bench.bench_upload_attach(payload, iterations))
+                results.append(bench.bench_upload_chunked(payload, chunk_size, iterations))
+            if 'download' in selected:
+                results.append(bench.bench_download(payload, iterations))
+            if 'clipboard' in selected:
+                bench.seed_clipboard(clipboard_items)
+                results.append(bench.bench_list_clipboard(clipboard_items, iterations))
+            if 'list_files' in selected:
+                for count in rows:
+                    bench.seed_files(count, user_ids)
+                    results.append(bench.bench_list_files(count, iterations))
+        finally:
+            bench.close()
+            module.db.session.remove()
+
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'rows': rows,
+            'users': users,
+            'clipboard_items': clipboard_items,
+            'file_size': file_size,
+            'chunk_size': chunk_size,
+            'iterations': iterations,
+            'max_seconds': max_seconds,
+        },
+        'scenarios': results,
+    }
+
+
+def compare_reports(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """对比两份报告中同名场景的延迟与吞吐量，返回变差比例超过 threshold 的条目。"""
+    previous = {entry['name']: entry for entry in baseline['scenarios']}
+    regressions = []
+    for entry in current['scenarios']:
+        before = previous.get(entry['name'])
+        if before is None:
+            continue
+        for metric in COMPARED_LATENCIES:
+            old, new = before.get(metric), entry.get(metric)
+            if not old or new is None or max(old, new) < COMPARE_FLOOR_MS:
+                continue
+            if new / old >= threshold:
+                regressions.append({
+                    'name': entry['name'], 'metric': metric, 'before': old, 'after': new,
+                    'ratio': round(new / old, 2)
+                })
+        old, new = before.get('ops_per_s'), entry.get('ops_per_s')
+        if old and new and old / new >= threshold:
+            regressions.append({
+                'name': entry['name'], 'metric': 'ops_per_s', 'before': old, 'after': new,
+                'ratio': round(new / old, 2)
+            })
+    return regressions
+
+
+def format_report(report):
+    header = f"{'场景':<18}{'次数':>6}{'ops/s':>10}{'MB/s':>9}{'p50':>12}{'p90':>12}{'p99':>12}{'max':>12}"
+    lines = [header, '-' * 93]
+    for entry in report['scenarios']:
+        mb_per_s = entry.get('mb_per_s')
+        latencies = ''.join(f"{str(entry[key]) + 'ms':>12}" for key in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms'))
+        lines.append(
+            f"{entry['name']:<20}{entry['iterations']:>6}{entry['ops_per_s']:>10}"
+            f"{mb_per_s if mb_per_s is not None else '-':>9}{latencies}"
+        )
+        if 'chunk_p50_ms' in entry:
+            lines.append(
+                f"{'  单个分块':<16}{'':>25}{str(entry['chunk_p50_ms']) + 'ms':>12}{'':>12}"
+                f"{str(entry['chunk_p99_ms']) + 'ms':>12}"
+            )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='在临时数据库上对后端热点接口做负载与基准测试')
+    parser.add_argument('--rows', type=int, nargs='+', default=list(DEFAULT_ROWS),
+                        help='文件列表场景的 files 表行数，可给出多个规模')
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS, help='写入的普通用户数')
+    parser.add_argument('--clipboard-items', type=int, default=DEFAULT_CLIPBOARD_ITEMS, help='剪贴板记录数')
+    parser.add_argument('--file-size', type=int, default=DEFAULT_FILE_SIZE, help='上传与下载的文件大小（字节）')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='分块上传的块大小（字节）')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS, help='每个场景的最多执行次数')
+    parser.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS,
+                        help='每个场景的最长计时（秒），至少执行 3 次')
+    parser.add_argument('--scenario', nargs='+', dest='scenarios',
+                        choices=('upload', 'list_files', 'clipboard', 'download'), help='只执行这些场景')
+    parser.add_argument('--workdir', help='数据库与上传目录所在目录，默认使用并在结束后删除临时目录')
+    parser.add_argument('--log-level', default='WARNING', help='应用日志级别，默认 WARNING 以免刷屏')
+    parser.add_argument('--json', metavar='PATH', help="把完整报告写成 JSON，'-' 表示标准输出")
+    parser.add_argument('--compare', metavar='BASELINE', help='与基线 JSON 报告对比，存在退化时返回 1')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='判定退化的比值')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    json_path = os.path.abspath(args.json) if args.json and args.json != '-' else args.json
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='websync-bench-')
+    cwd = os.getcwd()
+    try:
+        module, app = load_app(os.path.abspath(workdir), max_upload_size=max(args.file_size, args.chunk_size) * 2)
+        # Socket.IO 等库自带日志处理器，只调根日志级别压不住，直接屏蔽低于该级别的日志
+        logging.disable(logging.getLevelName(args.log_level.upper()) - 1)
+
+        def progress(message):
+            print(f'\r{message[:70]:<70}', end='', file=sys.stderr, flush=True)
+
+        report = run_benchmark(
+            module,
+            app,
+            rows=args.rows,
+            users=args.users,
+            clipboard_items=args.clipboard_items,
+            file_size=args.file_size,
+            chunk_size=args.chunk_size,
+            iterations=args.iterations,
+            max_seconds=args.max_seconds,
+            scenarios=args.scenarios,
+            progress=progress
+        )
+        print(file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if json_path == '-':
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        print(format_report(report))
+
+    if baseline is not None:
+        regressions = compare_reports(baseline, report, args.threshold)
+        for item in regressions:
+            print(f"退化: {item['name']} {item['metric']} {item['before']} -> {item['after']} x{item['ratio']}",
+                  file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
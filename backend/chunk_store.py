@@ -0,0 +1,196 @@
+import hashlib
+import os
+import random
+import tempfile
+import time
+import zlib
+
+MIN_CHUNK_SIZE = 64 * 1024
+AVG_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+READ_SIZE = 4 * 1024 * 1024
+WINDOW_SIZE = 48  # 切点判定所用的窗口字节数
+
+
+def _anchor_table(seed=0x5EED, marked=16):
+    """固定种子挑出 16 个字节值作为锚点字符，连续两个锚点字符构成候选切点（均匀数据中约 1/256）。"""
+    table = bytearray(256)
+    for value in random.Random(seed).sample(range(256), marked):
+        table[value] = 1
+    return bytes(table)
+
+
+ANCHOR_TABLE = _anchor_table()
+ANCHOR = b'\x01\x01'
+
+
+class ContentDefinedChunker:
+    """FastCDC 风格的内容定义分块。
+
+    沿用 FastCDC 的做法：跳过 min_size 以内的切点；avg_size 之前用更严格的掩码、之后用更宽松的掩码
+    （归一化分块），使块大小集中在 avg_size 附近；到 max_size 强制切分。
+    逐字节滚动 gear 哈希在纯 Python 中每 MB 要上百毫秒，这里改为只在锚点处计算窗口 CRC32：
+    锚点由 bytes.translate/find 在 C 层定位，切点只取决于附近的内容，插入或删除数据后
+    之后的切点仍能对齐，未改动的区域得到相同的块。
+    """
+
+    def __init__(self, min_size=MIN_CHUNK_SIZE, avg_size=AVG_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+        if not WINDOW_SIZE <= min_size < avg_size < max_size:
+            raise ValueError('分块大小必须满足 窗口 <= 最小 < 平均 < 最大')
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        # 每个候选切点约覆盖 256 字节，掩码位数按平均块大小换算，前后各偏移 2 位
+        bits = max(1, (avg_size // 256).bit_length() - 1)
+        self.strict_mask = (1 << (bits + 2)) - 1
+        self.loose_mask = (1 << max(0, bits - 2)) - 1
+
+    def _cut(self, data, marks, start, end):
+        if end - start <= self.min_size:
+            return end
+        normal = min(end, start + self.avg_size)
+        position = start + self.min_size
+        while True:
+            position = marks.find(ANCHOR, position, end - 1)
+            if position < 0:
+                return end
+            boundary = position + 2
+            digest = zlib.crc32(data[boundary - WINDOW_SIZE:boundary])
+            if not digest & (self.strict_mask if position < normal else self.loose_mask):
+                return boundary
+            position += 1
+
+    def split(self, stream):
+        """从二进制流中依次产出数据块。"""
+        data = b''
+        marks = b''
+        start = 0
+        eof = False
+        while True:
+            while not eof and len(data) - start < self.max_size:
+                block = stream.read(READ_SIZE)
+                if not block:
+                    eof = True
+                    break
+                data = data[start:] + block
+                marks = marks[start:] + block.translate(ANCHOR_TABLE)
+                start = 0
+            if start >= len(data):
+                return
+            end = min(len(data), start + self.max_size)
+            cut = self._cut(data, marks, start, end)
+            yield data[start:cut]
+            start = cut
+
+
+class ChunkStore:
+    """按 SHA-256 存放数据块，文件位于 root/前两位/次两位/哈希，写入是原子的，同一块只存一份。"""
+
+    def __init__(self, root='chunks', chunker=None):
+        self.root = root
+        self.chunker = chunker or ContentDefinedChunker()
+
+    def configure(self, root=None, chunker=None):
+        if root is not None:
+            self.root = root
+        if chunker is not None:
+            self.chunker = chunker
+
+    def path(self, chunk_hash):
+        return os.path.join(self.root, chunk_hash[:2], chunk_hash[2:4], chunk_hash)
+
+    def has(self, chunk_hash):
+        return os.path.exists(self.path(chunk_hash))
+
+    def put(self, chunk_hash, data):
+        """保存数据块，返回是否新写入；已存在时只刷新修改时间，避免被垃圾回收的宽限期漏掉。"""
+        path = self.path(chunk_hash)
+        try:
+            os.utime(path)
+            return False
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    def get(self, chunk_hash):
+        with open(self.path(chunk_hash), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != chunk_hash:
+            raise OSError(f'数据块 {chunk_hash} 已损坏')
+        return data
+
+    def modified_at(self, chunk_hash):
+        try:
+            return os.path.getmtime(self.path(chunk_hash))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, chunk_hash):
+        try:
+            os.remove(self.path(chunk_hash))
+        except FileNotFoundError:
+            pass
+
+    def ingest(self, file_path):
+        """分块并保存文件，返回 (整个文件的 SHA-256, 字节数, [(块哈希, 块大小), ...], 新写入的字节数)。"""
+        with open(file_path, 'rb') as f:
+            return self.ingest_stream(f)
+
+    def ingest_stream(self, stream):
+        """同 ingest，从二进制流读取，供存储后端打开的对象使用。"""
+        file_digest = hashlib.sha256()
+        manifest = []
+        size = 0
+        stored = 0
+        for chunk in self.chunker.split(stream):
+            file_digest.update(chunk)
+            chunk_hash = hashlib.sha256(chunk).hexdigest()
+            if self.put(chunk_hash, chunk):
+                stored += len(chunk)
+            manifest.append((chunk_hash, len(chunk)))
+            size += len(chunk)
+        return file_digest.hexdigest(), size, manifest, stored
+
+    def iter_content(self, chunk_hashes):
+        for chunk_hash in chunk_hashes:
+            yield self.get(chunk_hash)
+
+    def restore(self, chunk_hashes, file_path, tmp_dir=None):
+        """把一组数据块拼回文件，先写临时文件再替换，返回写入的字节数。
+
+        tmp_dir 须与 file_path 在同一文件系统，默认与 file_path 同目录。
+        """
+        directory = tmp_dir or os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.restore')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for data in self.iter_content(chunk_hashes):
+                    f.write(data)
+                    size += len(data)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return size
+
+    def is_stale(self, chunk_hash, grace, now=None):
+        """数据块超过 grace 秒未被写入或复用，才允许回收。"""
+        modified = self.modified_at(chunk_hash)
+        return modified is None or (now or time.time()) - modified >= grace
+
+
+chunk_store = ChunkStore()
@@ -1,10 +1,18 @@
+import hashlib
+import hmac
+import logging
 import os
 from cryptography.fernet import Fernet
 
+import metrics
+
+logger = logging.getLogger(__name__)
+
 class CryptoUtils:
     def __init__(self):
         self.key_file = 'encryption.key'
         self.fernet = None
+        self.digest_key = None
         self._load_or_create_key()
     
     def _load_or_create_key(self):
@@ -17,22 +25,33 @@ class CryptoUtils:
                 with open(self.key_file, 'wb') as f:
                     f.write(key)
             self.fernet = Fernet(key)
+            # 去重摘要使用从主密钥派生的独立子密钥，不直接复用加密密钥
+            self.digest_key = hmac.new(key, b'websync-content-digest', hashlib.sha256).digest()
         except Exception as e:
-            print(f"Error handling encryption key: {e}")
+            logger.error("Error handling encryption key: %s", e)
             raise
     
     def encrypt(self, data):
         if isinstance(data, str):
             data = data.encode()
-        return self.fernet.encrypt(data)
+        with metrics.CRYPTO_DURATION.time('encrypt'):
+            return self.fernet.encrypt(data)
     
+    def content_digest(self, data):
+        """计算明文的带密钥 HMAC，用于内容去重且不会泄露明文。"""
+        if isinstance(data, str):
+            data = data.encode()
+        with metrics.HASH_DURATION.time('hmac-sha256'):
+            return hmac.new(self.digest_key, data, hashlib.sha256).hexdigest()
+
     def decrypt(self, data):
         try:
             if isinstance(data, str):
                 data = data.encode()
-            return self.fernet.decrypt(data)
+            with metrics.CRYPTO_DURATION.time('decrypt'):
+                return self.fernet.decrypt(data)
         except Exception as e:
-            print(f"Decryption error: {e}")
+            logger.warning("Decryption error: %s", e)
             raise
 
 crypto = CryptoUtils() 
\ No newline at end of file
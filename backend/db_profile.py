@@ -0,0 +1,94 @@
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+class SQLitePragmas:
+    """每个新建的 SQLite 连接都要执行的 PRAGMA。
+
+    WAL 下读写互不阻塞，synchronous=NORMAL 在 WAL 中只在检查点时 fsync；
+    busy_timeout 让写冲突先等待而不是立即报 database is locked。
+    """
+
+    def __init__(self, journal_mode='WAL', synchronous='NORMAL', busy_timeout_ms=5000,
+                 mmap_size=256 * 1024 * 1024, cache_size_kb=64 * 1024):
+        self.configure(
+            journal_mode=journal_mode,
+            synchronous=synchronous,
+            busy_timeout_ms=busy_timeout_ms,
+            mmap_size=mmap_size,
+            cache_size_kb=cache_size_kb
+        )
+
+    def configure(self, journal_mode=None, synchronous=None, busy_timeout_ms=None, mmap_size=None,
+                  cache_size_kb=None):
+        if journal_mode is not None:
+            if journal_mode.upper() not in JOURNAL_MODES:
+                raise ValueError(f'SQLite journal_mode 只能是 {", ".join(JOURNAL_MODES)}')
+            self.journal_mode = journal_mode.upper()
+        if synchronous is not None:
+            if synchronous.upper() not in SYNCHRONOUS_MODES:
+                raise ValueError(f'SQLite synchronous 只能是 {", ".join(SYNCHRONOUS_MODES)}')
+            self.synchronous = synchronous.upper()
+        if busy_timeout_ms is not None:
+            self.busy_timeout_ms = int(busy_timeout_ms)
+        if mmap_size is not None:
+            self.mmap_size = int(mmap_size)
+        if cache_size_kb is not None:
+            self.cache_size_kb = int(cache_size_kb)
+        if min(self.busy_timeout_ms, self.mmap_size, self.cache_size_kb) < 0:
+            raise ValueError('SQLite busy_timeout、mmap_size 和 cache_size 不能为负数')
+
+    def statements(self):
+        return [
+            f'PRAGMA journal_mode={self.journal_mode}',
+            f'PRAGMA synchronous={self.synchronous}',
+            f'PRAGMA busy_timeout={self.busy_timeout_ms}',
+            f'PRAGMA mmap_size={self.mmap_size}',
+            # 负数表示以 KiB 为单位，而不是页数
+            f'PRAGMA cache_size=-{self.cache_size_kb}',
+        ]
+
+    def apply(self, dbapi_connection):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in self.statements():
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+sqlite_pragmas = SQLitePragmas()
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        sqlite_pragmas.apply(dbapi_connection)
+
+
+def engine_options(uri, pool_size=10, max_overflow=20, pool_timeout=10, pool_recycle=1800):
+    """按数据库类型生成 SQLALCHEMY_ENGINE_OPTIONS。
+
+    eventlet 未接管 threading，连接池耗尽时的等待会阻塞整个事件循环，
+    所以池大小应不小于同时持有会话的协程数。内存 SQLite 由 Flask-SQLAlchemy 固定为单连接。
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+    }
+    if backend != 'sqlite':
+        # 网络数据库的连接可能被服务端或中间设备回收，取用前探活并定期重建
+        options['pool_pre_ping'] = True
+        if pool_recycle > 0:
+            options['pool_recycle'] = pool_recycle
+    return options
@@ -0,0 +1,238 @@
+import threading
+import time
+from collections import deque
+
+from grok_engine import GrokError, grok_engine
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+    REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+# 零宽断言不消耗字符，两侧的字面量在文本中仍然相邻
+ZERO_WIDTH = {sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT}
+
+
+class AhoCorasick:
+    """多模式子串匹配自动机，一次扫描找出文本中出现的全部字面量。"""
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for index, word in enumerate(words):
+            state = 0
+            for char in word:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (index,)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """返回文本中出现过的字面量编号集合。"""
+        found = set()
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+def required_literals(regex):
+    """从编译好的正则中提取任何匹配都必须包含的字面量子串，以及行首锚定的前缀。
+
+    分析是保守的：只有在所有分支中都必然出现的字面量才会被收录，
+    忽略大小写的表达式不提取字面量。返回 (字面量集合, 前缀或 None)。
+    """
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return set(), None
+
+    def walk(items):
+        literals = set()
+        current = []
+
+        def flush():
+            if current:
+                literals.add(''.join(current))
+                current.clear()
+
+        for op, av in items:
+            if op is sre_constants.LITERAL:
+                current.append(chr(av))
+            elif op in ZERO_WIDTH:
+                continue
+            elif op is sre_constants.SUBPATTERN:
+                flush()
+                _, add_flags, _, body = av
+                if not add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+                    literals |= walk(body)
+            elif op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+                flush()
+                literals |= walk(av)
+            elif op in REPEATS:
+                flush()
+                low, _, body = av
+                if low >= 1:
+                    literals |= walk(body)
+            elif op is sre_constants.BRANCH:
+                flush()
+                branches = [walk(branch) for branch in av[1]]
+                literals |= set.intersection(*branches) if branches else set()
+            else:
+                flush()
+        flush()
+        return literals
+
+    prefix = []
+    items = list(parsed)
+    if items and items[0] == (sre_constants.AT, sre_constants.AT_BEGINNING):
+        for op, av in items[1:]:
+            if op is not sre_constants.LITERAL:
+                break
+            prefix.append(chr(av))
+    return walk(parsed), ''.join(prefix) or None
+
+
+class DiscoveryIndex:
+    """某个模式库快照上所有命名模式的预过滤索引。"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        literal_ids = {}
+        self.requirements = []
+        for entry in entries:
+            self.requirements.append(frozenset(
+                literal_ids.setdefault(literal, len(literal_ids))
+                for literal in entry['literals']
+            ))
+        self.literals = list(literal_ids)
+        self.automaton = AhoCorasick(self.literals)
+
+    def candidates(self, line):
+        """返回字面量和锚点都满足的模式下标，其余模式无需执行正则。"""
+        found = self.automaton.find(line)
+        survivors = []
+        for index, required in enumerate(self.requirements):
+            if not required <= found:
+                continue
+            prefix = self.entries[index]['prefix']
+            if prefix and not line.startswith(prefix):
+                continue
+            survivors.append(index)
+        return survivors
+
+
+class PatternDiscovery:
+    """根据样例日志行推荐合适的命名模式。"""
+
+    def __init__(self, engine=grok_engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._etag = None
+        self._index = None
+
+    def index(self):
+        """返回当前快照的索引，模式库变化时重新编译并构建。"""
+        snapshot = self.engine.library.snapshot()
+        with self._lock:
+            if self._index is None or self._etag != snapshot.etag:
+                entries = []
+                seen = set()
+                for filename in sorted(snapshot.files):
+                    for name in snapshot.files[filename]:
+                        if name in seen:
+                            continue
+                        seen.add(name)
+                        try:
+                            compiled = self.engine.compile(f'%{{{name}}}')
+                        except GrokError:
+                            continue
+                        literals, prefix = required_literals(compiled.regex)
+                        entries.append({
+                            'name': name,
+                            'file': filename,
+                            'compiled': compiled,
+                            'literals': literals,
+                            'prefix': prefix
+                        })
+                self._index = DiscoveryIndex(entries)
+                self._etag = snapshot.etag
+            return self._index
+
+    def discover(self, lines, limit=10):
+        """对样例行排序候选模式：匹配行数多者优先，其次整行覆盖率、捕获字段数。"""
+        started = time.perf_counter()
+        index = self.index()
+        lines = [line for line in lines if line.strip()]
+        scores = {}
+        evaluated = 0
+        for line in lines:
+            for position in index.candidates(line):
+                evaluated += 1
+                entry = index.entries[position]
+                match = entry['compiled'].regex.search(line)
+                if not match:
+                    continue
+                score = scores.setdefault(position, {
+                    'matched_lines': 0,
+                    'coverage': 0.0,
+                    'captures': None
+                })
+                score['matched_lines'] += 1
+                score['coverage'] += (match.end() - match.start()) / len(line)
+                if score['captures'] is None:
+                    score['captures'] = entry['compiled'].captures(match)
+
+        ranked = []
+        for position, score in scores.items():
+            entry = index.entries[position]
+            ranked.append({
+                'name': entry['name'],
+                'file': entry['file'],
+                'pattern': f'%{{{entry["name"]}}}',
+                'matched_lines': score['matched_lines'],
+                'coverage': round(score['coverage'] / len(lines), 4),
+                'fields': len(entry['compiled'].field_names),
+                'captures': score['captures']
+            })
+        ranked.sort(key=lambda item: (
+            -item['matched_lines'], -item['coverage'], -item['fields'], item['name']
+        ))
+        return {
+            'candidates': ranked[:limit],
+            'patterns': len(index.entries),
+            'evaluated': evaluated,
+            'prefiltered': len(index.entries) * len(lines) - evaluated,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+
+
+pattern_discovery = PatternDiscovery()
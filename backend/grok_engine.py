@@ -0,0 +1,415 @@
+import re
+import threading
+from collections import OrderedDict
+
+from pattern_library import pattern_library
+
+# %{NAME}、%{NAME:field}、%{NAME:field:type}
+GROK_REFERENCE = re.compile(r'%\{([A-Za-z0-9_]+)(?::([^:}]+))?(?::(int|float))?\}')
+# 先吞掉转义序列，避免把 \(?<x> 当成命名分组
+NAMED_GROUP = re.compile(r'\\.|\(\?P?<([A-Za-z_][A-Za-z0-9_]*)>', re.S)
+# Oniguruma 支持而 Python re 不支持的 POSIX 字符类（值为字符集内部的写法）
+POSIX_CLASSES = {
+    'alnum': 'a-zA-Z0-9',
+    'alpha': 'a-zA-Z',
+    'digit': '0-9',
+    'lower': 'a-z',
+    'upper': 'A-Z',
+    'space': r'\s',
+    'xdigit': '0-9A-Fa-f',
+    'word': r'\w',
+    'punct': r'!-/:-@\[-`{-~',
+}
+POSIX_CLASS = re.compile(r'\[:([a-z]+):\]')
+INLINE_FLAGS = re.compile(r'\(\?([imx]+)\)')
+# Ruby/Oniguruma 的 m 标志等价于 Python 的 DOTALL
+RUBY_FLAGS = {'i': re.I, 'm': re.S, 'x': re.X}
+HEX_CLASS = '0-9a-fA-F'
+CONVERTERS = {'int': int, 'float': float}
+FIELD_GROUP_PREFIX = 'grok_'
+
+
+class GrokError(ValueError):
+    """模式无法展开或编译。"""
+
+
+class GrokCycleError(GrokError):
+    """模式之间存在循环引用。"""
+
+
+def _field_group(field, type_name):
+    """把任意字段名编码成合法的 Python 分组名，编译时再解码。"""
+    return f'{FIELD_GROUP_PREFIX}{field.encode("utf-8").hex()}_{type_name or ""}'
+
+
+def _decode_field_group(name):
+    if not name.startswith(FIELD_GROUP_PREFIX):
+        return name, None
+    encoded, _, type_name = name[len(FIELD_GROUP_PREFIX):].partition('_')
+    return bytes.fromhex(encoded).decode('utf-8'), type_name or None
+
+
+def to_python_regex(source):
+    """把 Oniguruma 风格的正则转换为 Python re 可编译的形式，返回 (源码, 标志)。
+
+    处理 POSIX 字符类、嵌套字符集（展平为并集）、\\h 十六进制类、
+    表达式中部的全局内联标志（提升为整体标志）以及 .?* 这类叠加量词。
+    """
+    out = []
+    flags = 0
+    depth = 0
+    i = 0
+    length = len(source)
+    while i < length:
+        char = source[i]
+        if char == '\\':
+            escape = source[i:i + 2]
+            if escape in ('\\h', '\\H'):
+                negate = '^' if escape == '\\H' else ''
+                out.append(HEX_CLASS if depth else f'[{negate}{HEX_CLASS}]')
+            else:
+                out.append(escape)
+            i += 2
+            continue
+
+        if depth:
+            posix = POSIX_CLASS.match(source, i)
+            if posix and posix.group(1) in POSIX_CLASSES:
+                out.append(POSIX_CLASSES[posix.group(1)])
+                i = posix.end()
+            elif char == '[':
+                # Oniguruma 的嵌套字符集，展平到外层集合
+                depth += 1
+                i += 1
+            elif char == ']':
+                depth -= 1
+                if depth == 0:
+                    out.append(char)
+                i += 1
+            else:
+                out.append(char)
+                i += 1
+            continue
+
+        if char == '[':
+            depth = 1
+            out.append(char)
+            i += 1
+            if source.startswith('^', i):
+                out.append('^')
+                i += 1
+            if source.startswith(']', i):
+                out.append('\\]')
+                i += 1
+            continue
+
+        inline = INLINE_FLAGS.match(source, i)
+        if inline:
+            for flag in inline.group(1):
+                flags |= RUBY_FLAGS[flag]
+            i = inline.end()
+            continue
+
+        if char == '?' and source.startswith('*', i + 1):
+            # X?* 与 X* 等价，Python 不接受叠加量词
+            i += 1
+            continue
+
+        out.append(char)
+        i += 1
+    return ''.join(out), flags
+
+
+class CompiledGrok:
+    """编译好的 grok 表达式，分组统一重命名为 _gN，字段名与类型另行记录。"""
+
+    __slots__ = ('expression', 'regex', 'fields')
+
+    def __init__(self, expression, regex, fields):
+        self.expression = expression
+        self.regex = regex
+        self.fields = fields
+
+    @property
+    def field_names(self):
+        """按出现顺序去重后的字段名，用于 CSV 表头等场景。"""
+        names = []
+        for field, _ in self.fields:
+            if field is not None and field not in names:
+                names.append(field)
+        return names
+
+    def match(self, text):
+        """在文本中查找第一处匹配，返回 {字段: 值}；未匹配返回 None。"""
+        match = self.regex.search(text)
+        if not match:
+            return None
+        return self.captures(match)
+
+    def captures(self, match):
+        """把正则匹配对象转换为 {字段: 值}。"""
+        captures = {}
+        for group, (field, type_name) in zip(match.groups(), self.fields):
+            # 同名字段出现多次（如不同分支）时取第一个有值的
+            if field is None or group is None or field in captures:
+                continue
+            if type_name:
+                try:
+                    group = CONVERTERS[type_name](group)
+                except ValueError:
+                    pass
+            captures[field] = group
+        return captures
+
+
+class PatternOverlay:
+    """叠加在内置模式库之上的一组自定义模式，同名时覆盖内置模式。
+
+    key 标识编译缓存的归属（通常是用户 ID），为 None 时不保留缓存。
+    """
+
+    __slots__ = ('key', 'patterns')
+
+    def __init__(self, key, patterns):
+        self.key = key
+        self.patterns = dict(patterns)
+
+
+class _OverlayCache:
+    """某个覆盖层的展开与编译缓存。
+
+    每一项都记录展开时用到的全部模式名，覆盖层中的模式变化时只丢弃依赖它的项，
+    其余表达式无需重新编译。
+    """
+
+    def __init__(self, patterns):
+        self.patterns = dict(patterns)
+        self.expansions = {}
+        self.compiled = OrderedDict()
+
+    def update(self, patterns):
+        """替换为新的模式集合，返回发生变化（新增、修改或删除）的模式名。"""
+        changed = {
+            name for name in self.patterns.keys() | patterns.keys()
+            if self.patterns.get(name) != patterns.get(name)
+        }
+        if changed:
+            self.patterns = dict(patterns)
+            for cache in (self.expansions, self.compiled):
+                for key in [key for key, (_, deps) in cache.items() if not deps.isdisjoint(changed)]:
+                    del cache[key]
+        return changed
+
+
+class GrokEngine:
+    """基于模式库的服务端 grok 引擎。
+
+    命名模式的展开结果按快照缓存，编译后的表达式放在以表达式文本为键的 LRU 中，
+    跨请求复用，重复匹配只剩正则执行的开销。模式库变化时两级缓存一起失效。
+    带自定义模式覆盖层编译时，不涉及自定义模式的部分仍走共享缓存，
+    其余结果按覆盖层分别缓存并按依赖失效。
+    """
+
+    def __init__(self, library=pattern_library, cache_size=256, overlay_limit=64):
+        self.library = library
+        self.cache_size = cache_size
+        self.overlay_limit = overlay_limit
+        self._lock = threading.Lock()
+        self._etag = None
+        self._snapshot_files = {}
+        self._definitions = {}
+        self._expansions = {}
+        self._compiled = OrderedDict()
+        self._overlays = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self):
+        """模式库快照变化时清空缓存，调用方需持有锁。"""
+        snapshot = self.library.snapshot()
+        if snapshot.etag != self._etag:
+            self._etag = snapshot.etag
+            self._snapshot_files = snapshot.files
+            self._definitions = {}
+            self._expansions = {}
+            self._compiled.clear()
+            self._overlays.clear()
+        return snapshot
+
+    def _definitions_for(self, files):
+        """合并选中文件中的模式定义，文件按名称排序，同名模式先出现者优先。"""
+        definitions = self._definitions.get(files)
+        if definitions is None:
+            selected = sorted(self._snapshot_files) if files is None else files
+            definitions = {}
+            for filename in selected:
+                if filename not in self._snapshot_files:
+                    raise GrokError(f'模式文件不存在: {filename}')
+                for name, pattern in self._snapshot_files[filename].items():
+                    definitions.setdefault(name, pattern)
+            self._definitions[files] = definitions
+        return definitions
+
+    def _overlay_cache(self, overlay):
+        """返回覆盖层对应的缓存并同步其模式，调用方需持有锁。"""
+        if overlay is None:
+            return None
+        if overlay.key is None:
+            return _OverlayCache(overlay.patterns)
+        cache = self._overlays.get(overlay.key)
+        if cache is None:
+            cache = _OverlayCache(overlay.patterns)
+            self._overlays[overlay.key] = cache
+            if len(self._overlays) > self.overlay_limit:
+                self._overlays.popitem(last=False)
+        else:
+            self._overlays.move_to_end(overlay.key)
+            cache.update(overlay.patterns)
+        return cache
+
+    def _expand(self, expression, files, stack, overlay=None):
+        """展开表达式，返回 (正则源码, 用到的全部模式名)。"""
+        definitions = self._definitions_for(files)
+        deps = set()
+
+        def replace(match):
+            name, field, type_name = match.groups()
+            source, name_deps = self._expand_name(name, files, definitions, stack, overlay)
+            deps.update(name_deps)
+            if field:
+                return f'(?P<{_field_group(field, type_name)}>{source})'
+            return f'(?:{source})'
+
+        return GROK_REFERENCE.sub(replace, expression), frozenset(deps)
+
+    def _expand_name(self, name, files, definitions, stack, overlay):
+        shared = self._expansions.setdefault(files, {})
+        entry = shared.get(name)
+        # 共享缓存中的展开只要不涉及覆盖层里的模式就可以直接复用
+        if entry is not None and (overlay is None or entry[1].isdisjoint(overlay.patterns)):
+            return entry
+        if overlay is not None and (files, name) in overlay.expansions:
+            return overlay.expansions[(files, name)]
+        if name in stack:
+            chain = ' -> '.join(stack + (name,))
+            raise GrokCycleError(f'模式存在循环引用: {chain}')
+        if overlay is not None and name in overlay.patterns:
+            pattern = overlay.patterns[name]
+        elif name in definitions:
+            pattern = definitions[name]
+        else:
+            raise GrokError(f'模式不存在: {name}')
+
+        source, deps = self._expand(pattern, files, stack + (name,), overlay)
+        entry = (source, deps | {name})
+        if overlay is not None and not entry[1].isdisjoint(overlay.patterns):
+            overlay.expansions[(files, name)] = entry
+        else:
+            shared[name] = entry
+        return entry
+
+    def expand(self, expression, files=None, overlay=None):
+        """把表达式中的 %{...} 递归展开为正则源码（分组名尚未重命名）。"""
+        files = tuple(files) if files is not None else None
+        with self._lock:
+            self._sync()
+            return self._expand(expression, files, (), self._overlay_cache(overlay))[0]
+
+    def expansion_depth(self, expression, files=None):
+        """返回表达式中 %{...} 引用的最大嵌套层数，不引用任何模式时为 0。"""
+        files = tuple(files) if files is not None else None
+        with self._lock:
+            self._sync()
+            definitions = self._definitions_for(files)
+            depths = {}
+
+            def depth_of(text, stack):
+                deepest = 0
+                for match in GROK_REFERENCE.finditer(text):
+                    name = match.group(1)
+                    if name in stack:
+                        chain = ' -> '.join(stack + (name,))
+                        raise GrokCycleError(f'模式存在循环引用: {chain}')
+                    if name not in definitions:
+                        raise GrokError(f'模式不存在: {name}')
+                    if name not in depths:
+                        depths[name] = 1 + depth_of(definitions[name], stack + (name,))
+                    deepest = max(deepest, depths[name])
+                return deepest
+
+            return depth_of(expression, ())
+
+    def clear(self):
+        """清空展开和编译缓存，用于测量冷启动编译耗时。"""
+        with self._lock:
+            self._etag = None
+            self._snapshot_files = {}
+            self._definitions = {}
+            self._expansions = {}
+            self._compiled.clear()
+            self._overlays.clear()
+
+    def _build(self, expression, files, overlay=None):
+        """编译表达式，返回 (CompiledGrok, 用到的全部模式名)。"""
+        source, deps = self._expand(expression, files, (), overlay)
+        source, flags = to_python_regex(source)
+        fields = []
+
+        def rename(match):
+            if match.group(1) is None:
+                return match.group(0)
+            fields.append(_decode_field_group(match.group(1)))
+            return f'(?P<_g{len(fields)}>'
+
+        source = NAMED_GROUP.sub(rename, source)
+        try:
+            regex = re.compile(source, flags)
+        except re.error as e:
+            raise GrokError(f'正则编译失败: {e}') from e
+
+        # 只保留命名分组对应的捕获，普通括号分组不输出
+        group_fields = [None] * regex.groups
+        for index, field in enumerate(fields, start=1):
+            group_fields[regex.groupindex[f'_g{index}'] - 1] = field
+        return CompiledGrok(expression, regex, [
+            field or (None, None) for field in group_fields
+        ]), deps
+
+    def _store(self, cache, key, entry):
+        cache[key] = entry
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def compile(self, expression, files=None, overlay=None):
+        """返回编译好的表达式，命中 LRU 时直接复用。
+
+        overlay 为 PatternOverlay 时先在其中查找模式；修改覆盖层中的某个模式
+        只会让依赖它的表达式重新编译。
+        """
+        if not expression:
+            raise GrokError('表达式不能为空')
+        files = tuple(files) if files is not None else None
+        with self._lock:
+            self._sync()
+            overlay = self._overlay_cache(overlay)
+            key = (files, expression)
+            entry = self._compiled.get(key)
+            if entry is not None and (overlay is None or entry[1].isdisjoint(overlay.patterns)):
+                self._compiled.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if overlay is not None and key in overlay.compiled:
+                overlay.compiled.move_to_end(key)
+                self.hits += 1
+                return overlay.compiled[key][0]
+
+            self.misses += 1
+            entry = self._build(expression, files, overlay)
+            if overlay is not None and not entry[1].isdisjoint(overlay.patterns):
+                self._store(overlay.compiled, key, entry)
+            else:
+                self._store(self._compiled, key, entry)
+            return entry[0]
+
+
+grok_engine = GrokEngine()
@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from grok_engine import grok_engine
+from regex_pool import RegexTimeout, limit_cpu
+
+OUTPUT_FORMATS = ('ndjson', 'csv')
+# 每个分片的目标字节数；分片多于进程数，完成一片就能汇报一次进度
+DEFAULT_SHARD_SIZE = 16 * 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=None):
+    """返回全局共享的进程池，首次使用时创建。
+
+    使用 spawn 启动子进程，避免 fork 带上 eventlet hub 和数据库连接等父进程状态。
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers or os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def reset_executor(executor):
+    """丢弃已损坏的进程池（例如工作进程超出 CPU 上限被终止），下次使用时重建。"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def split_ranges(path, shard_size=DEFAULT_SHARD_SIZE):
+    """按字节把文件切成若干 [start, end) 区间，每个边界都落在行首。"""
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            end = start + shard_size
+            if end >= size:
+                end = size
+            else:
+                # 向后推进到下一行的开头，保证不会把一行拆到两个分片
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _format_record(writer, buffer, output_format, offset, captures, field_names):
+    if output_format == 'csv':
+        writer.writerow([offset] + [captures.get(name, '') for name in field_names])
+    else:
+        buffer.write(json.dumps({'offset': offset, 'captures': captures}, ensure_ascii=False))
+        buffer.write('\n')
+
+
+def parse_range(path, start, end, expression, files, output_path, output_format, cpu_limit=0,
+                overlay=None):
+    """在子进程中解析 [start, end) 区间的行，匹配结果写入 output_path。
+
+    逐行读取、逐行写出，内存占用与分片大小无关。cpu_limit 大于 0 时限制本分片可用的
+    CPU 秒数，灾难性回溯的表达式会让工作进程被终止而不是无限占用核心。
+    返回 (匹配行数, 未匹配行数, 字节数)。
+    """
+    limit_cpu(cpu_limit)
+    compiled = grok_engine.compile(expression, files, overlay)
+    field_names = compiled.field_names
+    matched = 0
+    unmatched = 0
+    with open(path, 'rb') as source, open(output_path, 'w', encoding='utf-8', newline='') as output:
+        writer = csv.writer(output) if output_format == 'csv' else None
+        source.seek(start)
+        offset = start
+        while offset < end:
+            raw = source.readline()
+            if not raw:
+                break
+            line_offset = offset
+            offset += len(raw)
+            line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+            if not line.strip():
+                continue
+            captures = compiled.match(line)
+            if captures is None:
+                unmatched += 1
+                continue
+            matched += 1
+            _format_record(writer, output, output_format, line_offset, captures, field_names)
+    return matched, unmatched, end - start
+
+
+def csv_header(expression, files, overlay=None):
+    return ['offset'] + grok_engine.compile(expression, files, overlay).field_names
+
+
+def run_bulk_parse(path, expression, files, output_format, result_path,
+                   progress=None, sleep=time.sleep, executor=None,
+                   shard_size=DEFAULT_SHARD_SIZE, poll_interval=0.2, cpu_limit=0, overlay=None):
+    """把文件按行对齐分片后交给进程池并行解析，按分片顺序合并结果。
+
+    progress(bytes_done, bytes_total, matched, unmatched) 在每个分片完成时调用；
+    等待期间通过 sleep 让出，调用方可传入 socketio.sleep 以免阻塞事件循环。
+    overlay 为用户的自定义模式覆盖层，随任务一起发送给子进程。
+    工作进程因超出 cpu_limit 被终止时抛出 RegexTimeout。返回 (匹配行数, 未匹配行数)。
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'不支持的输出格式: {output_format}')
+    executor = executor or get_executor()
+    files = tuple(files) if files is not None else None
+    total = os.path.getsize(path)
+    ranges = split_ranges(path, shard_size)
+    shard_paths = [f'{result_path}.{index}.part' for index in range(len(ranges))]
+    futures = [
+        executor.submit(parse_range, path, start, end, expression, files, shard_path,
+                        output_format, cpu_limit, overlay)
+        for (start, end), shard_path in zip(ranges, shard_paths)
+    ]
+
+    matched = 0
+    unmatched = 0
+    bytes_done = 0
+    pending = set(range(len(futures)))
+    try:
+        while pending:
+            for index in sorted(pending):
+                future = futures[index]
+                if not future.done():
+                    continue
+                try:
+                    shard_matched, shard_unmatched, shard_bytes = future.result()
+                except BrokenProcessPool as e:
+                    reset_executor(executor)
+                    raise RegexTimeout('表达式执行超过 CPU 时间限制，可能存在灾难性回溯') from e
+                pending.discard(index)
+                matched += shard_matched
+                unmatched += shard_unmatched
+                bytes_done += shard_bytes
+                if progress:
+                    progress(bytes_done, total, matched, unmatched)
+            if pending:
+                sleep(poll_interval)
+
+        with open(result_path, 'w', encoding='utf-8', newline='') as output:
+            if output_format == 'csv':
+                header = io.StringIO()
+                csv.writer(header).writerow(csv_header(expression, files, overlay))
+                output.write(header.getvalue())
+            for shard_path in shard_paths:
+                with open(shard_path, 'r', encoding='utf-8', newline='') as shard:
+                    shutil.copyfileobj(shard, output)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        if os.path.exists(result_path):
+            os.remove(result_path)
+        raise
+    finally:
+        for shard_path in shard_paths:
+            if os.path.exists(shard_path):
+                os.remove(shard_path)
+
+    if progress and not ranges:
+        progress(0, 0, 0, 0)
+    return matched, unmatched
@@ -0,0 +1,113 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+import metrics
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+# Socket.IO / Engine.IO 每个包都会记一行 INFO，默认只保留警告
+DEFAULT_LEVELS = 'socketio=WARNING,engineio=WARNING'
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """只把记录放进内存队列，格式化和写出都留给后台线程；队列满时丢弃并计数。"""
+
+    def prepare(self, record):
+        # 队列在同一进程内，不需要像默认实现那样先格式化成字符串再入队
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+
+def parse_levels(spec):
+    """解析 "socketio=WARNING,websync.upload=DEBUG" 形式的按子系统日志级别。"""
+    levels = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, level = item.partition('=')
+        if not sep or not name.strip() or not isinstance(logging.getLevelName(level.strip().upper()), int):
+            raise ValueError(f'无效的日志级别配置: {item}')
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+class LogPipeline:
+    """根日志器只挂一个队列处理器，真正的输出由后台线程完成，请求线程不再做同步 I/O。"""
+
+    def __init__(self):
+        self.listener = None
+        self.handler = None
+
+    def configure(self, level='INFO', levels=DEFAULT_LEVELS, queue_size=10000, stream=None):
+        """可重复调用，后一次配置替换前一次。"""
+        self.stop()
+        root = logging.getLogger()
+        root.setLevel(logging.getLevelName(level.upper()) if isinstance(level, str) else level)
+        for name, subsystem_level in parse_levels(levels).items():
+            logging.getLogger(name).setLevel(subsystem_level)
+
+        writer = logging.StreamHandler(stream or sys.stderr)
+        writer.setFormatter(logging.Formatter(LOG_FORMAT))
+        log_queue = queue.Queue(queue_size)
+        self.handler = _NonBlockingQueueHandler(log_queue)
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(self.handler)
+        self.listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """写完队列中剩余的记录后停止后台线程。"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+class SampledLogger:
+    """高频事件的日志：同一条消息模板每 interval 秒最多输出一次，期间省略的条数附在下一条末尾。
+
+    模板而不是参数作为键，数量有限，不需要清理。
+    """
+
+    def __init__(self, logger, interval=1.0):
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state = {}  # 模板 -> [上次输出时间, 省略条数]
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault(msg, [float('-inf'), 0])
+            if now - state[0] < self.interval:
+                state[1] += 1
+                return
+            suppressed = state[1]
+            state[0], state[1] = now, 0
+        if suppressed:
+            self.logger.log(level, msg + '（期间省略 %d 条）', *args, suppressed)
+        else:
+            self.logger.log(level, msg, *args)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+
+
+log_pipeline = LogPipeline()
+atexit.register(log_pipeline.stop)
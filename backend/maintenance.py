@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceJob:
+    def __init__(self, name, function, interval, initial_delay):
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.next_run = None
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+
+    def status(self, now):
+        return {
+            'name': self.name,
+            'interval': self.interval,
+            'running': self.running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_started_at': self.last_started_at.isoformat() if self.last_started_at else None,
+            'last_duration_ms': round(self.last_duration * 1000, 3) if self.last_duration is not None else None,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+            'next_run_in': max(0.0, round(self.next_run - now, 3)) if self.next_run is not None else None,
+        }
+
+
+class MaintenanceScheduler:
+    """按各自的间隔在后台依次执行清理任务，请求路径上不再做任何清理。
+
+    任务函数返回处理的条数（或其他可序列化的结果），抛出的异常只记录，不影响后续调度。
+    每次执行后把状态写入 status_path，多进程部署时 Web 进程也能读到服务进程的执行情况。
+    """
+
+    def __init__(self, tick=5.0, sleep=time.sleep, clock=time.monotonic, status_path=None):
+        self.tick = tick
+        self.sleep = sleep
+        self.clock = clock
+        self.status_path = status_path
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def configure(self, tick=None, sleep=None, status_path=None):
+        if tick is not None:
+            self.tick = tick
+        if sleep is not None:
+            self.sleep = sleep
+        if status_path is not None:
+            self.status_path = status_path
+
+    def register(self, name, function, interval, initial_delay=None):
+        """注册任务；initial_delay 为启动后首次执行前的等待秒数，默认等于 interval。"""
+        if interval <= 0:
+            raise ValueError(f'维护任务 {name} 的间隔必须大于 0')
+        self.jobs[name] = MaintenanceJob(
+            name, function, interval, interval if initial_delay is None else initial_delay
+        )
+
+    def run_job(self, name):
+        """立即执行一次指定任务，返回任务结果；任务正在执行时返回 None。"""
+        job = self.jobs[name]
+        with self._lock:
+            if job.running:
+                return None
+            job.running = True
+        job.last_started_at = datetime.utcnow()
+        started = self.clock()
+        status = 'ok'
+        try:
+            job.last_result = job.function()
+            job.last_error = None
+            if job.last_result:
+                logger.info("维护任务 %s 完成: %s", name, job.last_result)
+            return job.last_result
+        except Exception as e:
+            status = 'error'
+            job.failures += 1
+            job.last_error = str(e)
+            logger.error("维护任务 %s 失败: %s", name, e)
+            return None
+        finally:
+            job.last_duration = self.clock() - started
+            job.runs += 1
+            job.next_run = self.clock() + job.interval
+            job.running = False
+            metrics.MAINTENANCE_DURATION.observe(job.last_duration, name)
+            metrics.MAINTENANCE_RUNS.inc(name, status)
+            self.save_status()
+
+    def run_pending(self):
+        """执行所有已到期的任务，返回执行过的任务名。"""
+        now = self.clock()
+        due = []
+        for job in self.jobs.values():
+            if job.next_run is None:
+                job.next_run = now + job.initial_delay
+            if job.next_run <= now:
+                due.append(job.name)
+        for name in due:
+            self.run_job(name)
+        return due
+
+    def run_forever(self):
+        while True:
+            self.run_pending()
+            self.sleep(self.tick)
+
+    def status(self):
+        now = self.clock()
+        return [job.status(now) for job in self.jobs.values()]
+
+    def save_status(self):
+        if not self.status_path:
+            return
+        document = {'updated_at': datetime.utcnow().isoformat(), 'pid': os.getpid(), 'jobs': self.status()}
+        try:
+            os.makedirs(os.path.dirname(self.status_path) or '.', exist_ok=True)
+            with open(f'{self.status_path}.tmp', 'w', encoding='utf-8') as f:
+                json.dump(document, f, ensure_ascii=False)
+            os.replace(f'{self.status_path}.tmp', self.status_path)
+        except OSError as e:
+            logger.warning("写入维护任务状态失败: %s", e)
+
+    def load_status(self, path=None):
+        """读取最近一次保存的状态；还没有任务执行过时返回 None。
+
+        path 默认为本调度器的状态文件，Web 进程不运行调度器，按应用配置传入后台服务进程写出的路径。
+        """
+        path = path or self.status_path
+        if not path:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+maintenance = MaintenanceScheduler()
@@ -0,0 +1,253 @@
+import bisect
+import threading
+import time
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+THROUGHPUT_BUCKETS = tuple(float(2 ** power) for power in range(16, 32, 2))  # 64KB/s ~ 1GB/s
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _label_text(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, self._label_text(labels), value) for labels, value in items]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def set(self, value, *labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set_function(self, function):
+        """采集时调用 function() 取值，适合队列长度这类随时可读的状态。"""
+        self._function = function
+
+    def value(self, *labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                return [(self.name, '', self._function())]
+            except Exception:
+                return []
+        return super().samples()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, documentation, labelnames)
+
+    def observe(self, value, *labels):
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, *labels):
+        """用作上下文管理器，记录代码块的耗时（秒）。未启用时不计时。"""
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(state[0]), state[1])) for labels, state in self._values.items())
+        samples = []
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((
+                    f'{self.name}_bucket',
+                    self._label_text(labels, [('le', _format_value(float(bound)))]),
+                    cumulative
+                ))
+            samples.append((f'{self.name}_sum', self._label_text(labels), total))
+            samples.append((f'{self.name}_count', self._label_text(labels), cumulative))
+        return samples
+
+
+class Registry:
+    """进程内的指标集合，按 Prometheus 文本格式输出。
+
+    enabled 为 False 时所有记录操作直接返回，计时器也不会读取时钟。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+registry = Registry()
+
+HTTP_REQUEST_DURATION = Histogram(
+    registry, 'websync_http_request_duration_seconds', 'HTTP 请求处理耗时', ('method', 'endpoint'))
+HTTP_REQUESTS = Counter(
+    registry, 'websync_http_requests_total', 'HTTP 请求数', ('method', 'endpoint', 'status'))
+DB_QUERIES = Counter(registry, 'websync_db_queries_total', '执行的 SQL 语句数')
+DB_QUERIES_PER_REQUEST = Histogram(
+    registry, 'websync_db_queries_per_request', '每个 HTTP 请求执行的 SQL 语句数', ('endpoint',),
+    buckets=QUERY_COUNT_BUCKETS)
+UPLOAD_BYTES = Counter(registry, 'websync_upload_bytes_total', '上传接收的字节数', ('path',))
+UPLOAD_CHUNKS = Counter(registry, 'websync_upload_chunks_total', '上传接收的数据块数', ('path',))
+UPLOAD_THROUGHPUT = Histogram(
+    registry, 'websync_upload_throughput_bytes_per_second', '单次上传请求的接收速率', ('path',),
+    buckets=THROUGHPUT_BUCKETS)
+HASH_DURATION = Histogram(
+    registry, 'websync_hash_duration_seconds', '哈希计算耗时', ('algorithm',), buckets=FAST_BUCKETS)
+CRYPTO_DURATION = Histogram(
+    registry, 'websync_crypto_duration_seconds', '加解密耗时', ('operation',), buckets=FAST_BUCKETS)
+WATCHER_EVENTS = Counter(registry, 'websync_watcher_events_total', '文件监视器收到的事件数', ('event',))
+WATCHER_QUEUE = Gauge(registry, 'websync_watcher_queue_length', '文件监视器待处理的事件数')
+SOCKETIO_CLIENTS = Gauge(registry, 'websync_socketio_clients', '当前连接的 Socket.IO 客户端数')
+SOCKETIO_EMITS = Counter(registry, 'websync_socketio_emits_total', '推送的 Socket.IO 事件数', ('event',))
+LOG_RECORDS_DROPPED = Counter(registry, 'websync_log_records_dropped_total', '日志队列已满时丢弃的记录数')
+MAINTENANCE_DURATION = Histogram(
+    registry, 'websync_maintenance_duration_seconds', '后台维护任务单次执行耗时', ('job',))
+MAINTENANCE_RUNS = Counter(registry, 'websync_maintenance_runs_total', '后台维护任务执行次数', ('job', 'status'))
+ADMISSION_ACTIVE = Gauge(registry, 'websync_admission_active_transfers', '正在进行的上传/下载数')
+ADMISSION_QUEUE = Gauge(registry, 'websync_admission_queue_length', '排队等待传输名额的请求数')
+ADMISSION_WAIT = Histogram(
+    registry, 'websync_admission_wait_seconds', '传输请求排队等待名额的时间', ('priority',))
+ADMISSION_REJECTED = Counter(
+    registry, 'websync_admission_rejected_total', '因排队已满或超时被拒绝（429）的传输请求数', ('reason',))
+THROTTLE_EVENTS = Counter(registry, 'websync_throttle_events_total', '传输超过用户带宽限额而等待的次数', ('direction',))
+THROTTLE_SECONDS = Counter(registry, 'websync_throttle_seconds_total', '因带宽限额累计等待的秒数', ('direction',))
+OAUTH_REQUEST_DURATION = Histogram(
+    registry, 'websync_oauth_request_duration_seconds', '调用身份提供方接口的耗时', ('endpoint',))
+CHUNK_STORE_BYTES = Counter(
+    registry, 'websync_chunk_store_bytes_total', '版本历史分块入库的字节数，按新写入与去重复用区分', ('result',))
+STORAGE_REQUEST_DURATION = Histogram(
+    registry, 'websync_storage_request_duration_seconds', '调用对象存储接口的耗时', ('operation',))
+STORAGE_CACHE_REQUESTS = Counter(
+    registry, 'websync_storage_cache_requests_total', '对象存储本地读缓存的命中情况', ('result',))
+PREVIEW_REQUESTS = Counter(
+    registry, 'websync_preview_requests_total', '文件预览请求数，按缓存命中、未命中与 304 区分', ('result',))
+PREVIEW_GENERATE_DURATION = Histogram(
+    registry, 'websync_preview_generate_duration_seconds', '生成一份文件预览的耗时', ('kind',))
+TRASH_PURGED = Counter(
+    registry, 'websync_trash_purged_total', '后台回收物理删除的对象数，按回收站文件与随用户删除的对象区分', ('kind',))
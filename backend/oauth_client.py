@@ -0,0 +1,250 @@
+import http.client
+import json
+import logging
+import re
+import ssl
+import threading
+import time
+import urllib.parse
+
+import jwt
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_JWKS_URI = 'https://www.googleapis.com/oauth2/v3/certs'
+GOOGLE_ISSUERS = ('https://accounts.google.com', 'accounts.google.com')
+ID_TOKEN_ALGORITHMS = ('RS256',)
+IDLE_CONNECTION_TIMEOUT = 60  # 空闲超过这个秒数的连接不再复用，避免撞上服务端已关闭的连接
+
+
+class OAuthError(Exception):
+    """身份提供方返回错误，或 id_token 校验失败。"""
+
+
+class HTTPPool:
+    """按 (scheme, host, port) 复用 keep-alive 连接，身份提供方的调用不必每次重新握手。
+
+    复用的连接在发送时发现已被对端关闭会换新连接重试一次。
+    """
+
+    def __init__(self, max_idle=4, timeout=10.0):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = {}  # (scheme, host, port) -> [(连接, 归还时间)]
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+
+    def _connect(self, scheme, host, port):
+        self.connections_opened += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _acquire(self, key):
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection, released = idle.pop()
+                if now - released < IDLE_CONNECTION_TIMEOUT:
+                    return connection, True
+                connection.close()
+        return self._connect(*key), False
+
+    def _release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def request(self, method, url, body=None, headers=None):
+        """发送请求并读完响应体，返回 (状态码, 响应头, 响应体)。"""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise OAuthError(f'不支持的地址: {url}')
+        key = (parts.scheme, parts.hostname, parts.port)
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        for attempt in range(2):
+            connection, reused = self._acquire(key)
+            try:
+                connection.request(method, target, body=body, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except ConnectionError:
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+            return response.status, response.headers, data
+
+    def fetch_json(self, method, url, body=None, headers=None):
+        """请求 JSON 接口，返回 (解析后的内容, 响应头)；HTTP 错误转成 OAuthError。"""
+        status, response_headers, data = self.request(method, url, body=body, headers=headers)
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            raise OAuthError(f'{url} 返回的不是 JSON（HTTP {status}）')
+        if status >= 400:
+            detail = payload.get('error') if isinstance(payload, dict) else None
+            raise OAuthError(f'{url} 返回 HTTP {status}: {detail or "未知错误"}')
+        return payload, response_headers
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+
+class JWKSCache:
+    """缓存身份提供方的签名公钥。
+
+    按响应的 Cache-Control max-age（没有时用 ttl）过期后再取；遇到未知 kid 说明公钥已轮换，
+    距上次拉取超过 min_refresh_interval 秒就立即重新拉取。拉取失败时继续使用旧公钥。
+    """
+
+    def __init__(self, http, url, ttl=3600, min_refresh_interval=60, clock=time.monotonic):
+        self.http = http
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.clock = clock
+        self.keys = {}
+        self.fetched_at = None
+        self.expires_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def stale(self):
+        return self.expires_at is None or self.clock() >= self.expires_at
+
+    def refresh(self):
+        with metrics.OAUTH_REQUEST_DURATION.time('jwks'):
+            payload, headers = self.http.fetch_json('GET', self.url)
+        try:
+            key_set = jwt.PyJWKSet.from_dict(payload)
+        except jwt.PyJWTError as e:
+            raise OAuthError(f'JWKS 内容无效: {e}')
+        max_age = re.search(r'max-age=(\d+)', headers.get('Cache-Control', ''))
+        now = self.clock()
+        with self._lock:
+            self.keys = {key.key_id: key for key in key_set.keys}
+            self.fetched_at = now
+            self.expires_at = now + (int(max_age.group(1)) if max_age else self.ttl)
+
+    def _refresh_or_keep(self):
+        try:
+            self.refresh()
+        except (OSError, OAuthError) as e:
+            if not self.keys:
+                raise
+            logger.warning("刷新 JWKS 失败，继续使用缓存的公钥: %s", e)
+
+    def get_key(self, key_id):
+        if self.stale:
+            self._refresh_or_keep()
+        key = self.keys.get(key_id)
+        if key is None and self.clock() - self.fetched_at >= self.min_refresh_interval:
+            self._refresh_or_keep()
+            key = self.keys.get(key_id)
+        if key is None:
+            raise OAuthError(f'id_token 的签名公钥 {key_id} 不存在')
+        return key
+
+
+class OAuthClient:
+    """授权码登录：一次请求换取 id_token，在本地用缓存的 JWKS 验签，不再调用 userinfo 接口。"""
+
+    def __init__(self, timeout=10.0, max_idle=4, jwks_ttl=3600, leeway=60):
+        self.http = HTTPPool(max_idle=max_idle, timeout=timeout)
+        self.jwks_ttl = jwks_ttl
+        self.leeway = leeway
+        self._jwks = {}
+        self._lock = threading.Lock()
+
+    def configure(self, timeout=None, max_idle=None, jwks_ttl=None, leeway=None):
+        if timeout is not None:
+            self.http.timeout = timeout
+        if max_idle is not None:
+            self.http.max_idle = max_idle
+        if jwks_ttl is not None:
+            self.jwks_ttl = jwks_ttl
+        if leeway is not None:
+            self.leeway = leeway
+
+    def jwks(self, config):
+        url = config.get('jwks_uri') or GOOGLE_JWKS_URI
+        with self._lock:
+            cache = self._jwks.get(url)
+            if cache is None:
+                cache = self._jwks[url] = JWKSCache(self.http, url, ttl=self.jwks_ttl)
+        return cache
+
+    def warm_up(self, config):
+        """提前拉取公钥，回调时只剩换取 token 这一次往返。失败只记录日志。"""
+        cache = self.jwks(config)
+        if not cache.stale:
+            return
+        try:
+            cache.refresh()
+        except (OSError, OAuthError) as e:
+            logger.warning("预取 JWKS 失败: %s", e)
+
+    def exchange_code(self, config, code, redirect_uri):
+        """用授权码换取 token，返回校验通过的 id_token 声明。"""
+        body = urllib.parse.urlencode({
+            'code': code,
+            'client_id': config['client_id'],
+            'client_secret': config['client_secret'],
+            'redirect_uri': redirect_uri,
+            'grant_type': 'authorization_code'
+        })
+        with metrics.OAUTH_REQUEST_DURATION.time('token'):
+            token_data, _ = self.http.fetch_json(
+                'POST',
+                config['token_uri'],
+                body=body,
+                headers={'Content-Type': 'application/x-www-form-urlencoded', 'Accept': 'application/json'}
+            )
+        id_token = token_data.get('id_token') if isinstance(token_data, dict) else None
+        if not id_token:
+            raise OAuthError('token 响应中缺少 id_token')
+        return self.verify_id_token(config, id_token)
+
+    def verify_id_token(self, config, id_token):
+        try:
+            header = jwt.get_unverified_header(id_token)
+            if header.get('alg') not in ID_TOKEN_ALGORITHMS:
+                raise OAuthError(f'id_token 使用了不接受的签名算法 {header.get("alg")}')
+            key = self.jwks(config).get_key(header.get('kid'))
+            issuer = config.get('issuer')
+            return jwt.decode(
+                id_token,
+                key.key,
+                algorithms=list(ID_TOKEN_ALGORITHMS),
+                audience=config['client_id'],
+                issuer=[issuer] if issuer else list(GOOGLE_ISSUERS),
+                leeway=self.leeway,
+                options={'require': ['exp', 'iat', 'iss', 'aud', 'sub']}
+            )
+        except jwt.PyJWTError as e:
+            raise OAuthError(f'id_token 校验失败: {e}')
+
+    def close(self):
+        self.http.close()
+
+
+oauth_client = OAuthClient()
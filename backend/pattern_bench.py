@@ -0,0 +1,317 @@
+"""grok 模式库性能分析工具
+
+对每个命名模式展开编译后，用随附语料中的匹配行、近似但不匹配的行以及
+针对性构造的对抗输入计时，找出编译慢、执行慢或容易回溯的模式。
+
+    python pattern_bench.py                        # 文本报告，按最坏耗时排序
+    python pattern_bench.py --json report.json     # 输出 JSON，便于在模式库版本间对比
+    python pattern_bench.py --compare report.json  # 与基线对比，存在退化时返回 1
+
+每个模式在 RegexPool 的隔离进程中执行，超过 --timeout 的模式记为超时而不会卡住整个分析。
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import platform
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from grok_discovery import required_literals
+from grok_engine import GrokError, grok_engine
+from pattern_library import pattern_library
+from regex_pool import RegexPool, RegexTimeout
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pattern_corpus.log')
+ADVERSARIAL_LENGTH = 2048
+# 每个输入至少累计计时的纳秒数，单次很快的输入会重复执行取平均
+MIN_SAMPLE_NS = 200_000
+# 对抗输入的填充单元：长串同类字符最容易触发嵌套量词的回溯
+FILLERS = ('a', '0', ' ', '.', ':', '-', '/', 'a ', '0.', 'a:', 'a-')
+# 对抗输入中最多使用的必需字面量个数
+MAX_LITERAL_INPUTS = 3
+# 对比时的指标；两侧都低于 COMPARE_FLOOR_NS 的差异视为噪声
+COMPARED_METRICS = ('compile_ns', 'ns_per_match', 'ns_per_miss', 'worst_case_ns')
+COMPARE_FLOOR_NS = 2_000
+DEFAULT_THRESHOLD = 1.5
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\r\n') for line in f if line.strip()]
+
+
+def near_misses(lines):
+    """由语料行派生出形似但大多不再匹配的行：截断、数字换成字母、分隔符换成制表符。"""
+    variants = []
+    seen = set(lines)
+    for line in lines:
+        for variant in (
+            line[:len(line) * 3 // 4],
+            re.sub(r'\d', 'x', line),
+            line.replace(' ', '\t'),
+        ):
+            if variant and variant not in seen:
+                seen.add(variant)
+                variants.append(variant)
+    return variants
+
+
+def adversarial_inputs(regex, length=ADVERSARIAL_LENGTH):
+    """构造 {说明: 文本} 形式的对抗输入：长串重复字符，以及重复必需字面量后以无效字符收尾。"""
+    inputs = {}
+    for filler in FILLERS:
+        inputs[f'repeat {filler!r}'] = (filler * (length // len(filler) + 1))[:length] + '\x00'
+    literals, _ = required_literals(regex)
+    for literal in sorted(literals, key=lambda item: (-len(item), item))[:MAX_LITERAL_INPUTS]:
+        unit = f'{literal}a0 '
+        inputs[f'literal {literal!r}'] = (unit * (length // len(unit) + 1))[:length] + '\x00'
+    return inputs
+
+
+def time_search(regex, text, min_ns=MIN_SAMPLE_NS):
+    """返回 regex.search(text) 的平均耗时（纳秒），重复执行直到累计时间不少于 min_ns。"""
+    search = regex.search
+    runs = 0
+    elapsed = 0
+    batch = 1
+    while elapsed < min_ns:
+        started = time.perf_counter_ns()
+        for _ in range(batch):
+            search(text)
+        elapsed += time.perf_counter_ns() - started
+        runs += batch
+        batch *= 2
+    return elapsed // runs
+
+
+def _mean(values):
+    return sum(values) // len(values) if values else None
+
+
+def profile_pattern(name, files=None, corpus=None, adversarial_length=ADVERSARIAL_LENGTH,
+                    min_sample_ns=MIN_SAMPLE_NS, engine=grok_engine):
+    """分析单个命名模式，返回编译耗时、展开深度以及匹配/未匹配/对抗输入的计时。"""
+    expression = f'%{{{name}}}'
+    corpus = load_corpus() if corpus is None else corpus
+    engine.clear()
+    started = time.perf_counter_ns()
+    compiled = engine.compile(expression, files)
+    compile_ns = time.perf_counter_ns() - started
+    regex = compiled.regex
+
+    hits = [line for line in corpus if regex.search(line)]
+    misses = [line for line in near_misses(corpus) if not regex.search(line)]
+    worst_ns = 0
+    worst_input = None
+    for label, text in adversarial_inputs(regex, adversarial_length).items():
+        elapsed = time_search(regex, text, min_sample_ns)
+        if elapsed > worst_ns:
+            worst_ns = elapsed
+            worst_input = label
+
+    return {
+        'name': name,
+        'depth': engine.expansion_depth(expression, files),
+        'regex_length': len(regex.pattern),
+        'fields': len(compiled.field_names),
+        'compile_ns': compile_ns,
+        'matched_lines': len(hits),
+        'ns_per_match': _mean([time_search(regex, line, min_sample_ns) for line in hits]),
+        'ns_per_miss': _mean([time_search(regex, line, min_sample_ns) for line in misses]),
+        'worst_case_ns': worst_ns,
+        'worst_case_input': worst_input,
+    }
+
+
+def select_patterns(snapshot, files=None, globs=None):
+    """按文件名排序列出 (模式名, 所在文件)，同名模式只保留先出现者。"""
+    selected = []
+    seen = set()
+    for filename in sorted(snapshot.files):
+        for name in snapshot.files[filename]:
+            if name in seen:
+                continue
+            seen.add(name)
+            if files and filename not in files:
+                continue
+            if globs and not any(fnmatch.fnmatchcase(name, pattern) for pattern in globs):
+                continue
+            selected.append((name, filename))
+    return selected
+
+
+def run_benchmark(files=None, globs=None, workers=None, timeout=10.0, cpu_limit=10,
+                  adversarial_length=ADVERSARIAL_LENGTH, min_sample_ns=MIN_SAMPLE_NS,
+                  corpus_path=CORPUS_PATH, progress=None):
+    """在隔离进程池中分析选中的模式，返回可序列化为 JSON 的报告。"""
+    snapshot = pattern_library.snapshot()
+    corpus = load_corpus(corpus_path)
+    targets = select_patterns(snapshot, files, globs)
+    workers = workers or os.cpu_count() or 1
+    pool = RegexPool(workers=workers, timeout=timeout, cpu_limit=cpu_limit,
+                     max_queue=len(targets), queue_timeout=timeout * len(targets) + 60)
+
+    def profile(target):
+        name, filename = target
+        entry = {'name': name, 'file': filename}
+        try:
+            entry.update(pool.run('profile_pattern', name, None, corpus,
+                                  adversarial_length, min_sample_ns))
+        except RegexTimeout as e:
+            entry.update(timed_out=True, error=str(e))
+        except GrokError as e:
+            entry['error'] = str(e)
+        if progress:
+            progress(entry)
+        return entry
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(profile, targets))
+    finally:
+        pool.shutdown()
+
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'library': snapshot.etag,
+        'corpus': hashlib.sha256('\n'.join(corpus).encode('utf-8')).hexdigest()[:16],
+        'settings': {
+            'timeout': timeout,
+            'cpu_limit': cpu_limit,
+            'adversarial_length': adversarial_length,
+            'min_sample_ns': min_sample_ns,
+        },
+        'elapsed_s': round(time.perf_counter() - started, 3),
+        'patterns': results,
+    }
+
+
+def compare_reports(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """对比两份报告中同名模式的各项指标，返回比值超过 threshold 或新出现超时的条目。"""
+    previous = {entry['name']: entry for entry in baseline['patterns']}
+    regressions = []
+    for entry in current['patterns']:
+        before = previous.get(entry['name'])
+        if before is None:
+            continue
+        if entry.get('timed_out') and not before.get('timed_out'):
+            regressions.append({'name': entry['name'], 'metric': 'timed_out', 'before': False, 'after': True})
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), entry.get(metric)
+            if not old or new is None or max(old, new) < COMPARE_FLOOR_NS:
+                continue
+            ratio = new / old
+            if ratio >= threshold:
+                regressions.append({
+                    'name': entry['name'],
+                    'metric': metric,
+                    'before': old,
+                    'after': new,
+                    'ratio': round(ratio, 2)
+                })
+    return regressions
+
+
+def _format_ns(value):
+    if value is None:
+        return '-'
+    if value >= 1_000_000:
+        return f'{value / 1_000_000:.2f}ms'
+    if value >= 1_000:
+        return f'{value / 1_000:.1f}us'
+    return f'{value}ns'
+
+
+def format_report(report, top=None):
+    rows = sorted(
+        report['patterns'],
+        key=lambda entry: (not entry.get('timed_out'), -(entry.get('worst_case_ns') or 0))
+    )
+    if top:
+        rows = rows[:top]
+    header = ('pattern', 'file', 'depth', 'compile', 'per match', 'per miss', 'worst case', 'worst input')
+    table = [header]
+    for entry in rows:
+        if entry.get('error'):
+            status = 'TIMEOUT' if entry.get('timed_out') else 'ERROR'
+            table.append((entry['name'], entry['file'], '-', '-', '-', '-', status, entry['error'][:40]))
+            continue
+        table.append((
+            entry['name'],
+            entry['file'],
+            str(entry['depth']),
+            _format_ns(entry['compile_ns']),
+            _format_ns(entry['ns_per_match']),
+            _format_ns(entry['ns_per_miss']),
+            _format_ns(entry['worst_case_ns']),
+            entry['worst_case_input'] or '-',
+        ))
+    widths = [max(len(row[column]) for row in table) for column in range(len(header))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in table]
+    lines.append(f"{len(report['patterns'])} 个模式，耗时 {report['elapsed_s']}s，模式库 {report['library'][:12]}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='分析 grok 模式库中每个命名模式的编译与匹配性能')
+    parser.add_argument('--files', nargs='+', help='只分析这些模式文件中的模式')
+    parser.add_argument('--pattern', nargs='+', dest='globs', help='只分析名称匹配这些通配符的模式')
+    parser.add_argument('--json', metavar='PATH', help="把完整报告写成 JSON，'-' 表示标准输出")
+    parser.add_argument('--compare', metavar='BASELINE', help='与基线 JSON 报告对比，存在退化时返回 1')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='判定退化的耗时比值')
+    parser.add_argument('--top', type=int, default=30, help='文本报告中显示的行数，0 表示全部')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数，默认 CPU 核数')
+    parser.add_argument('--timeout', type=float, default=10.0, help='单个模式的墙钟超时（秒）')
+    parser.add_argument('--cpu-limit', type=int, default=10, help='单个模式的 CPU 时间上限（秒）')
+    parser.add_argument('--length', type=int, default=ADVERSARIAL_LENGTH, help='对抗输入的长度')
+    parser.add_argument('--corpus', default=CORPUS_PATH, help='语料文件，每行一条样例日志')
+    args = parser.parse_args(argv)
+
+    def progress(entry):
+        if args.json != '-':
+            print(f"\r已分析 {entry['name'][:40]:<40}", end='', file=sys.stderr, flush=True)
+
+    report = run_benchmark(
+        files=args.files,
+        globs=args.globs,
+        workers=args.workers,
+        timeout=args.timeout,
+        cpu_limit=args.cpu_limit,
+        adversarial_length=args.length,
+        corpus_path=args.corpus,
+        progress=progress
+    )
+    if args.json != '-':
+        print(file=sys.stderr)
+
+    if args.json == '-':
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        print(format_report(report, args.top or None))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_reports(json.load(f), report, args.threshold)
+        for item in regressions:
+            ratio = f" x{item['ratio']}" if 'ratio' in item else ''
+            print(f"退化: {item['name']} {item['metric']} {item['before']} -> {item['after']}{ratio}",
+                  file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+PATTERNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patterns')
+
+
+def parse_pattern_lines(lines):
+    """解析 grok 模式文本，返回 {名称: 表达式}，跳过空行、注释和格式错误的行。"""
+    patterns = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            name, pattern = line.split(' ', 1)
+            patterns[name] = pattern.strip()
+        except ValueError:
+            continue
+    return patterns
+
+
+class PatternSnapshot:
+    """某一时刻模式库的只读快照，连同预先序列化和压缩好的响应体。"""
+
+    def __init__(self, files, signature):
+        self.files = files
+        self.signature = signature
+        self.payload = json.dumps(files, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        self.gzip_payload = gzip.compress(self.payload, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(self.payload).hexdigest()[:32]
+        # 单个文件的响应体按需生成后缓存在快照里，快照替换时随之失效
+        self._file_payloads = {}
+
+    def file_payload(self, filename):
+        cached = self._file_payloads.get(filename)
+        if cached is None:
+            payload = json.dumps(self.files[filename], ensure_ascii=False, sort_keys=True).encode('utf-8')
+            cached = (payload, hashlib.sha256(payload).hexdigest()[:32])
+            self._file_payloads[filename] = cached
+        return cached
+
+
+class PatternLibrary:
+    """内存中的模式库索引，按文件 mtime 失效。
+
+    为避免每个请求都 stat 整个目录，两次检查之间至少间隔 check_interval 秒。
+    """
+
+    def __init__(self, patterns_dir=PATTERNS_DIR, check_interval=2.0):
+        self.patterns_dir = patterns_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+
+    def _scan(self):
+        """返回目录中模式文件的 (文件名, mtime_ns, 大小) 签名。"""
+        if not os.path.isdir(self.patterns_dir):
+            os.makedirs(self.patterns_dir, exist_ok=True)
+        entries = []
+        with os.scandir(self.patterns_dir) as it:
+            for entry in it:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
+
+    def _load(self, signature):
+        files = {}
+        for filename, _, _ in signature:
+            with open(os.path.join(self.patterns_dir, filename), 'r', encoding='utf-8') as f:
+                files[filename] = parse_pattern_lines(f)
+        return PatternSnapshot(files, signature)
+
+    def snapshot(self):
+        """返回最新快照，文件有变动时重新解析。"""
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot
+            signature = self._scan()
+            if self._snapshot is None or self._snapshot.signature != signature:
+                self._snapshot = self._load(signature)
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        """强制下一次访问重新扫描目录。"""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def filenames(self):
+        return list(self.snapshot().files)
+
+
+pattern_library = PatternLibrary()
@@ -0,0 +1,294 @@
+import base64
+import codecs
+import hashlib
+import io
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import deque
+
+import metrics
+
+try:
+    from PIL import Image
+    IMAGE_ERRORS = (Image.UnidentifiedImageError, Image.DecompressionBombError)
+except ImportError:  # 未安装 Pillow 时图片只返回不支持预览
+    Image = None
+    IMAGE_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+TEXT = 'text'
+IMAGE = 'image'
+ARCHIVE = 'archive'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tif', '.tiff')
+ZIP_EXTENSIONS = ('.zip', '.jar', '.war', '.apk', '.whl', '.epub')
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# 带 BOM 的文本按 BOM 解码；否则依次尝试 UTF-8 与 GB18030（兼容 GBK/GB2312）
+TEXT_BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+TEXT_ENCODINGS = ('utf-8', 'gb18030')
+CONTROL_CHAR_RATIO = 0.05  # 控制字符超过这个比例视为二进制
+CACHE_EVICT_RATIO = 0.9
+
+
+def preview_kind(filename):
+    """按扩展名决定预览方式，其余文件都按文本尝试。"""
+    name = filename.lower()
+    if name.endswith(IMAGE_EXTENSIONS):
+        return IMAGE
+    if name.endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS):
+        return ARCHIVE
+    return TEXT
+
+
+def decode_text(data, truncated):
+    """识别编码并解码，返回 (编码, 文本)；看起来是二进制时返回 None。
+
+    内容被截断时末尾可能是半个多字节字符，使用增量解码器丢弃这部分而不是判为解码失败。
+    """
+    encodings = [encoding for bom, encoding in TEXT_BOMS if data.startswith(bom)][:1]
+    if not encodings:
+        if b'\x00' in data:
+            return None
+        encodings = TEXT_ENCODINGS
+    for encoding in encodings:
+        try:
+            text = codecs.getincrementaldecoder(encoding)().decode(data, final=not truncated)
+        except UnicodeDecodeError:
+            continue
+        controls = sum(1 for char in text if char < ' ' and char not in '\t\n\r\f\v\x1b')
+        if text and controls / len(text) > CONTROL_CHAR_RATIO:
+            return None
+        return encoding, text
+    return None
+
+
+def text_preview(f, limit):
+    data = f.read(limit + 1)
+    truncated = len(data) > limit
+    decoded = decode_text(data[:limit], truncated)
+    if decoded is None:
+        return {'type': 'binary'}
+    encoding, text = decoded
+    return {'type': TEXT, 'encoding': encoding, 'text': text, 'truncated': truncated}
+
+
+def image_preview(f, max_side):
+    if Image is None:
+        return {'type': 'unsupported', 'reason': '服务器未安装 Pillow，无法生成缩略图'}
+    with Image.open(f) as image:
+        width, height = image.size
+        # JPEG 可以在解码时直接按 1/2、1/4、1/8 缩小，大图不必完整解码
+        image.draft('RGB', (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        out = io.BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.convert('RGBA').save(out, 'PNG', optimize=True)
+            mime = 'image/png'
+        else:
+            image.convert('RGB').save(out, 'JPEG', quality=80)
+            mime = 'image/jpeg'
+    return {
+        'type': IMAGE,
+        'width': width,
+        'height': height,
+        'mime': mime,
+        'data': base64.b64encode(out.getvalue()).decode('ascii')
+    }
+
+
+def archive_preview(f, filename, max_entries):
+    """列出压缩包的前 max_entries 个条目。
+
+    zip 只读取末尾的中央目录；tar 逐个读取条目头并跳过内容，压缩的 tar 只解压到第 max_entries 个条目为止。
+    """
+    entries = []
+    truncated = False
+    if filename.lower().endswith(ZIP_EXTENSIONS):
+        archive_format = 'zip'
+        with zipfile.ZipFile(f) as archive:
+            infos = archive.infolist()
+            truncated = len(infos) > max_entries
+            for info in infos[:max_entries]:
+                entries.append({'name': info.filename, 'size': info.file_size, 'dir': info.is_dir()})
+    else:
+        archive_format = 'tar'
+        with tarfile.open(fileobj=f, mode='r:*') as archive:
+            for member in archive:
+                if len(entries) >= max_entries:
+                    truncated = True
+                    break
+                entries.append({'name': member.name, 'size': member.size, 'dir': member.isdir()})
+    return {'type': ARCHIVE, 'format': archive_format, 'entries': entries, 'truncated': truncated}
+
+
+class PreviewCache:
+    """按预览键存放生成好的 JSON，总大小超过上限时按最近访问时间淘汰。"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return payload
+
+    def put(self, key, payload):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += len(payload)
+            evict = self._size is None or self._size > self.max_bytes
+        if evict:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if not entry.name.endswith('.json'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * CACHE_EVICT_RATIO:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self._lock:
+            self._size = total
+
+
+class PreviewService:
+    """文件预览：文本的开头部分、图片缩略图和压缩包目录。
+
+    预览按文件内容哈希缓存，内容变化后哈希不同自然得到新的预览，旧预览随缓存淘汰；
+    生成默认在系统线程中进行，同一预览只生成一次，同时进行的生成数不超过 workers。
+    生成只读取需要的部分（文本前 text_bytes 字节、zip 中央目录、tar 条目头），远程存储上的大文件也只传输几 KB。
+    """
+
+    def __init__(self, directory='previews', max_bytes=64 * 1024 * 1024, text_bytes=64 * 1024,
+                 thumbnail_size=256, archive_entries=500, max_image_bytes=20 * 1024 * 1024, workers=2,
+                 spawn=None):
+        self.cache = PreviewCache(directory, max_bytes)
+        self.text_bytes = text_bytes
+        self.thumbnail_size = thumbnail_size
+        self.archive_entries = archive_entries
+        self.max_image_bytes = max_image_bytes
+        self.workers = workers
+        self.spawn = spawn or (lambda function: threading.Thread(target=function, daemon=True).start())
+        self._pending = {}
+        self._queue = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def configure(self, directory=None, max_bytes=None, text_bytes=None, thumbnail_size=None,
+                  archive_entries=None, max_image_bytes=None, workers=None, spawn=None):
+        if directory is not None:
+            self.cache = PreviewCache(directory, self.cache.max_bytes)
+        if max_bytes is not None:
+            self.cache.max_bytes = max_bytes
+        if text_bytes is not None:
+            self.text_bytes = text_bytes
+        if thumbnail_size is not None:
+            self.thumbnail_size = thumbnail_size
+        if archive_entries is not None:
+            self.archive_entries = archive_entries
+        if max_image_bytes is not None:
+            self.max_image_bytes = max_image_bytes
+        if workers is not None:
+            self.workers = workers
+        if spawn is not None:
+            self.spawn = spawn
+
+    def key(self, file_hash, kind):
+        """预览键同时作为 ETag：包含内容哈希、预览方式和影响输出的配置。"""
+        options = f'{self.text_bytes}:{self.thumbnail_size}:{self.archive_entries}'
+        return f'{kind}-{file_hash[:40]}-{hashlib.sha256(options.encode("utf-8")).hexdigest()[:8]}'
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def generate(self, kind, filename, size, opener):
+        """生成预览并返回 JSON 字节。文件格式有误时返回错误预览；读取存储失败的 OSError 照常抛出。"""
+        if kind == IMAGE and size > self.max_image_bytes:
+            return json.dumps({'type': 'unsupported', 'reason': '图片过大，不生成缩略图'}).encode('utf-8')
+        with metrics.PREVIEW_GENERATE_DURATION.time(kind):
+            with opener() as f:
+                try:
+                    if kind == IMAGE:
+                        payload = image_preview(f, self.thumbnail_size)
+                    elif kind == ARCHIVE:
+                        payload = archive_preview(f, filename, self.archive_entries)
+                    else:
+                        payload = text_preview(f, self.text_bytes)
+                except (zipfile.BadZipFile, tarfile.TarError, EOFError, ValueError) + IMAGE_ERRORS as e:
+                    payload = {'type': 'error', 'error': f'无法解析文件: {e}'}
+        return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+    def submit(self, key, kind, filename, size, opener):
+        """安排后台生成预览；同一个键已在排队或生成中时忽略。"""
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending[key] = (kind, filename, size, opener)
+            self._queue.append(key)
+            if self._running >= self.workers:
+                return
+            self._running += 1
+        self.spawn(self._drain)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._running -= 1
+                    return
+                key = self._queue.popleft()
+                kind, filename, size, opener = self._pending[key]
+            try:
+                self.cache.put(key, self.generate(kind, filename, size, opener))
+            except Exception as e:
+                # 读取失败（如对象存储暂时不可用）不缓存结果，下次请求重新生成
+                logger.warning("生成预览失败 %s: %s", filename, e)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+
+preview_service = PreviewService()
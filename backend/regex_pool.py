@@ -0,0 +1,271 @@
+import math
+import multiprocessing
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 没有 RLIMIT_CPU，只依赖墙钟超时
+    resource = None
+
+
+WORKER_START_TIMEOUT = 60  # 工作进程启动和预热的最长等待秒数
+
+
+class RegexTimeout(Exception):
+    """表达式执行超过 CPU 或墙钟时间限制，对应的工作进程已被替换。"""
+
+
+class RegexPoolBusy(Exception):
+    """排队的任务过多，调用方应稍后重试。"""
+
+
+def limit_cpu(seconds):
+    """把当前进程的 CPU 软限制设为已用时间再加 seconds 秒，超出时内核以 SIGXCPU 终止进程。"""
+    if resource is None or not seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(math.ceil(usage.ru_utime + usage.ru_stime + seconds))
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _grok_match(expression, files, lines, overlay=None):
+    """逐行匹配，返回 (匹配结果列表, 未匹配行数)。"""
+    from grok_engine import grok_engine
+
+    compiled = grok_engine.compile(expression, files, overlay)
+    matches = []
+    unmatched = 0
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        captures = compiled.match(line)
+        if captures is None:
+            unmatched += 1
+            continue
+        matches.append({
+            'line_number': line_number,
+            'line': line,
+            'captures': captures
+        })
+    return matches, unmatched
+
+
+def _discover(lines, limit):
+    from grok_discovery import pattern_discovery
+
+    return pattern_discovery.discover(lines, limit)
+
+
+def _profile_pattern(*args):
+    from pattern_bench import profile_pattern
+
+    return profile_pattern(*args)
+
+
+def _warm_up():
+    """预先编译内置模式并构建推荐索引，避免首个任务把这部分时间算进超时。"""
+    from grok_discovery import pattern_discovery
+
+    pattern_discovery.index()
+
+
+# 工作进程只执行登记过的任务，父进程通过名称调用
+TASKS = {
+    'grok_match': _grok_match,
+    'discover': _discover,
+    'profile_pattern': _profile_pattern,
+}
+
+
+def _worker_main(conn, cpu_limit):
+    try:
+        _warm_up()
+    except Exception:
+        pass
+    conn.send(('ready', None))
+    while True:
+        try:
+            task, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        limit_cpu(cpu_limit)
+        try:
+            result = ('ok', TASKS[task](*args))
+        except Exception as e:
+            result = ('error', e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # 结果无法序列化时把错误带回去，而不是让父进程一直等待
+            conn.send(('error', RuntimeError(f'结果无法返回: {e}')))
+
+
+class _Worker:
+    def __init__(self, context, cpu_limit):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, cpu_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+
+
+class RegexPool:
+    """在独立进程中执行用户提供的正则/grok 表达式。
+
+    每个任务都有墙钟超时，工作进程另有 CPU 时间上限；超时的进程会被杀掉并替换，
+    不会拖住主进程的事件循环。排队数量有上限，超出时立即抛出 RegexPoolBusy。
+    等待期间通过 sleep 让出，可传入 socketio.sleep 以配合 eventlet。
+    """
+
+    def __init__(self, workers=2, timeout=2.0, cpu_limit=2, max_queue=32,
+                 queue_timeout=5.0, sleep=time.sleep):
+        self.configure(workers, timeout, cpu_limit, max_queue, queue_timeout, sleep)
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._idle = []
+        self._started = 0
+        self._waiting = 0
+        self.replaced = 0
+        self.rejected = 0
+
+    def configure(self, workers=None, timeout=None, cpu_limit=None, max_queue=None,
+                  queue_timeout=None, sleep=None):
+        if workers is not None:
+            self.workers = workers
+        if timeout is not None:
+            self.timeout = timeout
+        if cpu_limit is not None:
+            self.cpu_limit = cpu_limit
+        if max_queue is not None:
+            self.max_queue = max_queue
+        if queue_timeout is not None:
+            self.queue_timeout = queue_timeout
+        if sleep is not None:
+            self.sleep = sleep
+
+    @property
+    def queue_length(self):
+        return self._waiting
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if self._started < self.workers:
+                self._started += 1
+                spawn = True
+            elif self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise RegexPoolBusy('匹配任务过多，请稍后重试')
+            else:
+                spawn = False
+                self._waiting += 1
+
+        if spawn:
+            try:
+                return self._spawn()
+            except BaseException:
+                with self._lock:
+                    self._started -= 1
+                raise
+
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            while True:
+                with self._lock:
+                    if self._idle:
+                        return self._idle.pop()
+                if time.monotonic() >= deadline:
+                    with self._lock:
+                        self.rejected += 1
+                    raise RegexPoolBusy('匹配任务排队超时，请稍后重试')
+                self.sleep(0.002)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def _spawn(self):
+        """启动工作进程并等待其完成预热。"""
+        worker = _Worker(self._context, self.cpu_limit)
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        try:
+            while not worker.conn.poll():
+                if time.monotonic() >= deadline or not worker.process.is_alive():
+                    raise RuntimeError('匹配工作进程启动失败')
+                self.sleep(0.01)
+            worker.conn.recv()
+        except BaseException:
+            worker.kill()
+            raise
+        return worker
+
+    def start(self):
+        """预先启动全部工作进程，首个请求无需等待进程启动和预热。"""
+        while True:
+            with self._lock:
+                if self._started >= self.workers:
+                    return
+                self._started += 1
+            try:
+                worker = self._spawn()
+            except BaseException:
+                with self._lock:
+                    self._started -= 1
+                raise
+            self._release(worker)
+
+    def _release(self, worker):
+        with self._lock:
+            self._idle.append(worker)
+
+    def _discard(self, worker):
+        worker.kill()
+        with self._lock:
+            self._started -= 1
+            self.replaced += 1
+
+    def run(self, task, *args, timeout=None):
+        """在工作进程中执行任务并返回结果，任务内抛出的异常会原样重新抛出。"""
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._acquire()
+        try:
+            worker.conn.send((task, args))
+            deadline = time.monotonic() + timeout
+            delay = 0.0005
+            while not worker.conn.poll():
+                if time.monotonic() >= deadline:
+                    raise RegexTimeout(f'表达式执行超过 {timeout:g} 秒，可能存在灾难性回溯')
+                self.sleep(delay)
+                delay = min(delay * 2, 0.01)
+            try:
+                status, value = worker.conn.recv()
+            except (EOFError, OSError):
+                # 工作进程被 CPU 上限终止时管道会直接关闭
+                raise RegexTimeout('表达式执行超过 CPU 时间限制，可能存在灾难性回溯')
+        except BaseException:
+            self._discard(worker)
+            raise
+
+        self._release(worker)
+        if status == 'error':
+            raise value
+        return value
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+        for worker in idle:
+            worker.kill()
+
+
+regex_pool = RegexPool()
@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+PROFILE_ID = re.compile(r'[0-9]{20}-[0-9a-f]{8}')
+# 单次请求最多记录的 SQL 条数和每条语句保留的字符数，避免异常请求写出超大文件
+MAX_QUERIES = 1000
+MAX_STATEMENT_CHARS = 2000
+
+
+def _root_frame(frame):
+    while frame.f_back is not None:
+        frame = frame.f_back
+    return frame
+
+
+class _StackSampler(threading.Thread):
+    """按固定间隔读取目标线程当前的调用栈，累计为折叠栈（flamegraph.pl / speedscope 可直接读取）。
+
+    eventlet 下所有请求的 greenlet 共用一个系统线程，线程当前的调用栈可能属于其他请求。每个 greenlet
+    的调用栈有自己的最外层帧，只有最外层帧与开始分析时相同的样本才计入，即只在目标请求运行时采样，
+    切换出去等待 I/O 的时间不计入。
+    """
+
+    def __init__(self, thread_id, root_frame, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.root_frame = root_frame
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while True:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                if frame.f_back is None:
+                    break
+                frame = frame.f_back
+            if frame is not self.root_frame:
+                continue
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """一次请求的采样结果：调用栈样本与执行过的 SQL 语句及耗时。"""
+
+    def __init__(self, interval):
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.queries = []
+        self.dropped_queries = 0
+        self.sampler = _StackSampler(threading.get_ident(), _root_frame(sys._getframe()), interval)
+        self.sampler.start()
+
+    def record_query(self, statement, duration):
+        if len(self.queries) >= MAX_QUERIES:
+            self.dropped_queries += 1
+            return
+        self.queries.append({
+            'statement': statement[:MAX_STATEMENT_CHARS],
+            'duration_ms': round(duration * 1000, 3)
+        })
+
+    def finish(self):
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+
+class RequestProfiler:
+    """按需对单个请求做采样分析，结果写入磁盘并只保留最近 retention 份。"""
+
+    def __init__(self, directory=None, retention=50, interval=0.001, sample_rate=0.0, enabled=False):
+        self.directory = directory
+        self.configure(enabled=enabled, retention=retention, interval=interval, sample_rate=sample_rate)
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=None, directory=None, retention=None, interval=None, sample_rate=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if directory is not None:
+            self.directory = directory
+        if retention is not None:
+            self.retention = retention
+        if interval is not None:
+            self.interval = interval
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+
+    def sampled(self):
+        """按采样率决定是否分析未显式请求分析的请求。"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        return RequestProfile(self.interval)
+
+    def save(self, profile, **meta):
+        """写入分析结果并清理超出保留数量的旧文件，返回分析 ID。"""
+        profile.finish()
+        profile_id = f'{profile.started_at:%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+        total_sql = sum(query['duration_ms'] for query in profile.queries)
+        document = {
+            'id': profile_id,
+            'created_at': profile.started_at.isoformat(),
+            'duration_ms': round(profile.duration * 1000, 3),
+            'interval_ms': self.interval * 1000,
+            'samples': profile.sampler.samples,
+            'sql_count': len(profile.queries) + profile.dropped_queries,
+            'sql_ms': round(total_sql, 3),
+            **meta,
+            'queries': profile.queries,
+            'stacks': [
+                {'stack': stack, 'count': count}
+                for stack, count in profile.sampler.stacks.most_common()
+            ],
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{profile_id}.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False)
+        os.replace(f'{path}.tmp', path)
+        self._prune()
+        return profile_id
+
+    def _profile_files(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.endswith('.json') and PROFILE_ID.fullmatch(name[:-5])
+        )
+
+    def _prune(self):
+        with self._lock:
+            names = self._profile_files()
+            for name in names[:max(0, len(names) - self.retention)]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def list(self):
+        """按时间倒序返回已保存分析的摘要，不含调用栈和 SQL 明细。"""
+        summaries = []
+        for name in reversed(self._profile_files()):
+            document = self.load(name[:-5])
+            if document is None:
+                continue
+            summaries.append({
+                key: value for key, value in document.items() if key not in ('queries', 'stacks')
+            })
+        return summaries
+
+    def load(self, profile_id):
+        if not PROFILE_ID.fullmatch(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f'{profile_id}.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def collapsed(document):
+        """转换为折叠栈文本，每行为 "帧;帧;帧 次数"。"""
+        return ''.join(f"{entry['stack']} {entry['count']}\n" for entry in document['stacks'])
+
+
+request_profiler = RequestProfiler()
@@ -1,73 +1,151 @@
-from flask import Blueprint, jsonify, send_file
-import os
+from flask import Blueprint, Response, jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from grok_engine import GrokError
+from pattern_library import pattern_library
+from regex_pool import RegexPoolBusy, RegexTimeout, regex_pool
 
 patterns_bp = Blueprint('patterns', __name__)
 
-PATTERNS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'patterns')
+# 模式库很少变化：浏览器每次使用前都要用 ETag 重新验证，未变化时只需一次 304
+PATTERNS_CACHE_CONTROL = 'public, no-cache'
+# 与前端调试器保持一致的单次匹配上限
+MATCH_MAX_LINES = 1000
+MATCH_MAX_CHARS = 1024 * 1024
+# 模式推荐只需要少量样例行
+DISCOVER_MAX_LINES = 50
+DISCOVER_MAX_LIMIT = 50
+
+# 由应用注册：按用户 ID 返回其自定义模式覆盖层，未注册时只使用内置模式库
+_overlay_loader = None
+
+
+def set_overlay_loader(loader):
+    global _overlay_loader
+    _overlay_loader = loader
+
+
+def _conditional_json(payload, etag, gzip_payload=None):
+    """返回带 ETag 的 JSON 响应，命中 If-None-Match 时返回 304，客户端接受时直接发送预压缩内容。"""
+    use_gzip = gzip_payload is not None and 'gzip' in request.accept_encodings
+    if use_gzip:
+        # 不同编码的表示必须使用不同的强校验值
+        etag = f'{etag}-gz'
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(gzip_payload if use_gzip else payload, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = PATTERNS_CACHE_CONTROL
+    if gzip_payload is not None:
+        response.vary.add('Accept-Encoding')
+    return response
+
+def _pool_error(error):
+    """超时返回 422，表示表达式本身代价过高；排队已满返回 503 并提示重试时间。"""
+    if isinstance(error, RegexTimeout):
+        return jsonify({'error': str(error), 'timeout': True}), 422
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
 @patterns_bp.route('/list', methods=['GET'])
 def list_patterns():
     """获取所有可用的 pattern 文件列表"""
     try:
-        # 确保目录存在
-        if not os.path.exists(PATTERNS_DIR):
-            os.makedirs(PATTERNS_DIR)
-            
-        # 获取所有文件（排除隐藏文件和目录）
-        pattern_files = [f for f in os.listdir(PATTERNS_DIR) 
-                        if not f.startswith('.') and os.path.isfile(os.path.join(PATTERNS_DIR, f))]
-        return jsonify(pattern_files)
+        return jsonify(pattern_library.filenames())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @patterns_bp.route('/files', methods=['GET'])
 def get_all_patterns():
-    """获取所有模式文件的内容"""
+    """获取所有模式文件的内容，合并为一个预压缩的响应"""
     try:
-        all_patterns = {}
-        pattern_files = [f for f in os.listdir(PATTERNS_DIR) 
-                        if not f.startswith('.') and os.path.isfile(os.path.join(PATTERNS_DIR, f))]
-        
-        for filename in pattern_files:
-            file_path = os.path.join(PATTERNS_DIR, filename)
-            patterns = {}
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    try:
-                        name, pattern = line.split(' ', 1)
-                        patterns[name] = pattern.strip()
-                    except ValueError:
-                        continue
-            all_patterns[filename] = patterns
-            
-        return jsonify(all_patterns)
+        snapshot = pattern_library.snapshot()
+        return _conditional_json(snapshot.payload, snapshot.etag, snapshot.gzip_payload)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@patterns_bp.route('/match', methods=['POST'])
+@jwt_required()
+def match_patterns():
+    """用服务端 grok 引擎逐行匹配文本，返回命名捕获
+
+    请求格式: {pattern, text, files?}，files 为空时使用全部模式文件，当前用户的自定义模式叠加其上。
+    表达式在限时的工作进程中执行，灾难性回溯不会阻塞主进程。
+    """
+    data = request.get_json(silent=True) or {}
+    expression = data.get('pattern')
+    text = data.get('text')
+    files = data.get('files')
+    if not isinstance(expression, str) or not expression:
+        return jsonify({'error': '缺少 grok 表达式'}), 400
+    if not isinstance(text, str):
+        return jsonify({'error': '缺少待匹配文本'}), 400
+    if files is not None and (
+        not isinstance(files, list) or not all(isinstance(name, str) for name in files)
+    ):
+        return jsonify({'error': 'files 必须是文件名列表'}), 400
+    if len(text) > MATCH_MAX_CHARS:
+        return jsonify({'error': f'文本超过最大长度限制 ({MATCH_MAX_CHARS} 字符)'}), 400
+
+    lines = text.splitlines()
+    if len(lines) > MATCH_MAX_LINES:
+        return jsonify({'error': f'文本超过最大行数限制 ({MATCH_MAX_LINES} 行)'}), 400
+
+    try:
+        overlay = _overlay_loader(get_jwt_identity()) if _overlay_loader else None
+        matches, unmatched = regex_pool.run('grok_match', expression, files, lines, overlay)
+    except GrokError as e:
+        return jsonify({'error': str(e)}), 400
+    except (RegexTimeout, RegexPoolBusy) as e:
+        return _pool_error(e)
+
+    return jsonify({
+        'matches': matches,
+        'matched': len(matches),
+        'unmatched': unmatched
+    })
+
+@patterns_bp.route('/discover', methods=['POST'])
+@jwt_required()
+def discover_patterns():
+    """根据样例日志行推荐候选模式
+
+    请求格式: {text, limit?}。先用字面量索引排除不可能匹配的模式，只对剩余模式执行正则。
+    与 /match 一样在限时的工作进程中执行。
+    """
+    data = request.get_json(silent=True) or {}
+    text = data.get('text')
+    if not isinstance(text, str) or not text.strip():
+        return jsonify({'error': '缺少样例文本'}), 400
+    try:
+        limit = int(data.get('limit', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit 必须是整数'}), 400
+    if not 1 <= limit <= DISCOVER_MAX_LIMIT:
+        return jsonify({'error': f'limit 必须在 1 到 {DISCOVER_MAX_LIMIT} 之间'}), 400
+
+    lines = text.splitlines()
+    if len(lines) > DISCOVER_MAX_LINES:
+        return jsonify({'error': f'样例超过最大行数限制 ({DISCOVER_MAX_LINES} 行)'}), 400
+
+    try:
+        return jsonify(regex_pool.run('discover', lines, limit))
+    except (RegexTimeout, RegexPoolBusy) as e:
+        return _pool_error(e)
+
 @patterns_bp.route('/<filename>', methods=['GET'])
 def get_pattern_file(filename):
     """获取指定 pattern 文件的内容"""
     try:
-        file_path = os.path.join(PATTERNS_DIR, filename)
-        if not os.path.exists(file_path):
+        snapshot = pattern_library.snapshot()
+        if filename not in snapshot.files:
             return jsonify({'error': 'Pattern file not found'}), 404
 
-        patterns = {}
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                # 跳过空行和注释
-                if not line or line.startswith('#'):
-                    continue
-                try:
-                    name, pattern = line.split(' ', 1)
-                    patterns[name] = pattern.strip()
-                except ValueError:
-                    continue
-
-        return jsonify(patterns)
+        payload, etag = snapshot.file_payload(filename)
+        return _conditional_json(payload, etag)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,481 @@
+import errno
+import hashlib
+import hmac
+import http.client
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import metrics
+from storage_backend import READ_BLOCK_SIZE, FileRangeIterator, StorageBackend, StorageError
+
+logger = logging.getLogger(__name__)
+
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 要求除最后一段外每段至少 5MB
+MAX_PARTS = 10000
+IDLE_CONNECTION_TIMEOUT = 60  # 空闲超过这个秒数的连接不再复用
+CACHE_EVICT_RATIO = 0.9  # 淘汰到上限的这个比例，避免每次写入都扫描目录
+
+
+def _quote(value, safe='-_.~'):
+    return urllib.parse.quote(value, safe=safe)
+
+
+def _canonical_query(query):
+    return '&'.join(f'{_quote(name)}={_quote(value)}' for name, value in sorted(query.items()))
+
+
+def sign_request(method, host, path, query, headers, payload_hash, access_key, secret_key, region,
+                 now=None, service='s3'):
+    """按 AWS Signature Version 4 签名，返回加上 Host、x-amz-date、x-amz-content-sha256 和 Authorization 的请求头。"""
+    amz_date = (now or datetime.now(timezone.utc)).strftime('%Y%m%dT%H%M%SZ')
+    datestamp = amz_date[:8]
+    signed = dict(headers)
+    signed['Host'] = host
+    signed['x-amz-date'] = amz_date
+    signed['x-amz-content-sha256'] = payload_hash
+    canonical_headers = sorted(
+        (name.lower(), ' '.join(str(value).split()))
+        for name, value in signed.items() if name.lower() != 'content-length'
+    )
+    signed_headers = ';'.join(name for name, _ in canonical_headers)
+    canonical_request = '\n'.join([
+        method,
+        _quote(path, safe='/-_.~'),
+        _canonical_query(query),
+        ''.join(f'{name}:{value}\n' for name, value in canonical_headers),
+        signed_headers,
+        payload_hash
+    ])
+    scope = f'{datestamp}/{region}/{service}/aws4_request'
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+    ])
+    key = ('AWS4' + secret_key).encode('utf-8')
+    for part in (datestamp, region, service, 'aws4_request'):
+        key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+    signed['Authorization'] = (
+        f'AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}'
+    )
+    return signed
+
+
+def _xml_text(data, tag):
+    """取 S3 XML 响应中第一个 tag 元素的文本，忽略命名空间；无法解析时返回 None。"""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError:
+        return None
+    for element in root.iter():
+        if element.tag.rsplit('}', 1)[-1] == tag:
+            return element.text
+    return None
+
+
+class CachedObject:
+    """已打开的缓存条目，持有文件句柄，避免确认 ETag 之后条目被其他进程替换。"""
+
+    def __init__(self, f, etag, offset, size):
+        self.f = f
+        self.etag = etag
+        self.offset = offset
+        self.size = size
+
+    def close(self):
+        self.f.close()
+
+
+class CacheWriter:
+    """边转发边写入缓存的临时文件，完整读完才替换为正式条目。"""
+
+    def __init__(self, cache, key, etag):
+        self.cache = cache
+        self.path = cache.path(key)
+        os.makedirs(cache.directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.directory, suffix='.tmp')
+        self.f = os.fdopen(fd, 'wb')
+        self.f.write(etag.encode('utf-8') + b'\n')
+
+    def write(self, block):
+        self.f.write(block)
+
+    def commit(self):
+        size = self.f.tell()
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+        self.cache.added(size)
+
+    def abort(self):
+        self.f.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class ReadThroughCache:
+    """热点对象的本地读缓存。
+
+    每个对象存为一个文件，第一行是 ETag，其后是内容。读取时带 If-None-Match 向对象存储确认，
+    未变化（304）才使用本地副本，其他进程或节点改写对象后不会读到旧内容。
+    只缓存不超过 max_object_bytes 的完整读取；总大小超过 max_bytes 时按最近访问时间淘汰。
+    """
+
+    def __init__(self, directory, max_bytes, max_object_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def lookup(self, key):
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        etag = f.readline().rstrip(b'\n').decode('utf-8')
+        offset = f.tell()
+        size = os.fstat(f.fileno()).st_size - offset
+        os.utime(path)
+        return CachedObject(f, etag, offset, size)
+
+    def open(self, entry, start=0, end=None):
+        end = entry.size if end is None else end
+        return FileRangeIterator(entry.f, entry.offset + start, entry.offset + end)
+
+    def writer(self, key, etag, size):
+        if not etag or size is None or size > self.max_object_bytes:
+            return None
+        return CacheWriter(self, key, etag)
+
+    def discard(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def added(self, size):
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            evict = self._size is None or self._size > self.max_bytes
+        if evict:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if entry.name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * CACHE_EVICT_RATIO:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self._lock:
+            self._size = total
+
+
+class ObjectStream:
+    """转发 GET 响应体，读完后归还连接并提交缓存；中途关闭时丢弃连接和未写完的缓存。"""
+
+    def __init__(self, storage, connection, response, cache_writer=None):
+        self.storage = storage
+        self.connection = connection
+        self.response = response
+        self.cache_writer = cache_writer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.connection is None:
+            raise StopIteration
+        try:
+            block = self.response.read(READ_BLOCK_SIZE)
+        except BaseException:
+            self.close()
+            raise
+        if not block:
+            self.storage._finish(self.connection, self.response)
+            self.connection = None
+            if self.cache_writer:
+                self.cache_writer.commit()
+                self.cache_writer = None
+            raise StopIteration
+        if self.cache_writer:
+            self.cache_writer.write(block)
+        return block
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.cache_writer:
+            self.cache_writer.abort()
+            self.cache_writer = None
+
+
+class S3Storage(StorageBackend):
+    """S3 兼容对象存储（AWS S3、MinIO、Ceph RGW 等），只依赖标准库。
+
+    使用路径风格地址 endpoint/bucket/prefix+key 和 Signature V4 签名，连接保持复用。
+    大于 multipart_threshold 的文件分段并行上传；下载按 Range 流式转发；
+    配置 cache_dir 后热点小对象经 ReadThroughCache 从本地读取。
+    """
+
+    name = 's3'
+
+    def __init__(self, endpoint, bucket, access_key, secret_key, region='us-east-1', prefix='',
+                 multipart_threshold=16 * 1024 * 1024, part_size=8 * 1024 * 1024, concurrency=4,
+                 timeout=30.0, max_idle=8, cache_dir=None, cache_bytes=256 * 1024 * 1024,
+                 cache_max_object=16 * 1024 * 1024):
+        parts = urllib.parse.urlsplit(endpoint)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'S3 地址无效: {endpoint}')
+        if not bucket:
+            raise ValueError('缺少 S3 存储桶名称')
+        if part_size <= 0 or multipart_threshold <= 0 or concurrency <= 0:
+            raise ValueError('S3 分段大小、分段阈值和并发数必须大于 0')
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.hostname = parts.hostname
+        self.port = parts.port
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.cache = ReadThroughCache(cache_dir, cache_bytes, cache_max_object) if cache_dir and cache_bytes else None
+        self.connections_opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self.connections_opened += 1
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.hostname, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.hostname, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                connection, released = self._idle.pop()
+                if now - released < IDLE_CONNECTION_TIMEOUT:
+                    return connection, True
+                connection.close()
+        return self._connect(), False
+
+    def _finish(self, connection, response):
+        """响应体读完后归还连接。"""
+        if response.will_close:
+            connection.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def _path(self, key):
+        return f'/{self.bucket}/{self.prefix}{key}'
+
+    def _send(self, method, key, query=None, headers=None, body=None, payload_hash=EMPTY_SHA256):
+        """发送请求，返回 (连接, 响应)，响应体由调用方读取后交给 _finish。复用的连接已被对端关闭时重试一次。"""
+        query = query or {}
+        path = self._path(key)
+        target = _quote(path, safe='/-_.~') + ('?' + _canonical_query(query) if query else '')
+        signed = sign_request(
+            method, self.netloc, path, query, headers or {}, payload_hash,
+            self.access_key, self.secret_key, self.region
+        )
+        for attempt in range(2):
+            connection, reused = self._acquire()
+            if hasattr(body, 'seek'):
+                body.seek(0)
+            try:
+                connection.request(method, target, body=body, headers=signed)
+                return connection, connection.getresponse()
+            except ConnectionError:
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+
+    def _error(self, method, key, status, data):
+        if status == 404:
+            return FileNotFoundError(errno.ENOENT, 'S3 对象不存在', key)
+        code = _xml_text(data, 'Code') if data else None
+        return StorageError(f'S3 {method} {key} 返回 HTTP {status}: {code or "未知错误"}')
+
+    def _call(self, method, key, operation, expected=(200,), **kwargs):
+        with metrics.STORAGE_REQUEST_DURATION.time(operation):
+            connection, response = self._send(method, key, **kwargs)
+            try:
+                data = response.read()
+            except BaseException:
+                connection.close()
+                raise
+        self._finish(connection, response)
+        if response.status not in expected:
+            raise self._error(method, key, response.status, data)
+        return response, data
+
+    def save(self, key, source_path):
+        size = os.path.getsize(source_path)
+        if size > self.multipart_threshold:
+            self._multipart_upload(key, source_path, size)
+        else:
+            with open(source_path, 'rb') as f:
+                self._call(
+                    'PUT', key, 'put', body=f, payload_hash=UNSIGNED_PAYLOAD,
+                    headers={'Content-Length': str(size)}
+                )
+        if self.cache:
+            self.cache.discard(key)
+        os.remove(source_path)
+
+    def _multipart_upload(self, key, source_path, size):
+        # 分段数不能超过 S3 的上限，超大文件自动放大分段
+        part_size = max(self.part_size, math.ceil(size / MAX_PARTS))
+        part_count = math.ceil(size / part_size)
+        _, data = self._call('POST', key, 'multipart_create', query={'uploads': ''})
+        upload_id = _xml_text(data, 'UploadId')
+        if not upload_id:
+            raise StorageError(f'S3 未返回分段上传 ID: {key}')
+
+        def upload_part(number):
+            with open(source_path, 'rb') as f:
+                f.seek((number - 1) * part_size)
+                block = f.read(part_size)
+            response, _ = self._call(
+                'PUT', key, 'multipart_part', body=block,
+                query={'partNumber': str(number), 'uploadId': upload_id},
+                payload_hash=hashlib.sha256(block).hexdigest()
+            )
+            return response.getheader('ETag')
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, part_count)) as executor:
+                etags = list(executor.map(upload_part, range(1, part_count + 1)))
+            body = ''.join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                for number, etag in enumerate(etags, 1)
+            )
+            body = f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode('utf-8')
+            _, data = self._call(
+                'POST', key, 'multipart_complete', body=body, query={'uploadId': upload_id},
+                payload_hash=hashlib.sha256(body).hexdigest()
+            )
+            # 合并失败时 S3 也可能返回 200，错误放在响应体里
+            if _xml_text(data, 'Code'):
+                raise StorageError(f'S3 合并分段失败: {_xml_text(data, "Code")}')
+        except BaseException:
+            try:
+                self._call('DELETE', key, 'multipart_abort', expected=(204, 404), query={'uploadId': upload_id})
+            except OSError as e:
+                logger.warning("放弃 S3 分段上传失败: %s", e)
+            raise
+
+    def put_bytes(self, key, data):
+        self._call('PUT', key, 'put', body=data, payload_hash=hashlib.sha256(data).hexdigest())
+        if self.cache:
+            self.cache.discard(key)
+
+    def get_bytes(self, key):
+        body = self.open_stream(key)
+        try:
+            return b''.join(body)
+        finally:
+            body.close()
+
+    def open_stream(self, key, start=0, end=None):
+        headers = {}
+        ranged = start > 0 or end is not None
+        if ranged:
+            headers['Range'] = f'bytes={start}-{"" if end is None else end - 1}'
+        cached = self.cache.lookup(key) if self.cache else None
+        if cached:
+            headers['If-None-Match'] = cached.etag
+        try:
+            with metrics.STORAGE_REQUEST_DURATION.time('get'):
+                connection, response = self._send('GET', key, headers=headers)
+        except BaseException:
+            if cached:
+                cached.close()
+            raise
+
+        if response.status == 304 and cached:
+            response.read()
+            self._finish(connection, response)
+            metrics.STORAGE_CACHE_REQUESTS.inc('hit')
+            return self.cache.open(cached, start, end)
+        if cached:
+            # ETag 不一致说明缓存已过期；完整读取会重新写入，区间读取直接丢弃
+            cached.close()
+            if response.status == 206:
+                self.cache.discard(key)
+        if response.status not in (200, 206):
+            data = response.read()
+            self._finish(connection, response)
+            raise self._error('GET', key, response.status, data)
+
+        writer = None
+        if self.cache:
+            metrics.STORAGE_CACHE_REQUESTS.inc('miss')
+            if response.status == 200:
+                length = response.getheader('Content-Length')
+                writer = self.cache.writer(key, response.getheader('ETag'), int(length) if length else None)
+        return ObjectStream(self, connection, response, writer)
+
+    def size(self, key):
+        response, _ = self._call('HEAD', key, 'head')
+        return int(response.getheader('Content-Length'))
+
+    def delete(self, key):
+        self._call('DELETE', key, 'delete', expected=(200, 204, 404))
+        if self.cache:
+            self.cache.discard(key)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
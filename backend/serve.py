@@ -0,0 +1,198 @@
+"""生产环境多进程启动器
+
+    python serve.py                        # 按 CPU 核数启动 Web 进程，外加一个后台服务进程
+    python serve.py --workers 4 --port 5002
+    python serve.py --web-only             # 只启动 Web 进程，后台服务进程运行在别处
+    python serve.py --services-only        # 只启动后台服务进程
+
+Web 进程通过 SO_REUSEPORT 共享同一个监听端口，由内核在进程间分配连接；前端 Socket.IO 只使用
+websocket 传输，不需要粘性会话。文件监视器、后台维护任务和 grok 批量任务只在后台服务进程中运行
+（BACKGROUND_SERVICES=external），各进程的 Socket.IO 推送经 SOCKETIO_MESSAGE_QUEUE 互相转发。
+开发环境仍可直接运行 python app.py，所有服务在同一进程中。
+"""
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+from dotenv import load_dotenv
+
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 5002
+# 后台服务进程完成数据库初始化的最长等待时间（秒）
+SERVICES_READY_TIMEOUT = 120
+# 子进程启动后不到 MIN_UPTIME 秒就退出视为配置错误，停止全部进程而不是反复重启
+MIN_UPTIME = 5.0
+SHUTDOWN_TIMEOUT = 10
+
+
+def _patch_sockets():
+    """Socket.IO 的 Redis 消息队列要求 eventlet 接管 socket。
+
+    线程和 multiprocessing 保持原生，文件监视器、正则执行池和 grok 进程池的行为与单进程模式一致。
+    """
+    import eventlet
+    eventlet.monkey_patch(socket=True, select=True)
+
+
+def run_web_worker(host, port):
+    """Web 进程：只处理 HTTP 与 Socket.IO 请求，不运行任何后台服务。"""
+    _patch_sockets()
+    import eventlet
+    import eventlet.wsgi
+    import app as module
+
+    app = module.create_app()
+    module.configure_process(app)
+    listener = eventlet.listen((host, port), reuse_port=True)
+    # 预先启动正则执行进程，首个请求不必承担整库编译
+    module.socketio.start_background_task(module.regex_pool.start)
+    # 每个 Web 进程复查自己持有的 Socket.IO 连接
+    module.socketio.start_background_task(module.run_socket_auth_checker, app)
+    eventlet.wsgi.server(listener, app, log_output=False)
+
+
+def run_services(ready=None):
+    """后台服务进程：初始化数据库后运行文件监视器、维护调度器和 grok 任务调度。"""
+    _patch_sockets()
+    import app as module
+
+    app = module.create_app()
+    module.configure_process(app)
+    module.initialize_database(app)
+    observer = module.start_background_services(app)
+    if ready is not None:
+        ready.set()
+    try:
+        while True:
+            module.socketio.sleep(60)
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def check_deployment(workers, message_queue, web=True, services=True):
+    """返回部署配置中的问题列表，为空表示可以启动。"""
+    problems = []
+    if web and workers < 1:
+        problems.append('--workers 必须大于 0')
+    if web and workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        problems.append('当前平台不支持 SO_REUSEPORT，只能运行 1 个 Web 进程')
+    if not message_queue:
+        problems.append(
+            'Web 进程与后台服务进程分离后需要通过消息队列转发 Socket.IO 推送，'
+            '请配置 SOCKETIO_MESSAGE_QUEUE（例如 redis://localhost:6379/0）并安装 redis 包；'
+            '单进程运行请使用 python app.py'
+        )
+    elif message_queue.startswith(('redis://', 'rediss://')) and importlib.util.find_spec('redis') is None:
+        problems.append('SOCKETIO_MESSAGE_QUEUE 使用 redis，但未安装 redis 包，请执行 pip install -r requirements.txt')
+    return problems
+
+
+class Supervisor:
+    """启动并看护后台服务进程与 Web 进程，意外退出的进程会被重新拉起。"""
+
+    def __init__(self, host, port, workers, web=True, services=True):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.web = web
+        self.services = services
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = {}  # 名称 -> (进程, 启动时间)
+        self.stopping = False
+
+    def _spawn(self, name):
+        if name == 'services':
+            ready = self.context.Event()
+            process = self.context.Process(target=run_services, args=(ready,), name='websync-services')
+        else:
+            ready = None
+            process = self.context.Process(target=run_web_worker, args=(self.host, self.port), name=f'websync-{name}')
+        process.start()
+        self.processes[name] = (process, time.monotonic())
+        return ready
+
+    def start(self):
+        if self.services:
+            ready = self._spawn('services')
+            # Web 进程在数据库初始化完成后再启动，避免多个进程同时建表
+            if not ready.wait(SERVICES_READY_TIMEOUT):
+                raise RuntimeError('后台服务进程未能在限定时间内完成初始化')
+        if self.web:
+            for index in range(self.workers):
+                self._spawn(f'web-{index}')
+        print(
+            f'WebSync 服务已启动，监听地址：http://{self.host}:{self.port}，'
+            f'Web 进程 {self.workers if self.web else 0} 个，后台服务进程 {1 if self.services else 0} 个',
+            flush=True
+        )
+
+    def watch(self, interval=1.0):
+        """阻塞直到收到退出信号；子进程意外退出时重启，启动即退出时放弃。"""
+        while not self.stopping:
+            time.sleep(interval)
+            for name, (process, started) in list(self.processes.items()):
+                if process.is_alive() or self.stopping:
+                    continue
+                if time.monotonic() - started < MIN_UPTIME:
+                    raise RuntimeError(f'{process.name} 启动后立即退出（退出码 {process.exitcode}）')
+                print(f'{process.name} 已退出（退出码 {process.exitcode}），正在重启', file=sys.stderr, flush=True)
+                self._spawn(name)
+
+    def stop(self, *args):
+        self.stopping = True
+        processes = [process for process, _ in self.processes.values()]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='以多个 Web 进程加一个后台服务进程运行 WebSync 后端')
+    parser.add_argument('--host', default=os.environ.get('HOST', DEFAULT_HOST), help='监听地址')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', DEFAULT_PORT)), help='监听端口')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1)),
+                        help='Web 进程数，默认取 WEB_WORKERS 或 CPU 核数')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--web-only', action='store_true', help='只启动 Web 进程')
+    mode.add_argument('--services-only', action='store_true', help='只启动后台服务进程')
+    args = parser.parse_args(argv)
+
+    web = not args.services_only
+    services = not args.web_only
+    problems = check_deployment(args.workers, os.environ.get('SOCKETIO_MESSAGE_QUEUE'), web, services)
+    if problems:
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        return 2
+
+    # 子进程以 spawn 方式启动并继承环境变量，在导入 app 前即处于 external 模式
+    os.environ['BACKGROUND_SERVICES'] = 'external'
+    supervisor = Supervisor(args.host, args.port, args.workers, web=web, services=services)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    try:
+        supervisor.start()
+        supervisor.watch()
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        supervisor.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
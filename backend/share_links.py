@@ -0,0 +1,102 @@
+import hashlib
+import threading
+import time
+
+from itsdangerous import BadSignature, URLSafeSerializer
+
+DOWNLOAD = 'download'
+PREVIEW = 'preview'
+OPERATIONS = {DOWNLOAD: 'd', PREVIEW: 'p'}
+
+
+class ShareLinkError(Exception):
+    """链接无效（404）、已过期或已撤销（410）、不允许此操作（403）。"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class ShareLinks:
+    """无需登录的签名分享链接。
+
+    链接中签名保存文件 ID、存储键、内容哈希、文件名、大小、过期时间、允许的操作和签发时的撤销纪元，
+    下载时只校验 HMAC 签名和过期时间，不查询数据库。撤销通过每个文件的纪元计数实现：
+    纪元表只包含签发过链接的文件，整张表缓存在进程内，每 refresh_interval 秒重新加载一次，
+    与下载次数无关；本进程内的撤销立即生效，其他进程最迟在下次加载后生效。
+    """
+
+    def __init__(self, secret='', refresh_interval=5.0, loader=None):
+        self.secret = secret
+        self.refresh_interval = refresh_interval
+        self.loader = loader
+        self._epochs = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def configure(self, secret=None, refresh_interval=None, loader=None):
+        if secret is not None:
+            self.secret = secret
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+        if loader is not None:
+            self.loader = loader
+        self.expire()
+
+    def _serializer(self):
+        return URLSafeSerializer(self.secret, salt='share-link', signer_kwargs={'digest_method': hashlib.sha256})
+
+    def sign(self, file_id, storage_key, file_hash, name, size, expires_at, operations, epoch, public):
+        return self._serializer().dumps({
+            'f': file_id,
+            'k': storage_key,
+            'h': file_hash,
+            'n': name,
+            's': size,
+            'x': int(expires_at),
+            'o': ''.join(OPERATIONS[operation] for operation in operations),
+            'e': epoch,
+            'pub': bool(public)
+        })
+
+    def verify(self, token, operation, now=None):
+        """校验链接并返回其中的声明；失败时抛出 ShareLinkError。"""
+        try:
+            claims = self._serializer().loads(token)
+        except BadSignature:
+            raise ShareLinkError('链接无效', 404)
+        if not isinstance(claims, dict):
+            raise ShareLinkError('链接无效', 404)
+        if claims['x'] <= (now or time.time()):
+            raise ShareLinkError('链接已过期', 410)
+        if OPERATIONS[operation] not in claims['o']:
+            raise ShareLinkError('链接不允许此操作', 403)
+        if claims['e'] != self.epoch(claims['f'], claims['e']):
+            raise ShareLinkError('链接已被撤销', 410)
+        return claims
+
+    def epoch(self, file_id, expected=None):
+        """返回文件当前的撤销纪元；链接纪元比缓存新（其他进程刚撤销后签发）时立即重新加载。"""
+        now = time.monotonic()
+        with self._lock:
+            stale = self._loaded_at is None or now - self._loaded_at >= self.refresh_interval
+            current = self._epochs.get(file_id, 0)
+        if stale or (expected is not None and expected > current):
+            epochs = dict(self.loader())
+            with self._lock:
+                self._epochs = epochs
+                self._loaded_at = now
+                current = epochs.get(file_id, 0)
+        return current
+
+    def set_epoch(self, file_id, epoch):
+        with self._lock:
+            self._epochs[file_id] = epoch
+
+    def expire(self):
+        """下次校验时重新加载纪元表，撤销提交后调用。"""
+        with self._lock:
+            self._loaded_at = None
+
+
+share_links = ShareLinks()
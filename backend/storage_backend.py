@@ -0,0 +1,221 @@
+import io
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class StorageError(OSError):
+    """存储后端读写失败；对象不存在时抛出 FileNotFoundError。"""
+
+
+class StorageBackend:
+    """上传文件和剪贴板图片的存储后端。
+
+    对象用 / 分隔的键定位（文件为 storage_key 或平铺路径，剪贴板图片为 clipboard_images/文件名），
+    具体存放位置由后端决定。读写失败抛出 OSError 的子类，调用方沿用原来的 OSError 处理。
+    """
+
+    name = None
+
+    def save(self, key, source_path):
+        """把已写完的本地文件存为对象，source_path 会被移走或删除。"""
+        raise NotImplementedError
+
+    def put_bytes(self, key, data):
+        raise NotImplementedError
+
+    def get_bytes(self, key):
+        raise NotImplementedError
+
+    def open_stream(self, key, start=0, end=None):
+        """返回按块产出 [start, end) 字节的可迭代对象，用完须 close；对象不存在时立即抛出。"""
+        raise NotImplementedError
+
+    def size(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        try:
+            self.size(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete(self, key):
+        """删除对象，不存在时忽略。"""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """对象在本机文件系统上的路径；远程后端返回 None。"""
+        return None
+
+    def open_file(self, key):
+        """以可随机读取的只读文件对象打开对象，远程后端按需发起区间读取，只传输实际读到的部分。"""
+        return io.BufferedReader(RangeReader(self, key, self.size(key)), buffer_size=READ_BLOCK_SIZE)
+
+    @contextmanager
+    def local_copy(self, key):
+        """需要真实文件路径的处理（如 grok 批量解析）使用：本地后端直接给出路径，远程后端先下载到临时文件。"""
+        fd, tmp_path = tempfile.mkstemp(suffix='.download')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                body = self.open_stream(key)
+                try:
+                    for block in body:
+                        f.write(block)
+                finally:
+                    body.close()
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
+
+
+class FileRangeIterator:
+    """按块读取本地文件的一个区间，close 时关闭文件。"""
+
+    def __init__(self, f, start, end, block_size=READ_BLOCK_SIZE):
+        self.f = f
+        self.remaining = end - start
+        self.block_size = block_size
+        f.seek(start)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.remaining <= 0:
+            raise StopIteration
+        block = self.f.read(min(self.block_size, self.remaining))
+        if not block:
+            raise StopIteration
+        self.remaining -= len(block)
+        return block
+
+    def close(self):
+        self.f.close()
+
+
+class RangeReader(io.RawIOBase):
+    """把存储后端的区间读取包装成可 seek 的文件，供 zipfile、tarfile 等只读取文件局部的场景使用。"""
+
+    def __init__(self, storage, key, size):
+        self.storage = storage
+        self.key = key
+        self.length = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.length
+        if offset < 0:
+            raise ValueError('seek 位置不能为负数')
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer):
+        end = min(self.length, self.position + len(buffer))
+        if end <= self.position:
+            return 0
+        body = self.storage.open_stream(self.key, self.position, end)
+        filled = 0
+        try:
+            for block in body:
+                buffer[filled:filled + len(block)] = block
+                filled += len(block)
+        finally:
+            body.close()
+        self.position += filled
+        return filled
+
+
+class LocalStorage(StorageBackend):
+    """默认后端：对象是 root 下的普通文件，写入通过临时文件原子替换。"""
+
+    name = 'local'
+
+    def __init__(self, root='uploads'):
+        self.root = root
+
+    def configure(self, root=None):
+        if root is not None:
+            self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def local_path(self, key):
+        return self.path(key)
+
+    @contextmanager
+    def local_copy(self, key):
+        yield self.path(key)
+
+    def open_file(self, key):
+        return open(self.path(key), 'rb')
+
+    def save(self, key, source_path):
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(source_path, target)
+        except OSError:
+            # 暂存目录与 root 不在同一文件系统时退化为复制
+            shutil.copyfile(source_path, target)
+            os.remove(source_path)
+
+    def put_bytes(self, key, data):
+        target = self.path(key)
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_bytes(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def open_stream(self, key, start=0, end=None):
+        f = open(self.path(key), 'rb')
+        if end is None:
+            end = os.fstat(f.fileno()).st_size
+        return FileRangeIterator(f, start, end)
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+def create_storage(backend, root, **s3_options):
+    """按 STORAGE_BACKEND 创建存储后端：local 或 s3。"""
+    if backend == 'local':
+        return LocalStorage(root)
+    if backend == 's3':
+        from s3_storage import S3Storage
+        return S3Storage(**s3_options)
+    raise ValueError(f'未知的存储后端: {backend}')
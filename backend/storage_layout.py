@@ -0,0 +1,66 @@
+import os
+import shutil
+import uuid
+
+FLAT = 'flat'
+SHARDED = 'sharded'
+OBJECT_DIR = 'objects'
+
+
+class StorageLayout:
+    """上传文件在磁盘上的布局。
+
+    flat：文件直接放在上传目录下，磁盘文件名就是用户看到的路径，与旧版本一致。
+    sharded：文件按随机对象键放在 objects/前两位/次两位/键 下，用户看到的路径只保存在数据库，
+    单个目录的条目数不随文件总数增长，同名文件也不会互相覆盖。
+    数据库中记录了对象键（storage_key）的文件总是按对象键定位，与当前模式无关，
+    因此切换模式或迁移到一半时两种文件可以共存。
+    """
+
+    def __init__(self, mode=FLAT, depth=2):
+        self.configure(mode=mode, depth=depth)
+
+    def configure(self, mode=None, depth=None):
+        if mode is not None:
+            if mode not in (FLAT, SHARDED):
+                raise ValueError(f'未知的存储布局: {mode}')
+            self.mode = mode
+        if depth is not None:
+            if not 0 < depth <= 4:
+                raise ValueError('分片目录层数必须在 1 到 4 之间')
+            self.depth = depth
+
+    @property
+    def sharded(self):
+        return self.mode == SHARDED
+
+    def new_key(self):
+        """生成新的对象键，使用 / 分隔以便跨平台保存在数据库中。"""
+        token = uuid.uuid4().hex
+        shards = [token[2 * level:2 * level + 2] for level in range(self.depth)]
+        return '/'.join([OBJECT_DIR, *shards, token])
+
+    def flat_path(self, root, file_path):
+        """把监视器上报的磁盘路径还原为平铺文件名；分片对象和以 . 开头的内部目录返回 None。
+
+        分片对象只由应用自己写入，写入时已经更新数据库并广播，监视器不必递归监视数万个分片目录。
+        """
+        rel_path = os.path.relpath(file_path, root)
+        top = rel_path.split(os.sep)[0]
+        if top == OBJECT_DIR or top.startswith('.'):
+            return None
+        return rel_path
+
+    def link(self, source, target):
+        """让 target 指向与 source 相同的内容：优先硬链接，不支持时复制。
+
+        迁移时先建立新位置再提交数据库，旧位置在提交后才删除，期间两个路径都能读到文件。
+        """
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+
+storage_layout = StorageLayout()
@@ -0,0 +1,176 @@
+import os
+import unittest
+
+from app_testing import AppTestCase, module
+import metrics
+from admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+class FakeClock:
+    """sleep 推进时钟，等待不花真实时间。"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_burst_then_wait_for_refill(self):
+        bucket = TokenBucket(rate=100, burst=200, now=0)
+        self.assertEqual(bucket.reserve(200, 0), 0)
+        self.assertAlmostEqual(bucket.reserve(50, 0), 0.5)
+        # 欠额补足后回满不超过 burst
+        bucket.refill(100)
+        self.assertEqual(bucket.tokens, 200)
+
+
+class AdmissionControllerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.controller = AdmissionController(
+            max_active=2, max_active_per_user=1, max_queue=2, max_queue_per_user=1,
+            queue_timeout=3, small_request_bytes=100, interactive_slots=1,
+            sleep=self.clock.sleep, clock=self.clock
+        )
+
+    def test_per_user_limit_rejects_when_user_queue_is_full(self):
+        self.controller.admit(1, 'upload', 1000)
+        self.controller.max_queue_per_user = 0
+        with self.assertRaises(AdmissionRejected) as caught:
+            self.controller.admit(1, 'upload', 1000)
+        self.assertEqual(caught.exception.retry_after, 3)
+        self.assertEqual(self.controller.queue_length, 0)
+        # 其他用户不受影响
+        self.controller.admit(2, 'upload', 1000)
+        self.assertEqual(self.controller.active, 2)
+
+    def test_waiting_request_times_out(self):
+        self.controller.admit(1, 'upload', 1000)
+        before = metrics.ADMISSION_REJECTED.value('timeout')
+        with self.assertRaises(AdmissionRejected):
+            self.controller.admit(1, 'upload', 1000)
+        self.assertGreaterEqual(self.clock.slept, 3)
+        self.assertEqual(self.controller.queue_length, 0)
+        self.assertEqual(metrics.ADMISSION_REJECTED.value('timeout'), before + 1)
+
+    def test_small_requests_use_reserved_slot(self):
+        self.controller.admit(1, 'upload', 1000)
+        self.controller.admit(2, 'upload', 1000)
+        self.controller.max_queue = 0
+        with self.assertRaises(AdmissionRejected):
+            self.controller.admit(3, 'upload', 1000)
+        ticket = self.controller.admit(3, 'upload', 10)
+        self.assertTrue(ticket.interactive)
+        self.assertEqual(self.controller.active, 3)
+
+    def test_release_wakes_waiter_and_is_idempotent(self):
+        first = self.controller.admit(1, 'upload', 1000)
+
+        def release_soon(seconds):
+            self.clock.sleep(seconds)
+            first.release()
+
+        self.controller.sleep = release_soon
+        second = self.controller.admit(1, 'download', 1000)
+        first.release()
+        self.assertEqual(self.controller.active, 1)
+        second.release()
+        self.assertEqual(self.controller.active, 0)
+
+    def test_interactive_waiters_are_served_first(self):
+        self.controller.max_active_per_user = 10
+        self.controller.interactive_slots = 0
+        self.controller.admit(1, 'upload', 1000)
+        self.controller.admit(1, 'upload', 1000)
+        bulk = [1, next(self.controller._sequence), 2]
+        interactive = [0, next(self.controller._sequence), 3]
+        self.controller._waiters.extend([bulk, interactive])
+        self.controller._active = 1
+        self.assertIs(self.controller._next_waiter(), interactive)
+
+    def test_throttle_shapes_each_user_separately(self):
+        self.controller.configure(bandwidth=1000, burst=1000)
+        first = self.controller.admit(1, 'upload', 1000)
+        second = self.controller.admit(2, 'upload', 1000)
+        self.assertEqual(first.throttle(1000), 0)
+        self.assertAlmostEqual(first.throttle(500), 0.5)
+        self.assertEqual(second.throttle(1000), 0)
+        self.assertAlmostEqual(self.clock.slept, 0.5)
+
+    def test_shaped_iterator_releases_on_close(self):
+        self.controller.configure(bandwidth=10, burst=10)
+        ticket = self.controller.admit(1, 'download', 1000)
+        body = ticket.shaped([b'x' * 10, b'y' * 10])
+        self.assertEqual(b''.join(body), b'x' * 10 + b'y' * 10)
+        self.assertAlmostEqual(self.clock.slept, 1.0)
+        self.assertEqual(self.controller.active, 1)
+        body.close()
+        self.assertEqual(self.controller.active, 0)
+
+
+class AdmissionEndpointTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.original_settings = (
+            module.admission.max_active_per_user,
+            module.admission.max_queue_per_user,
+            module.admission.bandwidth,
+            module.admission.burst
+        )
+
+    def tearDown(self):
+        module.admission.configure(
+            max_active_per_user=self.original_settings[0],
+            max_queue_per_user=self.original_settings[1],
+            bandwidth=self.original_settings[2],
+            burst=self.original_settings[3]
+        )
+
+    def upload(self, name, body):
+        return self.client.post(f'/api/clipboard/attach?filename={name}', headers=self.headers, data=body)
+
+    def test_upload_releases_slot_after_request(self):
+        self.assertEqual(self.upload('a.bin', b'a' * 100).status_code, 200)
+        self.assertEqual(module.admission.active, 0)
+
+    def test_busy_user_gets_429_with_retry_after(self):
+        module.admission.configure(max_active_per_user=1, max_queue_per_user=0)
+        held = module.admission.admit(self.user.id, 'upload', 10 ** 9)
+        try:
+            response = self.upload('b.bin', b'b' * 100)
+        finally:
+            held.release()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], str(module.admission.retry_after))
+        self.assertFalse(os.path.exists(os.path.join(self.upload_folder, 'b.bin')))
+        self.assertEqual(self.upload('b.bin', b'b' * 100).status_code, 200)
+
+    def test_download_holds_slot_until_body_is_closed(self):
+        self.assertEqual(self.upload('c.bin', b'c' * 5000).status_code, 200)
+        # 限速只影响耗时，测试里不能真的等
+        module.admission.configure(bandwidth=10 ** 9)
+
+        response = self.client.get('/api/download/c.bin', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), b'c' * 5000)
+        self.assertEqual(module.admission.active, 1)
+        response.close()
+        self.assertEqual(module.admission.active, 0)
+
+    def test_throttled_upload_is_counted(self):
+        module.admission.configure(bandwidth=10 ** 6, burst=1)
+        before = metrics.THROTTLE_EVENTS.value('upload')
+        self.assertEqual(self.upload('d.bin', b'd' * 1000).status_code, 200)
+        self.assertGreater(metrics.THROTTLE_EVENTS.value('upload'), before)
+        self.assertIn('websync_admission_queue_length 0', metrics.registry.render())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import unittest
+
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+os.environ['JWT_SECRET_KEY'] = 'test-only-random-jwt-secret-with-32-characters'
+
+import app as module
+import bench_backend
+
+app = module.create_app()
+
+
+class BenchBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        module.db.create_all()
+        self.original_oauth_loader = module.load_google_oauth_config
+
+    def tearDown(self):
+        module.db.session.remove()
+        module.db.drop_all()
+        self.context.pop()
+
+    def test_run_benchmark_covers_hot_endpoints_and_cleans_up(self):
+        report = bench_backend.run_benchmark(
+            module, app, rows=[20, 50], users=3, clipboard_items=5, file_size=3000, chunk_size=1024,
+            iterations=3, max_seconds=5
+        )
+        self.assertEqual([entry['name'] for entry in report['scenarios']], [
+            'upload_multipart', 'upload_attach', 'upload_chunked', 'download',
+            'list_clipboard', 'list_files_20', 'list_files_50'
+        ])
+        for entry in report['scenarios']:
+            self.assertEqual(entry['iterations'], 3)
+            self.assertGreater(entry['ops_per_s'], 0)
+            self.assertLessEqual(entry['p50_ms'], entry['p99_ms'])
+        chunked = report['scenarios'][2]
+        self.assertEqual(chunked['chunks'], 3)
+        self.assertIn('chunk_p99_ms', chunked)
+        json.dumps(report)
+        self.assertIn('list_files_50', bench_backend.format_report(report))
+
+        # 上传与下载产生的文件和记录在场景结束后被删除，种子数据保留
+        self.assertEqual(module.File.query.count(), 50)
+        self.assertFalse([
+            name for name in os.listdir(app.config['UPLOAD_FOLDER']) if name.startswith(bench_backend.FILE_PREFIX)
+        ])
+        self.assertIs(module.load_google_oauth_config, self.original_oauth_loader)
+
+    def test_summarize_and_percentiles(self):
+        self.assertEqual(bench_backend.percentile([], 99), 0.0)
+        self.assertEqual(bench_backend.percentile([3, 1, 2, 4], 50), 2)
+        self.assertEqual(bench_backend.percentile(list(range(1, 101)), 99), 99)
+        summary = bench_backend.summarize([0.001, 0.003], elapsed=0.004, bytes_per_op=1024 * 1024)
+        self.assertEqual(summary['ops_per_s'], 500.0)
+        self.assertEqual(summary['mb_per_s'], 500.0)
+        self.assertEqual(summary['p99_ms'], 3.0)
+
+    def test_compare_reports_flags_latency_and_throughput_regressions(self):
+        baseline = {'scenarios': [
+            {'name': 'download', 'p50_ms': 2.0, 'p99_ms': 4.0, 'ops_per_s': 400},
+            {'name': 'list_files_1000', 'p50_ms': 0.2, 'p99_ms': 0.4, 'ops_per_s': 100},
+        ]}
+        current = {'scenarios': [
+            {'name': 'download', 'p50_ms': 2.1, 'p99_ms': 9.0, 'ops_per_s': 200},
+            {'name': 'list_files_1000', 'p50_ms': 0.5, 'p99_ms': 0.9, 'ops_per_s': 95},
+            {'name': 'upload_attach', 'p50_ms': 50.0, 'p99_ms': 90.0, 'ops_per_s': 1},
+        ]}
+        regressions = bench_backend.compare_reports(baseline, current)
+        self.assertEqual(
+            [(item['name'], item['metric']) for item in regressions],
+            [('download', 'p99_ms'), ('download', 'ops_per_s')]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from app_testing import AppTestCase, module
+
+
+class ClipboardPushTestCase(AppTestCase):
+    def connect(self, token=None):
+        auth = {'token': token} if token else None
+        client = module.socketio.test_client(self.app, auth=auth)
+        self.addCleanup(lambda: client.is_connected() and client.disconnect())
+        return client
+
+    def received(self, socket_client, name):
+        return [event['args'][0] for event in socket_client.get_received() if event['name'] == name]
+
+    def test_authenticated_device_receives_create_and_delete(self):
+        device = self.connect(self.access_token)
+        anonymous = self.connect()
+        self.assertTrue(device.is_connected())
+
+        long_text = 'x' * (module.CLIPBOARD_PREVIEW_CHARS + 10)
+        created = self.client.post(
+            '/api/clipboard',
+            headers=self.headers,
+            json={'content': long_text, 'type': 'text'}
+        )
+        item_id = created.get_json()['id']
+
+        events = self.received(device, 'clipboard_item_created')
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['id'], item_id)
+        self.assertEqual(len(events[0]['preview']), module.CLIPBOARD_PREVIEW_CHARS)
+        self.assertTrue(events[0]['truncated'])
+        self.assertEqual(self.received(anonymous, 'clipboard_item_created'), [])
+
+        self.client.delete(f'/api/clipboard/{item_id}', headers=self.headers)
+        self.assertEqual(
+            self.received(device, 'clipboard_items_deleted'),
+            [{'ids': [item_id]}]
+        )
+
+    def test_expired_token_disconnects_socket(self):
+        device = self.connect(self.access_token)
+        anonymous = self.connect()
+        self.assertEqual(module.check_socket_sessions(), 0)
+        expires = module.decode_token(self.access_token)['exp']
+
+        self.assertEqual(module.check_socket_sessions(now=expires + 1), 1)
+        self.assertFalse(device.is_connected())
+        self.assertTrue(anonymous.is_connected())
+
+    def test_role_change_and_deleted_user_disconnect_socket(self):
+        device = self.connect(self.access_token)
+        self.user.role = module.UserRole.USER
+        module.db.session.commit()
+        self.assertEqual(module.check_socket_sessions(), 1)
+        self.assertFalse(device.is_connected())
+
+        # 按新角色重新连接后保持连接；用户被删除后断开
+        device = self.connect(self.access_token)
+        self.assertEqual(module.check_socket_sessions(), 0)
+        module.db.session.delete(self.user)
+        module.db.session.commit()
+        self.assertEqual(module.check_socket_sessions(), 1)
+        self.assertFalse(device.is_connected())
+
+    def test_deleted_user_leaves_private_room(self):
+        other = self.create_user('other@example.test')
+        server = module.socketio.server
+        sid = server.manager.sid_from_eio_sid(self.connect().eio_sid, '/')
+        server.enter_room(sid, module.user_room(other.id), namespace='/')
+
+        response = self.client.delete(f'/api/users/{other.id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(server.manager.get_participants('/', module.user_room(other.id))), [])
+
+    def test_invalid_token_is_rejected(self):
+        device = self.connect('not-a-jwt')
+        self.assertFalse(device.is_connected())
+
+
+if __name__ == '__main__':
+    unittest.main()
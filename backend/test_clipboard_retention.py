@@ -0,0 +1,111 @@
+import io
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from app_testing import AppTestCase, module
+
+
+class ClipboardRetentionTestCase(AppTestCase):
+    def paste_text(self, content, item_type='text'):
+        return self.client.post(
+            '/api/clipboard',
+            headers=self.headers,
+            json={'content': content, 'type': item_type}
+        )
+
+    def test_repeat_paste_bumps_existing_item(self):
+        first = self.paste_text('same snippet')
+        self.assertEqual(first.status_code, 201)
+        item = module.db.session.get(module.ClipboardItem, first.get_json()['id'])
+        item.updated_at = datetime.utcnow() - timedelta(hours=1)
+        module.db.session.commit()
+
+        self.paste_text('other snippet')
+        repeat = self.paste_text('same snippet')
+        self.assertEqual(repeat.status_code, 200)
+        self.assertTrue(repeat.get_json()['deduplicated'])
+        self.assertEqual(repeat.get_json()['id'], first.get_json()['id'])
+        self.assertEqual(module.ClipboardItem.query.count(), 2)
+
+        listing = self.client.get('/api/clipboard', headers=self.headers)
+        self.assertEqual(listing.get_json()[0]['content'], 'same snippet')
+
+        # 类型不同视为不同条目
+        self.assertEqual(self.paste_text('same snippet', 'code').status_code, 201)
+
+    def test_digest_does_not_expose_plaintext(self):
+        self.paste_text('secret value')
+        item = module.ClipboardItem.query.one()
+        self.assertEqual(len(item.content_hash), 64)
+        self.assertNotIn('secret', item.content_hash)
+        self.assertEqual(item.size, len('secret value'))
+
+    def test_duplicate_image_is_not_written_twice(self):
+        for _ in range(2):
+            response = self.client.post(
+                '/api/clipboard',
+                headers=self.headers,
+                data={'file': (io.BytesIO(b'\x89PNG fake image'), 'paste.png', 'image/png')},
+                content_type='multipart/form-data'
+            )
+            self.assertIn(response.status_code, (200, 201))
+        image_dir = os.path.join(self.upload_folder, 'clipboard_images')
+        self.assertEqual(len(os.listdir(image_dir)), 1)
+        self.assertEqual(module.ClipboardItem.query.count(), 1)
+
+    def test_compactor_applies_item_age_and_byte_limits(self):
+        for index in range(5):
+            self.paste_text(f'item {index}')
+        oldest = module.ClipboardItem.query.order_by(module.ClipboardItem.id).first()
+        oldest.updated_at = datetime.utcnow() - timedelta(days=10)
+        module.db.session.commit()
+
+        response = self.client.put(
+            '/api/clipboard/retention',
+            headers=self.headers,
+            json={'max_items': 3, 'max_age_days': 5, 'max_bytes': 0}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['max_items'], 3)
+
+        removed = module.compact_clipboard_items(batch_size=1)
+        self.assertEqual(removed, 2)
+        remaining = [
+            module.crypto.decrypt(item.content).decode()
+            for item in module.ClipboardItem.query.order_by(module.ClipboardItem.id)
+        ]
+        self.assertEqual(remaining, ['item 2', 'item 3', 'item 4'])
+
+        self.user.clipboard_max_bytes = len('item 4') * 2
+        module.db.session.commit()
+        self.assertEqual(module.compact_clipboard_items(), 1)
+        self.assertEqual(module.ClipboardItem.query.count(), 2)
+
+    def test_compactor_removes_image_files(self):
+        self.client.post(
+            '/api/clipboard',
+            headers=self.headers,
+            data={'file': (io.BytesIO(b'image bytes'), 'paste.png', 'image/png')},
+            content_type='multipart/form-data'
+        )
+        self.user.clipboard_max_items = 0
+        self.user.clipboard_max_age_days = 0
+        self.user.clipboard_max_bytes = 1
+        module.db.session.commit()
+
+        self.assertEqual(module.compact_clipboard_items(), 1)
+        image_dir = os.path.join(self.upload_folder, 'clipboard_images')
+        self.assertEqual(os.listdir(image_dir), [])
+
+    def test_retention_rejects_negative_values(self):
+        response = self.client.put(
+            '/api/clipboard/retention',
+            headers=self.headers,
+            json={'max_items': -1}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app_testing import AppTestCase
+from grok_engine import GrokEngine, PatternOverlay
+from pattern_library import PatternLibrary
+
+
+class PatternOverlayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.patterns_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.patterns_dir, 'base'), 'w', encoding='utf-8') as f:
+            f.write('INT (?:[+-]?(?:[0-9]+))\nWORD \\b\\w+\\b\n')
+        self.engine = GrokEngine(PatternLibrary(self.patterns_dir, check_interval=0))
+
+    def tearDown(self):
+        shutil.rmtree(self.patterns_dir, ignore_errors=True)
+
+    def test_overlay_layers_over_builtin_patterns(self):
+        overlay = PatternOverlay(1, {'USERID': 'u%{INT}', 'WORD': '[a-z]+'})
+        compiled = self.engine.compile('%{USERID:id} %{WORD:name}', overlay=overlay)
+        self.assertEqual(compiled.match('u42 bob'), {'id': 'u42', 'name': 'bob'})
+        self.assertIsNone(compiled.match('u42 BOB'))
+        # 不带覆盖层时仍使用内置定义
+        self.assertEqual(self.engine.compile('%{WORD:name}').match('BOB'), {'name': 'BOB'})
+
+    def test_editing_a_pattern_recompiles_only_dependents(self):
+        patterns = {'USERID': 'u%{INT}', 'TAG': '#%{WORD}'}
+        users = self.engine.compile('%{USERID:id}', overlay=PatternOverlay(1, patterns))
+        tags = self.engine.compile('%{TAG:tag}', overlay=PatternOverlay(1, patterns))
+        builtin = self.engine.compile('%{INT:n}', overlay=PatternOverlay(1, patterns))
+        self.assertEqual(self.engine.misses, 3)
+
+        patterns = dict(patterns, USERID='user-%{INT}')
+        self.assertIs(self.engine.compile('%{TAG:tag}', overlay=PatternOverlay(1, patterns)), tags)
+        self.assertIs(self.engine.compile('%{INT:n}', overlay=PatternOverlay(1, patterns)), builtin)
+        edited = self.engine.compile('%{USERID:id}', overlay=PatternOverlay(1, patterns))
+        self.assertIsNot(edited, users)
+        self.assertEqual(edited.match('user-7'), {'id': 'user-7'})
+        self.assertEqual(self.engine.misses, 4)
+
+        # 新增一个与内置模式同名的自定义模式，依赖它的表达式随之失效
+        patterns = dict(patterns, WORD='[A-Z]+')
+        self.assertIsNone(self.engine.compile('%{TAG:tag}', overlay=PatternOverlay(1, patterns)).match('#abc'))
+
+    def test_overlays_are_isolated_per_key(self):
+        first = self.engine.compile('%{ID:id}', overlay=PatternOverlay(1, {'ID': 'a%{INT}'}))
+        second = self.engine.compile('%{ID:id}', overlay=PatternOverlay(2, {'ID': 'b%{INT}'}))
+        self.assertEqual(first.match('a1'), {'id': 'a1'})
+        self.assertEqual(second.match('b1'), {'id': 'b1'})
+        self.assertIsNone(second.match('a1'))
+
+
+class CustomPatternEndpointTestCase(AppTestCase):
+    def test_custom_pattern_crud_and_match(self):
+        response = self.client.put('/api/patterns/custom/ORDER_ID', headers=self.headers, json={
+            'pattern': 'ORD-%{INT}'
+        })
+        self.assertEqual(response.status_code, 200)
+
+        listed = self.client.get('/api/patterns/custom', headers=self.headers)
+        self.assertEqual([item['name'] for item in listed.get_json()], ['ORDER_ID'])
+
+        response = self.client.post('/api/patterns/match', headers=self.headers, json={
+            'pattern': 'order %{ORDER_ID:order}',
+            'text': 'order ORD-17'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['matches'][0]['captures'], {'order': 'ORD-17'})
+
+        self.client.put('/api/patterns/custom/ORDER_ID', headers=self.headers, json={'pattern': 'O%{INT}'})
+        response = self.client.post('/api/patterns/match', headers=self.headers, json={
+            'pattern': 'order %{ORDER_ID:order}',
+            'text': 'order O18'
+        })
+        self.assertEqual(response.get_json()['matches'][0]['captures'], {'order': 'O18'})
+
+        response = self.client.delete('/api/patterns/custom/ORDER_ID', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/patterns/match', headers=self.headers, json={
+            'pattern': '%{ORDER_ID}',
+            'text': 'O18'
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_custom_patterns_are_rejected(self):
+        self.client.put('/api/patterns/custom/LOOP_A', headers=self.headers, json={'pattern': 'a'})
+        response = self.client.put('/api/patterns/custom/LOOP_B', headers=self.headers, json={
+            'pattern': '%{LOOP_A}'
+        })
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put('/api/patterns/custom/LOOP_A', headers=self.headers, json={
+            'pattern': '%{LOOP_B}'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('循环引用', response.get_json()['error'])
+
+        for name, pattern in (('bad-name', 'x'), ('EMPTY', ''), ('BROKEN', '(unclosed')):
+            response = self.client.put(f'/api/patterns/custom/{name}', headers=self.headers, json={
+                'pattern': pattern
+            })
+            self.assertEqual(response.status_code, 400, name)
+
+    def test_builtin_pattern_files_are_still_served(self):
+        response = self.client.get('/api/patterns/grok-patterns')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('INT', response.get_json())
+        self.assertEqual(self.client.get('/api/patterns/custom').status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+os.environ['JWT_SECRET_KEY'] = 'test-only-random-jwt-secret-with-32-characters'
+
+import app as module
+import db_profile
+from sqlalchemy import text
+
+
+class DatabaseProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'websync.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_file_database_uses_tuned_pragmas_and_pool(self):
+        flask_app = module.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.path}'})
+        with flask_app.app_context():
+            engine = module.db.engine
+            self.assertEqual(engine.pool.size(), flask_app.config['DB_POOL_SIZE'])
+            with engine.connect() as conn:
+                self.assertEqual(conn.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+                self.assertEqual(conn.execute(text('PRAGMA synchronous')).scalar(), 1)  # NORMAL
+                self.assertEqual(conn.execute(text('PRAGMA busy_timeout')).scalar(), flask_app.config['SQLITE_BUSY_TIMEOUT_MS'])
+                self.assertEqual(conn.execute(text('PRAGMA cache_size')).scalar(), -flask_app.config['SQLITE_CACHE_SIZE_KB'])
+            engine.dispose()
+
+    def test_upgrade_adds_hot_lookup_indexes_to_old_databases(self):
+        # 旧版本建出的表没有这些索引
+        conn = sqlite3.connect(self.path)
+        conn.executescript('''
+            CREATE TABLE files (id INTEGER PRIMARY KEY, path VARCHAR(500) NOT NULL, hash VARCHAR(64) NOT NULL,
+                last_modified DATETIME NOT NULL, size INTEGER NOT NULL, owner_id INTEGER NOT NULL,
+                is_public BOOLEAN, created_at DATETIME NOT NULL);
+            CREATE TABLE file_shares (id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+                created_at DATETIME NOT NULL, created_by INTEGER NOT NULL);
+            CREATE TABLE clipboard_items (id INTEGER PRIMARY KEY, content TEXT, type VARCHAR(10) NOT NULL,
+                image_path VARCHAR(500), owner_id INTEGER NOT NULL, created_at DATETIME NOT NULL);
+        ''')
+        conn.close()
+
+        flask_app = module.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.path}'})
+        with flask_app.app_context():
+            module.db.create_all()
+            module.upgrade_schema()
+            module.upgrade_schema()
+            inspector = module.db.inspect(module.db.engine)
+            indexes = {
+                table: {index['name']: index['column_names'] for index in inspector.get_indexes(table)}
+                for table in ('files', 'file_shares', 'clipboard_items')
+            }
+            module.db.engine.dispose()
+        self.assertEqual(indexes['files']['ix_files_path'], ['path'])
+        self.assertEqual(indexes['files']['ix_files_owner_id'], ['owner_id'])
+        self.assertEqual(indexes['file_shares']['ix_file_shares_user_file'], ['user_id', 'file_id'])
+        self.assertEqual(indexes['clipboard_items']['ix_clipboard_items_owner_updated'], ['owner_id', 'updated_at'])
+
+    def test_engine_options_by_backend(self):
+        self.assertEqual(db_profile.engine_options('sqlite:///:memory:'), {})
+        self.assertEqual(db_profile.engine_options('sqlite://'), {})
+        self.assertNotIn('pool_pre_ping', db_profile.engine_options(f'sqlite:///{self.path}'))
+        options = db_profile.engine_options('postgresql://websync@db/websync', pool_size=5, pool_recycle=600)
+        self.assertEqual(options['pool_size'], 5)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['pool_recycle'], 600)
+
+    def test_invalid_pragmas_are_rejected(self):
+        pragmas = db_profile.SQLitePragmas()
+        with self.assertRaises(ValueError):
+            pragmas.configure(journal_mode='fast')
+        with self.assertRaises(ValueError):
+            pragmas.configure(busy_timeout_ms=-1)
+        self.assertIn('PRAGMA synchronous=NORMAL', pragmas.statements())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import re
+import unittest
+import urllib.parse
+
+from app_testing import AppTestCase, module
+
+
+NGINX_CONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deploy', 'nginx.conf')
+
+
+def internal_location(conf_path):
+    """从随附的 nginx 配置中取出 internal location 的前缀、alias 与去掉注释的指令。"""
+    with open(conf_path, encoding='utf-8') as f:
+        conf = f.read()
+    match = re.search(r'location\s+(\S+)\s*\{([^}]*)\}', conf[conf.index('internal;') - 200:])
+    body = re.sub(r'#.*', '', match.group(2))
+    return match.group(1), re.search(r'alias\s+(\S+);', body).group(1), body
+
+
+class DownloadOffloadTestCase(AppTestCase):
+    def upload(self, name, body):
+        response = self.client.post(f'/api/clipboard/attach?filename={name}', headers=self.headers, data=body)
+        self.assertEqual(response.status_code, 200)
+        return module.db.session.get(module.File, response.get_json()['file']['id'])
+
+    def test_nginx_receives_internal_redirect_matching_bundled_config(self):
+        self.app.config['DOWNLOAD_OFFLOAD'] = 'nginx'
+        module.storage_layout.configure(mode='sharded')
+        self.upload('report.pdf', b'offloaded bytes')
+
+        response = self.client.get('/api/download/report.pdf', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), b'')
+        self.assertIn("filename*=UTF-8''report.pdf", response.headers['Content-Disposition'])
+        self.assertNotIn('X-Accel-Limit-Rate', response.headers)
+        self.assertEqual(module.admission.active, 0)
+
+        # 按随附配置的 internal location 解析内部重定向，应得到后端存放的同一个文件
+        prefix, alias, _ = internal_location(NGINX_CONF)
+        redirect = response.headers['X-Accel-Redirect']
+        self.assertEqual(prefix, self.app.config['DOWNLOAD_OFFLOAD_PREFIX'])
+        self.assertTrue(redirect.startswith(prefix))
+        self.assertTrue(alias.endswith('/'))
+        relative = urllib.parse.unquote(redirect[len(prefix):])
+        with open(os.path.join(self.upload_folder, *relative.split('/')), 'rb') as f:
+            self.assertEqual(f.read(), b'offloaded bytes')
+
+    def test_cache_control_comes_from_backend_for_share_links(self):
+        self.app.config['DOWNLOAD_OFFLOAD'] = 'nginx'
+        record = self.upload('public.txt', b'public bytes')
+        # internal location 不能再追加 Cache-Control，否则会与分享链接的 public, max-age 冲突
+        _, _, directives = internal_location(NGINX_CONF)
+        self.assertNotIn('Cache-Control', directives)
+
+        response = self.client.get('/api/download/public.txt', headers=self.headers)
+        self.assertIn('X-Accel-Redirect', response.headers)
+        self.assertEqual(response.headers.get_all('Cache-Control'), ['private, no-cache'])
+
+        self.client.post(f'/api/files/{record.id}/share', headers=self.headers, json={'type': 'public'})
+        url = self.client.post(f'/api/files/{record.id}/links', headers=self.headers, json={}).get_json()['url']
+        response = self.client.get(url)
+        self.assertIn('X-Accel-Redirect', response.headers)
+        self.assertEqual(response.headers.get_all('Cache-Control'), ['public, max-age=300'])
+
+    def test_apache_receives_absolute_path_and_rate_limit_is_forwarded_to_nginx(self):
+        record = self.upload('notes.txt', b'notes')
+        self.app.config['DOWNLOAD_OFFLOAD'] = 'apache'
+        response = self.client.get('/api/download/notes.txt', headers=self.headers)
+        self.assertEqual(response.headers['X-Sendfile'], os.path.abspath(module.storage.local_path(record.path)))
+        self.assertNotIn('X-Accel-Redirect', response.headers)
+
+        self.app.config['DOWNLOAD_OFFLOAD'] = 'nginx'
+        self.app.config['USER_BANDWIDTH_LIMIT'] = 1024 * 1024
+        response = self.client.get('/api/download/notes.txt', headers=self.headers)
+        self.assertEqual(response.headers['X-Accel-Limit-Rate'], str(1024 * 1024))
+
+    def test_missing_file_and_disabled_offload(self):
+        record = self.upload('gone.txt', b'gone')
+        self.app.config['DOWNLOAD_OFFLOAD'] = 'nginx'
+        os.remove(module.storage.local_path(record.path))
+        response = self.client.get('/api/download/gone.txt', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+        self.upload('kept.txt', b'kept')
+        self.app.config['DOWNLOAD_OFFLOAD'] = 'off'
+        response = self.client.get('/api/download/kept.txt', headers=self.headers)
+        self.assertEqual(response.get_data(), b'kept')
+        self.assertNotIn('X-Accel-Redirect', response.headers)
+        response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from app_testing import AppTestCase, module
+from chunk_store import ChunkStore, ContentDefinedChunker
+
+
+def small_chunker():
+    return ContentDefinedChunker(min_size=1024, avg_size=4096, max_size=16384)
+
+
+def random_bytes(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+class ContentDefinedChunkerTestCase(unittest.TestCase):
+    def test_chunks_respect_bounds_and_rebuild_input(self):
+        data = random_bytes(200000, 1)
+        chunks = list(small_chunker().split(io.BytesIO(data)))
+        self.assertEqual(b''.join(chunks), data)
+        self.assertTrue(all(len(chunk) <= 16384 for chunk in chunks))
+        self.assertTrue(all(len(chunk) > 1024 for chunk in chunks[:-1]))
+
+    def test_insert_only_changes_nearby_chunks(self):
+        data = random_bytes(200000, 2)
+        edited = data[:100000] + b'inserted bytes' + data[100000:]
+        before = set(small_chunker().split(io.BytesIO(data)))
+        after = list(small_chunker().split(io.BytesIO(edited)))
+        changed = [chunk for chunk in after if chunk not in before]
+        self.assertLessEqual(len(changed), 3)
+        self.assertGreater(len(after), 10)
+
+    def test_corrupted_chunk_is_detected(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = ChunkStore(root=root, chunker=small_chunker())
+            source = os.path.join(root, 'source.bin')
+            with open(source, 'wb') as f:
+                f.write(random_bytes(5000, 3))
+            _, _, manifest, _ = store.ingest(source)
+            with open(store.path(manifest[0][0]), 'r+b') as f:
+                f.write(b'broken')
+            with self.assertRaises(OSError):
+                store.get(manifest[0][0])
+
+
+class FileVersionTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        module.chunk_store.configure(chunker=small_chunker())
+
+    def upload(self, name, body):
+        response = self.client.post(f'/api/clipboard/attach?filename={name}', headers=self.headers, data=body)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['file']
+
+    def test_reupload_adds_version_to_same_record(self):
+        original = random_bytes(60000, 4)
+        first = self.upload('report.bin', original)
+        # 当前版本只存完整文件，不重复分块存放
+        self.assertEqual(module.Chunk.query.count(), 0)
+        self.assertFalse(os.path.exists(module.chunk_store.root))
+        second = self.upload('report.bin', original[:30000] + b'edit' + original[30000:])
+        third = self.upload('report.bin', original[:30000] + b'edit' + original[30000:] + b'tail')
+
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual((first['version'], second['version'], third['version']), (1, 2, 3))
+        self.assertEqual(module.File.query.count(), 1)
+        module.db.session.refresh(self.user)
+        self.assertEqual(self.user.storage_used, 60008)
+
+        listing = self.client.get(f'/api/files/{first["id"]}/versions', headers=self.headers).get_json()
+        self.assertEqual([entry['version'] for entry in listing['versions']], [3, 2, 1])
+        self.assertTrue(listing['versions'][0]['current'])
+        self.assertEqual(listing['versions'][0]['chunks'], 0)
+        self.assertGreater(listing['versions'][1]['chunks'], 0)
+
+        usage = self.client.get('/api/files/versions/usage', headers=self.headers).get_json()
+        self.assertEqual(usage['versions'], 3)
+        self.assertEqual(usage['logical_bytes'], 180012)
+        # 被取代的两个版本中未改动的块只存一份，再加上当前内容的完整文件
+        self.assertGreater(usage['unique_bytes'], 60008 + 60004)
+        self.assertLess(usage['unique_bytes'], 60008 + 80000)
+
+        response = self.client.get(f'/api/files/{first["id"]}/versions/3/download', headers=self.headers)
+        self.assertTrue(response.get_data().endswith(b'tail'))
+        response.close()
+
+    def test_old_version_can_be_downloaded_and_restored(self):
+        original = random_bytes(40000, 5)
+        file_id = self.upload('notes.bin', original)['id']
+        self.upload('notes.bin', b'replaced')
+
+        response = self.client.get(f'/api/files/{file_id}/versions/1/download', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), original)
+        self.assertIn("filename*=UTF-8''v1-notes.bin", response.headers['Content-Disposition'])
+        response.close()
+        self.assertEqual(module.admission.active, 0)
+
+        response = self.client.post(f'/api/files/{file_id}/versions/1/restore', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['version'], 3)
+        self.assertEqual(response.get_json()['restored_from'], 1)
+        with open(os.path.join(self.upload_folder, 'notes.bin'), 'rb') as f:
+            self.assertEqual(f.read(), original)
+        self.assertEqual(module.db.session.get(module.File, file_id).size, 40000)
+
+        missing = self.client.post(f'/api/files/{file_id}/versions/9/restore', headers=self.headers)
+        self.assertEqual(missing.status_code, 404)
+
+    def test_superseded_version_is_archived_from_stored_content(self):
+        file_id = self.upload('synced.bin', b'uploaded')['id']
+        # 目录监控同步进来的修改不产生新版本，归档时以实际内容为准
+        with open(os.path.join(self.upload_folder, 'synced.bin'), 'wb') as f:
+            f.write(b'edited on disk')
+        self.upload('synced.bin', b'next')
+
+        response = self.client.get(f'/api/files/{file_id}/versions/1/download', headers=self.headers)
+        self.assertEqual(response.get_data(), b'edited on disk')
+        response.close()
+        version = module.FileVersion.query.filter_by(file_id=file_id, version=1).one()
+        self.assertEqual(version.size, len(b'edited on disk'))
+
+    def test_prune_keeps_recent_versions_and_collects_orphan_chunks(self):
+        for seed in range(4):
+            file_id = self.upload('draft.bin', random_bytes(20000, 10 + seed))['id']
+        self.app.config['FILE_VERSION_KEEP'] = 2
+        self.app.config['CHUNK_GC_GRACE'] = 0
+
+        result = module.prune_file_versions()
+        self.assertEqual(result['versions'], 2)
+        self.assertGreater(result['chunks'], 0)
+        remaining = module.FileVersion.query.filter_by(file_id=file_id).order_by(module.FileVersion.version).all()
+        self.assertEqual([version.version for version in remaining], [3, 4])
+        for chunk in module.Chunk.query.all():
+            self.assertTrue(module.chunk_store.has(chunk.hash))
+        self.assertEqual(
+            module.Chunk.query.count(),
+            len({row.chunk_hash for row in module.FileVersionChunk.query.all()})
+        )
+        self.assertIsNone(module.prune_file_versions())
+
+    def test_recent_chunks_survive_gc_grace(self):
+        self.upload('fresh.bin', random_bytes(20000, 20))
+        file_id = self.upload('fresh.bin', b'replaced')['id']
+        self.client.delete(f'/api/files/{file_id}', headers=self.headers)
+        module.purge_trash(now=datetime.utcnow() + timedelta(days=self.app.config['TRASH_RETENTION_DAYS'] + 1))
+        self.assertEqual(module.FileVersion.query.count(), 0)
+        self.assertIsNone(module.prune_file_versions())
+        self.assertGreater(module.Chunk.query.count(), 0)
+
+        self.app.config['CHUNK_GC_GRACE'] = 0
+        module.prune_file_versions(now=datetime.utcnow() + timedelta(days=1))
+        self.assertEqual(module.Chunk.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
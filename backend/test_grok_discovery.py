@@ -0,0 +1,65 @@
+import re
+import unittest
+
+from app_testing import AppTestCase
+from grok_discovery import AhoCorasick, pattern_discovery, required_literals
+
+
+SAMPLE_LINES = [
+    '127.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] "GET /apache_pb.gif HTTP/1.0" 200 2326',
+    'Oct 11 22:14:15 myhost sshd[123]: Accepted password for root from 1.2.3.4 port 22 ssh2',
+    '2024-01-02T03:04:05Z ERROR something failed',
+]
+
+
+class PatternDiscoveryTestCase(unittest.TestCase):
+    def test_aho_corasick_finds_overlapping_literals(self):
+        automaton = AhoCorasick(['he', 'she', 'his', 'hers'])
+        self.assertEqual(automaton.find('ushers'), {0, 1, 3})
+        self.assertEqual(automaton.find('xyz'), set())
+
+    def test_required_literals_are_conservative(self):
+        literals, prefix = required_literals(re.compile(r'^GET (?:foo|bar)=\d+ HTTP/(?:1\.0|1\.1)(x)?'))
+        self.assertIn('GET ', literals)
+        self.assertIn(' HTTP/1.', literals)
+        self.assertNotIn('foo', literals)
+        self.assertNotIn('x', literals)
+        self.assertEqual(prefix, 'GET ')
+        self.assertEqual(required_literals(re.compile('(?i)abc')), (set(), None))
+
+    def test_prefilter_never_drops_a_matching_pattern(self):
+        index = pattern_discovery.index()
+        for line in SAMPLE_LINES:
+            survivors = set(index.candidates(line))
+            for position, entry in enumerate(index.entries):
+                if entry['compiled'].regex.search(line):
+                    self.assertIn(position, survivors, entry['name'])
+            self.assertLess(len(survivors), len(index.entries))
+
+    def test_discover_ranks_full_line_patterns_first(self):
+        pattern_discovery.index()
+        result = pattern_discovery.discover(SAMPLE_LINES[:1], limit=3)
+        self.assertEqual(result['candidates'][0]['name'], 'COMMONAPACHELOG')
+        self.assertEqual(result['candidates'][0]['coverage'], 1.0)
+        self.assertGreater(result['prefiltered'], 0)
+        self.assertLess(result['elapsed_ms'], 50)
+
+
+class DiscoverEndpointTestCase(AppTestCase):
+    def test_discover_endpoint(self):
+        response = self.client.post('/api/patterns/discover', headers=self.headers, json={
+            'text': SAMPLE_LINES[1],
+            'limit': 2
+        })
+        self.assertEqual(response.status_code, 200)
+        candidates = response.get_json()['candidates']
+        self.assertEqual(len(candidates), 2)
+        self.assertEqual(candidates[0]['name'], 'SYSLOGLINE')
+        self.assertEqual(candidates[0]['captures']['program'], 'sshd')
+
+        invalid = self.client.post('/api/patterns/discover', headers=self.headers, json={'text': ''})
+        self.assertEqual(invalid.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
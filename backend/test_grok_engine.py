@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app_testing import AppTestCase
+from grok_engine import GrokCycleError, GrokEngine, GrokError, to_python_regex
+from pattern_library import PatternLibrary
+
+
+class GrokEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.patterns_dir = tempfile.mkdtemp()
+        self.write('base', '\n'.join([
+            'INT (?:[+-]?(?:[0-9]+))',
+            'WORD \\b\\w+\\b',
+            'PAIR %{WORD:key}=%{INT:value:int}',
+            'LOOP_A x%{LOOP_B}',
+            'LOOP_B y%{LOOP_A}',
+        ]))
+        self.engine = GrokEngine(PatternLibrary(self.patterns_dir, check_interval=0))
+
+    def tearDown(self):
+        shutil.rmtree(self.patterns_dir, ignore_errors=True)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.patterns_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def test_named_captures_and_type_conversion(self):
+        compiled = self.engine.compile('%{PAIR} and %{WORD:other-field}')
+        self.assertEqual(
+            compiled.match('size=42 and done'),
+            {'key': 'size', 'value': 42, 'other-field': 'done'}
+        )
+        self.assertIsNone(compiled.match('no pairs here'))
+
+    def test_repeated_pattern_and_raw_named_groups(self):
+        compiled = self.engine.compile('%{PAIR} %{PAIR} (?<tail>.*)')
+        self.assertEqual(compiled.match('a=1 b=2 rest'), {'key': 'a', 'value': 1, 'tail': 'rest'})
+
+    def test_compiled_patterns_are_memoized_until_library_changes(self):
+        first = self.engine.compile('%{PAIR}')
+        self.assertIs(self.engine.compile('%{PAIR}'), first)
+        self.assertEqual((self.engine.hits, self.engine.misses), (1, 1))
+
+        self.write('extra', 'NUMBER %{INT}\n')
+        self.assertIsNot(self.engine.compile('%{PAIR}'), first)
+
+    def test_cycles_and_unknown_patterns_are_reported(self):
+        with self.assertRaises(GrokCycleError) as raised:
+            self.engine.compile('%{LOOP_A}')
+        self.assertIn('LOOP_A -> LOOP_B -> LOOP_A', str(raised.exception))
+        with self.assertRaises(GrokError):
+            self.engine.compile('%{MISSING}')
+        with self.assertRaises(GrokError):
+            self.engine.compile('%{INT}', files=['missing'])
+
+    def test_oniguruma_syntax_is_translated(self):
+        source, flags = to_python_regex(r'(?m)[[[:alnum:]]_-]+\h{2}.?*')
+        self.assertEqual(source, r'[a-zA-Z0-9_-]+[0-9a-fA-F]{2}.*')
+        self.assertTrue(flags)
+
+
+class PatternMatchEndpointTestCase(AppTestCase):
+    def test_match_returns_named_captures(self):
+        response = self.client.post('/api/patterns/match', headers=self.headers, json={
+            'pattern': '%{IP:client} %{WORD:method} %{NUMBER:bytes:int}',
+            'text': '10.0.0.1 GET 512\nnot a log line\n\n10.0.0.2 POST 7'
+        })
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['matched'], 2)
+        self.assertEqual(body['unmatched'], 1)
+        self.assertEqual(body['matches'][1]['line_number'], 4)
+        self.assertEqual(
+            body['matches'][0]['captures'],
+            {'client': '10.0.0.1', 'method': 'GET', 'bytes': 512}
+        )
+
+    def test_match_requires_auth_and_valid_pattern(self):
+        self.assertEqual(
+            self.client.post('/api/patterns/match', json={'pattern': '%{IP}', 'text': ''}).status_code,
+            401
+        )
+        response = self.client.post('/api/patterns/match', headers=self.headers, json={
+            'pattern': '%{NO_SUCH_PATTERN}',
+            'text': 'x'
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
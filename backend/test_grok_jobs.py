@@ -0,0 +1,135 @@
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app_testing import AppTestCase, module
+import grok_jobs
+
+
+LOG_LINES = [f'10.0.0.{index % 250} GET /item/{index} {index * 10}' for index in range(200)]
+PATTERN = '%{IP:client} %{WORD:method} %{URIPATH:path} %{INT:bytes:int}'
+
+
+class BulkParseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.workdir, 'access.log')
+        with open(self.log_path, 'w', encoding='utf-8') as f:
+            for index, line in enumerate(LOG_LINES):
+                f.write(line + '\n')
+                if index % 50 == 0:
+                    f.write('garbage line\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_ranges_are_line_aligned_and_cover_file(self):
+        ranges = grok_jobs.split_ranges(self.log_path, shard_size=100)
+        self.assertGreater(len(ranges), 10)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.log_path))
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+        for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[end - 1:end], b'\n')
+
+    def test_process_pool_results_keep_file_order(self):
+        progress = []
+        result_path = os.path.join(self.workdir, 'result.ndjson')
+        with grok_jobs.ProcessPoolExecutor(
+            max_workers=2,
+            mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            matched, unmatched = grok_jobs.run_bulk_parse(
+                self.log_path, PATTERN, None, 'ndjson', result_path,
+                progress=lambda *args: progress.append(args),
+                executor=executor, shard_size=1024, poll_interval=0.01
+            )
+        self.assertEqual((matched, unmatched), (200, 4))
+        self.assertEqual(progress[-1][0], os.path.getsize(self.log_path))
+        with open(result_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record['captures']['bytes'] for record in records], [i * 10 for i in range(200)])
+        self.assertEqual(
+            [name for name in os.listdir(self.workdir) if name.endswith('.part')],
+            []
+        )
+
+    def test_csv_output_has_header(self):
+        result_path = os.path.join(self.workdir, 'result.csv')
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            grok_jobs.run_bulk_parse(
+                self.log_path, PATTERN, None, 'csv', result_path,
+                executor=executor, shard_size=512, poll_interval=0.01
+            )
+        with open(result_path, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['offset', 'client', 'method', 'path', 'bytes'])
+        self.assertEqual(rows[1][1:], ['10.0.0.0', 'GET', '/item/0', '0'])
+        self.assertEqual(len(rows), 201)
+
+
+class GrokJobEndpointTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.started = []
+        self.original_start = module.socketio.start_background_task
+        module.socketio.start_background_task = lambda target, *args: self.started.append(args)
+        self.original_executor = grok_jobs.get_executor
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        grok_jobs.get_executor = lambda max_workers=None: self.executor
+
+        with open(os.path.join(self.upload_folder, 'access.log'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(LOG_LINES[:3]) + '\n')
+        self.file = module.File(
+            path='access.log', hash='0' * 64, last_modified=datetime.utcnow(),
+            size=os.path.getsize(os.path.join(self.upload_folder, 'access.log')),
+            owner_id=self.user.id
+        )
+        module.db.session.add(self.file)
+        module.db.session.commit()
+
+    def tearDown(self):
+        module.socketio.start_background_task = self.original_start
+        grok_jobs.get_executor = self.original_executor
+        self.executor.shutdown()
+
+    def test_job_runs_and_result_can_be_downloaded(self):
+        response = self.client.post(f'/api/files/{self.file.id}/grok', headers=self.headers, json={
+            'pattern': PATTERN, 'format': 'ndjson'
+        })
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['id']
+        self.assertEqual(self.started, [(self.app, job_id)])
+
+        not_ready = self.client.get(f'/api/grok/jobs/{job_id}/result', headers=self.headers)
+        self.assertEqual(not_ready.status_code, 409)
+
+        module.run_grok_job(self.app, job_id)
+        status = self.client.get(f'/api/grok/jobs/{job_id}', headers=self.headers).get_json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['matched'], 3)
+
+        result = self.client.get(f'/api/grok/jobs/{job_id}/result', headers=self.headers)
+        self.assertEqual(result.status_code, 200)
+        lines = result.get_data(as_text=True).splitlines()
+        result.close()
+        self.assertEqual(json.loads(lines[0])['captures']['client'], '10.0.0.0')
+
+    def test_invalid_pattern_is_rejected_before_queueing(self):
+        response = self.client.post(f'/api/files/{self.file.id}/grok', headers=self.headers, json={
+            'pattern': '%{NOT_A_PATTERN}'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.started, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
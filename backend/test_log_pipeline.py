@@ -0,0 +1,99 @@
+import io
+import logging
+import queue
+import threading
+import unittest
+from unittest import mock
+
+import metrics
+from log_pipeline import LogPipeline, SampledLogger, _NonBlockingQueueHandler, parse_levels
+
+
+class _ThreadRecorder:
+    """格式化时记录所在线程，用于确认格式化不在调用方线程中进行。"""
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.get_ident())
+        return 'formatted'
+
+
+class LogPipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self.saved = (root.level, list(root.handlers))
+        self.saved_levels = {name: logging.getLogger(name).level for name in ('socketio', 'websync.test')}
+
+    def tearDown(self):
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        level, handlers = self.saved
+        root.setLevel(level)
+        for handler in handlers:
+            root.addHandler(handler)
+        for name, level in self.saved_levels.items():
+            logging.getLogger(name).setLevel(level)
+
+    def test_records_are_formatted_and_written_by_background_thread(self):
+        stream = io.StringIO()
+        pipeline = LogPipeline().configure(level='INFO', levels='socketio=ERROR', stream=stream)
+        recorder = _ThreadRecorder()
+        logging.getLogger('websync.test').info('value=%s', recorder)
+        logging.getLogger('websync.test').debug('hidden')
+        logging.getLogger('socketio.server').warning('hidden by subsystem level')
+        pipeline.stop()
+
+        output = stream.getvalue()
+        self.assertIn('INFO websync.test: value=formatted', output)
+        self.assertNotIn('hidden', output)
+        self.assertEqual(len(recorder.threads), 1)
+        self.assertNotEqual(recorder.threads[0], threading.get_ident())
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = _NonBlockingQueueHandler(queue.Queue(1))
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, 'msg', None, None)
+        before = metrics.LOG_RECORDS_DROPPED.value()
+        handler.handle(record)
+        handler.handle(record)
+        self.assertEqual(metrics.LOG_RECORDS_DROPPED.value() - before, 1)
+
+    def test_parse_levels(self):
+        self.assertEqual(parse_levels('socketio=warning, websync.upload=DEBUG,'), {
+            'socketio': logging.WARNING, 'websync.upload': logging.DEBUG
+        })
+        for spec in ('socketio', 'socketio=LOUD', '=INFO'):
+            with self.assertRaises(ValueError):
+                parse_levels(spec)
+
+
+class SampledLoggerTestCase(unittest.TestCase):
+    def test_repeated_messages_are_throttled_and_counted(self):
+        logger = logging.getLogger('websync.test.sampled')
+        logger.setLevel(logging.INFO)
+        sampled = SampledLogger(logger, interval=10)
+        with mock.patch('log_pipeline.time.monotonic') as clock, mock.patch.object(logger, 'log') as log:
+            clock.return_value = 100.0
+            for index in range(5):
+                sampled.info('chunk %d', index)
+            sampled.info('other %d', 1)
+            clock.return_value = 111.0
+            sampled.info('chunk %d', 5)
+        self.assertEqual(log.call_args_list, [
+            mock.call(logging.INFO, 'chunk %d', 0),
+            mock.call(logging.INFO, 'other %d', 1),
+            mock.call(logging.INFO, 'chunk %d（期间省略 %d 条）', 5, 4),
+        ])
+
+    def test_disabled_level_is_skipped_without_counting(self):
+        logger = logging.getLogger('websync.test.sampled.quiet')
+        logger.setLevel(logging.WARNING)
+        sampled = SampledLogger(logger, interval=10)
+        sampled.info('chunk %d', 1)
+        self.assertEqual(sampled._state, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,47 +1,15 @@
-import os
 import unittest
 from datetime import datetime, timedelta
 from urllib.parse import parse_qs, urlsplit
 
-os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-os.environ['JWT_SECRET_KEY'] = 'test-only-random-jwt-secret-with-32-characters'
-
-import app as module
-from flask_jwt_extended import create_access_token
-
-
-class MagicLinkTestCase(unittest.TestCase):
-    def setUp(self):
-        self.context = module.app.app_context()
-        self.context.push()
-        module.db.create_all()
-        self.original_oauth_loader = module.load_google_oauth_config
-        module.load_google_oauth_config = lambda: ({
-            'allowed_email': 'allowed@example.test'
-        }, 'https://example.test/auth/google/callback')
-        self.user = module.User(
-            email='allowed@example.test',
-            password=b'not-used-for-login',
-            role=module.UserRole.ADMIN
-        )
-        module.db.session.add(self.user)
-        module.db.session.commit()
-        self.access_token = create_access_token(identity=str(self.user.id))
-        self.client = module.app.test_client()
-
-    def tearDown(self):
-        module.load_google_oauth_config = self.original_oauth_loader
-        module.db.session.remove()
-        module.db.drop_all()
-        self.context.pop()
+from app_testing import AppTestCase, module
 
-    def auth_headers(self):
-        return {'Authorization': f'Bearer {self.access_token}'}
 
+class MagicLinkTestCase(AppTestCase):
     def create_code(self, expires_in=120):
         response = self.client.post(
             '/api/auth/magic-link',
-            headers=self.auth_headers(),
+            headers=self.headers,
             json={'expires_in': expires_in}
         )
         self.assertEqual(response.status_code, 200)
@@ -103,34 +71,34 @@ class MagicLinkTestCase(unittest.TestCase):
 
         invalid_ttl = self.client.post(
             '/api/auth/magic-link',
-            headers=self.auth_headers(),
+            headers=self.headers,
             json={'expires_in': 30}
         )
         self.assertEqual(invalid_ttl.status_code, 400)
 
     def test_default_ttl_and_hourly_rate_limit(self):
-        original_limit = module.MAGIC_LINK_RATE_LIMIT
-        module.MAGIC_LINK_RATE_LIMIT = 1
+        original_limit = self.app.config['MAGIC_LINK_RATE_LIMIT']
+        self.app.config['MAGIC_LINK_RATE_LIMIT'] = 1
         try:
             first = self.client.post(
                 '/api/auth/magic-link',
-                headers=self.auth_headers(),
+                headers=self.headers,
                 json={}
             )
             self.assertEqual(first.status_code, 200)
             self.assertEqual(
                 first.get_json()['expires_in'],
-                module.MAGIC_LINK_DEFAULT_TTL
+                self.app.config['MAGIC_LINK_DEFAULT_TTL']
             )
 
             second = self.client.post(
                 '/api/auth/magic-link',
-                headers=self.auth_headers(),
+                headers=self.headers,
                 json={}
             )
             self.assertEqual(second.status_code, 429)
         finally:
-            module.MAGIC_LINK_RATE_LIMIT = original_limit
+            self.app.config['MAGIC_LINK_RATE_LIMIT'] = original_limit
 
     def test_regeneration_invalidates_previous_unused_link(self):
         first_code = self.create_code()
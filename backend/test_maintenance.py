@@ -0,0 +1,148 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from app_testing import AppTestCase, module
+from maintenance import MaintenanceScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MaintenanceSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.scheduler = MaintenanceScheduler(
+            clock=self.clock,
+            status_path=os.path.join(self.tmpdir.name, 'status.json')
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_jobs_run_after_initial_delay_and_then_every_interval(self):
+        calls = []
+        self.scheduler.register('fast', lambda: calls.append('fast') or 1, 10, initial_delay=0)
+        self.scheduler.register('slow', lambda: calls.append('slow') or 0, 100)
+
+        self.assertEqual(self.scheduler.run_pending(), ['fast'])
+        self.clock.now = 5
+        self.assertEqual(self.scheduler.run_pending(), [])
+        self.clock.now = 10
+        self.assertEqual(self.scheduler.run_pending(), ['fast'])
+        self.clock.now = 100
+        self.assertEqual(self.scheduler.run_pending(), ['fast', 'slow'])
+        self.assertEqual(calls, ['fast', 'fast', 'fast', 'slow'])
+
+    def test_failure_is_recorded_and_job_is_rescheduled(self):
+        def broken():
+            raise RuntimeError('磁盘不可用')
+
+        self.scheduler.register('broken', broken, 30, initial_delay=0)
+        self.scheduler.run_pending()
+
+        status = self.scheduler.status()[0]
+        self.assertEqual(status['runs'], 1)
+        self.assertEqual(status['failures'], 1)
+        self.assertEqual(status['last_error'], '磁盘不可用')
+        self.assertEqual(status['next_run_in'], 30)
+        self.assertFalse(status['running'])
+
+    def test_status_is_written_after_each_run(self):
+        self.assertIsNone(self.scheduler.load_status())
+        self.scheduler.register('count', lambda: 7, 60, initial_delay=0)
+        self.scheduler.run_pending()
+
+        saved = self.scheduler.load_status()
+        self.assertEqual(saved['pid'], os.getpid())
+        self.assertEqual(saved['jobs'][0]['name'], 'count')
+        self.assertEqual(saved['jobs'][0]['last_result'], 7)
+        self.assertIsNone(saved['jobs'][0]['last_error'])
+
+    def test_interval_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.register('bad', lambda: None, 0)
+
+
+class MaintenanceJobsTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.attach_tmp = module.attach_tmp_dir()
+        os.makedirs(self.attach_tmp, exist_ok=True)
+
+    def add_code(self, index, expires_at):
+        module.db.session.add(module.MagicLoginCode(
+            code_hash=f'{index:064d}',
+            user_id=self.user.id,
+            expires_at=expires_at
+        ))
+
+    def test_purge_removes_only_codes_expired_beyond_retention(self):
+        now = datetime.utcnow()
+        for index in range(5):
+            self.add_code(index, now - timedelta(days=2))
+        self.add_code(5, now - timedelta(hours=1))
+        self.add_code(6, now + timedelta(minutes=5))
+        module.db.session.commit()
+
+        self.assertEqual(module.purge_magic_codes(now=now, batch_size=2), 5)
+        self.assertEqual(module.MagicLoginCode.query.count(), 2)
+        self.assertEqual(module.purge_magic_codes(now=now), 0)
+
+    def test_creating_a_link_does_not_purge_old_codes(self):
+        self.add_code(0, datetime.utcnow() - timedelta(days=2))
+        module.db.session.commit()
+
+        response = self.client.post(
+            '/api/auth/magic-link',
+            headers=self.headers,
+            json={'expires_in': 120}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(module.MagicLoginCode.query.count(), 2)
+
+    def test_attach_tmp_cleanup_is_bounded_and_skips_fresh_parts(self):
+        now = time.time()
+        stale = now - module.ATTACH_TMP_MAX_AGE - 60
+        for index in range(3):
+            path = os.path.join(self.attach_tmp, f'stale-{index}.part')
+            open(path, 'wb').close()
+            os.utime(path, (stale, stale))
+        open(os.path.join(self.attach_tmp, 'fresh.part'), 'wb').close()
+        other = os.path.join(self.attach_tmp, 'notes.txt')
+        open(other, 'wb').close()
+        os.utime(other, (stale, stale))
+
+        self.assertEqual(module.cleanup_stale_attach_tmp(now=now, batch_size=2), 2)
+        self.assertEqual(module.cleanup_stale_attach_tmp(now=now, batch_size=2), 1)
+        self.assertEqual(sorted(os.listdir(self.attach_tmp)), ['fresh.part', 'notes.txt'])
+
+    def test_admin_can_read_maintenance_status(self):
+        # 维护任务由启动器注册一次，而不是每次 create_app 都注册
+        registered = dict(module.maintenance.jobs)
+        module.create_app()
+        self.assertEqual(module.maintenance.jobs, registered)
+        module.register_maintenance_tasks(self.app)
+        self.addCleanup(module.maintenance.jobs.clear)
+        response = self.client.get('/api/admin/maintenance', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        names = {job['name'] for job in response.get_json()['jobs']}
+        self.assertTrue({'magic_codes', 'attach_tmp', 'clipboard_compaction'} <= names)
+
+    def test_maintenance_status_requires_admin(self):
+        self.user.role = module.UserRole.USER
+        module.db.session.commit()
+        response = self.client.get('/api/admin/maintenance', headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
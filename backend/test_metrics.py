@@ -0,0 +1,83 @@
+import os
+import unittest
+
+from app_testing import AppTestCase
+import metrics
+
+
+class RegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.counter = metrics.Counter(self.registry, 'test_total', '计数', ('kind',))
+        self.histogram = metrics.Histogram(self.registry, 'test_seconds', '耗时', buckets=(0.1, 1.0))
+
+    def test_render_text_format(self):
+        self.counter.inc('a"b')
+        self.counter.inc('a"b', amount=2)
+        self.histogram.observe(0.05)
+        self.histogram.observe(0.5)
+        self.histogram.observe(5)
+        text = self.registry.render()
+        self.assertIn('# TYPE test_total counter', text)
+        self.assertIn('test_total{kind="a\\"b"} 3', text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{le="1"} 2', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('test_seconds_count 3', text)
+        self.assertIn('test_seconds_sum 5.55', text)
+
+    def test_disabled_registry_records_nothing(self):
+        self.registry.enabled = False
+        self.counter.inc('x')
+        with self.histogram.time():
+            pass
+        self.assertEqual(self.counter.value('x'), 0)
+        self.assertEqual(self.histogram.count(), 0)
+
+
+class MetricsEndpointTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+
+    def test_request_upload_and_db_metrics(self):
+        response = self.client.post(
+            '/api/clipboard/attach?filename=metrics.bin', headers=self.headers, data=b'x' * 1000
+        )
+        self.assertEqual(response.status_code, 200)
+        path = os.path.join(self.app.config['UPLOAD_FOLDER'], 'metrics.bin')
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+
+        self.assertEqual(metrics.HTTP_REQUESTS.value('POST', '/api/clipboard/attach', '200'), 1)
+        self.assertEqual(metrics.UPLOAD_BYTES.value('attach'), 1000)
+        self.assertEqual(metrics.UPLOAD_CHUNKS.value('attach'), 1)
+        self.assertEqual(metrics.HASH_DURATION.count('sha256'), 1)
+        self.assertGreater(metrics.DB_QUERIES.value(), 0)
+        self.assertEqual(metrics.DB_QUERIES_PER_REQUEST.count('/api/clipboard/attach'), 1)
+
+        self.app.config['METRICS_TOKEN'] = 'scrape-secret'
+        text = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).get_data(as_text=True)
+        self.assertIn(
+            'websync_http_requests_total{method="POST",endpoint="/api/clipboard/attach",status="200"} 1', text
+        )
+        self.assertIn('websync_upload_bytes_total{path="attach"} 1000', text)
+
+    def test_route_template_is_used_as_label(self):
+        self.client.get('/api/grok/jobs/12345', headers=self.headers)
+        self.assertEqual(metrics.HTTP_REQUESTS.value('GET', '/api/grok/jobs/<int:job_id>', '404'), 1)
+
+    def test_metrics_are_not_exposed_without_token(self):
+        self.assertEqual(self.app.config['METRICS_TOKEN'], '')
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code, 404)
+
+    def test_metrics_token(self):
+        self.app.config['METRICS_TOKEN'] = 'scrape-secret'
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+
+
+if __name__ == '__main__':
+    unittest.main()
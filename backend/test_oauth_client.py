@@ -0,0 +1,265 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from app_testing import module, write_oauth_config
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from oauth_client import HTTPPool, JWKSCache, OAuthClient, OAuthError
+
+CLIENT_ID = 'websync-test-client'
+
+
+class StandInProvider:
+    """本地的 OAuth 服务端替身：/token 返回签名的 id_token，/jwks 返回公钥。"""
+
+    def __init__(self):
+        self.keys = {}
+        self.signing_kid = None
+        self.rotate_key()
+        self.claims = {}
+        self.requests = []
+        self.client_ports = set()
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                provider.requests.append(('GET', self.path))
+                provider.client_ports.add(self.client_address[1])
+                if self.path == '/jwks':
+                    keys = []
+                    for kid, private_key in provider.keys.items():
+                        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+                        keys.append(dict(jwk, kid=kid, use='sig', alg='RS256'))
+                    self._send_json(200, {'keys': keys}, {'Cache-Control': 'public, max-age=600'})
+                else:
+                    self._send_json(404, {'error': 'not_found'})
+
+            def do_POST(self):
+                provider.requests.append(('POST', self.path))
+                provider.client_ports.add(self.client_address[1])
+                length = int(self.headers.get('Content-Length', 0))
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                if self.path != '/token' or form.get('code') != ['good-code']:
+                    self._send_json(400, {'error': 'invalid_grant'})
+                    return
+                self._send_json(200, {
+                    'access_token': 'provider-access-token',
+                    'id_token': provider.sign(),
+                    'token_type': 'Bearer'
+                })
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def rotate_key(self):
+        self.signing_kid = f'key-{len(self.keys) + 1}'
+        self.keys[self.signing_kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def sign(self, **overrides):
+        now = int(time.time())
+        claims = {
+            'iss': self.base_url,
+            'aud': CLIENT_ID,
+            'sub': '1234567890',
+            'email': 'allowed@example.test',
+            'email_verified': True,
+            'iat': now,
+            'exp': now + 300,
+        }
+        claims.update(self.claims)
+        claims.update(overrides)
+        return jwt.encode(
+            claims, self.keys[self.signing_kid], algorithm='RS256', headers={'kid': self.signing_kid}
+        )
+
+    def config(self):
+        return {
+            'client_id': CLIENT_ID,
+            'client_secret': 'test-secret',
+            'auth_uri': f'{self.base_url}/auth',
+            'token_uri': f'{self.base_url}/token',
+            'jwks_uri': f'{self.base_url}/jwks',
+            'issuer': self.base_url,
+            'allowed_email': 'allowed@example.test',
+        }
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OAuthClientTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.provider = StandInProvider()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.provider.stop()
+
+    def setUp(self):
+        self.provider.claims = {}
+        self.provider.requests.clear()
+        self.provider.client_ports.clear()
+        self.client = OAuthClient()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_exchange_uses_one_keep_alive_connection(self):
+        claims = self.client.exchange_code(self.provider.config(), 'good-code', 'http://localhost/cb')
+        self.assertEqual(claims['email'], 'allowed@example.test')
+        self.client.exchange_code(self.provider.config(), 'good-code', 'http://localhost/cb')
+
+        self.assertEqual(self.provider.requests, [('POST', '/token'), ('GET', '/jwks'), ('POST', '/token')])
+        self.assertEqual(self.client.http.connections_opened, 1)
+        self.assertEqual(len(self.provider.client_ports), 1)
+
+    def test_warm_up_prefetches_keys(self):
+        self.client.warm_up(self.provider.config())
+        self.client.warm_up(self.provider.config())
+        self.client.exchange_code(self.provider.config(), 'good-code', 'http://localhost/cb')
+        self.assertEqual(self.provider.requests, [('GET', '/jwks'), ('POST', '/token')])
+
+    def test_rejects_wrong_audience_and_expired_token(self):
+        config = self.provider.config()
+        with self.assertRaises(OAuthError):
+            self.client.verify_id_token(config, self.provider.sign(aud='someone-else'))
+        with self.assertRaises(OAuthError):
+            self.client.verify_id_token(config, self.provider.sign(exp=int(time.time()) - 3600))
+        with self.assertRaises(OAuthError):
+            self.client.verify_id_token(config, self.provider.sign(iss='https://evil.example'))
+
+    def test_rejects_unsigned_token(self):
+        token = jwt.encode({'aud': CLIENT_ID}, None, algorithm='none')
+        with self.assertRaises(OAuthError):
+            self.client.verify_id_token(self.provider.config(), token)
+
+    def test_provider_error_is_reported(self):
+        with self.assertRaises(OAuthError):
+            self.client.exchange_code(self.provider.config(), 'bad-code', 'http://localhost/cb')
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.provider = StandInProvider()
+        self.now = 0.0
+        self.http = HTTPPool()
+        self.cache = JWKSCache(self.http, f'{self.provider.base_url}/jwks', clock=lambda: self.now)
+
+    def tearDown(self):
+        self.http.close()
+        self.provider.stop()
+
+    def test_keys_are_cached_until_max_age(self):
+        self.cache.get_key('key-1')
+        self.now = 599
+        self.cache.get_key('key-1')
+        self.assertEqual(len(self.provider.requests), 1)
+        self.now = 600
+        self.cache.get_key('key-1')
+        self.assertEqual(len(self.provider.requests), 2)
+
+    def test_unknown_kid_triggers_refresh_after_min_interval(self):
+        self.cache.get_key('key-1')
+        self.provider.rotate_key()
+        with self.assertRaises(OAuthError):
+            self.cache.get_key('key-2')
+        self.now = 60
+        self.assertEqual(self.cache.get_key('key-2').key_id, 'key-2')
+
+    def test_stale_keys_are_kept_when_refresh_fails(self):
+        self.cache.get_key('key-1')
+        self.provider.stop()
+        self.http.close()
+        self.now = 601
+        self.assertEqual(self.cache.get_key('key-1').key_id, 'key-1')
+
+
+class GoogleCallbackTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.provider = StandInProvider()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.provider.stop()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        oauth_config = write_oauth_config(directory.name, redirect_uris=['http://localhost/auth/google/callback'],
+                                          **self.provider.config())
+        environ = mock.patch.dict(os.environ, {'GOOGLE_OAUTH_CLIENT_JSON': oauth_config})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self.app = module.create_app({'UPLOAD_FOLDER': directory.name})
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        module.db.create_all()
+        self.addCleanup(module.db.session.remove)
+        self.provider.claims = {}
+        self.provider.requests.clear()
+        self.client = self.app.test_client()
+
+    def start_login(self):
+        response = self.client.get('/api/auth/google')
+        self.assertEqual(response.status_code, 302)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(response.headers['Location']).query)
+        return query['state'][0], query['nonce'][0]
+
+    def callback(self, state):
+        response = self.client.get(f'/auth/google/callback?code=good-code&state={state}')
+        self.assertEqual(response.status_code, 302)
+        return urllib.parse.urlsplit(response.headers['Location']).fragment
+
+    def test_login_verifies_id_token_without_userinfo_call(self):
+        state, nonce = self.start_login()
+        self.provider.claims = {'nonce': nonce}
+        fragment = self.callback(state)
+
+        self.assertTrue(fragment.startswith('access_token='))
+        self.assertNotIn(('GET', '/userinfo'), self.provider.requests)
+        self.assertEqual(self.provider.requests.count(('POST', '/token')), 1)
+        user = module.User.query.filter_by(email='allowed@example.test').one()
+        self.assertEqual(user.role, module.UserRole.ADMIN)
+
+    def test_nonce_mismatch_is_rejected(self):
+        state, _ = self.start_login()
+        self.provider.claims = {'nonce': 'replayed'}
+        self.assertEqual(self.callback(state), 'auth_error=google_failed')
+
+    def test_other_account_is_rejected(self):
+        state, nonce = self.start_login()
+        self.provider.claims = {'nonce': nonce, 'email': 'intruder@example.test'}
+        self.assertEqual(self.callback(state), 'auth_error=account_not_allowed')
+
+
+if __name__ == '__main__':
+    unittest.main()
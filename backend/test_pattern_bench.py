@@ -0,0 +1,74 @@
+import json
+import os
+import re
+import tempfile
+import unittest
+
+from grok_engine import GrokCycleError, GrokEngine, grok_engine
+from pattern_library import PatternLibrary
+import pattern_bench
+
+
+class PatternBenchTestCase(unittest.TestCase):
+    def test_expansion_depth(self):
+        self.assertEqual(grok_engine.expansion_depth('plain'), 0)
+        self.assertEqual(grok_engine.expansion_depth('%{INT}'), 1)
+        self.assertEqual(grok_engine.expansion_depth('%{NUMBER}'), 2)
+        self.assertGreater(grok_engine.expansion_depth('%{COMBINEDAPACHELOG}'), 3)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'cycle'), 'w', encoding='utf-8') as f:
+                f.write('A %{B}\nB %{A}\n')
+            with self.assertRaises(GrokCycleError):
+                GrokEngine(PatternLibrary(directory)).expansion_depth('%{A}')
+
+    def test_profile_pattern_reports_matches_and_worst_case(self):
+        corpus = pattern_bench.load_corpus()
+        result = pattern_bench.profile_pattern(
+            'COMMONAPACHELOG', corpus=corpus, adversarial_length=256, min_sample_ns=10_000
+        )
+        self.assertEqual(result['depth'], grok_engine.expansion_depth('%{COMMONAPACHELOG}'))
+        self.assertGreaterEqual(result['matched_lines'], 2)
+        self.assertGreater(result['compile_ns'], 0)
+        self.assertGreater(result['ns_per_match'], 0)
+        self.assertGreater(result['ns_per_miss'], 0)
+        self.assertGreater(result['worst_case_ns'], 0)
+        self.assertIsNotNone(result['worst_case_input'])
+        json.dumps(result)
+
+    def test_adversarial_inputs_use_required_literals(self):
+        inputs = pattern_bench.adversarial_inputs(re.compile(r'user=\w+ id=\d+'), length=64)
+        self.assertIn("literal 'user='", inputs)
+        self.assertTrue(all(len(text) == 65 for text in inputs.values()))
+
+    def test_run_benchmark_profiles_selected_patterns_in_workers(self):
+        report = pattern_bench.run_benchmark(
+            globs=['INT', 'POSINT'], workers=1, timeout=30, adversarial_length=64, min_sample_ns=1_000
+        )
+        self.assertEqual(
+            [(entry['name'], entry['file']) for entry in report['patterns']],
+            [('INT', 'grok-patterns'), ('POSINT', 'grok-patterns')]
+        )
+        self.assertTrue(all(entry['matched_lines'] > 0 for entry in report['patterns']))
+        self.assertIn('INT', pattern_bench.format_report(report))
+        json.dumps(report)
+
+    def test_compare_reports_flags_regressions(self):
+        baseline = {'patterns': [
+            {'name': 'A', 'compile_ns': 10_000, 'ns_per_match': 100, 'ns_per_miss': 5_000, 'worst_case_ns': 50_000},
+            {'name': 'B', 'compile_ns': 10_000, 'worst_case_ns': 50_000},
+        ]}
+        current = {'patterns': [
+            {'name': 'A', 'compile_ns': 11_000, 'ns_per_match': 900, 'ns_per_miss': 5_000, 'worst_case_ns': 200_000},
+            {'name': 'B', 'timed_out': True},
+            {'name': 'C', 'compile_ns': 1},
+        ]}
+        regressions = pattern_bench.compare_reports(baseline, current)
+        self.assertEqual(
+            [(item['name'], item['metric']) for item in regressions],
+            [('A', 'worst_case_ns'), ('B', 'timed_out')]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
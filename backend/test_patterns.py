@@ -0,0 +1,73 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+os.environ['JWT_SECRET_KEY'] = 'test-only-random-jwt-secret-with-32-characters'
+
+import app as module
+from pattern_library import PatternLibrary
+
+app = module.create_app()
+
+
+class PatternLibraryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.patterns_dir = tempfile.mkdtemp()
+        self.write('base', '# comment\nWORD \\b\\w+\\b\nINT (?:[+-]?(?:[0-9]+))\n\nbroken\n')
+        self.library = PatternLibrary(self.patterns_dir, check_interval=0)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.patterns_dir, ignore_errors=True)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.patterns_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def test_parses_files_and_reuses_snapshot_until_mtime_changes(self):
+        first = self.library.snapshot()
+        self.assertEqual(first.files, {'base': {'WORD': r'\b\w+\b', 'INT': '(?:[+-]?(?:[0-9]+))'}})
+        self.assertIs(self.library.snapshot(), first)
+
+        self.write('extra', 'NUMBER %{INT}\n')
+        second = self.library.snapshot()
+        self.assertIsNot(second, first)
+        self.assertEqual(sorted(second.files), ['base', 'extra'])
+        self.assertNotEqual(second.etag, first.etag)
+
+    def test_combined_payload_supports_etag_and_gzip(self):
+        response = self.client.get('/api/patterns/files', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        patterns = json.loads(gzip.decompress(response.data))
+        self.assertIn('grok-patterns', patterns)
+
+        revalidated = self.client.get('/api/patterns/files', headers={
+            'Accept-Encoding': 'gzip',
+            'If-None-Match': response.headers['ETag']
+        })
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.data, b'')
+
+        plain = self.client.get('/api/patterns/files')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.get_json(), patterns)
+
+    def test_single_file_and_missing_file(self):
+        response = self.client.get('/api/patterns/grok-patterns')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('WORD', response.get_json())
+        cached = self.client.get('/api/patterns/grok-patterns', headers={
+            'If-None-Match': response.headers['ETag']
+        })
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get('/api/patterns/missing').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+from app_testing import AppTestCase, module
+import preview
+from preview import PreviewCache, archive_preview, decode_text, preview_kind
+from storage_backend import LocalStorage, StorageBackend
+
+
+def zip_bytes(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name in names:
+            archive.writestr(name, os.urandom(2000))
+    return buffer.getvalue()
+
+
+class RangeCountingStorage(LocalStorage):
+    """通过区间读取打开文件的本地存储，记录实际读取的字节数，模拟远程后端。"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.bytes_read = 0
+
+    def open_file(self, key):
+        return StorageBackend.open_file(self, key)
+
+    def open_stream(self, key, start=0, end=None):
+        self.bytes_read += (end if end is not None else self.size(key)) - start
+        return super().open_stream(key, start, end)
+
+
+class PreviewHelpersTestCase(unittest.TestCase):
+    def test_kind_follows_extension(self):
+        self.assertEqual(preview_kind('photo.JPG'), preview.IMAGE)
+        self.assertEqual(preview_kind('logs.tar.gz'), preview.ARCHIVE)
+        self.assertEqual(preview_kind('notes'), preview.TEXT)
+
+    def test_encoding_detection(self):
+        self.assertEqual(decode_text('日志'.encode('utf-8')[:-1], truncated=True), ('utf-8', '日'))
+        self.assertEqual(decode_text('中文日志'.encode('gbk'), truncated=False), ('gb18030', '中文日志'))
+        self.assertEqual(decode_text('hi'.encode('utf-16'), truncated=False), ('utf-16', 'hi'))
+        self.assertIsNone(decode_text(b'\x7fELF\x02\x01\x01\x00\x00', truncated=False))
+        self.assertIsNone(decode_text(bytes(range(1, 32)) * 4, truncated=False))
+
+    def test_archive_listing_is_capped(self):
+        listing = archive_preview(io.BytesIO(zip_bytes(['a.txt', 'b.txt', 'c.txt'])), 'x.zip', 2)
+        self.assertEqual([entry['name'] for entry in listing['entries']], ['a.txt', 'b.txt'])
+        self.assertTrue(listing['truncated'])
+
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            info = tarfile.TarInfo('dir/file.log')
+            info.size = 5
+            archive.addfile(info, io.BytesIO(b'hello'))
+        buffer.seek(0)
+        listing = archive_preview(buffer, 'x.tar.gz', 10)
+        self.assertEqual(listing['format'], 'tar')
+        self.assertEqual(listing['entries'], [{'name': 'dir/file.log', 'size': 5, 'dir': False}])
+        self.assertFalse(listing['truncated'])
+
+    def test_cache_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PreviewCache(directory, max_bytes=250)
+            for key in ('a', 'b'):
+                cache.put(key, b'x' * 100)
+            os.utime(cache.path('a'), (1, 1))
+            cache.put('c', b'x' * 100)
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('c'), b'x' * 100)
+
+
+class PreviewEndpointTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.default_spawn = module.preview_service.spawn
+        self.spawned = []
+        module.preview_service.configure(spawn=self.spawned.append)
+
+    def upload(self, name, body):
+        response = self.client.post(f'/api/clipboard/attach?filename={name}', headers=self.headers, data=body)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['file']['id']
+
+    def run_workers(self):
+        while self.spawned:
+            self.spawned.pop(0)()
+
+    def test_preview_is_generated_in_background_and_revalidated(self):
+        file_id = self.upload('self.app.log', '第一行\n'.encode('utf-8') * 20000)
+
+        response = self.client.get(f'/api/files/{file_id}/preview', headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        # 重复请求不会重复安排生成
+        self.client.get(f'/api/files/{file_id}/preview', headers=self.headers)
+        self.assertEqual(len(self.spawned), 1)
+        self.run_workers()
+
+        response = self.client.get(f'/api/files/{file_id}/preview', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual((payload['type'], payload['encoding']), ('text', 'utf-8'))
+        self.assertTrue(payload['truncated'])
+        self.assertTrue(payload['text'].startswith('第一行\n'))
+        self.assertLessEqual(len(payload['text'].encode('utf-8')), module.preview_service.text_bytes)
+        etag = response.headers['ETag']
+
+        response = self.client.get(f'/api/files/{file_id}/preview', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # 内容变化后预览键随哈希变化，旧的 ETag 不再命中
+        self.upload('self.app.log', b'replaced')
+        response = self.client.get(f'/api/files/{file_id}/preview', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 202)
+        self.run_workers()
+        response = self.client.get(f'/api/files/{file_id}/preview', headers=self.headers)
+        self.assertEqual(response.get_json()['text'], 'replaced')
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_generation_runs_outside_the_request_thread(self):
+        # 应用默认在系统线程中生成，Pillow 解码等耗 CPU 的工作不占用事件循环
+        module.preview_service.configure(spawn=self.default_spawn)
+        threads = []
+
+        def opener():
+            threads.append(threading.get_ident())
+            return io.BytesIO(b'hello')
+
+        key = module.preview_service.key('0' * 64, preview.TEXT)
+        module.preview_service.submit(key, preview.TEXT, 'a.txt', 5, opener)
+        deadline = time.monotonic() + 5
+        while module.preview_service.get(key) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(json.loads(module.preview_service.get(key))['text'], 'hello')
+        self.assertNotEqual(threads, [threading.get_ident()])
+        self.assertEqual(len(threads), 1)
+
+    def test_archive_preview_reads_only_the_directory(self):
+        self.app.extensions['storage'] = RangeCountingStorage(self.upload_folder)
+        module.preview_service.configure(spawn=lambda function: function())
+        body = zip_bytes([f'part-{index}.bin' for index in range(200)])
+        file_id = self.upload('bundle.zip', body)
+
+        response = self.client.get(f'/api/files/{file_id}/preview', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual(len(payload['entries']), 200)
+        self.assertEqual(payload['entries'][0], {'name': 'part-0.bin', 'size': 2000, 'dir': False})
+        self.assertLess(module.storage.bytes_read, len(body) // 4)
+
+    def test_unreadable_archive_yields_error_preview(self):
+        module.preview_service.configure(spawn=lambda function: function())
+        file_id = self.upload('broken.zip', b'not a zip file')
+        payload = self.client.get(f'/api/files/{file_id}/preview', headers=self.headers).get_json()
+        self.assertEqual(payload['type'], 'error')
+
+    @unittest.skipIf(preview.Image is None, '未安装 Pillow')
+    def test_image_thumbnail(self):
+        module.preview_service.configure(spawn=lambda function: function())
+        buffer = io.BytesIO()
+        preview.Image.new('RGB', (1024, 512), 'red').save(buffer, 'JPEG')
+        file_id = self.upload('photo.jpg', buffer.getvalue())
+        payload = self.client.get(f'/api/files/{file_id}/preview', headers=self.headers).get_json()
+        self.assertEqual((payload['type'], payload['width'], payload['mime']), ('image', 1024, 'image/jpeg'))
+        self.assertTrue(json.dumps(payload))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import time
+import unittest
+
+from app_testing import AppTestCase
+from grok_engine import GrokError
+from regex_pool import RegexPool, RegexPoolBusy, RegexTimeout, regex_pool
+
+
+CATASTROPHIC = '(a+)+$'
+CATASTROPHIC_TEXT = 'a' * 40 + 'b'
+
+
+class RegexPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = RegexPool(workers=1, timeout=1.0, cpu_limit=0, max_queue=0, queue_timeout=0)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_matches_in_worker(self):
+        matches, unmatched = self.pool.run('grok_match', '%{INT:n:int} %{WORD:w}', None, ['12 ab', 'x'])
+        self.assertEqual(matches[0]['captures'], {'n': 12, 'w': 'ab'})
+        self.assertEqual(unmatched, 1)
+        with self.assertRaises(GrokError):
+            self.pool.run('grok_match', '%{NOT_A_PATTERN}', None, ['x'])
+
+    def test_catastrophic_pattern_times_out_and_pool_recovers(self):
+        self.pool.start()
+        started = time.monotonic()
+        with self.assertRaises(RegexTimeout):
+            self.pool.run('grok_match', CATASTROPHIC, None, [CATASTROPHIC_TEXT])
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(self.pool.replaced, 1)
+
+        matches, _ = self.pool.run('grok_match', '%{INT:n}', None, ['7'])
+        self.assertEqual(matches[0]['captures'], {'n': '7'})
+
+    def test_cpu_limit_kills_worker(self):
+        self.pool.configure(timeout=30, cpu_limit=1)
+        started = time.monotonic()
+        with self.assertRaises(RegexTimeout):
+            self.pool.run('grok_match', CATASTROPHIC, None, [CATASTROPHIC_TEXT])
+        self.assertLess(time.monotonic() - started, 15)
+
+    def test_rejects_when_queue_is_full(self):
+        self.pool.start()
+        worker = self.pool._acquire()
+        try:
+            with self.assertRaises(RegexPoolBusy):
+                self.pool.run('discover', ['x'], 1)
+            self.assertEqual(self.pool.rejected, 1)
+        finally:
+            self.pool._release(worker)
+
+
+class MatchTimeoutEndpointTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.original_timeout = regex_pool.timeout
+        regex_pool.configure(timeout=1.0)
+
+    def tearDown(self):
+        regex_pool.configure(timeout=self.original_timeout)
+
+    def test_catastrophic_pattern_returns_422(self):
+        response = self.client.post('/api/patterns/match', headers=self.headers, json={
+            'pattern': CATASTROPHIC,
+            'text': CATASTROPHIC_TEXT
+        })
+        self.assertEqual(response.status_code, 422)
+        self.assertTrue(response.get_json()['timeout'])
+
+        response = self.client.post('/api/patterns/match', headers=self.headers, json={
+            'pattern': '%{INT:n}',
+            'text': '42'
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_busy_pool_returns_503(self):
+        original_queue = regex_pool.max_queue
+        regex_pool.configure(max_queue=0)
+        workers = []
+        try:
+            regex_pool.start()
+            while regex_pool._idle:
+                workers.append(regex_pool._acquire())
+            response = self.client.post('/api/patterns/discover', headers=self.headers, json={'text': 'x'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+        finally:
+            for worker in workers:
+                regex_pool._release(worker)
+            regex_pool.configure(max_queue=original_queue)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import time
+import unittest
+
+import greenlet
+
+from app_testing import AppTestCase, module
+from request_profiler import RequestProfiler
+
+
+def spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class GreenletSamplingTestCase(unittest.TestCase):
+    def test_concurrent_requests_on_one_thread_are_not_mixed(self):
+        # 模拟 eventlet：两个请求的 greenlet 在同一个系统线程上交替运行
+        profiler = RequestProfiler(interval=0.001)
+        profiles = {}
+
+        def profiled_request():
+            profiles['profiled'] = profiler.start()
+            spin(0.05)
+            other.switch()
+            spin(0.05)
+            profiles['profiled'].finish()
+
+        def other_request():
+            spin(0.1)
+            profiled.switch()
+
+        profiled = greenlet.greenlet(profiled_request)
+        other = greenlet.greenlet(other_request)
+        profiled.switch()
+
+        stacks = profiles['profiled'].sampler.stacks
+        self.assertTrue(stacks)
+        self.assertTrue(all('profiled_request' in stack for stack in stacks))
+        self.assertFalse(any('other_request' in stack for stack in stacks))
+
+
+class RequestProfilerTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = self.make_tempdir()
+        module.request_profiler.configure(directory=self.directory, retention=2, sample_rate=0)
+
+    def test_disabled_profiler_records_nothing(self):
+        module.request_profiler.configure(enabled=False)
+        response = self.client.get('/api/clipboard', headers=self.headers)
+        self.assertNotIn('X-WebSync-Profile-Id', response.headers)
+        self.assertEqual(self.client.post('/api/admin/profiles/token', headers=self.headers).status_code, 409)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_signed_token_profiles_request(self):
+        module.enable_request_profiling(self.app)
+        token = self.client.post('/api/admin/profiles/token', headers=self.headers).get_json()['token']
+
+        unsigned = self.client.get('/api/clipboard', headers={**self.headers, 'X-WebSync-Profile': 'forged'})
+        self.assertNotIn('X-WebSync-Profile-Id', unsigned.headers)
+
+        response = self.client.get('/api/clipboard', headers={**self.headers, 'X-WebSync-Profile': token})
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers['X-WebSync-Profile-Id']
+
+        listed = self.client.get('/api/admin/profiles', headers=self.headers).get_json()
+        self.assertEqual(listed[0]['id'], profile_id)
+        self.assertEqual(listed[0]['endpoint'], '/api/clipboard')
+        self.assertNotIn('stacks', listed[0])
+
+        document = self.client.get(f'/api/admin/profiles/{profile_id}', headers=self.headers).get_json()
+        self.assertEqual(document['trigger'], 'token')
+        self.assertGreater(document['sql_count'], 0)
+        self.assertIn('SELECT', document['queries'][0]['statement'])
+
+        collapsed = self.client.get(f'/api/admin/profiles/{profile_id}?format=collapsed', headers=self.headers)
+        self.assertEqual(collapsed.status_code, 200)
+        self.assertEqual(collapsed.mimetype, 'text/plain')
+
+    def test_token_requires_issuer_to_still_be_admin(self):
+        module.enable_request_profiling(self.app)
+        token = self.client.post('/api/admin/profiles/token', headers=self.headers).get_json()['token']
+        self.assertEqual(module.verify_profile_token(token), self.user.id)
+
+        self.user.role = module.UserRole.USER
+        module.db.session.commit()
+        response = self.client.get('/api/clipboard', headers={**self.headers, 'X-WebSync-Profile': token})
+        self.assertNotIn('X-WebSync-Profile-Id', response.headers)
+
+        module.db.session.delete(self.user)
+        module.db.session.commit()
+        self.assertIsNone(module.verify_profile_token(token))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_sampling_and_retention(self):
+        module.enable_request_profiling(self.app)
+        module.request_profiler.configure(sample_rate=1)
+        ids = [
+            self.client.get(f'/api/clipboard?n={index}', headers=self.headers).headers['X-WebSync-Profile-Id']
+            for index in range(3)
+        ]
+        listed = [entry['id'] for entry in self.client.get('/api/admin/profiles', headers=self.headers).get_json()]
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertIn(ids[-1], listed)
+        self.assertNotIn(ids[0], listed)
+        self.assertEqual(self.client.get('/api/admin/profiles/../../etc', headers=self.headers).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
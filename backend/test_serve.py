@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+os.environ['JWT_SECRET_KEY'] = 'test-only-random-jwt-secret-with-32-characters'
+
+import app as module
+import serve
+
+app = module.create_app()
+
+
+class AppFactoryTestCase(unittest.TestCase):
+    def test_apps_created_by_factory_have_isolated_databases(self):
+        first = module.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        second = module.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        with first.app_context():
+            module.db.create_all()
+            module.db.session.add(module.User(email='first@example.test', password=b'x'))
+            module.db.session.commit()
+        with second.app_context():
+            module.db.create_all()
+            self.assertEqual(module.User.query.count(), 0)
+        with first.app_context():
+            self.assertEqual(module.User.query.count(), 1)
+            module.db.session.remove()
+
+        client = second.test_client()
+        self.assertEqual(client.get('/api/files').status_code, 401)
+        self.assertEqual(client.get('/api/patterns/grok-patterns').status_code, 200)
+
+    def test_config_is_validated_when_the_app_is_created(self):
+        # 导入模块不再校验配置，缺少密钥时只有 create_app 失败
+        environment = {key: value for key, value in os.environ.items() if key != 'JWT_SECRET_KEY'}
+        result = subprocess.run(
+            [sys.executable, '-c', 'import app'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=environment, capture_output=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr.decode('utf-8', 'replace'))
+
+        for config in ({'JWT_SECRET_KEY': 'too-short'}, {'MAX_UPLOAD_SIZE': 0}, {'DOWNLOAD_OFFLOAD': 'lighttpd'}):
+            with self.assertRaises(RuntimeError):
+                module.create_app(config)
+        # 校验失败不会改动已生效的配置
+        self.assertEqual(app.config['JWT_SECRET_KEY'], os.environ['JWT_SECRET_KEY'])
+        self.assertGreater(app.config['MAX_UPLOAD_SIZE'], 0)
+
+    def test_interrupted_grok_jobs_are_marked_failed_on_startup(self):
+        with app.app_context():
+            module.db.create_all()
+            try:
+                user = module.User(email='owner@example.test', password=b'x')
+                module.db.session.add(user)
+                module.db.session.flush()
+                file_record = module.File(
+                    path='a.log', hash='0' * 64, last_modified=module.datetime.utcnow(), size=1, owner_id=user.id
+                )
+                module.db.session.add(file_record)
+                module.db.session.flush()
+                job = module.GrokJob(owner_id=user.id, file_id=file_record.id, pattern='%{INT}', status='running')
+                module.db.session.add(job)
+                module.db.session.commit()
+                job_id = job.id
+                self.assertEqual(module.recover_grok_jobs(app), 1)
+                module.db.session.expire_all()
+                job = module.db.session.get(module.GrokJob, job_id)
+                self.assertEqual(job.status, 'failed')
+                self.assertIsNotNone(job.finished_at)
+            finally:
+                module.db.session.remove()
+                module.db.drop_all()
+
+
+@mock.patch('importlib.util.find_spec', lambda name: object())
+class DeploymentCheckTestCase(unittest.TestCase):
+    def test_split_deployment_requires_message_queue(self):
+        problems = serve.check_deployment(4, '')
+        self.assertEqual(len(problems), 1)
+        self.assertIn('SOCKETIO_MESSAGE_QUEUE', problems[0])
+        self.assertEqual(serve.check_deployment(4, 'redis://localhost:6379/0'), [])
+        self.assertTrue(serve.check_deployment(0, 'redis://localhost:6379/0'))
+
+    def test_redis_queue_requires_redis_package(self):
+        with mock.patch('importlib.util.find_spec', lambda name: None):
+            problems = serve.check_deployment(4, 'redis://localhost:6379/0')
+        self.assertEqual(len(problems), 1)
+        self.assertIn('redis', problems[0])
+
+    def test_multiple_workers_need_reuse_port(self):
+        with mock.patch.object(serve, 'socket', mock.Mock(spec=[])):
+            self.assertTrue(serve.check_deployment(2, 'redis://localhost:6379/0'))
+            self.assertEqual(serve.check_deployment(1, 'redis://localhost:6379/0'), [])
+
+    def test_main_refuses_to_start_without_message_queue(self):
+        with mock.patch.dict(os.environ, {'SOCKETIO_MESSAGE_QUEUE': ''}), \
+                mock.patch.object(serve, 'load_dotenv'), \
+                mock.patch.object(serve, 'Supervisor') as supervisor:
+            self.assertEqual(serve.main(['--workers', '2']), 2)
+        supervisor.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import time
+import unittest
+
+from app_testing import AppTestCase, module
+from share_links import ShareLinkError, ShareLinks
+from sqlalchemy import event
+
+
+class ShareLinksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.epochs = {7: 0}
+        self.loads = 0
+
+        def loader():
+            self.loads += 1
+            return list(self.epochs.items())
+
+        self.links = ShareLinks('secret', refresh_interval=60, loader=loader)
+
+    def sign(self, operations=('download',), expires_at=None, epoch=0):
+        return self.links.sign(7, 'a.txt', 'h' * 64, 'a.txt', 3, expires_at or time.time() + 60,
+                               operations, epoch, False)
+
+    def assertStatus(self, status, token, operation='download'):
+        with self.assertRaises(ShareLinkError) as caught:
+            self.links.verify(token, operation)
+        self.assertEqual(caught.exception.status, status)
+
+    def test_signature_expiry_and_operations(self):
+        token = self.sign()
+        self.assertEqual(self.links.verify(token, 'download')['k'], 'a.txt')
+        self.assertStatus(404, token[:-2] + ('AA' if not token.endswith('AA') else 'BB'))
+        self.assertStatus(404, ShareLinks('other').sign(7, 'a.txt', 'h', 'a.txt', 3, time.time() + 60,
+                                                        ['download'], 0, False))
+        self.assertStatus(410, self.sign(expires_at=time.time() - 1))
+        self.assertStatus(403, token, 'preview')
+
+    def test_epochs_are_cached_between_refreshes(self):
+        token = self.sign()
+        for _ in range(5):
+            self.links.verify(token, 'download')
+        self.assertEqual(self.loads, 1)
+
+        # 其他进程撤销后，本进程在下次重新加载前仍接受旧链接
+        self.epochs[7] = 1
+        self.links.verify(token, 'download')
+        self.links.expire()
+        self.assertStatus(410, token)
+        # 纪元比缓存新的链接会立即触发重新加载
+        self.epochs[7] = 2
+        self.assertEqual(self.links.verify(self.sign(epoch=2), 'download')['e'], 2)
+        self.assertEqual(self.loads, 3)
+
+
+class ShareLinkEndpointTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        module.preview_service.configure(spawn=lambda function: function())
+
+    def upload(self, name, body):
+        response = self.client.post(f'/api/clipboard/attach?filename={name}', headers=self.headers, data=body)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['file']['id']
+
+    def create_link(self, file_id, **body):
+        response = self.client.post(f'/api/files/{file_id}/links', headers=self.headers, json=body)
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['url']
+
+    def download(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        body = response.get_data()
+        response.close()
+        return response, body
+
+    def test_anonymous_download_does_not_query_the_database(self):
+        file_id = self.upload('report.txt', b'shared bytes')
+        url = self.create_link(file_id, operations=['download'])
+        response, body = self.download(url)
+        self.assertEqual((response.status_code, body), (200, b'shared bytes'))
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=300')
+        etag = response.headers['ETag']
+
+        queries = []
+        listener = lambda *args: queries.append(args[2])
+        event.listen(module.db.engine, 'before_cursor_execute', listener)
+        try:
+            response, body = self.download(url, Range='bytes=7-')
+            self.assertEqual((response.status_code, body), (206, b'bytes'))
+            response, _ = self.download(url, **{'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            response, _ = self.download(url + '/preview')
+            self.assertEqual(response.status_code, 403)
+        finally:
+            event.remove(module.db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(queries, [])
+        self.assertEqual(module.admission.active, 0)
+
+    def test_content_change_and_revocation_invalidate_links(self):
+        file_id = self.upload('notes.txt', b'first')
+        url = self.create_link(file_id)
+        self.upload('notes.txt', b'second')
+        response, _ = self.download(url)
+        self.assertEqual(response.status_code, 410)
+
+        # 新签发的链接指向新内容
+        url = self.create_link(file_id, expires_in=60)
+        response, body = self.download(url)
+        self.assertEqual(body, b'second')
+        response = self.client.delete(f'/api/files/{file_id}/links', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response, _ = self.download(url)
+        self.assertEqual(response.status_code, 410)
+
+        url = self.create_link(file_id)
+        self.client.delete(f'/api/files/{file_id}', headers=self.headers)
+        response, _ = self.download(url)
+        self.assertEqual(response.status_code, 410)
+
+    def test_unsharing_public_file_revokes_cacheable_links(self):
+        file_id = self.upload('public.txt', b'public')
+        self.client.post(f'/api/files/{file_id}/share', headers=self.headers, json={'type': 'public'})
+        url = self.create_link(file_id)
+        response, _ = self.download(url)
+        self.assertTrue(response.headers['Cache-Control'].startswith('public, '))
+
+        self.client.delete(f'/api/files/{file_id}/share', headers=self.headers, json={'type': 'public'})
+        response, _ = self.download(url)
+        self.assertEqual(response.status_code, 410)
+        response, _ = self.download(self.create_link(file_id))
+        self.assertTrue(response.headers['Cache-Control'].startswith('private, '))
+
+    def test_preview_and_validation(self):
+        file_id = self.upload('self.app.log', b'line one\n')
+        url = self.create_link(file_id, operations=['preview'])
+        response = self.client.get(url + '/preview')
+        self.assertEqual(response.get_json()['text'], 'line one\n')
+        self.assertTrue(response.headers['Cache-Control'].startswith('private, max-age='))
+        response, _ = self.download(url)
+        self.assertEqual(response.status_code, 403)
+
+        for body in ({'expires_in': 0}, {'expires_in': self.app.config['SHARE_LINK_MAX_TTL'] + 1}, {'operations': ['delete']}):
+            response = self.client.post(f'/api/files/{file_id}/links', headers=self.headers, json=body)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/s/not-a-token').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import unittest
+from datetime import datetime
+
+from app_testing import AppTestCase, module
+from storage_backend import LocalStorage
+from storage_layout import StorageLayout
+from watchdog.events import FileDeletedEvent, FileModifiedEvent
+
+
+class StorageLayoutTestCase(unittest.TestCase):
+    def test_keys_are_sharded_by_prefix(self):
+        layout = StorageLayout(mode='sharded', depth=2)
+        key = layout.new_key()
+        objects, first, second, token = key.split('/')
+        self.assertEqual(objects, 'objects')
+        self.assertEqual((first, second), (token[:2], token[2:4]))
+        self.assertEqual(LocalStorage('/data').path(key), os.path.join('/data', 'objects', first, second, token))
+
+    def test_watcher_paths_skip_objects_and_internal_dirs(self):
+        layout = StorageLayout()
+        self.assertEqual(layout.flat_path('/data', '/data/report.txt'), 'report.txt')
+        self.assertIsNone(layout.flat_path('/data', '/data/objects/ab/cd/abcd'))
+        self.assertIsNone(layout.flat_path('/data', '/data/.tmp/upload.part'))
+
+    def test_invalid_configuration_is_rejected(self):
+        with self.assertRaises(ValueError):
+            StorageLayout(mode='nested')
+        with self.assertRaises(ValueError):
+            StorageLayout(depth=0)
+
+
+class ShardedStorageTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = self.create_user('other@example.test')
+
+    def upload(self, name, body):
+        response = self.client.post(f'/api/clipboard/attach?filename={name}', headers=self.headers, data=body)
+        self.assertEqual(response.status_code, 200)
+        return module.db.session.get(module.File, response.get_json()['file']['id'])
+
+    def add_flat_file(self, name, body, owner):
+        with open(os.path.join(self.upload_folder, name), 'wb') as f:
+            f.write(body)
+        record = module.File(
+            path=name, hash='0' * 64, last_modified=datetime.utcnow(), size=len(body), owner_id=owner.id
+        )
+        module.db.session.add(record)
+        module.db.session.commit()
+        return record
+
+    def read(self, record):
+        return module.storage.get_bytes(module.file_storage_key(record))
+
+    def test_sharded_upload_keeps_visible_path_in_database(self):
+        module.storage_layout.configure(mode='sharded')
+        record = self.upload('report.txt', b'sharded content')
+
+        self.assertEqual(record.path, 'report.txt')
+        self.assertTrue(record.storage_key.startswith('objects/'))
+        self.assertFalse(os.path.exists(os.path.join(self.upload_folder, 'report.txt')))
+        self.assertEqual(self.read(record), b'sharded content')
+
+        response = self.client.get('/api/download/report.txt', headers=self.headers)
+        self.assertEqual(response.get_data(), b'sharded content')
+        self.assertIn('report.txt', response.headers['Content-Disposition'])
+        response.close()
+
+        # 再次上传写回同一个对象
+        self.assertEqual(self.upload('report.txt', b'second').storage_key, record.storage_key)
+        self.assertEqual(self.read(record), b'second')
+
+    def test_flat_name_collision_no_longer_overwrites(self):
+        theirs = self.add_flat_file('notes.txt', b'their notes', self.other)
+        mine = self.upload('notes.txt', b'my notes')
+
+        self.assertNotEqual(mine.id, theirs.id)
+        self.assertIsNotNone(mine.storage_key)
+        self.assertEqual(self.read(theirs), b'their notes')
+        response = self.client.get('/api/download/notes.txt', headers=self.headers)
+        self.assertEqual(response.get_data(), b'my notes')
+        response.close()
+
+    def test_migration_moves_flat_files_in_batches(self):
+        first = self.add_flat_file('a.txt', b'aaa', self.user)
+        second = self.add_flat_file('b.txt', b'bbb', self.user)
+        # 旧版本中同名文件会共用一个磁盘文件
+        shared = module.File(
+            path='a.txt', hash='0' * 64, last_modified=datetime.utcnow(), size=3, owner_id=self.other.id
+        )
+        module.db.session.add(shared)
+        module.db.session.commit()
+
+        self.assertIsNone(module.migrate_storage_layout())
+        module.storage_layout.configure(mode='sharded')
+        self.assertEqual(module.migrate_storage_layout(batch_size=1), {'migrated': 3})
+
+        for record, body in ((first, b'aaa'), (second, b'bbb'), (shared, b'aaa')):
+            module.db.session.refresh(record)
+            self.assertIsNotNone(record.storage_key)
+            self.assertEqual(self.read(record), body)
+        self.assertEqual(os.listdir(self.upload_folder), ['objects'])
+        self.assertIsNone(module.migrate_storage_layout())
+
+    def test_watcher_ignores_old_location_of_migrated_file(self):
+        record = self.add_flat_file('c.txt', b'ccc', self.user)
+        module.storage_layout.configure(mode='sharded')
+        module.migrate_storage_layout()
+        emitted = []
+        socketio = type('SocketIO', (), {'emit': lambda _, *args: emitted.append(args)})()
+        handler = module.FileChangeHandler(self.app, socketio)
+
+        handler.on_deleted(FileDeletedEvent(os.path.join(self.upload_folder, 'c.txt')))
+        handler.on_modified(FileModifiedEvent(module.storage.local_path(record.storage_key)))
+
+        self.assertIsNotNone(module.db.session.get(module.File, record.id))
+        self.assertEqual(emitted, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
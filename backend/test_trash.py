@@ -0,0 +1,125 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from app_testing import AppTestCase, module
+from storage_backend import LocalStorage
+
+
+class CountingStorage(LocalStorage):
+    def __init__(self, root):
+        super().__init__(root)
+        self.deleted = []
+
+    def delete(self, key):
+        self.deleted.append(key)
+        super().delete(key)
+
+
+class TrashTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.original_emit = module.socketio.emit
+        self.app.extensions['storage'] = CountingStorage(self.upload_folder)
+        self.events = []
+        module.socketio.emit = lambda event, data=None, **kwargs: self.events.append((event, data, kwargs.get('to')))
+
+    def tearDown(self):
+        module.socketio.emit = self.original_emit
+
+    def upload(self, name, body):
+        response = self.client.post(f'/api/clipboard/attach?filename={name}', headers=self.headers, data=body)
+        self.assertEqual(response.status_code, 200)
+        return module.db.session.get(module.File, response.get_json()['file']['id'])
+
+    def purge_due(self):
+        return module.purge_trash(now=datetime.utcnow() + timedelta(days=self.app.config['TRASH_RETENTION_DAYS'] + 1))
+
+    def listed_paths(self):
+        return [item['path'] for item in self.client.get('/api/files', headers=self.headers).get_json()]
+
+    def test_delete_moves_file_to_trash_and_restore_brings_it_back(self):
+        record = self.upload('notes.txt', b'keep me')
+        response = self.client.delete(f'/api/files/{record.id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(module.storage.deleted, [])
+        self.assertEqual(self.user.storage_used, 0)
+        self.assertEqual(self.listed_paths(), [])
+        self.assertEqual(self.client.get('/api/download/notes.txt', headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/files/{record.id}', headers=self.headers).status_code, 404)
+
+        trash = self.client.get('/api/trash', headers=self.headers).get_json()
+        self.assertEqual([item['id'] for item in trash], [record.id])
+        # 保留期内不会被回收
+        self.assertIsNone(module.purge_trash())
+
+        response = self.client.post(f'/api/trash/{record.id}/restore', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user.storage_used, len(b'keep me'))
+        response = self.client.get('/api/download/notes.txt', headers=self.headers)
+        self.assertEqual(response.get_data(), b'keep me')
+        response.close()
+
+    def test_restore_refuses_to_shadow_a_newer_upload(self):
+        old = self.upload('report.txt', b'old')
+        self.client.delete(f'/api/files/{old.id}', headers=self.headers)
+        new = self.upload('report.txt', b'new')
+        self.assertNotEqual(new.id, old.id)
+        # 回收站中的平铺文件仍占用原位置，新上传改用分片对象键
+        self.assertNotEqual(module.file_storage_key(new), module.file_storage_key(old))
+
+        response = self.client.post(f'/api/trash/{old.id}/restore', headers=self.headers)
+        self.assertEqual(response.status_code, 409)
+
+        self.assertEqual(self.purge_due(), {'files': 1, 'blobs': 0, 'bytes': 3})
+        self.assertIsNone(module.db.session.get(module.File, old.id))
+        self.assertEqual(module.FileVersion.query.filter_by(file_id=old.id).count(), 0)
+        response = self.client.get('/api/download/report.txt', headers=self.headers)
+        self.assertEqual(response.get_data(), b'new')
+        response.close()
+
+    def test_purge_now_and_progress_events(self):
+        records = [self.upload(f'file-{index}.txt', b'x' * index) for index in range(1, 4)]
+        for record in records:
+            self.client.delete(f'/api/files/{record.id}', headers=self.headers)
+        response = self.client.delete('/api/trash', headers=self.headers)
+        self.assertEqual((response.status_code, response.get_json()['count']), (202, 3))
+
+        self.events.clear()
+        self.assertEqual(module.purge_trash(batch_size=2), {'files': 3, 'blobs': 0, 'bytes': 6})
+        progress = [data for event, data, _ in self.events if event == 'trash_purge_progress']
+        self.assertEqual(progress, [{'purged': 2, 'remaining': 1}, {'purged': 3, 'remaining': 0}])
+        self.assertEqual(sorted(module.storage.deleted), sorted(module.file_storage_key(r) for r in records))
+        self.assertEqual(self.client.get('/api/trash', headers=self.headers).get_json(), [])
+
+    def test_delete_user_defers_physical_deletion(self):
+        member = self.create_user('member@example.test')
+        for index in range(5):
+            module.storage.put_bytes(f'member-{index}.txt', b'data')
+            module.db.session.add(module.File(
+                path=f'member-{index}.txt', hash='0' * 64, last_modified=datetime.utcnow(), size=4,
+                owner_id=member.id
+            ))
+        module.storage.put_bytes(module._clipboard_image_key('paste.png.enc'), b'image')
+        module.db.session.add(module.ClipboardItem(type='image', image_path='paste.png.enc', owner_id=member.id))
+        module.db.session.commit()
+
+        response = self.client.delete(f'/api/users/{member.id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(module.storage.deleted, [])
+        self.assertEqual(module.File.query.count(), 0)
+        self.assertEqual(module.BlobDeletion.query.count(), 6)
+
+        # 记录删除后同名文件又被上传，回收时不能误删
+        self.upload('member-0.txt', b'reused name')
+        self.assertEqual(module.purge_trash(batch_size=4), {'files': 0, 'blobs': 6, 'bytes': 0})
+        self.assertEqual(module.BlobDeletion.query.count(), 0)
+        self.assertNotIn('member-0.txt', module.storage.deleted)
+        self.assertIn('clipboard_images/paste.png.enc', module.storage.deleted)
+        self.assertFalse(os.path.exists(module.storage.local_path('member-4.txt')))
+        progress = [(data, to) for event, data, to in self.events if event == 'trash_purge_progress']
+        self.assertEqual(progress[-1], ({'purged': 6, 'remaining': 0}, module.user_room(self.user.id)))
+
+
+if __name__ == '__main__':
+    unittest.main()
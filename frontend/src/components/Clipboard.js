@@ -1,10 +1,11 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { List, Card, Button, message, Typography, Space, Image, Input, Popconfirm } from 'antd';
 import { DeleteOutlined, CopyOutlined, SendOutlined, SyncOutlined } from '@ant-design/icons';
 import { Prism as SyntaxHighlighter } from 'react-syntax-highlighter';
 import { tomorrow } from 'react-syntax-highlighter/dist/esm/styles/prism';
 import axios from 'axios';
 import { format } from 'date-fns';
+import io from 'socket.io-client';
 
 const { Text, Title } = Typography;
 const { TextArea } = Input;
@@ -28,8 +29,72 @@ const Clipboard = () => {
     }
   };
 
+  const socketRef = useRef(null);
+
+  // 实时推送可用时由服务器事件增量更新列表，否则退回到重新拉取
+  const refreshIfOffline = () => {
+    if (!socketRef.current || !socketRef.current.connected) {
+      fetchItems();
+    }
+  };
+
+  const upsertItem = (item) => {
+    setItems(prev => [item, ...prev.filter(existing => existing.id !== item.id)]);
+  };
+
   useEffect(() => {
     fetchItems();
+
+    // 携带 token 连接，服务器会把本连接加入当前用户的私有房间
+    const socket = io('/', {
+      path: '/socket.io',
+      transports: ['websocket'],
+      upgrade: false,
+      reconnection: true,
+      reconnectionAttempts: 5,
+      reconnectionDelay: 3000,
+      forceNew: true,
+      auth: { token: localStorage.getItem('token') }
+    });
+
+    socket.on('clipboard_item_created', async (data) => {
+      // 图片和被截断的文本需要单独拉取完整内容
+      if (data.type === 'image') {
+        upsertItem({ id: data.id, type: data.type, content: null, created_at: data.created_at });
+        return;
+      }
+      if (!data.truncated) {
+        upsertItem({ id: data.id, type: data.type, content: data.preview, created_at: data.created_at });
+        return;
+      }
+      try {
+        const response = await axios.get(`/api/clipboard/${data.id}`);
+        upsertItem({ ...response.data, created_at: data.created_at });
+      } catch (error) {
+        console.error('Error fetching clipboard item:', error);
+      }
+    });
+
+    socket.on('clipboard_items_deleted', (data) => {
+      const ids = new Set(data.ids);
+      setItems(prev => prev.filter(item => !ids.has(item.id)));
+    });
+
+    let connectedBefore = false;
+    socket.on('connect', () => {
+      // 断线期间可能错过事件，重连后同步一次
+      if (connectedBefore) {
+        fetchItems();
+      }
+      connectedBefore = true;
+    });
+
+    socketRef.current = socket;
+
+    return () => {
+      socketRef.current = null;
+      socket.disconnect();
+    };
   }, []);
 
   // 预加载图片并创建 blob URL
@@ -99,7 +164,7 @@ const Clipboard = () => {
         });
         console.log('Upload response:', response.data);  // 调试日志
         message.success('图片已保存到剪贴板');
-        fetchItems();
+        refreshIfOffline();
       } catch (error) {
         console.error('Error details:', error.response?.data || error.message);  // 调试日志
         message.error('保存图片失败');
@@ -120,7 +185,7 @@ const Clipboard = () => {
           type: isCode ? 'code' : 'text'
         });
         message.success('内容已保存到剪贴板');
-        fetchItems();
+        refreshIfOffline();
       } catch (error) {
         message.error('保存内容失败');
         console.error('Error saving clipboard item:', error);
@@ -134,7 +199,7 @@ const Clipboard = () => {
     try {
       await axios.delete(`/api/clipboard/${id}`);
       message.success('删除成功');
-      fetchItems();
+      refreshIfOffline();
     } catch (error) {
       message.error('删除失败');
       console.error('Error deleting clipboard item:', error);
@@ -191,7 +256,7 @@ const Clipboard = () => {
       });
       message.success('内容已保存到剪贴板');
       setInputText(''); // 清空输入框
-      fetchItems();
+      refreshIfOffline();
     } catch (error) {
       message.error('保存内容失败');
       console.error('Error saving clipboard item:', error);
@@ -1,12 +1,34 @@
-import React, { useState, useEffect } from 'react';
-import { Table, Button, Modal, Form, Input, Select, message, Popconfirm, Tag, Space, Typography } from 'antd';
-import { DownloadOutlined, SyncOutlined, ShareAltOutlined, DeleteOutlined, GlobalOutlined, UserOutlined } from '@ant-design/icons';
+import React, { useState, useEffect, useRef } from 'react';
+import { Table, Button, Modal, Form, Input, Select, message, Popconfirm, Tag, Space, Typography, Spin } from 'antd';
+import { DownloadOutlined, SyncOutlined, ShareAltOutlined, DeleteOutlined, GlobalOutlined, UserOutlined, EyeOutlined, LinkOutlined, RestOutlined, UndoOutlined } from '@ant-design/icons';
 import axios from '../utils/axios';
 import io from 'socket.io-client';
 
 const { Text } = Typography;
 const { Option } = Select;
 
+// 预览尚未生成时服务端返回 202，按 Retry-After 重试的最多次数
+const PREVIEW_MAX_ATTEMPTS = 20;
+
+const formatSize = (size) => {
+  const units = ['B', 'KB', 'MB', 'GB'];
+  let i = 0;
+  let fileSize = size;
+  while (fileSize >= 1024 && i < units.length - 1) {
+    fileSize /= 1024;
+    i++;
+  }
+  return `${fileSize.toFixed(2)} ${units[i]}`;
+};
+
+// 分享链接可选的有效期（秒）
+const LINK_TTL_OPTIONS = [
+  { value: 3600, label: '1 小时' },
+  { value: 86400, label: '1 天' },
+  { value: 7 * 86400, label: '7 天' },
+  { value: 30 * 86400, label: '30 天' },
+];
+
 const FileList = ({ currentUser }) => {
   const [files, setFiles] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -15,6 +37,16 @@ const FileList = ({ currentUser }) => {
   const [shareForm] = Form.useForm();
   const [users, setUsers] = useState([]);
   const [socket, setSocket] = useState(null);
+  const [previewFile, setPreviewFile] = useState(null);
+  const [preview, setPreview] = useState(null);
+  const previewRef = useRef(null);
+  const [linkFile, setLinkFile] = useState(null);
+  const [link, setLink] = useState(null);
+  const [linkForm] = Form.useForm();
+  const [trashVisible, setTrashVisible] = useState(false);
+  const [trash, setTrash] = useState([]);
+  const [trashLoading, setTrashLoading] = useState(false);
+  const [purgeProgress, setPurgeProgress] = useState(null);
 
   const fetchUsers = async () => {
     try {
@@ -34,7 +66,9 @@ const FileList = ({ currentUser }) => {
       reconnection: true,
       reconnectionAttempts: 5,
       reconnectionDelay: 3000,
-      forceNew: true
+      forceNew: true,
+      // 携带 token 才会加入自己的房间，收到回收站的回收进度
+      auth: { token: localStorage.getItem('token') }
     });
 
     newSocket.on('connect', () => {
@@ -57,12 +91,21 @@ const FileList = ({ currentUser }) => {
       if (data && data.message && (
         data.message === '文件已更新' || 
         data.message === '新文件已添加' || 
-        data.message === '文件已删除'
+        data.message === '文件已删除' ||
+        data.message === '文件已移入回收站' ||
+        data.message === '文件已从回收站恢复'
       )) {
         fetchFiles();
       }
     });
 
+    newSocket.on('trash_purge_progress', (data) => {
+      setPurgeProgress(data);
+      if (data.remaining === 0) {
+        fetchTrash();
+      }
+    });
+
     setSocket(newSocket);
 
     // 组件卸载时清理
@@ -110,6 +153,101 @@ const FileList = ({ currentUser }) => {
     }
   };
 
+  const fetchPreview = async (file, attempt = 0) => {
+    try {
+      const response = await axios.get(`/api/files/${file.id}/preview`);
+      // 预览窗口已关闭或切换到其他文件
+      if (previewRef.current !== file.id) {
+        return;
+      }
+      if (response.status === 202) {
+        if (attempt + 1 >= PREVIEW_MAX_ATTEMPTS) {
+          setPreview({ type: 'error', error: '预览生成超时，请稍后再试' });
+          return;
+        }
+        const delay = (Number(response.headers['retry-after']) || 1) * 1000;
+        setTimeout(() => fetchPreview(file, attempt + 1), delay);
+        return;
+      }
+      setPreview(response.data);
+    } catch (error) {
+      console.error('Error fetching preview:', error);
+      if (previewRef.current === file.id) {
+        setPreview({ type: 'error', error: '获取预览失败' });
+      }
+    }
+  };
+
+  const handlePreview = (file) => {
+    previewRef.current = file.id;
+    setPreviewFile(file);
+    setPreview(null);
+    fetchPreview(file);
+  };
+
+  const closePreview = () => {
+    previewRef.current = null;
+    setPreviewFile(null);
+    setPreview(null);
+  };
+
+  const renderPreview = () => {
+    if (!preview) {
+      return <div style={{ textAlign: 'center', padding: 32 }}><Spin tip="正在生成预览..." /></div>;
+    }
+    switch (preview.type) {
+      case 'text':
+        return (
+          <>
+            <pre style={{ maxHeight: '60vh', overflow: 'auto', whiteSpace: 'pre-wrap', wordBreak: 'break-all' }}>
+              {preview.text}
+            </pre>
+            <Text type="secondary">
+              编码 {preview.encoding}{preview.truncated && '，仅显示文件开头部分'}
+            </Text>
+          </>
+        );
+      case 'image':
+        return (
+          <>
+            <img
+              src={`data:${preview.mime};base64,${preview.data}`}
+              alt={previewFile && previewFile.path}
+              style={{ maxWidth: '100%' }}
+            />
+            <div><Text type="secondary">原图 {preview.width} × {preview.height}</Text></div>
+          </>
+        );
+      case 'archive':
+        return (
+          <>
+            <Table
+              size="small"
+              pagination={{ pageSize: 20 }}
+              rowKey="name"
+              dataSource={preview.entries}
+              columns={[
+                { title: '名称', dataIndex: 'name', key: 'name' },
+                {
+                  title: '大小',
+                  dataIndex: 'size',
+                  key: 'size',
+                  render: (size, entry) => (entry.dir ? '-' : formatSize(size))
+                }
+              ]}
+            />
+            {preview.truncated && <Text type="secondary">条目较多，仅列出前 {preview.entries.length} 个</Text>}
+          </>
+        );
+      case 'binary':
+        return <Text type="secondary">二进制文件，无法预览</Text>;
+      case 'unsupported':
+        return <Text type="secondary">{preview.reason}</Text>;
+      default:
+        return <Text type="danger">{preview.error}</Text>;
+    }
+  };
+
   const handleShare = (file) => {
     setSelectedFile(file);
     shareForm.resetFields();
@@ -146,10 +284,117 @@ const FileList = ({ currentUser }) => {
     }
   };
 
+  const handleLink = (file) => {
+    setLinkFile(file);
+    setLink(null);
+    linkForm.setFieldsValue({ expiresIn: 7 * 86400, operations: ['download', 'preview'] });
+  };
+
+  const handleLinkSubmit = async () => {
+    try {
+      const values = await linkForm.validateFields();
+      const response = await axios.post(`/api/files/${linkFile.id}/links`, {
+        expires_in: values.expiresIn,
+        operations: values.operations
+      });
+      setLink({ ...response.data, url: `${window.location.origin}${response.data.url}` });
+    } catch (error) {
+      console.error('Error creating share link:', error);
+    }
+  };
+
+  const handleRevokeLinks = async () => {
+    try {
+      await axios.delete(`/api/files/${linkFile.id}/links`);
+      message.success('已撤销该文件的全部分享链接');
+      setLink(null);
+    } catch (error) {
+      console.error('Error revoking share links:', error);
+    }
+  };
+
+  const fetchTrash = async () => {
+    setTrashLoading(true);
+    try {
+      const response = await axios.get('/api/trash');
+      setTrash(response.data);
+    } catch (error) {
+      console.error('Error fetching trash:', error);
+    } finally {
+      setTrashLoading(false);
+    }
+  };
+
+  const openTrash = () => {
+    setTrashVisible(true);
+    setPurgeProgress(null);
+    fetchTrash();
+  };
+
+  const handleRestore = async (file) => {
+    try {
+      await axios.post(`/api/trash/${file.id}/restore`);
+      message.success('文件已恢复');
+      fetchTrash();
+      fetchFiles();
+    } catch (error) {
+      message.error(error.response?.data?.error || '恢复失败');
+    }
+  };
+
+  const handlePurge = async (file) => {
+    try {
+      const response = file
+        ? await axios.delete(`/api/trash/${file.id}`)
+        : await axios.delete('/api/trash');
+      message.success(response.data.message);
+      fetchTrash();
+    } catch (error) {
+      console.error('Error purging trash:', error);
+    }
+  };
+
+  const trashColumns = [
+    { title: '文件名', dataIndex: 'path', key: 'path' },
+    { title: '所有者', dataIndex: 'owner', key: 'owner' },
+    { title: '大小', dataIndex: 'size', key: 'size', render: (size) => formatSize(size) },
+    {
+      title: '删除时间',
+      dataIndex: 'trashed_at',
+      key: 'trashed_at',
+      render: (date) => new Date(`${date}Z`).toLocaleString(),
+    },
+    {
+      title: '彻底删除时间',
+      dataIndex: 'purge_at',
+      key: 'purge_at',
+      render: (date) => new Date(`${date}Z`).toLocaleString(),
+    },
+    {
+      title: '操作',
+      key: 'action',
+      render: (_, record) => (
+        <Space>
+          <Button icon={<UndoOutlined />} onClick={() => handleRestore(record)}>
+            恢复
+          </Button>
+          <Popconfirm
+            title="彻底删除后无法恢复，确定吗？"
+            onConfirm={() => handlePurge(record)}
+            okText="确定"
+            cancelText="取消"
+          >
+            <Button danger>彻底删除</Button>
+          </Popconfirm>
+        </Space>
+      ),
+    },
+  ];
+
   const handleDelete = async (file) => {
     try {
       await axios.delete(`/api/files/${file.id}`);
-      message.success('文件删除成功');
+      message.success('文件已移入回收站');
       fetchFiles();
     } catch (error) {
       console.error('Error deleting file:', error);
@@ -193,16 +438,7 @@ const FileList = ({ currentUser }) => {
       title: '大小',
       dataIndex: 'size',
       key: 'size',
-      render: (size) => {
-        const units = ['B', 'KB', 'MB', 'GB'];
-        let i = 0;
-        let fileSize = size;
-        while (fileSize >= 1024 && i < units.length - 1) {
-          fileSize /= 1024;
-          i++;
-        }
-        return `${fileSize.toFixed(2)} ${units[i]}`;
-      },
+      render: (size) => formatSize(size),
     },
     {
       title: '修改时间',
@@ -222,6 +458,12 @@ const FileList = ({ currentUser }) => {
           >
             下载
           </Button>
+          <Button
+            icon={<EyeOutlined />}
+            onClick={() => handlePreview(record)}
+          >
+            预览
+          </Button>
           {(record.type === 'own' || currentUser.role === 'admin') && (
             <>
               <Button
@@ -230,8 +472,14 @@ const FileList = ({ currentUser }) => {
               >
                 共享
               </Button>
+              <Button
+                icon={<LinkOutlined />}
+                onClick={() => handleLink(record)}
+              >
+                链接
+              </Button>
               <Popconfirm
-                title="确定要删除此文件吗？"
+                title="确定要将此文件移入回收站吗？"
                 onConfirm={() => handleDelete(record)}
                 okText="确定"
                 cancelText="取消"
@@ -260,6 +508,13 @@ const FileList = ({ currentUser }) => {
           >
             刷新列表
           </Button>
+          <Button
+            icon={<RestOutlined />}
+            onClick={openTrash}
+            style={{ marginRight: 16 }}
+          >
+            回收站
+          </Button>
           <Text type="secondary">
             共 {files.length} 个文件
           </Text>
@@ -271,6 +526,90 @@ const FileList = ({ currentUser }) => {
         rowKey={(record) => `${record.path}-${record.owner}`}
         loading={loading}
       />
+      <Modal
+        title={previewFile ? `预览：${previewFile.path}` : '预览'}
+        open={!!previewFile}
+        onCancel={closePreview}
+        footer={null}
+        width={800}
+      >
+        {renderPreview()}
+      </Modal>
+      <Modal
+        title="回收站"
+        open={trashVisible}
+        onCancel={() => setTrashVisible(false)}
+        width={900}
+        footer={[
+          <Popconfirm
+            key="empty"
+            title="清空后回收站中的文件都无法恢复，确定吗？"
+            onConfirm={() => handlePurge(null)}
+            okText="确定"
+            cancelText="取消"
+          >
+            <Button danger>清空回收站</Button>
+          </Popconfirm>,
+        ]}
+      >
+        {purgeProgress && purgeProgress.remaining > 0 && (
+          <Text type="secondary">
+            正在彻底删除：已删除 {purgeProgress.purged} 个，剩余 {purgeProgress.remaining} 个
+          </Text>
+        )}
+        <Table
+          columns={trashColumns}
+          dataSource={trash}
+          rowKey="id"
+          loading={trashLoading}
+          size="small"
+        />
+      </Modal>
+      <Modal
+        title={linkFile ? `分享链接：${linkFile.path}` : '分享链接'}
+        open={!!linkFile}
+        onCancel={() => setLinkFile(null)}
+        footer={[
+          <Popconfirm
+            key="revoke"
+            title="撤销后此文件已生成的所有链接都将失效，确定吗？"
+            onConfirm={handleRevokeLinks}
+            okText="确定"
+            cancelText="取消"
+          >
+            <Button danger>撤销全部链接</Button>
+          </Popconfirm>,
+          <Button key="create" type="primary" onClick={handleLinkSubmit}>
+            生成链接
+          </Button>,
+        ]}
+      >
+        <Form form={linkForm} layout="vertical">
+          <Form.Item name="expiresIn" label="有效期">
+            <Select options={LINK_TTL_OPTIONS} />
+          </Form.Item>
+          <Form.Item
+            name="operations"
+            label="允许的操作"
+            rules={[{ required: true, message: '请至少选择一项' }]}
+          >
+            <Select mode="multiple">
+              <Option value="download">下载</Option>
+              <Option value="preview">预览</Option>
+            </Select>
+          </Form.Item>
+        </Form>
+        {link && (
+          <div>
+            <Text copyable={{ text: link.url }} code>{link.url}</Text>
+            <div>
+              <Text type="secondary">
+                无需登录即可访问，{new Date(link.expires_at).toLocaleString()} 过期；文件内容变化后链接自动失效
+              </Text>
+            </div>
+          </div>
+        )}
+      </Modal>
       <Modal
         title="共享文件"
         open={shareModalVisible}
@@ -20,14 +20,16 @@ const GrokDebugger = () => {
   const [grokPatterns, setGrokPatterns] = useState({});
   const [patternFiles, setPatternFiles] = useState([]);
   const [selectedFiles, setSelectedFiles] = useState(['grok-patterns']);
+  const [patternLibrary, setPatternLibrary] = useState({});
   const textAreaRef = useRef(null);
   const grokInstance = useRef(new GrokCollection());
 
-  // 加载 pattern 文件列表
+  // 一次请求取回全部模式文件，服务器返回带 ETag 的合并内容，重复访问只需 304 验证
   useEffect(() => {
-    axios.get('/api/patterns/list')
+    axios.get('/api/patterns/files')
       .then(response => {
-        setPatternFiles(response.data);
+        setPatternLibrary(response.data);
+        setPatternFiles(Object.keys(response.data));
       })
       .catch(error => {
         console.error('Failed to load pattern files:', error);
@@ -35,64 +37,43 @@ const GrokDebugger = () => {
       });
   }, []);
 
+  // 自定义模式保存在服务器上，叠加在内置模式库之上，服务端匹配时同样生效
+  useEffect(() => {
+    axios.get('/api/patterns/custom')
+      .then(response => {
+        setCustomPatterns(Object.fromEntries(
+          response.data.map(item => [item.name, item.pattern])
+        ));
+      })
+      .catch(error => {
+        console.error('Failed to load custom patterns:', error);
+      });
+  }, []);
+
   // 修改模式文件加载逻辑
   const loadPatternFiles = useCallback(async () => {
     try {
       // 重置 grok 实例
       grokInstance.current = new GrokCollection();
       
-      // 加载所有选中的模式文件
+      // 注册所有选中文件中的模式
       for (const file of selectedFiles) {
-        try {
-          console.log(`Loading patterns from ${file}...`);
-          const response = await axios.get(`/api/patterns/${file}`);
-          const patternsData = response.data;
-          
-          // 添加调试日志
-          console.log('Received patterns data:', {
-            type: typeof patternsData,
-            value: patternsData
-          });
-          
-          // 处理 JSON 格式的模式数据
-          if (typeof patternsData === 'object') {
-            // 注册所有模式
-            Object.entries(patternsData).forEach(([name, pattern]) => {
-              try {
-                grokInstance.current.createPattern(pattern, name);
-              } catch (e) {
-                console.error(`Failed to register pattern ${name}:`, e);
-              }
-            });
-            
-            // 更新建议列表
-            setGrokPatterns(prev => ({
-              ...prev,
-              ...patternsData
-            }));
-          } else {
-            // 如果是文本格式，使用原来的处理方式
-            const textContent = String(patternsData);
-            const ids = grokInstance.current.loadPatterns(textContent);
-            console.log(`Loaded patterns: ${ids}`);
-            
-            const patterns = {};
-            textContent.split('\n').forEach(line => {
-              const match = line.match(/^([A-Z0-9_]+)\s+(.+)/);
-              if (match) {
-                patterns[match[1]] = match[2];
-              }
-            });
-            
-            setGrokPatterns(prev => ({
-              ...prev,
-              ...patterns
-            }));
+        const patternsData = patternLibrary[file];
+        if (!patternsData) continue;
+
+        Object.entries(patternsData).forEach(([name, pattern]) => {
+          try {
+            grokInstance.current.createPattern(pattern, name);
+          } catch (e) {
+            console.error(`Failed to register pattern ${name}:`, e);
           }
-        } catch (error) {
-          console.error(`Failed to load pattern file ${file}:`, error);
-          message.error(`加载模式文件 ${file} 失败`);
-        }
+        });
+
+        // 更新建议列表
+        setGrokPatterns(prev => ({
+          ...prev,
+          ...patternsData
+        }));
       }
       
       // 注册自定义模式
@@ -103,6 +84,10 @@ const GrokDebugger = () => {
           console.error(`Failed to register custom pattern ${name}:`, e);
         }
       }
+      setGrokPatterns(prev => ({
+        ...prev,
+        ...customPatterns
+      }));
 
       console.log('Grok patterns registration completed');
       
@@ -110,7 +95,7 @@ const GrokDebugger = () => {
       console.error('Failed to initialize or load pattern files:', error);
       message.error('初始化 Grok 解析器失败');
     }
-  }, [selectedFiles, customPatterns]);
+  }, [selectedFiles, customPatterns, patternLibrary]);
 
   // 修改匹配逻辑
   const debouncedExecuteMatch = useCallback(
@@ -244,28 +229,42 @@ const GrokDebugger = () => {
     return () => debouncedExecuteMatch.cancel();
   }, [debouncedExecuteMatch]);
 
-  // 修改添加自定义模式的逻辑
+  // 添加或修改自定义模式，由服务器校验并保存
   const addCustomPattern = async () => {
     const name = prompt('输入模式名称：');
     if (name) {
-      const value = prompt('输入模式定义：');
+      const value = prompt('输入模式定义：', customPatterns[name] || '');
       if (value) {
         try {
-          const pattern = grokInstance.current.createPattern(value, name);
-          if (pattern) {
-            setCustomPatterns(prev => ({
-              ...prev,
-              [name]: value
-            }));
-          }
+          const response = await axios.put(`/api/patterns/custom/${encodeURIComponent(name)}`, {
+            pattern: value
+          });
+          setCustomPatterns(prev => ({
+            ...prev,
+            [response.data.name]: response.data.pattern
+          }));
         } catch (e) {
-          console.error(`Failed to register custom pattern ${name}:`, e);
-          message.error('添加自定义模式失败');
+          console.error(`Failed to save custom pattern ${name}:`, e);
+          message.error(e.response?.data?.error || '添加自定义模式失败');
         }
       }
     }
   };
 
+  const deleteCustomPattern = async (name) => {
+    try {
+      await axios.delete(`/api/patterns/custom/${encodeURIComponent(name)}`);
+      setCustomPatterns(prev => {
+        const next = { ...prev };
+        delete next[name];
+        return next;
+      });
+    } catch (e) {
+      console.error(`Failed to delete custom pattern ${name}:`, e);
+      message.error(e.response?.data?.error || '删除自定义模式失败');
+    }
+  };
+
   // 复制匹配结果
   const copyResults = () => {
     const resultsText = matches.map(m => 
@@ -378,6 +377,24 @@ const GrokDebugger = () => {
             </Space>
           </div>
 
+          {Object.keys(customPatterns).length > 0 && (
+            <div>
+              {Object.entries(customPatterns).map(([name, value]) => (
+                <Tooltip key={name} title={value}>
+                  <Tag
+                    closable
+                    onClose={(e) => {
+                      e.preventDefault();
+                      deleteCustomPattern(name);
+                    }}
+                  >
+                    {name}
+                  </Tag>
+                </Tooltip>
+              ))}
+            </div>
+          )}
+
           {error && (
             <Text type="danger">
               错误：{error}
@@ -8,6 +8,8 @@ const { Text } = Typography;
 const CHUNK_SIZE = 512 * 1024; // 每块 512KB，base64 后约 700KB，和普通文本请求体量相当
 const CHUNK_RETRY = 3;
 
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 // 把 Blob 转成 base64（不带 data: 前缀）
 const blobToBase64 = (blob) => new Promise((resolve, reject) => {
   const reader = new FileReader();
@@ -52,6 +54,11 @@ const UploadForm = () => {
             break;
           } catch (err) {
             lastError = err;
+            // 服务器传输名额已满时按 Retry-After 等待后再重试
+            if (err.response && err.response.status === 429) {
+              const retryAfter = Number(err.response.headers['retry-after']) || 1;
+              await sleep(retryAfter * 1000);
+            }
           }
         }
         if (lastError) {